@@ -1,22 +1,19 @@
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 import secrets
 import os
+import json
 import subprocess
 from datetime import datetime, timezone
 import logging
 
 # ==================== 应用初始化 ====================
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)
 
-# 目录配置
-INSTALL_DIR = "/usr/local/ovpn-ui"
-CONFIG_DIR = "/etc/ovpn-ui"
-LOG_DIR = "/var/log/ovpn-ui"
-DATA_DIR = "/var/lib/ovpn-ui"
+# 目录配置（可通过环境变量覆盖，便于在测试/基准环境中使用临时目录）
+from services import CONFIG_DIR, LOG_DIR, DATA_DIR, CONFIG_FILE, DB_PATH
 
 # 创建必要目录
 os.makedirs(CONFIG_DIR, exist_ok=True)
@@ -24,8 +21,37 @@ os.makedirs(LOG_DIR, exist_ok=True)
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(f"{DATA_DIR}/temp_links", exist_ok=True)
 
+
+def load_secret_key(config_file):
+    """读取 webui.json 中的 secret_key，缺少时生成并写回
+
+    密钥必须在重启和多个工作进程之间保持不变，否则会话 Cookie 和邮件验证链接都会失效。
+    """
+    try:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    webui = config.setdefault("webui", {})
+    secret_key = webui.get("secret_key")
+    if secret_key and "{{" not in secret_key:
+        return secret_key
+
+    webui["secret_key"] = secret_key = secrets.token_hex(32)
+    try:
+        tmp_path = f"{config_file}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(config, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, config_file)
+    except OSError as e:
+        logging.getLogger(__name__).warning(f"无法保存 secret_key，重启后会话将失效: {e}")
+    return secret_key
+
+
+app.secret_key = load_secret_key(CONFIG_FILE)
+
 # 数据库配置
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DATA_DIR}/webui.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # 日志配置
@@ -38,53 +64,16 @@ logging.basicConfig(
     ]
 )
 
-db = SQLAlchemy(app)
+from models import db, AdminUser, NormalUser, TempDownloadLink
+from utils import api_response
+from utils.api_response import api_error, api_success
+
+db.init_app(app)
+api_response.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'user_login'
 
-# ==================== 数据库模型 ====================
-class AdminUser(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(50), unique=True, nullable=False)
-    password_hash = db.Column(db.String(255), nullable=False)
-    email = db.Column(db.String(100))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    @property
-    def user_type(self):
-        return "admin"
-
-class NormalUser(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(50), unique=True, nullable=False)
-    email = db.Column(db.String(100), unique=True, nullable=False)
-    password_hash = db.Column(db.String(255), nullable=False)
-    status = db.Column(db.String(20), default='pending')
-    ovpn_username = db.Column(db.String(50))
-    ovpn_password = db.Column(db.String(255))
-    max_devices = db.Column(db.Integer, default=2)
-    password_set = db.Column(db.Boolean, default=False)
-    approved_by = db.Column(db.Integer, db.ForeignKey('admin_user.id'))
-    approved_at = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    @property
-    def user_type(self):
-        return "user"
-
-class TempDownloadLink(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('normal_user.id'))
-    username = db.Column(db.String(50))
-    token = db.Column(db.String(64), unique=True)
-    temp_filename = db.Column(db.String(100))
-    actual_filename = db.Column(db.String(100))
-    download_count = db.Column(db.Integer, default=0)
-    max_downloads = db.Column(db.Integer, default=1)
-    expires_at = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
 # ==================== Flask-Login ====================
 @login_manager.user_loader
 def load_user(user_id):
@@ -111,9 +100,8 @@ def init_db():
             app.logger.info("数据库初始化完成，找到现有管理员账户")
 
 # ==================== OpenVPN 工具函数 ====================
-from utils.openvpn_manager import OpenVPNManager
-
-ovpn_manager = OpenVPNManager()
+from services import ovpn_manager
+from utils.account_lifecycle import account_active
 
 def create_ovpn_user(username, password, max_devices=2):
     try:
@@ -132,12 +120,35 @@ def change_ovpn_password(username, new_password):
     except Exception as e:
         return False, '', str(e)
 
+# ==================== 邮件通知 ====================
+from services import mail_outbox
+
+# 邮箱验证链接有效期
+EMAIL_VERIFY_MAX_AGE = 48 * 3600
+
+def email_token_serializer():
+    return URLSafeTimedSerializer(app.secret_key, salt='email-verify')
+
+# ==================== 静态资源 ====================
+from utils.asset_pipeline import AssetPipeline
+
+asset_pipeline = AssetPipeline()
+asset_pipeline.init_app(app)
+
 # ==================== 蓝图注册 ====================
 from routes.admin import admin_bp
 from routes.openvpn import openvpn_bp
+from routes.stats import stats_bp
+from services import (revocation_manager, user_reconciler, user_search, request_profiler, activity_tracker,
+                      lifecycle_sweeper, ccd_compiler, connection_history, stats_service, data_version)
+
+request_profiler.init_app(app)
+# VPN 连接和断开事件更新用户的最后连接时间
+connection_history.listeners.append(activity_tracker.on_connection_event)
 
 app.register_blueprint(admin_bp)
 app.register_blueprint(openvpn_bp)
+app.register_blueprint(stats_bp)
 
 # ==================== 路由 ====================
 @app.route('/')
@@ -172,10 +183,34 @@ def user_register():
         )
         db.session.add(new_user)
         db.session.commit()
+        # 只写入发件箱，由后台线程发送，注册耗时与邮件服务器无关
+        token = email_token_serializer().dumps(new_user.id)
+        mail_outbox.enqueue('verification', email, {
+            'username': username,
+            'verify_url': url_for('verify_email', token=token, _external=True),
+            'expires_hours': EMAIL_VERIFY_MAX_AGE // 3600
+        })
         app.logger.info(f"新用户注册: {username} ({email})")
         return jsonify({'success': True, 'message': '注册成功！请等待管理员审核。'})
     return render_template('user/register.html')
 
+@app.route('/verify_email/<token>')
+def verify_email(token):
+    try:
+        user_id = email_token_serializer().loads(token, max_age=EMAIL_VERIFY_MAX_AGE)
+    except SignatureExpired:
+        return jsonify({'success': False, 'error': '验证链接已过期'}), 400
+    except BadSignature:
+        return jsonify({'success': False, 'error': '无效的验证链接'}), 400
+    user = NormalUser.query.get(user_id)
+    if not user:
+        return jsonify({'success': False, 'error': '用户不存在'}), 404
+    if not user.email_verified:
+        user.email_verified = True
+        db.session.commit()
+        app.logger.info(f"用户 {user.username} 邮箱验证成功")
+    return redirect(url_for('user_login'))
+
 @app.route('/user/login', methods=['GET', 'POST'])
 def user_login():
     if request.method == 'POST':
@@ -185,6 +220,7 @@ def user_login():
         if user and check_password_hash(user.password_hash, password):
             if user.status == 'approved':
                 login_user(user, remember=True)
+                activity_tracker.touch_login(user.id)
                 return jsonify({'success': True})
             else:
                 return jsonify({'success': False, 'error': '账户尚未审核通过'})
@@ -236,23 +272,72 @@ def change_user_ovpn_password():
         user.ovpn_password = generate_password_hash(new_password)
         user.password_set = True
         db.session.commit()
+        if action == "创建":
+            # 按用户组策略生成完整的CCD配置（create_user 只写入地址和设备数）
+            ccd_compiler.compile(usernames=[user.ovpn_username])
+        mail_outbox.enqueue('password_changed', user.email, {
+            'username': user.username,
+            'changed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
         app.logger.info(f"用户 {user.username} {action}OpenVPN密码成功")
         return jsonify({'success': True, 'message': f'OpenVPN密码{action}成功'})
     else:
         app.logger.error(f"{action}OpenVPN密码失败: {stderr}")
         return jsonify({'success': False, 'error': f'OpenVPN密码{action}失败: {stderr}'})
 
+# ---------- OpenVPN 认证 ----------
+# auth-user-pass-verify 脚本（check_user.sh）只能从本机调用
+LOOPBACK_ADDRS = {'127.0.0.1', '::1'}
+
+@app.route('/api/v1/auth/verify', methods=['POST'])
+def verify_ovpn_user():
+    """OpenVPN 登录校验：账户须已审核通过且未过期，密码与 auth/users 中未锁定的凭据一致"""
+    if request.remote_addr not in LOOPBACK_ADDRS:
+        return api_error('无权限', 403)
+    data = request.get_json(silent=True) or request.form
+    username = data.get('username') or ''
+    password = data.get('password') or ''
+    user = NormalUser.query.filter_by(ovpn_username=username).first() if username else None
+    if (user is None or not account_active(user.status, user.expires_at)
+            or not ovpn_manager.verify_user(username, password)):
+        app.logger.warning(f"OpenVPN用户 {username} 认证失败")
+        return api_error('认证失败', 403)
+    return api_success()
+
 # ==================== 错误处理 ====================
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({'error': '资源未找到'}), 404
+    return api_error('资源未找到', 404)
 
 @app.errorhandler(500)
 def internal_error(error):
-    return jsonify({'error': '服务器内部错误'}), 500
+    return api_error('服务器内部错误', 500)
 
 # ==================== 启动 ====================
 if __name__ == '__main__':
     init_db()
+    stats_service.install()
+    data_version.install()
+    user_search.install()
+    activity_tracker.install()
+    ccd_compiler.install()
+    stats_service.start_reconciler()
+    mail_outbox.start()
+    connection_history.start()
+    revocation_manager.ensure_crl()
+    try:
+        # 启动时只报告差异（例如刚从备份恢复数据库），修复交给定时对账（有删除数量保护）
+        report = user_reconciler.reconcile(dry_run=True)
+        if report["changes"]:
+            app.logger.warning(f"用户数据与文件存在 {report['changes']} 处差异，将在定时对账中修复")
+    except Exception as e:
+        app.logger.error(f"启动时用户数据对账失败: {e}")
+    try:
+        ccd_compiler.compile()
+    except Exception as e:
+        app.logger.error(f"启动时CCD编译失败: {e}")
+    user_reconciler.start()
+    activity_tracker.start()
+    lifecycle_sweeper.start()
     app.logger.info("启动 OpenVPN WebUI 服务...")
     app.run(host='0.0.0.0', port=5000, debug=False)
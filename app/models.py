@@ -4,8 +4,9 @@ from datetime import datetime, timezone
 
 db = SQLAlchemy()
 
+# 表名与 init_admin.py / install.sh 创建的表保持一致
 class AdminUser(UserMixin, db.Model):
-    __tablename__ = 'admin_users'
+    __tablename__ = 'admin_user'
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
@@ -15,28 +16,45 @@ class AdminUser(UserMixin, db.Model):
     
     def __repr__(self):
         return f'<AdminUser {self.username}>'
+    
+    @property
+    def user_type(self):
+        return "admin"
+    
+    def get_id(self):
+        # 与 load_user 约定的 <type>-<id> 格式
+        return f"admin-{self.id}"
 
 class NormalUser(UserMixin, db.Model):
-    __tablename__ = 'normal_users'
+    __tablename__ = 'normal_user'
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     email_verified = db.Column(db.Boolean, default=False)
     password_hash = db.Column(db.String(255), nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, approved, rejected
+    status = db.Column(db.String(20), default='pending')  # pending, approved, rejected, suspended
     ovpn_username = db.Column(db.String(50))
     ovpn_password = db.Column(db.String(255))
     max_devices = db.Column(db.Integer, default=2)
     ip_type = db.Column(db.String(10), default='dhcp')
     static_ip = db.Column(db.String(15))
     password_set = db.Column(db.Boolean, default=False)
-    approved_by = db.Column(db.Integer, db.ForeignKey('admin_users.id'))
+    approved_by = db.Column(db.Integer, db.ForeignKey('admin_user.id'))
     approved_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    # 账户生命周期（最后活动时间由 ActivityTracker 批量写入）
+    last_login_at = db.Column(db.DateTime)
+    last_connect_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
+    expiry_notified_at = db.Column(db.DateTime)
+    # 用户组及个人覆盖项（JSON，格式见 utils.ccd_compiler.normalize_policy）
+    group_id = db.Column(db.Integer, db.ForeignKey('user_group.id'), index=True)
+    ccd_overrides = db.Column(db.Text)
     
     # 关系定义
     admin = db.relationship('AdminUser', backref='users')
+    group = db.relationship('UserGroup', backref='members')
     
     def __repr__(self):
         return f'<NormalUser {self.username}>'
@@ -44,12 +62,28 @@ class NormalUser(UserMixin, db.Model):
     @property
     def user_type(self):
         return "user"
+    
+    def get_id(self):
+        return f"user-{self.id}"
+
+class UserGroup(db.Model):
+    __tablename__ = 'user_group'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    description = db.Column(db.String(255))
+    # 路由、DNS、设备数、地址池等（JSON，由 CCDCompiler 生成成员的 CCD 文件）
+    policy = db.Column(db.Text, default='{}')
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    def __repr__(self):
+        return f'<UserGroup {self.name}>'
 
 class TempDownloadLink(db.Model):
-    __tablename__ = 'temp_download_links'
+    __tablename__ = 'temp_download_link'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('normal_users.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('normal_user.id'))
     username = db.Column(db.String(50))
     token = db.Column(db.String(64), unique=True)
     temp_filename = db.Column(db.String(100))
@@ -60,4 +94,4 @@ class TempDownloadLink(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     
     def __repr__(self):
-        return f'<TempDownloadLink {self.token}>'
\ No newline at end of file
+        return f'<TempDownloadLink {self.token}>'
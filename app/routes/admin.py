@@ -1,8 +1,16 @@
-from flask import Blueprint, render_template, jsonify, request
-from flask_login import login_required, current_user
-from app.models import NormalUser, db, AdminUser
+from flask import Blueprint, Response, render_template, request, url_for, redirect, send_file, stream_with_context
+from flask_login import login_required, login_user, logout_user, current_user
+from models import NormalUser, db, AdminUser, UserGroup
 from werkzeug.security import check_password_hash
-from datetime import datetime
+from datetime import datetime, timezone
+import json
+from utils.api_response import api_success, api_error, versioned
+from utils.auth import admin_required
+from utils.ccd_compiler import normalize_policy
+from utils.report_exporter import EXPORT_FORMATS
+from services import (backup_manager, ccd_compiler, data_version, lifecycle_sweeper,
+                      log_viewer, mail_outbox, ovpn_manager, report_exporter, request_profiler,
+                      revocation_manager, user_reconciler, user_search)
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -14,20 +22,17 @@ def admin_login():
         password = request.json.get('password')
         user = AdminUser.query.filter_by(username=username).first()
         if user and check_password_hash(user.password_hash, password):
+            # AdminUser.get_id() 返回 admin-<id> 格式
             login_user(user, remember=True)
-            # 设置用户ID格式为 admin-<id>
-            from flask_login import login_user
-            login_user(user)
-            session['_user_id'] = f"admin-{user.id}"
-            return jsonify({'success': True})
-        return jsonify({'success': False, 'error': '用户名或密码错误'})
+            return api_success()
+        return api_error('用户名或密码错误', 401)
     return render_template('admin/login.html')
 
 @admin_bp.route('/logout')
 @login_required
 def admin_logout():
     logout_user()
-    return redirect(url_for('admin_login'))
+    return redirect(url_for('admin.admin_login'))
 
 @admin_bp.route('/dashboard')
 @login_required
@@ -67,47 +72,445 @@ def admin_index(path):
         return render_template('admin/dashboard.html')
 
 # 管理员API路由
+USER_LIST_COLUMNS = ('id', 'username', 'email', 'status', 'ovpn_username', 'max_devices',
+                     'ip_type', 'static_ip', 'created_at', 'approved_at',
+                     'last_login_at', 'last_connect_at', 'expires_at')
+
 @admin_bp.route('/api/users')
 @login_required
+@admin_required
+@versioned(lambda: data_version.get('normal_user'))
 def get_users():
-    """获取用户列表"""
-    users = NormalUser.query.all()
-    return jsonify([{
-        'id': u.id,
-        'username': u.username,
-        'email': u.email,
-        'status': u.status,
-        'ovpn_username': u.ovpn_username,
-        'max_devices': u.max_devices,
-        'ip_type': u.ip_type,
-        'static_ip': u.static_ip,
-        'created_at': u.created_at.isoformat(),
-        'approved_at': u.approved_at.isoformat() if u.approved_at else None
-    } for u in users])
+    """获取用户列表（数据未变化时返回 304）"""
+    # 只查询需要的列，不构造 ORM 对象
+    rows = NormalUser.query.with_entities(
+        *(getattr(NormalUser, c) for c in USER_LIST_COLUMNS)
+    ).order_by(NormalUser.id).all()
+    return api_success([dict(zip(USER_LIST_COLUMNS, row)) for row in rows])
+
+@admin_bp.route('/api/users/search')
+@login_required
+@admin_required
+@versioned(lambda: data_version.get('normal_user'))
+def search_users():
+    """搜索用户（用户名、邮箱、OpenVPN用户名、静态IP、状态的子串匹配）"""
+    query = request.args.get('q', '').strip()
+    if len(query) > 100:
+        return api_error('搜索内容过长')
+    result = user_search.search(
+        query,
+        limit=request.args.get('limit', 20, type=int),
+        status=request.args.get('status') or None
+    )
+    return api_success(result['items'], mode=result['mode'], elapsed_ms=result['elapsed_ms'])
 
 @admin_bp.route('/api/users/<int:user_id>', methods=['DELETE'])
 @login_required
+@admin_required
 def delete_user(user_id):
     """删除用户"""
     user = NormalUser.query.get_or_404(user_id)
+    common_name = user.ovpn_username or user.username
     db.session.delete(user)
     db.session.commit()
-    return jsonify({'success': True})
+    # 删除认证文件中的凭据和CCD配置，吊销证书并断开在线会话
+    ovpn_manager.delete_user(common_name)
+    revocation_manager.revoke_user(common_name, reason='cessation_of_operation')
+    return api_success()
 
 @admin_bp.route('/api/users/<int:user_id>/suspend', methods=['POST'])
 @login_required
+@admin_required
 def suspend_user(user_id):
     """暂停用户"""
     user = NormalUser.query.get_or_404(user_id)
     user.status = 'suspended'
     db.session.commit()
-    return jsonify({'success': True})
+    common_name = user.ovpn_username or user.username
+    # 服务端使用用户名密码认证（verify-client-cert none），因此先锁定凭据，再暂停证书并断开在线会话；
+    # 两者激活时都可以恢复
+    ovpn_manager.set_locked([common_name], True)
+    revocation_manager.revoke_user(common_name, reason='certificate_hold')
+    return api_success()
+
+@admin_bp.route('/api/users/<int:user_id>/expiry', methods=['POST'])
+@login_required
+@admin_required
+def set_user_expiry(user_id):
+    """设置账户到期时间（ISO 8601，null 表示永不过期）"""
+    user = NormalUser.query.get_or_404(user_id)
+    value = (request.json or {}).get('expires_at')
+    if value:
+        try:
+            expires_at = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return api_error('到期时间格式无效')
+        if expires_at.tzinfo is not None:
+            expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        expires_at = None
+    user.expires_at = expires_at
+    # 到期时间变化后重新发送到期提醒
+    user.expiry_notified_at = None
+    db.session.commit()
+    return api_success({'expires_at': expires_at.isoformat() if expires_at else None})
 
 @admin_bp.route('/api/users/<int:user_id>/activate', methods=['POST'])
 @login_required
+@admin_required
 def activate_user(user_id):
     """激活用户"""
     user = NormalUser.query.get_or_404(user_id)
+    previous_status = user.status
     user.status = 'approved'
     db.session.commit()
-    return jsonify({'success': True})
\ No newline at end of file
+    common_name = user.ovpn_username or user.username
+    ovpn_manager.set_locked([common_name], False)
+    revocation_manager.release_hold(common_name)
+    if previous_status == 'pending':
+        mail_outbox.enqueue('approved', user.email, {
+            'username': user.username,
+            'login_url': url_for('user_login', _external=True)
+        })
+    return api_success()
+
+# 用户组API路由
+def _group_dict(group, members):
+    return {'id': group.id, 'name': group.name, 'description': group.description,
+            'policy': json.loads(group.policy or '{}'), 'members': members,
+            'created_at': group.created_at}
+
+def _compile_summary(report):
+    return {k: report[k] for k in ('changes', 'unchanged', 'errors', 'elapsed_ms')}
+
+@admin_bp.route('/api/groups')
+@login_required
+@admin_required
+@versioned(lambda: data_version.get('user_group', 'normal_user'))
+def get_groups():
+    """用户组列表（含成员数）"""
+    counts = dict(db.session.query(NormalUser.group_id, db.func.count(NormalUser.id))
+                  .filter(NormalUser.group_id.isnot(None)).group_by(NormalUser.group_id).all())
+    groups = UserGroup.query.order_by(UserGroup.name).all()
+    return api_success([_group_dict(g, counts.get(g.id, 0)) for g in groups])
+
+@admin_bp.route('/api/groups', methods=['POST'])
+@login_required
+@admin_required
+def create_group():
+    """创建用户组"""
+    data = request.json or {}
+    name = (data.get('name') or '').strip()
+    if not name:
+        return api_error('请填写组名')
+    if UserGroup.query.filter_by(name=name).first():
+        return api_error('组名已存在')
+    try:
+        policy = normalize_policy(data.get('policy'))
+    except ValueError as e:
+        return api_error(str(e))
+    group = UserGroup(name=name, description=data.get('description'), policy=json.dumps(policy))
+    db.session.add(group)
+    db.session.commit()
+    return api_success(_group_dict(group, 0))
+
+@admin_bp.route('/api/groups/<int:group_id>', methods=['PUT'])
+@login_required
+@admin_required
+def update_group(group_id):
+    """修改用户组策略，并重新生成成员的CCD文件（dry_run 时只返回差异）"""
+    group = UserGroup.query.get_or_404(group_id)
+    data = request.json or {}
+    try:
+        policy = normalize_policy(data.get('policy', json.loads(group.policy or '{}')))
+    except ValueError as e:
+        return api_error(str(e))
+    name = (data.get('name') or group.name).strip()
+    if name != group.name and UserGroup.query.filter_by(name=name).first():
+        return api_error('组名已存在')
+
+    if data.get('dry_run'):
+        return api_success(ccd_compiler.compile(dry_run=True, group_id=group_id,
+                                                group_policies={group_id: policy}))
+
+    group.name = name
+    group.description = data.get('description', group.description)
+    group.policy = json.dumps(policy)
+    db.session.commit()
+    report = ccd_compiler.compile(group_id=group_id)
+    return api_success(dict(_group_dict(group, report['users']), compile=_compile_summary(report)))
+
+@admin_bp.route('/api/groups/<int:group_id>', methods=['DELETE'])
+@login_required
+@admin_required
+def delete_group(group_id):
+    """删除用户组，成员恢复为默认策略"""
+    group = UserGroup.query.get_or_404(group_id)
+    member_names = [name for (name,) in db.session.query(NormalUser.ovpn_username)
+                    .filter(NormalUser.group_id == group_id, NormalUser.ovpn_username.isnot(None))]
+    NormalUser.query.filter_by(group_id=group_id).update({'group_id': None})
+    db.session.delete(group)
+    db.session.commit()
+    report = ccd_compiler.compile(usernames=member_names)
+    return api_success({'compile': _compile_summary(report)})
+
+@admin_bp.route('/api/users/<int:user_id>/policy')
+@login_required
+@admin_required
+def get_user_policy(user_id):
+    """用户生效的策略和CCD内容"""
+    preview = ccd_compiler.preview(user_id)
+    if preview is None:
+        return api_error('用户不存在', 404)
+    return api_success(preview)
+
+@admin_bp.route('/api/users/<int:user_id>/policy', methods=['POST'])
+@login_required
+@admin_required
+def set_user_policy(user_id):
+    """设置用户所属的组和个人覆盖项 {group_id, overrides}，并重新生成CCD文件"""
+    user = NormalUser.query.get_or_404(user_id)
+    data = request.json or {}
+    if 'group_id' in data:
+        if data['group_id'] is not None and UserGroup.query.get(data['group_id']) is None:
+            return api_error('用户组不存在')
+        user.group_id = data['group_id']
+    if 'overrides' in data:
+        try:
+            overrides = normalize_policy(data['overrides'])
+        except ValueError as e:
+            return api_error(str(e))
+        user.ccd_overrides = json.dumps(overrides) if overrides else None
+    db.session.commit()
+    report = ccd_compiler.compile(usernames=[user.ovpn_username]) if user.ovpn_username else None
+    return api_success({'compile': _compile_summary(report) if report else None})
+
+@admin_bp.route('/api/ccd/compile')
+@login_required
+@admin_required
+def ccd_compile_preview():
+    """完整编译的差异（不写入文件）"""
+    return api_success(ccd_compiler.compile(dry_run=True))
+
+@admin_bp.route('/api/ccd/compile', methods=['POST'])
+@login_required
+@admin_required
+def ccd_compile_apply():
+    """完整编译：只重写内容变化或被手工修改的CCD文件"""
+    return api_success(ccd_compiler.compile())
+
+# 导出API路由
+@admin_bp.route('/api/export/<dataset>')
+@login_required
+@admin_required
+def export_data(dataset):
+    """流式导出 users / events / usage / online（CSV 或 JSONL）
+
+    参数：format、columns（逗号分隔）、筛选条件（status、group_id、common_name、event、since、until）、
+    after（续传：上次收到的最后一行的键，键列名见 X-Export-Key 响应头）、limit
+    """
+    args = request.args
+    filters = {k: args.get(k) for k in ('status', 'group_id', 'common_name', 'event', 'since', 'until')
+               if args.get(k)}
+    try:
+        params = report_exporter.prepare(
+            dataset, args.get('format', 'csv'),
+            args.get('columns').split(',') if args.get('columns') else None, filters, args.get('after'))
+    except ValueError as e:
+        return api_error(str(e))
+
+    filename = f"{dataset}-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.{params['format']}"
+    chunks = report_exporter.export(params, limit=args.get('limit', None, type=int))
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[params['format']])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Export-Key'] = params['key']
+    response.headers['Cache-Control'] = 'no-store'
+    # 关闭反向代理缓冲，边生成边发送
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# 日志API路由
+def _log_filters():
+    args = request.args
+    return {'level': args.get('level') or None, 'user': args.get('user') or None,
+            'query': args.get('q') or None}
+
+@admin_bp.route('/api/logs')
+@login_required
+@admin_required
+def list_logs():
+    """可查看的日志（webui.json 的 logs 配置）"""
+    return api_success(log_viewer.list_sources())
+
+@admin_bp.route('/api/logs/<name>')
+@login_required
+@admin_required
+def read_log(name):
+    """从文件末尾向前分页读取日志，按时间倒序
+
+    参数：level（最低级别）、user（OpenVPN 用户名）、q（包含的文本）、since/until（Unix 时间戳）、
+    limit、before（上一页返回的 next_before；为空表示已到开头）
+    """
+    args = request.args
+    try:
+        page = log_viewer.read(name, before=args.get('before', None, type=int),
+                               limit=args.get('limit', 200, type=int),
+                               since=args.get('since', None, type=int), until=args.get('until', None, type=int),
+                               **_log_filters())
+    except KeyError:
+        return api_error('日志不存在', 404)
+    except FileNotFoundError:
+        return api_error('日志文件不存在', 404)
+    return api_success(page)
+
+@admin_bp.route('/api/logs/<name>/follow')
+@login_required
+@admin_required
+def follow_log(name):
+    """持续推送新写入的日志（Server-Sent Events）
+
+    事件 id 为下一行的偏移，断线后 EventSource 会带上 Last-Event-ID 从断点继续；
+    也可以用 after 参数指定起始偏移（默认从文件末尾开始）。每次连接最长 5 分钟，之后由客户端自动重连。
+    """
+    try:
+        log_viewer.resolve(name)
+    except KeyError:
+        return api_error('日志不存在', 404)
+    after = request.headers.get('Last-Event-ID', None, type=int)
+    if after is None:
+        after = request.args.get('after', None, type=int)
+    filters = _log_filters()
+
+    def events():
+        yield 'retry: 3000\n\n'
+        try:
+            for entry in log_viewer.follow(name, after=after, **filters):
+                if entry is None:
+                    yield ': keepalive\n\n'
+                elif entry.get('rotated'):
+                    yield f"id: {entry['next']}\nevent: rotated\ndata: {{}}\n\n"
+                else:
+                    yield f"id: {entry['next']}\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+        except FileNotFoundError:
+            yield 'event: error\ndata: {"message": "日志文件不存在"}\n\n'
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# 备份API路由
+@admin_bp.route('/api/backups')
+@login_required
+@admin_required
+def list_backups():
+    """获取备份列表"""
+    return api_success(backup_manager.list_backups())
+
+@admin_bp.route('/api/backups', methods=['POST'])
+@login_required
+@admin_required
+def create_backup():
+    """创建备份"""
+    try:
+        return api_success(backup_manager.create_backup())
+    except Exception as e:
+        return api_error(str(e), 500)
+
+@admin_bp.route('/api/backups/<snapshot_id>/verify', methods=['POST'])
+@login_required
+@admin_required
+def verify_backup(snapshot_id):
+    """校验备份完整性"""
+    try:
+        result = backup_manager.verify_backup(snapshot_id)
+        if not result['ok']:
+            return api_error('备份校验失败', 409, data=result)
+        return api_success(result)
+    except ValueError as e:
+        return api_error(str(e), 404)
+
+@admin_bp.route('/api/backups/prune', methods=['POST'])
+@login_required
+@admin_required
+def prune_backups():
+    """按保留策略清理旧备份"""
+    data = request.json or {}
+    result = backup_manager.prune_backups(
+        keep_last=int(data.get('keep_last', 7)),
+        keep_days=int(data.get('keep_days', 30))
+    )
+    return api_success(result)
+
+
+@admin_bp.route('/api/outbox')
+@login_required
+@admin_required
+def outbox_stats():
+    """邮件发件箱状态"""
+    return api_success({'enabled': mail_outbox.enabled, 'counts': mail_outbox.get_stats()})
+
+@admin_bp.route('/api/reconcile')
+@login_required
+@admin_required
+def reconcile_preview():
+    """数据库与用户文件的差异报告（不做修改）"""
+    return api_success(user_reconciler.reconcile(dry_run=True))
+
+@admin_bp.route('/api/reconcile', methods=['POST'])
+@login_required
+@admin_required
+def reconcile_apply():
+    """修复数据库与用户文件的差异（force 为 true 时不受删除数量保护限制）"""
+    force = bool((request.get_json(silent=True) or {}).get('force'))
+    return api_success(user_reconciler.reconcile(force=force))
+
+@admin_bp.route('/api/lifecycle')
+@login_required
+@admin_required
+def lifecycle_preview():
+    """按当前策略需要暂停、删除、提醒的用户（不做修改）"""
+    return api_success(dict(lifecycle_sweeper.sweep(dry_run=True), policy=lifecycle_sweeper.policy))
+
+@admin_bp.route('/api/lifecycle', methods=['POST'])
+@login_required
+@admin_required
+def lifecycle_apply():
+    """立即执行一次账户生命周期处理"""
+    return api_success(lifecycle_sweeper.sweep())
+
+@admin_bp.route('/api/profiler')
+@login_required
+@admin_required
+def profiler_status():
+    """性能分析状态和已保存的分析结果"""
+    return api_success(dict(request_profiler.status(), profiles=request_profiler.list_profiles()))
+
+@admin_bp.route('/api/profiler', methods=['POST'])
+@login_required
+@admin_required
+def profiler_start():
+    """全局采样 N 秒（单个请求的分析使用 X-Profile: 1 头或 ?_profile=1 参数）"""
+    seconds = int((request.json or {}).get('seconds', 30))
+    if not 1 <= seconds <= 300:
+        return api_error('采样时长必须在 1-300 秒之间')
+    return api_success(request_profiler.start_global(seconds))
+
+@admin_bp.route('/api/profiler/<profile_id>')
+@login_required
+@admin_required
+def profiler_download(profile_id):
+    """下载 folded stacks（flamegraph.pl / speedscope 格式）"""
+    path = request_profiler.profile_path(profile_id)
+    if path is None:
+        return api_error('分析结果不存在', 404)
+    return send_file(path, mimetype='text/plain', as_attachment=True,
+                     download_name=f'{profile_id}.folded')
+
+@admin_bp.route('/api/slow-requests')
+@login_required
+@admin_required
+def slow_requests():
+    """最近的慢请求记录"""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return api_success(request_profiler.recent_slow_requests(limit))
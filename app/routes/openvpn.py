@@ -1,71 +1,176 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, request
 from flask_login import login_required
 import subprocess
 import os
+import time
+from utils.api_response import api_success, api_error, versioned
+from utils.auth import admin_required
+from services import OPENVPN_DIR, connection_history, fleet_manager, pki_jobs, pki_manager
 
 openvpn_bp = Blueprint('openvpn', __name__, url_prefix='/api/openvpn')
 
+def _fan_out_response(results):
+    """多实例操作结果：任一实例失败时 success 为 false，data 中保留每个实例的结果"""
+    if all(r['ok'] for r in results.values()):
+        return api_success(results)
+    failed = [name for name, r in results.items() if not r['ok']]
+    return api_error(f"部分实例操作失败: {', '.join(failed)}", 502, data=results)
+
 @openvpn_bp.route('/status')
 @login_required
 def get_status():
-    """获取OpenVPN状态"""
+    """获取OpenVPN状态（汇总所有实例）"""
     try:
-        # 检查OpenVPN服务状态
-        result = subprocess.run(
-            ['systemctl', 'is-active', 'openvpn-server@server'],
-            capture_output=True, text=True
-        )
-        
-        status = 'active' if result.returncode == 0 else 'inactive'
-        
-        # 获取连接用户数
-        if status == 'active':
-            status_result = subprocess.run(
-                ['/opt/ovpn-ui/bin/openvpn', '--status', '/opt/ovpn-ui/logs/openvpn-status.log', '1'],
-                capture_output=True, text=True
-            )
-            connected_clients = len([line for line in status_result.stdout.split('\n') if line.startswith('CLIENT_LIST')])
-        else:
-            connected_clients = 0
-        
-        return jsonify({
-            'status': status,
-            'connected_clients': connected_clients
-        })
+        return api_success(fleet_manager.status())
     except Exception as e:
-        return jsonify({'status': 'error', 'error': str(e)})
+        return api_error(str(e), 500)
 
 @openvpn_bp.route('/restart', methods=['POST'])
 @login_required
+@admin_required
 def restart_service():
-    """重启OpenVPN服务"""
-    try:
-        subprocess.run(['systemctl', 'restart', 'openvpn-server@server'], check=True)
-        return jsonify({'success': True})
-    except subprocess.CalledProcessError as e:
-        return jsonify({'success': False, 'error': str(e)})
+    """重启OpenVPN服务（可通过 instances 参数指定实例）"""
+    names = (request.get_json(silent=True) or {}).get('instances')
+    return _fan_out_response(fleet_manager.restart(names))
 
-@openvpn_bp.route('/config', methods=['GET', 'POST'])
+@openvpn_bp.route('/sessions')
 @login_required
-def manage_config():
-    """管理OpenVPN配置"""
-    config_file = '/opt/ovpn-ui/config/openvpn/server.conf'
-    
-    if request.method == 'GET':
-        # 读取配置
-        try:
-            with open(config_file, 'r') as f:
-                config_content = f.read()
-            return jsonify({'config': config_content})
-        except FileNotFoundError:
-            return jsonify({'config': ''})
-    
-    elif request.method == 'POST':
-        # 保存配置
-        config_content = request.json.get('config', '')
+@admin_required
+def get_sessions():
+    """获取所有实例的在线会话"""
+    return api_success(fleet_manager.sessions())
+
+@openvpn_bp.route('/history')
+@login_required
+@admin_required
+def get_history():
+    """按时间范围查询连接事件（since/until 为 Unix 时间戳，可按 common_name 过滤）"""
+    since = request.args.get('since', int(time.time()) - 86400, type=int)
+    until = request.args.get('until', None, type=int)
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+    events = connection_history.get_events(since, until, request.args.get('common_name'), limit)
+    return api_success(events, total=len(events))
+
+@openvpn_bp.route('/history/<common_name>/sessions')
+@login_required
+@admin_required
+def get_user_history(common_name):
+    """查询用户最近若干天的会话"""
+    days = min(request.args.get('days', 90, type=int), connection_history.retention_days)
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+    sessions = connection_history.get_user_sessions(common_name, days, limit)
+    return api_success(sessions, total=len(sessions))
+
+@openvpn_bp.route('/instances', methods=['GET', 'PUT'])
+@login_required
+@admin_required
+def manage_instances():
+    """查看或更新实例注册表"""
+    if request.method == 'PUT':
+        instances = (request.json or {}).get('instances', [])
         try:
-            with open(config_file, 'w') as f:
-                f.write(config_content)
-            return jsonify({'success': True})
-        except Exception as e:
-            return jsonify({'success': False, 'error': str(e)})
\ No newline at end of file
+            fleet_manager.save_instances(instances)
+        except ValueError as e:
+            return api_error(str(e))
+    return api_success(fleet_manager.get_instances())
+
+@openvpn_bp.route('/instances/sync', methods=['POST'])
+@login_required
+@admin_required
+def sync_instances():
+    """同步用户文件到所有实例"""
+    names = (request.get_json(silent=True) or {}).get('instances')
+    return _fan_out_response(fleet_manager.sync_users(names))
+
+@openvpn_bp.route('/instances/push_config', methods=['POST'])
+@login_required
+@admin_required
+def push_instance_config():
+    """下发 server.conf 到所有实例"""
+    data = request.json or {}
+    config = data.get('config', '')
+    if not config:
+        return api_error('配置内容不能为空')
+    return _fan_out_response(fleet_manager.push_config(config, data.get('instances'), bool(data.get('restart'))))
+
+SERVER_CONFIG_FILE = os.path.join(OPENVPN_DIR, 'server.conf')
+
+def _config_version():
+    try:
+        st = os.stat(SERVER_CONFIG_FILE)
+        return f"config:{st.st_mtime_ns}:{st.st_size}"
+    except OSError:
+        return "config:missing"
+
+@openvpn_bp.route('/config', methods=['GET'])
+@login_required
+@admin_required
+@versioned(_config_version)
+def get_config():
+    """读取OpenVPN配置（文件未修改时返回 304）"""
+    try:
+        with open(SERVER_CONFIG_FILE, 'r') as f:
+            return api_success({'config': f.read()})
+    except FileNotFoundError:
+        return api_success({'config': ''})
+
+@openvpn_bp.route('/config', methods=['POST'])
+@login_required
+@admin_required
+def save_config():
+    """保存OpenVPN配置"""
+    config_content = (request.json or {}).get('config', '')
+    try:
+        with open(SERVER_CONFIG_FILE, 'w') as f:
+            f.write(config_content)
+        return api_success()
+    except Exception as e:
+        return api_error(str(e), 500)
+
+@openvpn_bp.route('/pki/certificates')
+@login_required
+@admin_required
+def list_certificates():
+    """查询即将到期的证书"""
+    days = request.args.get('expiring_days', 30, type=int)
+    limit = request.args.get('limit', 500, type=int)
+    return api_success({
+        'counts': pki_manager.count_certificates(),
+        'expiring': pki_manager.get_expiring(days, limit)
+    })
+
+@openvpn_bp.route('/pki/issue', methods=['POST'])
+@login_required
+@admin_required
+def issue_certificates():
+    """批量签发客户端证书（后台任务，返回任务ID）"""
+    names = (request.json or {}).get('common_names', [])
+    if not names:
+        return api_error('请提供证书CN列表')
+    return _submit_pki_job('issue', names=names)
+
+@openvpn_bp.route('/pki/renew', methods=['POST'])
+@login_required
+@admin_required
+def renew_certificates():
+    """批量续期即将到期的证书（后台任务，返回任务ID）"""
+    return _submit_pki_job('renew', days=int((request.json or {}).get('days', 30)))
+
+@openvpn_bp.route('/pki/jobs/<job_id>')
+@login_required
+@admin_required
+def get_pki_job(job_id):
+    """查询证书任务状态（running / done / failed）"""
+    job = pki_jobs.get(job_id)
+    if not job:
+        return api_error('任务不存在', 404)
+    return api_success(job)
+
+def _submit_pki_job(command, **kwargs):
+    try:
+        job_id = pki_jobs.submit(command, **kwargs)
+    except ValueError as e:
+        return api_error(str(e))
+    except RuntimeError as e:
+        return api_error(str(e), 409)
+    return api_success({'job_id': job_id}, status=202)
@@ -0,0 +1,32 @@
+import time
+from flask import Blueprint
+from flask_login import login_required
+from utils.api_response import api_success, api_error, versioned
+from utils.auth import admin_required
+from services import data_version, stats_service
+
+stats_bp = Blueprint('stats', __name__, url_prefix='/api/admin')
+
+def _stats_version():
+    # 计数随用户表变化；事件分桶按小时滚动，所以版本里带上当前小时
+    version = data_version.get('normal_user')
+    return version and f"{version}:{int(time.time()) // 3600}"
+
+@stats_bp.route('/stats')
+@login_required
+@admin_required
+@versioned(_stats_version)
+def get_stats():
+    """控制面板统计信息（读取物化计数，不扫描用户表）"""
+    try:
+        return api_success(stats_service.get_stats())
+    except Exception as e:
+        return api_error(str(e), 500)
+
+@stats_bp.route('/stats/reconcile', methods=['POST'])
+@login_required
+@admin_required
+def reconcile_stats():
+    """立即对账统计计数"""
+    drift = stats_service.reconcile()
+    return api_success({'drift': drift})
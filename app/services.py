@@ -0,0 +1,64 @@
+"""应用共享的服务实例
+
+目录由 OVPN_UI_*_DIR 环境变量决定，app.py 与各蓝图都从这里导入同一组实例，
+测试/基准环境设置环境变量后不会读写系统目录。
+"""
+import os
+
+from utils.account_lifecycle import ActivityTracker, LifecycleSweeper, load_lifecycle_config
+from utils.backup_manager import BackupManager, default_sources
+from utils.ccd_compiler import CCDCompiler, load_server_network
+from utils.connection_history import ConnectionHistory
+from utils.data_version import DataVersion
+from utils.fleet_manager import FleetManager
+from utils.log_viewer import LogViewer, load_log_config
+from utils.mail_outbox import MailOutbox, load_mail_config
+from utils.openvpn_manager import OpenVPNManager
+from utils.pki_manager import IssueJobRunner, PKIManager, load_pki_dir
+from utils.report_exporter import ReportExporter
+from utils.request_profiler import RequestProfiler
+from utils.revocation_manager import RevocationManager
+from utils.stats_service import StatsService
+from utils.user_reconciler import UserReconciler
+from utils.user_search import UserSearch
+
+# ==================== 目录 ====================
+INSTALL_DIR = os.environ.get("OVPN_UI_INSTALL_DIR", "/usr/local/ovpn-ui")
+CONFIG_DIR = os.environ.get("OVPN_UI_CONFIG_DIR", "/etc/ovpn-ui")
+LOG_DIR = os.environ.get("OVPN_UI_LOG_DIR", "/var/log/ovpn-ui")
+DATA_DIR = os.environ.get("OVPN_UI_DATA_DIR", "/var/lib/ovpn-ui")
+
+CONFIG_FILE = f"{CONFIG_DIR}/webui.json"
+DB_PATH = f"{DATA_DIR}/webui.db"
+OPENVPN_DIR = f"{CONFIG_DIR}/openvpn"
+
+# ==================== OpenVPN ====================
+ovpn_manager = OpenVPNManager(install_dir=INSTALL_DIR, config_dir=OPENVPN_DIR)
+fleet_manager = FleetManager(registry_file=f"{CONFIG_DIR}/instances.json", source_config_dir=OPENVPN_DIR)
+# CCD 中的固定地址从 server.conf 的子网中分配
+ccd_compiler = CCDCompiler(ovpn_manager, db_path=DB_PATH,
+                           network=load_server_network(f"{OPENVPN_DIR}/server.conf"))
+user_reconciler = UserReconciler(ovpn_manager, db_path=DB_PATH, ccd_compiler=ccd_compiler)
+connection_history = ConnectionHistory(db_path=f"{DATA_DIR}/history.db")
+
+# ==================== 证书 ====================
+pki_manager = PKIManager(load_pki_dir(CONFIG_FILE), db_path=DB_PATH)
+# 吊销后在所有实例上断开用户
+revocation_manager = RevocationManager(pki_manager, fleet_manager)
+pki_jobs = IssueJobRunner(pki_manager, revocation_manager)
+
+# ==================== 用户与数据 ====================
+mail_outbox = MailOutbox(db_path=DB_PATH, config=load_mail_config(CONFIG_FILE))
+data_version = DataVersion(DB_PATH)
+user_search = UserSearch(DB_PATH)
+stats_service = StatsService(DB_PATH)
+activity_tracker = ActivityTracker(DB_PATH)
+lifecycle_sweeper = LifecycleSweeper(ovpn_manager, revocation_manager, mail_outbox, activity_tracker,
+                                     db_path=DB_PATH, policy=load_lifecycle_config(CONFIG_FILE))
+report_exporter = ReportExporter(db_path=DB_PATH, connection_history=connection_history,
+                                 fleet_manager=fleet_manager)
+
+# ==================== 运维 ====================
+backup_manager = BackupManager(db_path=DB_PATH, sources=default_sources(INSTALL_DIR, CONFIG_DIR, DATA_DIR))
+request_profiler = RequestProfiler(log_dir=LOG_DIR)
+log_viewer = LogViewer(load_log_config(CONFIG_FILE, LOG_DIR))
@@ -0,0 +1,45 @@
+// 加载统计信息
+async function loadStats() {
+    try {
+        const response = await fetch('/api/admin/stats');
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.error);
+        }
+        const data = result.data;
+        
+        document.getElementById('total-users').textContent = data.total_users;
+        document.getElementById('pending-users').textContent = data.pending_users;
+        document.getElementById('approved-users').textContent = data.approved_users;
+    } catch (error) {
+        console.error('加载统计信息失败:', error);
+    }
+}
+
+// 检查OpenVPN状态
+async function checkOpenVPNStatus() {
+    try {
+        const response = await fetch('/api/openvpn/status');
+        const result = await response.json();
+        
+        const statusElement = document.getElementById('openvpn-status');
+        if (result.success) {
+            const status = result.data.status;
+            statusElement.textContent = status === 'active' ? '运行中' : '已停止';
+            statusElement.className = `stat-number ${status === 'active' ? 'status-active' : 'status-inactive'}`;
+        } else {
+            statusElement.textContent = '检查失败';
+            statusElement.className = 'stat-number status-error';
+        }
+    } catch (error) {
+        console.error('检查OpenVPN状态失败:', error);
+        document.getElementById('openvpn-status').textContent = '检查失败';
+        document.getElementById('openvpn-status').className = 'stat-number status-error';
+    }
+}
+
+// 页面加载时初始化
+document.addEventListener('DOMContentLoaded', function() {
+    loadStats();
+    checkOpenVPNStatus();
+});
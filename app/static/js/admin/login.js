@@ -0,0 +1,31 @@
+document.getElementById('loginForm').addEventListener('submit', async function(e) {
+    e.preventDefault();
+    
+    const formData = new FormData(this);
+    const data = {
+        username: formData.get('username'),
+        password: formData.get('password')
+    };
+    
+    try {
+        const response = await fetch('/admin/login', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(data)
+        });
+        
+        const result = await response.json();
+        
+        if (result.success) {
+            window.location.href = '/admin/dashboard';
+        } else {
+            document.getElementById('error-message').textContent = result.error || '登录失败';
+            document.getElementById('error-message').style.display = 'block';
+        }
+    } catch (error) {
+        document.getElementById('error-message').textContent = '网络错误，请重试';
+        document.getElementById('error-message').style.display = 'block';
+    }
+});
@@ -0,0 +1,132 @@
+// 获取OpenVPN状态
+function loadOpenVPNStatus() {
+    fetch('/api/openvpn/status')
+        .then(response => response.json())
+        .then(result => {
+            const statusDiv = document.getElementById('openvpn-status');
+            const restartBtn = document.getElementById('restart-openvpn');
+            
+            if (result.success) {
+                const data = result.data;
+                let statusClass = data.status === 'active' ? 'status-active' : 'status-inactive';
+                let statusText = data.status === 'active' ? '运行中' : '已停止';
+                let statusIcon = data.status === 'active' ? 'fa-check-circle' : 'fa-times-circle';
+                
+                statusDiv.innerHTML = `
+                    <div class="status-item">
+                        <i class="fas ${statusIcon} ${statusClass}"></i>
+                        <div>
+                            <div class="status-label">服务状态</div>
+                            <div class="status-value ${statusClass}">${statusText}</div>
+                        </div>
+                    </div>
+                    <div class="status-item">
+                        <i class="fas fa-users"></i>
+                        <div>
+                            <div class="status-label">连接客户端</div>
+                            <div class="status-value">${data.connected_clients}</div>
+                        </div>
+                    </div>
+                    <div class="status-item">
+                        <i class="fas fa-server"></i>
+                        <div>
+                            <div class="status-label">服务器运行</div>
+                            <div class="status-value">${data.server_running ? '是' : '否'}</div>
+                        </div>
+                    </div>
+                `;
+                
+                restartBtn.disabled = false;
+            } else {
+                statusDiv.innerHTML = `
+                    <div class="status-error">
+                        <i class="fas fa-exclamation-triangle"></i>
+                        <div>获取状态失败: ${result.error}</div>
+                    </div>
+                `;
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            document.getElementById('openvpn-status').innerHTML = `
+                <div class="status-error">
+                    <i class="fas fa-exclamation-triangle"></i>
+                    <div>获取状态时发生错误</div>
+                </div>
+            `;
+        });
+}
+
+// 重启OpenVPN服务
+document.getElementById('restart-openvpn').addEventListener('click', function() {
+    if (!confirm('确定要重启OpenVPN服务吗？这可能会中断现有连接。')) {
+        return;
+    }
+    
+    const originalText = this.innerHTML;
+    this.disabled = true;
+    this.innerHTML = '<i class="fas fa-spinner fa-spin"></i> 重启中...';
+    
+    fetch('/api/openvpn/restart', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            showNotification('OpenVPN服务重启成功', 'success');
+            loadOpenVPNStatus(); // 重新加载状态
+        } else {
+            showNotification('重启失败: ' + (data.error || '未知错误'), 'error');
+        }
+    })
+    .catch(error => {
+        showNotification('重启请求失败: ' + error, 'error');
+    })
+    .finally(() => {
+        this.disabled = false;
+        this.innerHTML = originalText;
+    });
+});
+
+// 显示配置信息
+function showConfigInfo() {
+    const configInfo = `
+服务器配置信息:
+
+• 配置文件: /etc/ovpn-ui/openvpn/server.conf
+• 客户端配置模板: /usr/local/ovpn-ui/config/openvpn/common-client.ovpn
+• 认证文件: /etc/ovpn-ui/openvpn/auth/users
+• CCD目录: /etc/ovpn-ui/openvpn/ccd/
+• 日志文件: /var/log/ovpn-ui/openvpn.log
+    `;
+    
+    alert(configInfo);
+}
+
+// 显示通知
+function showNotification(message, type) {
+    // 这里可以添加更美观的通知组件
+    const notification = document.createElement('div');
+    notification.className = `notification notification-${type}`;
+    notification.innerHTML = `
+        <i class="fas fa-${type === 'success' ? 'check' : 'exclamation-triangle'}"></i>
+        <span>${message}</span>
+    `;
+    
+    document.body.appendChild(notification);
+    
+    setTimeout(() => {
+        notification.remove();
+    }, 3000);
+}
+
+// 页面加载时获取状态
+document.addEventListener('DOMContentLoaded', function() {
+    loadOpenVPNStatus();
+    
+    // 每30秒自动更新状态
+    setInterval(loadOpenVPNStatus, 30000);
+});
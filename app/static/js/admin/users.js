@@ -0,0 +1,537 @@
+// 手动创建用户功能
+document.getElementById('createUserForm').addEventListener('submit', async function(e) {
+    e.preventDefault();
+    
+    const formData = new FormData(this);
+    const data = {
+        username: formData.get('username'),
+        email: formData.get('email'),
+        password: formData.get('password')  // 只保留密码字段
+    };
+    
+    // 验证密码
+    if (!data.password) {
+        showCreateUserMessage('请输入登录密码', 'error');
+        return;
+    }
+    
+    const submitBtn = this.querySelector('button[type="submit"]');
+    submitBtn.disabled = true;
+    submitBtn.textContent = '创建中...';
+    
+    try {
+        const response = await fetch('/api/users/create', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(data)
+        });
+        
+        const result = await response.json();
+        
+        if (result.success) {
+            showCreateUserMessage(result.message || '用户创建成功', 'success');
+            this.reset();
+            // 刷新用户列表
+            loadPendingUsers();
+            loadApprovedUsers();
+            loadAllUsers();
+        } else {
+            showCreateUserMessage('创建失败: ' + result.error, 'error');
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        showCreateUserMessage('创建请求失败', 'error');
+    } finally {
+        submitBtn.disabled = false;
+        submitBtn.textContent = '创建用户';
+    }
+});
+
+function showCreateUserMessage(message, type) {
+    const messageDiv = document.getElementById('createUserMessage');
+    messageDiv.textContent = message;
+    messageDiv.className = `message message-${type}`;
+    messageDiv.style.display = 'block';
+    
+    // 3秒后自动隐藏成功消息
+    if (type === 'success') {
+        setTimeout(() => {
+            messageDiv.style.display = 'none';
+        }, 3000);
+    }
+}
+
+// 标签页切换功能
+function showTab(tabName) {
+    // 隐藏所有标签内容
+    document.querySelectorAll('.tab-content').forEach(tab => {
+        tab.classList.remove('active');
+    });
+    
+    // 移除所有标签按钮的active类
+    document.querySelectorAll('.tab-btn').forEach(btn => {
+        btn.classList.remove('active');
+    });
+    
+    // 显示选中的标签内容
+    document.getElementById(`${tabName}-tab`).classList.add('active');
+    
+    // 激活选中的标签按钮
+    event.target.classList.add('active');
+    
+    // 加载对应的用户数据
+    switch(tabName) {
+        case 'pending':
+            loadPendingUsers();
+            break;
+        case 'approved':
+            loadApprovedUsers();
+            break;
+        case 'all':
+            loadAllUsers();
+            break;
+    }
+}
+
+// 加载待审核用户
+function loadPendingUsers() {
+    fetch('/api/users/pending')
+        .then(response => response.json())
+        .then(users => {
+            const container = document.getElementById('pending-users-list');
+            container.innerHTML = '';
+            
+            if (users.length === 0) {
+                container.innerHTML = '<div class="no-users">暂无待审核用户</div>';
+                return;
+            }
+            
+            users.forEach(user => {
+                const userElement = createUserElement(user, 'pending');
+                container.appendChild(userElement);
+            });
+        })
+        .catch(error => {
+            console.error('Error loading pending users:', error);
+            document.getElementById('pending-users-list').innerHTML = 
+                '<div class="error">加载失败</div>';
+        });
+}
+
+// 加载已开通用户
+function loadApprovedUsers() {
+    fetch('/api/users/list')
+        .then(response => response.json())
+        .then(data => {
+            const container = document.getElementById('approved-users-list');
+            container.innerHTML = '';
+            
+            if (!data.success) {
+                container.innerHTML = '<div class="error">加载失败: ' + data.error + '</div>';
+                return;
+            }
+            
+            const approvedUsers = data.users.filter(user => user.status === 'approved');
+            
+            if (approvedUsers.length === 0) {
+                container.innerHTML = '<div class="no-users">暂无已开通用户</div>';
+                return;
+            }
+            
+            approvedUsers.forEach(user => {
+                const userElement = createUserElement(user, 'approved');
+                container.appendChild(userElement);
+            });
+        })
+        .catch(error => {
+            console.error('Error loading approved users:', error);
+            document.getElementById('approved-users-list').innerHTML = 
+                '<div class="error">加载失败</div>';
+        });
+}
+
+// 加载所有用户
+function loadAllUsers() {
+    fetch('/api/users/list')
+        .then(response => response.json())
+        .then(data => {
+            const container = document.getElementById('all-users-list');
+            container.innerHTML = '';
+            
+            if (!data.success) {
+                container.innerHTML = '<div class="error">加载失败: ' + data.error + '</div>';
+                return;
+            }
+            
+            if (data.users.length === 0) {
+                container.innerHTML = '<div class="no-users">暂无用户</div>';
+                return;
+            }
+            
+            data.users.forEach(user => {
+                const userElement = createUserElement(user, 'all');
+                container.appendChild(userElement);
+            });
+        })
+        .catch(error => {
+            console.error('Error loading all users:', error);
+            document.getElementById('all-users-list').innerHTML = 
+                '<div class="error">加载失败</div>';
+        });
+}
+
+// 创建用户元素
+function createUserElement(user, listType) {
+    const userDiv = document.createElement('div');
+    userDiv.className = 'user-card';
+    userDiv.innerHTML = `
+        <div class="user-info">
+            <div class="user-main">
+                <h4>${user.username}</h4>
+                <span class="user-email">${user.email}</span>
+            </div>
+            <div class="user-details">
+                <span class="status-badge status-${user.status}">${getStatusText(user.status)}</span>
+                ${user.ovpn_username ? `<span class="ovpn-username">OpenVPN: ${user.ovpn_username}</span>` : ''}
+                ${user.max_devices ? `<span class="max-devices">最大设备: ${user.max_devices}</span>` : ''}
+                <span class="create-time">注册: ${new Date(user.created_at).toLocaleDateString()}</span>
+            </div>
+        </div>
+        <div class="user-actions">
+            ${listType === 'pending' ? `
+                <button class="btn-success" onclick="openApproveModal(${user.id}, '${user.username}', '${user.email}')">审核开通</button>
+                <button class="btn-danger" onclick="rejectUser(${user.id})">拒绝</button>
+            ` : ''}
+            ${listType === 'approved' || listType === 'all' ? `
+                <button class="btn-info" onclick="openUserActions(${user.id}, '${user.username}', '${user.status}')">管理</button>
+            ` : ''}
+        </div>
+    `;
+    return userDiv;
+}
+
+// 用户搜索（输入时实时搜索，服务端返回已转义的高亮片段）
+let searchTimer = null;
+let searchController = null;
+
+document.getElementById('user-search-input').addEventListener('input', function() {
+    clearTimeout(searchTimer);
+    const query = this.value.trim();
+    searchTimer = setTimeout(() => searchUsers(query), 150);
+});
+
+async function searchUsers(query) {
+    const container = document.getElementById('user-search-results');
+    // 取消上一次未完成的请求，避免旧结果覆盖新结果
+    if (searchController) {
+        searchController.abort();
+    }
+    if (!query) {
+        container.style.display = 'none';
+        container.innerHTML = '';
+        return;
+    }
+
+    searchController = new AbortController();
+    try {
+        const response = await fetch(`/admin/api/users/search?q=${encodeURIComponent(query)}`, {
+            signal: searchController.signal
+        });
+        const result = await response.json();
+        container.innerHTML = '';
+        container.style.display = 'block';
+
+        if (!result.success) {
+            container.innerHTML = '<div class="error">搜索失败</div>';
+            return;
+        }
+        if (result.data.length === 0) {
+            container.innerHTML = '<div class="no-users">没有匹配的用户</div>';
+            return;
+        }
+
+        result.data.forEach(user => {
+            const userElement = createUserElement(user, user.status === 'pending' ? 'pending' : 'all');
+            if (user.highlight.username) {
+                userElement.querySelector('h4').innerHTML = user.highlight.username;
+            }
+            if (user.highlight.email) {
+                userElement.querySelector('.user-email').innerHTML = user.highlight.email;
+            }
+            container.appendChild(userElement);
+        });
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Error searching users:', error);
+        }
+    }
+}
+
+// 获取状态文本
+function getStatusText(status) {
+    const statusMap = {
+        'pending': '待审核',
+        'approved': '已开通',
+        'rejected': '已拒绝'
+    };
+    return statusMap[status] || status;
+}
+
+// 打开审核模态框
+function openApproveModal(userId, username, email) {
+    document.getElementById('approve-user-id').value = userId;
+    document.getElementById('approve-username').textContent = username;
+    document.getElementById('approve-email').textContent = email;
+    document.getElementById('ovpn-username').value = username.toLowerCase().replace(/[^a-z0-9]/g, '_');
+    document.getElementById('approve-modal').style.display = 'block';
+}
+
+// 关闭审核模态框
+function closeApproveModal() {
+    document.getElementById('approve-modal').style.display = 'none';
+    document.getElementById('approve-form').reset();
+}
+
+// 提交审核表单
+document.getElementById('approve-form').addEventListener('submit', function(e) {
+    e.preventDefault();
+    
+    const userId = document.getElementById('approve-user-id').value;
+    
+    const data = {
+        ovpn_username: document.getElementById('ovpn-username').value,
+        max_devices: parseInt(document.getElementById('max-devices').value) || 2
+    };
+    
+    fetch(`/api/users/${userId}/approve`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(data)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            alert('用户开通成功');
+            closeApproveModal();
+            loadPendingUsers();
+            loadApprovedUsers();
+            loadAllUsers();
+        } else {
+            alert('开通失败: ' + data.error);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('开通请求失败');
+    });
+});
+
+// 拒绝用户
+function rejectUser(userId) {
+    if (!confirm('确定要拒绝此用户的申请吗？')) {
+        return;
+    }
+    
+    fetch(`/api/users/${userId}/reject`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            alert('用户已拒绝');
+            loadPendingUsers();
+            loadAllUsers();
+        } else {
+            alert('操作失败: ' + data.error);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('操作请求失败');
+    });
+}
+
+// 打开用户操作模态框
+function openUserActions(userId, username, status) {
+    document.getElementById('action-user-id').value = userId;
+    document.getElementById('action-username').textContent = username;
+    document.getElementById('action-status').textContent = getStatusText(status);
+    document.getElementById('user-actions-modal').style.display = 'block';
+    
+    // 加载用户当前的最大设备数
+    loadUserMaxDevices(userId);
+}
+
+// 加载用户最大设备数
+function loadUserMaxDevices(userId) {
+    fetch(`/api/users/${userId}/details`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                document.getElementById('action-max-devices').value = data.user.max_devices || 2;
+            } else {
+                document.getElementById('action-max-devices').value = 2;
+            }
+        })
+        .catch(error => {
+            console.error('Error loading user details:', error);
+            document.getElementById('action-max-devices').value = 2;
+        });
+}
+
+// 更新最大设备数
+function updateMaxDevices() {
+    const userId = document.getElementById('action-user-id').value;
+    const maxDevices = parseInt(document.getElementById('action-max-devices').value);
+    const username = document.getElementById('action-username').textContent;
+    
+    if (!maxDevices || maxDevices < 1 || maxDevices > 10) {
+        alert('请输入1-10之间的有效设备数');
+        return;
+    }
+    
+    fetch(`/api/users/${userId}/update_max_devices`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            max_devices: maxDevices
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            alert('最大设备数更新成功');
+            // 刷新用户列表以显示更新后的信息
+            loadApprovedUsers();
+            loadAllUsers();
+        } else {
+            alert('更新失败: ' + data.error);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('更新请求失败');
+    });
+}
+
+// 关闭用户操作模态框
+function closeUserActionsModal() {
+    document.getElementById('user-actions-modal').style.display = 'none';
+    hideResetPasswordForm();
+}
+
+// 生成下载链接
+function generateDownloadLink() {
+    const userId = document.getElementById('action-user-id').value;
+    const username = document.getElementById('action-username').textContent;
+    
+    fetch(`/api/users/${username}/generate_download`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            // 显示下载链接模态框
+            document.getElementById('download-link').href = data.download_url;
+            document.getElementById('download-link').textContent = data.download_url;
+            document.getElementById('expires-at').textContent = new Date(data.expires_at).toLocaleString();
+            document.getElementById('user-actions-modal').style.display = 'none';
+            document.getElementById('download-modal').style.display = 'block';
+        } else {
+            alert('生成下载链接失败: ' + data.error);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('生成下载链接请求失败');
+    });
+}
+
+// 关闭下载模态框
+function closeDownloadModal() {
+    document.getElementById('download-modal').style.display = 'none';
+}
+
+// 显示重置密码表单
+function showResetPasswordForm() {
+    document.getElementById('reset-password-form').style.display = 'block';
+}
+
+// 隐藏重置密码表单
+function hideResetPasswordForm() {
+    document.getElementById('reset-password-form').style.display = 'none';
+    document.getElementById('new-password').value = '';
+    document.getElementById('confirm-new-password').value = '';
+}
+
+// 重置密码
+function resetPassword() {
+    const newPassword = document.getElementById('new-password').value;
+    const confirmPassword = document.getElementById('confirm-new-password').value;
+    const username = document.getElementById('action-username').textContent;
+    
+    if (!newPassword || !confirmPassword) {
+        alert('请输入新密码和确认密码');
+        return;
+    }
+    
+    if (newPassword !== confirmPassword) {
+        alert('两次输入的密码不一致');
+        return;
+    }
+    
+    // 这里需要调用重置密码的API
+    alert('重置密码功能待实现 - 用户名: ' + username + ', 新密码: ' + newPassword);
+}
+
+// 删除用户
+function deleteUser() {
+    const userId = document.getElementById('action-user-id').value;
+    const username = document.getElementById('action-username').textContent;
+    
+    if (!confirm(`确定要删除用户 "${username}" 吗？此操作不可撤销！`)) {
+        return;
+    }
+    
+    fetch(`/api/users/${userId}/delete`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            alert('用户删除成功');
+            closeUserActionsModal();
+            loadPendingUsers();
+            loadApprovedUsers();
+            loadAllUsers();
+        } else {
+            alert('删除失败: ' + data.error);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('删除请求失败');
+    });
+}
+
+// 页面加载时初始化
+document.addEventListener('DOMContentLoaded', function() {
+    loadPendingUsers();
+    
+    // 删除自动填充OpenVPN用户名字段的代码，因为不再需要
+});
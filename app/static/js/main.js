@@ -68,8 +68,12 @@ function showTab(tabName) {
 // 加载标签数据
 async function loadTabData(tabName) {
     try {
-        const response = await fetch('/api/users');
-        const users = await response.json();
+        const response = await fetch('/admin/api/users');
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.error);
+        }
+        const users = result.data;
         
         let filteredUsers = users;
         if (tabName === 'pending') {
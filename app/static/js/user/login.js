@@ -0,0 +1,46 @@
+document.getElementById('loginForm').addEventListener('submit', async function(e) {
+    e.preventDefault();
+    
+    const submitBtn = this.querySelector('button[type="submit"]');
+    const messageDiv = document.getElementById('message');
+    
+    const formData = {
+        username: document.getElementById('username').value,
+        password: document.getElementById('password').value
+    };
+    
+    submitBtn.disabled = true;
+    submitBtn.textContent = '登录中...';
+    
+    try {
+        const response = await fetch('/user/login', {
+            method: 'POST',
+            credentials: 'include',    // ★ 必须加
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(formData)
+        });
+        
+        const result = await response.json();
+        
+        if (result.success) {
+            window.location.href = '/user/profile';
+        } else {
+            showMessage('登录失败: ' + result.error, 'error');
+        }
+    } catch (error) {
+        showMessage('登录请求失败，请稍后重试', 'error');
+    } finally {
+        submitBtn.disabled = false;
+        submitBtn.textContent = '登录';
+    }
+});
+
+
+function showMessage(message, type) {
+    const messageDiv = document.getElementById('message');
+    messageDiv.textContent = message;
+    messageDiv.className = type === 'success' ? 'success-message' : 'error-message';
+    messageDiv.style.display = 'block';
+}
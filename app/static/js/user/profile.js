@@ -0,0 +1,158 @@
+// 显示修改密码模态框
+function showChangePasswordModal() {
+    document.getElementById('change-password-modal').style.display = 'block';
+}
+
+// 关闭修改密码模态框
+function closeChangePasswordModal() {
+    document.getElementById('change-password-modal').style.display = 'none';
+    document.getElementById('change-password-form').reset();
+}
+
+// 关闭下载模态框
+function closeDownloadModal() {
+    document.getElementById('download-modal').style.display = 'none';
+}
+
+// 修改OpenVPN密码
+document.getElementById('change-password-form').addEventListener('submit', function(e) {
+    e.preventDefault();
+    
+    var newPassword = document.getElementById('new-ovpn-password').value;
+    var confirmPassword = document.getElementById('confirm-ovpn-password').value;
+    
+    if (!newPassword || !confirmPassword) {
+        showMessage('请填写新密码和确认密码', 'danger');
+        return;
+    }
+    
+    if (newPassword !== confirmPassword) {
+        showMessage('两次输入的密码不一致', 'danger');
+        return;
+    }
+    
+    if (newPassword.length < 6) {
+        showMessage('密码长度至少6位', 'danger');
+        return;
+    }
+    
+    fetch('/user/change_ovpn_password', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            new_password: newPassword,
+            confirm_password: confirmPassword
+        })
+    })
+    .then(function(response) {
+        return response.json();
+    })
+    .then(function(data) {
+        if (data.success) {
+            showMessage(data.message || 'OpenVPN密码修改成功', 'success');
+            closeChangePasswordModal();
+        } else {
+            showMessage('修改失败: ' + data.error, 'danger');
+        }
+    })
+    .catch(function(error) {
+        console.error('Error:', error);
+        showMessage('修改请求失败，请稍后重试', 'danger');
+    });
+});
+
+// 生成配置文件
+function generateConfig() {
+    var username = document.getElementById('user-username').textContent;
+    
+    fetch('/api/users/' + username + '/generate_download', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    })
+    .then(function(response) {
+        return response.json();
+    })
+    .then(function(data) {
+        if (data.success) {
+            // 显示下载链接模态框
+            document.getElementById('download-link').href = data.download_url;
+            document.getElementById('download-link').textContent = data.download_url;
+            document.getElementById('expires-at').textContent = new Date(data.expires_at).toLocaleString();
+            document.getElementById('download-modal').style.display = 'block';
+        } else {
+            showMessage('生成配置文件失败: ' + data.error, 'danger');
+        }
+    })
+    .catch(function(error) {
+        console.error('Error:', error);
+        showMessage('生成配置文件请求失败', 'danger');
+    });
+}
+
+// 显示消息
+function showMessage(message, type) {
+    var messageDiv = document.getElementById('message');
+    messageDiv.textContent = message;
+    messageDiv.className = 'alert alert-' + type;
+    messageDiv.style.display = 'block';
+    
+    // 3秒后自动隐藏成功消息
+    if (type === 'success') {
+        setTimeout(function() {
+            messageDiv.style.display = 'none';
+        }, 3000);
+    }
+}
+
+// 加载连接状态
+function loadConnectionStatus() {
+    fetch('/user/connection_status')
+        .then(function(response) {
+            return response.json();
+        })
+        .then(function(data) {
+            var statusDiv = document.getElementById('connection-status');
+            if (data.success) {
+                if (data.connected) {
+                    statusDiv.innerHTML = '<div class="alert alert-success">' +
+                        '<i class="fas fa-check-circle"></i>' +
+                        '当前状态: <strong>已连接</strong>' +
+                        '<br>' +
+                        '<small>连接时间: ' + (data.connected_since || '未知') + '</small>' +
+                        '<br>' +
+                        '<small>客户端IP: ' + (data.client_ip || '未知') + '</small>' +
+                        '</div>';
+                } else {
+                    statusDiv.innerHTML = '<div class="alert alert-secondary">' +
+                        '<i class="fas fa-times-circle"></i>' +
+                        '当前状态: <strong>未连接</strong>' +
+                        '</div>';
+                }
+            } else {
+                statusDiv.innerHTML = '<div class="alert alert-warning">' +
+                    '<i class="fas fa-exclamation-triangle"></i>' +
+                    '无法获取连接状态: ' + (data.error || '未知错误') +
+                    '</div>';
+            }
+        })
+        .catch(function(error) {
+            console.error('Error loading connection status:', error);
+            document.getElementById('connection-status').innerHTML = 
+                '<div class="alert alert-danger">' +
+                '<i class="fas fa-exclamation-triangle"></i>' +
+                '获取连接状态失败，请刷新页面重试' +
+                '</div>';
+        });
+}
+
+// 页面加载时初始化
+document.addEventListener('DOMContentLoaded', function() {
+    // 加载连接状态（连接状态卡片只在用户已开通时渲染）
+    if (document.getElementById('connection-status')) {
+        loadConnectionStatus();
+    }
+});
@@ -0,0 +1,77 @@
+document.getElementById('registerForm').addEventListener('submit', async function(e) {
+    e.preventDefault();
+    
+    const submitBtn = this.querySelector('button[type="submit"]');
+    const messageDiv = document.getElementById('message');
+    
+    // 获取表单数据
+    const formData = {
+        username: document.getElementById('username').value,
+        email: document.getElementById('email').value,
+        password: document.getElementById('password').value,
+        password_confirm: document.getElementById('password_confirm').value
+    };
+    
+    // 验证输入
+    if (!formData.username || !formData.email || !formData.password || !formData.password_confirm) {
+        showMessage('请填写所有必填字段', 'error');
+        return;
+    }
+    
+    if (formData.password !== formData.password_confirm) {
+        showMessage('两次输入的密码不一致', 'error');
+        return;
+    }
+    
+    if (formData.password.length < 6) {
+        showMessage('密码长度至少6位', 'error');
+        return;
+    }
+    
+    // 禁用提交按钮
+    submitBtn.disabled = true;
+    submitBtn.textContent = '注册中...';
+    
+    try {
+        const response = await fetch('/register', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(formData)
+        });
+        
+        const result = await response.json();
+        
+        if (result.success) {
+            showMessage('注册成功！请等待管理员审核。', 'success');
+            this.reset();
+            // 3秒后跳转到登录页面
+            setTimeout(() => {
+                window.location.href = '/user/login';
+            }, 3000);
+        } else {
+            showMessage('注册失败: ' + result.error, 'error');
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        showMessage('注册请求失败，请稍后重试', 'error');
+    } finally {
+        submitBtn.disabled = false;
+        submitBtn.textContent = '注册';
+    }
+});
+
+function showMessage(message, type) {
+    const messageDiv = document.getElementById('message');
+    messageDiv.textContent = message;
+    messageDiv.className = type === 'success' ? 'success-message' : 'error-message';
+    messageDiv.style.display = 'block';
+    
+    // 3秒后自动隐藏成功消息
+    if (type === 'success') {
+        setTimeout(() => {
+            messageDiv.style.display = 'none';
+        }, 3000);
+    }
+}
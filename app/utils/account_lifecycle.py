@@ -0,0 +1,385 @@
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 旧数据库中缺少的列（新安装由 db.create_all 按 models.py 创建）
+LIFECYCLE_COLUMNS = {
+    "last_login_at": "DATETIME",
+    "last_connect_at": "DATETIME",
+    "expires_at": "DATETIME",
+    "expiry_notified_at": "DATETIME",
+}
+
+LIFECYCLE_INDEXES = """
+CREATE INDEX IF NOT EXISTS ix_{table}_ovpn_username ON {table} (ovpn_username);
+CREATE INDEX IF NOT EXISTS ix_{table}_expires_at ON {table} (expires_at) WHERE expires_at IS NOT NULL;
+"""
+
+DEFAULT_POLICY = {
+    "enabled": True,
+    "notify_days": 7,                 # 到期前多少天发送提醒邮件
+    "expired_delete_after_days": 0,   # 过期多少天后删除（0 表示只暂停不删除）
+    "dormant_days": 0,                # 多少天没有登录和连接视为闲置（0 表示不处理闲置账户）
+    "dormant_action": "suspend",      # 闲置账户的处理方式：suspend / delete
+}
+
+
+def load_lifecycle_config(config_file: str = "/etc/ovpn-ui/webui.json") -> Dict[str, Any]:
+    """读取 webui.json 中的 lifecycle 配置段"""
+    try:
+        with open(config_file, "r") as f:
+            return dict(DEFAULT_POLICY, **json.load(f).get("lifecycle", {}))
+    except (OSError, ValueError):
+        return dict(DEFAULT_POLICY)
+
+
+def install_columns(db_path: str, table: str = "normal_user") -> bool:
+    """为已有数据库补充生命周期相关的列和索引"""
+    try:
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in LIFECYCLE_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            conn.executescript(LIFECYCLE_INDEXES.format(table=table))
+            conn.commit()
+        finally:
+            conn.close()
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"安装账户生命周期字段失败: {e}")
+        return False
+
+
+def account_active(status: Optional[str], expires_at: Optional[datetime],
+                   now: Optional[datetime] = None) -> bool:
+    """账户是否允许连接 VPN：已审核通过且未过期（expires_at 为 UTC，不带时区）"""
+    if status != "approved":
+        return False
+    if expires_at is None:
+        return True
+    now = now or datetime.now(timezone.utc)
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at > now
+
+
+class ActivityTracker:
+    """最后登录 / 最后连接时间（写合并）
+
+    登录和 VPN 连接事件只更新内存中的字典（同一用户多次活动只保留最新时间），
+    后台线程每 flush_interval 秒在一个事务中批量写入，不会为每次登录或连接增加一次 SQLite 写入。
+    进程异常退出最多丢失一个周期内的活动时间，对闲置判断没有影响。
+    """
+
+    def __init__(self, db_path: str = "/var/lib/ovpn-ui/webui.db", table: str = "normal_user",
+                 flush_interval: float = 60.0):
+        self.db_path = db_path
+        self.table = table
+        self.flush_interval = flush_interval
+
+        self._logins: Dict[int, float] = {}
+        self._connects: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def install(self) -> bool:
+        return install_columns(self.db_path, self.table)
+
+    def touch_login(self, user_id: int, ts: Optional[float] = None):
+        ts = ts or time.time()
+        with self._lock:
+            if ts > self._logins.get(user_id, 0):
+                self._logins[user_id] = ts
+
+    def touch_connect(self, common_name: str, ts: Optional[float] = None):
+        ts = ts or time.time()
+        with self._lock:
+            if ts > self._connects.get(common_name, 0):
+                self._connects[common_name] = ts
+
+    def on_connection_event(self, event: Dict[str, Any]):
+        """ConnectionHistory 监听器：连接和断开都算作 VPN 活动"""
+        try:
+            ts = float(event.get("ts") or time.time())
+        except (TypeError, ValueError):
+            ts = time.time()
+        self.touch_connect(str(event["common_name"]), ts)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._logins) + len(self._connects)
+
+    def flush(self) -> int:
+        """写入缓冲的活动时间，返回写入的用户数"""
+        with self._lock:
+            logins, self._logins = self._logins, {}
+            connects, self._connects = self._connects, {}
+        if not logins and not connects:
+            return 0
+
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                with conn:
+                    # 只会把时间往后推（多进程或重放的旧事件不会覆盖较新的时间）
+                    conn.executemany(
+                        f"UPDATE {self.table} SET last_login_at = ? WHERE id = ? "
+                        f"AND (last_login_at IS NULL OR last_login_at < ?)",
+                        [(_db_time(ts), user_id, _db_time(ts)) for user_id, ts in logins.items()]
+                    )
+                    conn.executemany(
+                        f"UPDATE {self.table} SET last_connect_at = ? WHERE ovpn_username = ? "
+                        f"AND (last_connect_at IS NULL OR last_connect_at < ?)",
+                        [(_db_time(ts), name, _db_time(ts)) for name, ts in connects.items()]
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"写入用户活动时间失败，下次重试: {e}")
+            with self._lock:
+                for user_id, ts in logins.items():
+                    self._logins[user_id] = max(ts, self._logins.get(user_id, 0))
+                for name, ts in connects.items():
+                    self._connects[name] = max(ts, self._connects.get(name, 0))
+            return 0
+        return len(logins) + len(connects)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.wait(self.flush_interval):
+                self.flush()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="activity-tracker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+
+class LifecycleSweeper:
+    """账户生命周期定时处理
+
+    每次处理按策略一次性找出所有需要处理的用户：
+    - 已过期（expires_at 已到）的已开通用户：暂停
+    - 过期超过 expired_delete_after_days 天的用户：删除
+    - 超过 dormant_days 天没有登录和 VPN 活动的用户：暂停或删除
+    - notify_days 天内到期的用户：发送提醒邮件（每个到期时间只提醒一次）
+
+    数据库修改在一个事务中完成；随后删除用户的凭据和 CCD 文件批量删除、暂停用户的凭据批量锁定
+    （auth/users 各只重写一次），证书吊销的 CRL 发布由 RevocationManager 合并为一次。
+    """
+
+    def __init__(self, ovpn_manager, revocation_manager=None, mail_outbox=None,
+                 activity_tracker: Optional[ActivityTracker] = None,
+                 db_path: str = "/var/lib/ovpn-ui/webui.db", table: str = "normal_user",
+                 policy: Optional[Dict[str, Any]] = None):
+        self.ovpn_manager = ovpn_manager
+        self.revocation_manager = revocation_manager
+        self.mail_outbox = mail_outbox
+        self.activity_tracker = activity_tracker
+        self.db_path = db_path
+        self.table = table
+        self.policy = policy if policy is not None else load_lifecycle_config()
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    # ==================== 处理 ====================
+    def plan(self, now: Optional[datetime] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """找出需要处理的用户（不做修改）"""
+        now = now or datetime.now(timezone.utc)
+        policy = self.policy
+        columns = "id, username, email, status, ovpn_username, expires_at"
+        plan: Dict[str, List[Dict[str, Any]]] = {"suspend": [], "delete": [], "notify": []}
+        seen = set()
+
+        def add(action, rows, reason):
+            for row in rows:
+                if row["id"] not in seen:
+                    seen.add(row["id"])
+                    plan[action].append(dict(row, reason=reason))
+
+        with self._connect() as conn:
+            delete_after = int(policy.get("expired_delete_after_days") or 0)
+            if delete_after:
+                add("delete", conn.execute(
+                    f"SELECT {columns} FROM {self.table} WHERE expires_at <= ?",
+                    (_db_time(now - timedelta(days=delete_after)),)
+                ), "expired")
+
+            add("suspend", conn.execute(
+                f"SELECT {columns} FROM {self.table} WHERE expires_at <= ? AND status = 'approved'",
+                (_db_time(now),)
+            ), "expired")
+
+            dormant_days = int(policy.get("dormant_days") or 0)
+            if dormant_days:
+                action = "delete" if policy.get("dormant_action") == "delete" else "suspend"
+                statuses = ("approved", "suspended") if action == "delete" else ("approved",)
+                # 最后活动时间取登录、VPN活动、开通、注册时间中最晚的一个
+                add(action, conn.execute(
+                    f"SELECT {columns} FROM {self.table} "
+                    f"WHERE status IN ({', '.join('?' for _ in statuses)}) "
+                    f"AND max(coalesce(last_login_at, ''), coalesce(last_connect_at, ''), "
+                    f"coalesce(approved_at, ''), coalesce(created_at, '')) <= ?",
+                    statuses + (_db_time(now - timedelta(days=dormant_days)),)
+                ), "dormant")
+
+            # 修改到期时间时会清空 expiry_notified_at，新的到期时间会重新提醒
+            notify_days = int(policy.get("notify_days") or 0)
+            if notify_days:
+                add("notify", conn.execute(
+                    f"SELECT {columns} FROM {self.table} "
+                    f"WHERE expires_at > ? AND expires_at <= ? AND status = 'approved' "
+                    f"AND expiry_notified_at IS NULL",
+                    (_db_time(now), _db_time(now + timedelta(days=notify_days)))
+                ), "expiring")
+        return plan
+
+    def sweep(self, dry_run: bool = False) -> Dict[str, Any]:
+        """执行一次生命周期处理；dry_run 时只返回计划"""
+        started = time.monotonic()
+        if not self.policy.get("enabled", True):
+            return {"enabled": False}
+
+        # 先写入缓冲中的活动时间，避免刚登录的用户被判定为闲置
+        if self.activity_tracker and not dry_run:
+            self.activity_tracker.flush()
+        now = datetime.now(timezone.utc)
+        plan = self.plan(now)
+        report: Dict[str, Any] = {"dry_run": dry_run, "plan": plan,
+                                  "counts": {k: len(v) for k, v in plan.items()}}
+        if not dry_run and any(plan.values()):
+            self._apply(plan, now)
+
+        report["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+        if not dry_run and any(plan.values()):
+            logger.info(f"账户生命周期处理: {report['counts']}")
+        self.last_report = report
+        return report
+
+    def _apply(self, plan: Dict[str, List[Dict[str, Any]]], now: datetime):
+        suspend_ids = [u["id"] for u in plan["suspend"]]
+        delete_ids = [u["id"] for u in plan["delete"]]
+        notify_ids = [u["id"] for u in plan["notify"]]
+
+        # 1. 数据库：一个事务
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for sql, ids in (
+                (f"UPDATE {self.table} SET status = 'suspended' WHERE id = ?", suspend_ids),
+                (f"DELETE FROM {self.table} WHERE id = ?", delete_ids),
+                (f"UPDATE {self.table} SET expiry_notified_at = '{_db_time(now)}' WHERE id = ?", notify_ids),
+            ):
+                conn.executemany(sql, [(i,) for i in ids])
+
+        # 2. OpenVPN：删除的用户一次性移除凭据和CCD；暂停的用户一次性锁定凭据（与管理员暂停相同），
+        #    证书挂起并断开在线会话，重新激活时恢复
+        deleted_names = [u["ovpn_username"] or u["username"] for u in plan["delete"]]
+        suspended_names = [u["ovpn_username"] or u["username"] for u in plan["suspend"]]
+        if deleted_names:
+            self.ovpn_manager.delete_users(deleted_names)
+        if suspended_names:
+            self.ovpn_manager.set_locked(suspended_names, True)
+        if self.revocation_manager:
+            for name in suspended_names:
+                self.revocation_manager.revoke_user(name, reason="certificate_hold")
+            for name in deleted_names:
+                self.revocation_manager.revoke_user(name, reason="cessation_of_operation")
+        else:
+            for name in suspended_names:
+                self.ovpn_manager.kill_client(name)
+
+        # 3. 邮件
+        if self.mail_outbox:
+            for user in plan["notify"]:
+                self.mail_outbox.enqueue("account_expiring", user["email"], {
+                    "username": user["username"], "expires_at": user["expires_at"][:16]
+                })
+            for user in plan["suspend"]:
+                self.mail_outbox.enqueue("account_suspended", user["email"], {
+                    "username": user["username"],
+                    "reason": "账户已过期" if user["reason"] == "expired" else "长期未使用",
+                })
+
+    # ==================== 定时处理 ====================
+    def start(self, interval: int = 3600):
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"账户生命周期处理失败: {e}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="lifecycle-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+def _db_time(value) -> str:
+    """与 SQLAlchemy 在 SQLite 中保存 DateTime 的格式一致（UTC，不带时区）"""
+    if not isinstance(value, datetime):
+        value = datetime.fromtimestamp(value, timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: python3 -m utils.account_lifecycle [--dry-run]"""
+    from utils.mail_outbox import MailOutbox
+    from utils.openvpn_manager import OpenVPNManager
+
+    parser = argparse.ArgumentParser(description="OpenVPN WebUI 账户生命周期处理")
+    parser.add_argument("--db", default="/var/lib/ovpn-ui/webui.db")
+    parser.add_argument("--config-dir", default="/etc/ovpn-ui/openvpn")
+    parser.add_argument("--dry-run", action="store_true", help="只列出需要处理的用户")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    install_columns(args.db)
+    sweeper = LifecycleSweeper(OpenVPNManager(config_dir=args.config_dir),
+                               mail_outbox=MailOutbox(db_path=args.db), db_path=args.db)
+    print(json.dumps(sweeper.sweep(dry_run=args.dry_run), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
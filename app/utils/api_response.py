@@ -0,0 +1,138 @@
+import gzip
+import hashlib
+from datetime import date, datetime
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from flask import current_app, make_response, request
+from flask.json.provider import DefaultJSONProvider
+from flask_login import current_user
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，缺失时使用标准库 json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该大小的响应不压缩（压缩头部开销和 CPU 时间不划算）
+COMPRESS_MIN_SIZE = 1024
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """优先使用 orjson 序列化；不排序键、不转义中文，减小响应体积"""
+
+    ensure_ascii = False
+    sort_keys = False
+
+    @staticmethod
+    def default(o: Any) -> Any:
+        # 与 orjson 一致，日期统一输出 ISO 8601
+        if isinstance(o, (date, datetime)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode("utf-8")
+
+
+# ==================== 统一响应格式 ====================
+# 成功: {"success": true, "data": ...}
+# 失败: {"success": false, "error": "..."}
+def api_success(data: Any = None, status: int = 200, **meta: Any):
+    """成功响应；meta 中的字段与 data 并列（如分页信息）"""
+    body = {"success": True, "data": data}
+    body.update(meta)
+    response = current_app.json.response(body)
+    response.status_code = status
+    return response
+
+
+def api_error(message: str, status: int = 400, **extra: Any):
+    """失败响应"""
+    body = {"success": False, "error": message}
+    body.update(extra)
+    response = current_app.json.response(body)
+    response.status_code = status
+    return response
+
+
+def versioned(version_func: Callable[[], Optional[str]]):
+    """条件请求装饰器
+
+    version_func 返回当前数据版本（None 表示无法确定，不做条件处理）。
+    版本未变化时直接返回 304，不执行视图，也不做序列化。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = version_func()
+            if version is None:
+                return view(*args, **kwargs)
+
+            etag = _version_etag(version)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
+
+
+def _version_etag(version: str) -> str:
+    # 同一版本下不同查询参数、不同用户的响应内容不同
+    user_id = current_user.get_id() if current_user.is_authenticated else ""
+    key = f"{version}|{request.full_path}|{user_id}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+# ==================== 响应后处理 ====================
+def _finalize_json(response):
+    """JSON 响应：补充 ETag 并处理条件请求，再按 Accept-Encoding 压缩"""
+    if response.mimetype != "application/json" or response.direct_passthrough:
+        return response
+
+    if request.method == "GET" and response.status_code == 200 and "ETag" not in response.headers:
+        response.add_etag(weak=True)
+        response.headers.setdefault("Cache-Control", "private, no-cache")
+        response.make_conditional(request)
+
+    if response.status_code != 200 or "Content-Encoding" in response.headers:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if brotli is not None and request.accept_encodings["br"]:
+        data, encoding = brotli.compress(data, quality=4), "br"
+    elif request.accept_encodings["gzip"]:
+        data, encoding = gzip.compress(data, compresslevel=6), "gzip"
+    else:
+        return response
+
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_app(app):
+    """安装 JSON 序列化器和响应后处理"""
+    app.json = FastJSONProvider(app)
+    app.after_request(_finalize_json)
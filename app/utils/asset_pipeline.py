@@ -0,0 +1,258 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import sys
+from typing import Dict, List, Optional
+
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import rjsmin
+except ImportError:  # 可选依赖，缺失时 JS 不压缩（由 gzip/brotli 预压缩弥补）
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import brotli
+except ImportError:  # 未安装时只生成 .gz
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+
+# 打包清单：输出名 -> 源文件（相对 static/），同一包内的文件按顺序拼接
+BUNDLES: Dict[str, List[str]] = {
+    "base.css": ["css/style.css"],
+    "base.js": ["js/main.js"],
+    "admin/dashboard.css": ["css/admin/dashboard.css"],
+    "admin/dashboard.js": ["js/admin/dashboard.js"],
+    "admin/login.js": ["js/admin/login.js"],
+    "admin/openvpn.css": ["css/admin/openvpn.css"],
+    "admin/openvpn.js": ["js/admin/openvpn.js"],
+    "admin/users.css": ["css/admin/users.css"],
+    "admin/users.js": ["js/admin/users.js"],
+    "user/login.js": ["js/user/login.js"],
+    "user/profile.css": ["css/user/profile.css"],
+    "user/profile.js": ["js/user/profile.js"],
+    "user/register.js": ["js/user/register.js"],
+}
+
+# 小于该大小的文件压缩收益有限，不生成预压缩文件
+MIN_COMPRESS_SIZE = 512
+
+
+class AssetPipeline:
+    """静态资源构建与引用
+
+    build() 把 BUNDLES 中的源文件拼接、压缩，写入 static/dist/ 下带内容哈希的文件名
+    （例如 admin/users.3f2a1b9c0d1e.js），同时生成 .gz/.br 预压缩文件和 manifest.json。
+    模板中通过 asset_url('admin/users.js') 引用，文件名随内容变化，
+    因此可以使用一年的 immutable 缓存，页面本身只剩 HTML 结构。
+    """
+
+    def __init__(self, static_dir: str = STATIC_DIR, bundles: Optional[Dict[str, List[str]]] = None):
+        self.static_dir = static_dir
+        self.dist_dir = os.path.join(static_dir, "dist")
+        self.manifest_path = os.path.join(self.dist_dir, "manifest.json")
+        self.bundles = bundles if bundles is not None else BUNDLES
+        self._manifest: Dict[str, str] = {}
+        self._manifest_mtime = None
+
+    # ==================== 构建 ====================
+    def build(self) -> Dict[str, str]:
+        """构建所有资源包，返回 manifest（包名 -> dist 下的文件名）"""
+        manifest = {}
+        for name, sources in self.bundles.items():
+            content = self._minify(name, self._concat(sources))
+            data = content.encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            base, ext = os.path.splitext(name)
+            filename = f"{base}.{digest}{ext}"
+            self._write_outputs(filename, data)
+            manifest[name] = filename
+
+        os.makedirs(self.dist_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+        removed = self._remove_stale(manifest)
+        logger.info(f"静态资源构建完成: {len(manifest)} 个资源包，清理旧文件 {removed} 个")
+        self._manifest_mtime = None
+        return manifest
+
+    def is_stale(self) -> bool:
+        """manifest 不存在，或有源文件比 manifest 新"""
+        try:
+            built = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            return True
+        manifest = self.get_manifest()
+        if set(manifest) != set(self.bundles):
+            return True
+        for sources in self.bundles.values():
+            for source in sources:
+                try:
+                    if os.stat(os.path.join(self.static_dir, source)).st_mtime > built:
+                        return True
+                except OSError:
+                    continue
+        return False
+
+    def _concat(self, sources: List[str]) -> str:
+        parts = []
+        for source in sources:
+            with open(os.path.join(self.static_dir, source), "r", encoding="utf-8") as f:
+                parts.append(f.read())
+        # JS 文件之间加分号，避免上一个文件缺少结尾分号时与下一个文件连在一起
+        return "\n;\n".join(parts) if sources[0].endswith(".js") and len(parts) > 1 else "\n".join(parts)
+
+    @staticmethod
+    def _minify(name: str, content: str) -> str:
+        if name.endswith(".css"):
+            return rcssmin.cssmin(content) if rcssmin else _minify_css(content)
+        if name.endswith(".js"):
+            # 逐行处理无法识别模板字符串和多行字符串，没有 rjsmin 时原样输出
+            return rjsmin.jsmin(content) if rjsmin else content
+        return content
+
+    def _write_outputs(self, filename: str, data: bytes):
+        path = os.path.join(self.dist_dir, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        outputs = {path: data}
+        if len(data) >= MIN_COMPRESS_SIZE:
+            # mtime=0 使相同内容每次生成的 .gz 完全一致
+            outputs[f"{path}.gz"] = gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli:
+                outputs[f"{path}.br"] = brotli.compress(data, quality=11)
+
+        for out_path, out_data in outputs.items():
+            if os.path.exists(out_path):
+                continue  # 文件名包含内容哈希，存在即相同
+            with open(f"{out_path}.tmp", "wb") as f:
+                f.write(out_data)
+            os.replace(f"{out_path}.tmp", out_path)
+
+    def _remove_stale(self, manifest: Dict[str, str]) -> int:
+        keep = {"manifest.json"}
+        for filename in manifest.values():
+            keep.update({filename, f"{filename}.gz", f"{filename}.br"})
+
+        removed = 0
+        for root, _, files in os.walk(self.dist_dir):
+            for name in files:
+                rel = os.path.relpath(os.path.join(root, name), self.dist_dir)
+                if rel not in keep:
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+        return removed
+
+    # ==================== 引用 ====================
+    def get_manifest(self) -> Dict[str, str]:
+        """读取 manifest（文件变化后自动重新加载）"""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return {}
+        if mtime != self._manifest_mtime:
+            try:
+                with open(self.manifest_path, "r") as f:
+                    self._manifest = json.load(f)
+                self._manifest_mtime = mtime
+            except (OSError, ValueError) as e:
+                logger.error(f"读取静态资源清单失败: {e}")
+        return self._manifest
+
+    def asset_url(self, name: str) -> str:
+        """模板助手：返回资源包的带哈希 URL，未构建时回退到源文件"""
+        filename = self.get_manifest().get(name)
+        if filename:
+            return url_for("static_asset", filename=filename)
+        sources = self.bundles.get(name)
+        if not sources:
+            raise KeyError(f"未定义的静态资源包: {name}")
+        return url_for("static", filename=sources[0])
+
+    def init_app(self, app):
+        """注册模板助手和 dist 路由，资源过期时自动重新构建"""
+        if self.is_stale():
+            try:
+                self.build()
+            except OSError as e:
+                logger.error(f"构建静态资源失败，使用未打包的源文件: {e}")
+
+        app.add_template_global(self.asset_url, "asset_url")
+        app.add_url_rule("/static/dist/<path:filename>", "static_asset", self.serve)
+
+    def serve(self, filename: str):
+        """直接访问 Flask 时提供 dist 文件（生产环境由 nginx gzip_static 处理）"""
+        if filename.endswith((".gz", ".br")) or filename == "manifest.json":
+            abort(404)
+
+        response = None
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if request.accept_encodings[encoding] and os.path.exists(os.path.join(self.dist_dir, filename + suffix)):
+                response = send_from_directory(self.dist_dir, filename + suffix,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers["Content-Encoding"] = encoding
+                break
+        if response is None:
+            response = send_from_directory(self.dist_dir, filename)
+
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+def _minify_css(content: str) -> str:
+    """保守的 CSS 压缩：去掉注释和多余空白"""
+    content = re.sub(r"/\*.*?\*/", "", content, flags=re.S)
+    content = re.sub(r"\s+", " ", content)
+    content = re.sub(r"\s*([{};,>])\s*", r"\1", content)
+    content = re.sub(r":\s+", ":", content)
+    return content.replace(";}", "}").strip()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: python3 -m utils.asset_pipeline <命令>"""
+    parser = argparse.ArgumentParser(description="OpenVPN WebUI 静态资源构建")
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="构建带哈希的资源包")
+    sub.add_parser("list", help="列出资源包及大小")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    pipeline = AssetPipeline(static_dir=args.static_dir)
+
+    if args.command == "build":
+        result = pipeline.build()
+    else:
+        result = {}
+        for name, filename in pipeline.get_manifest().items():
+            path = os.path.join(pipeline.dist_dir, filename)
+            result[name] = {
+                "file": filename,
+                "size": os.path.getsize(path),
+                "gzip": os.path.getsize(f"{path}.gz") if os.path.exists(f"{path}.gz") else None,
+                "brotli": os.path.getsize(f"{path}.br") if os.path.exists(f"{path}.br") else None,
+            }
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
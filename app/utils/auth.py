@@ -0,0 +1,13 @@
+from functools import wraps
+from flask_login import current_user
+from utils.api_response import api_error
+
+
+def admin_required(view):
+    """管理员API权限检查（需放在 login_required 之后）"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if getattr(current_user, 'user_type', '') != 'admin':
+            return api_error('无权限', 403)
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,521 @@
+import argparse
+import fcntl
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import stat
+import sys
+import tempfile
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# SQLite 数据库文件头
+SQLITE_MAGIC = b"SQLite format 3\x00"
+# 数据库的附属文件（由在线备份得到一致性副本，不单独复制）
+SQLITE_SUFFIXES = ("-wal", "-shm", "-journal")
+
+
+def default_sources(install_dir: str = "/usr/local/ovpn-ui", config_dir: str = "/etc/ovpn-ui",
+                    data_dir: str = "/var/lib/ovpn-ui") -> List[str]:
+    """默认备份的数据源（与安装脚本中的目录保持一致）"""
+    return [
+        config_dir,
+        data_dir,
+        os.path.join(install_dir, "config"),
+        os.path.join(install_dir, ".installed"),
+        "/etc/ssl/ovpn-ui",
+        "/etc/nginx/sites-available/ovpn-ui",
+    ]
+
+# 不需要备份的文件/目录
+DEFAULT_EXCLUDES = ["temp_links", "*-journal", "*-wal", "*-shm", "__pycache__"]
+
+
+class BackupManager:
+    """增量备份管理
+
+    备份仓库结构:
+        chunks/ab/<sha256>   zlib压缩的数据块（按内容寻址，天然去重）
+        snapshots/<id>.json  快照清单（文件元数据 + 数据块列表）
+
+    数据源中的所有 SQLite 数据库（按文件头识别，例如 webui.db 和 WAL 模式的 history.db）
+    都通过SQLite在线备份API复制，已提交但仍在 -wal 文件中的数据也会包含在内；
+    数据块按固定大小切分（SQLite页大小的整数倍），页面原地更新时只有
+    变化的数据块需要重新写入。
+    """
+
+    def __init__(self, repo_dir: str = "/var/backups/ovpn-ui",
+                 db_path: str = "/var/lib/ovpn-ui/webui.db",
+                 sources: Optional[List[str]] = None,
+                 excludes: Optional[List[str]] = None,
+                 chunk_size: int = 256 * 1024,
+                 compress_level: int = 6):
+        self.repo_dir = repo_dir
+        self.db_path = db_path
+        self.sources = sources if sources is not None else default_sources()
+        self.excludes = excludes if excludes is not None else list(DEFAULT_EXCLUDES)
+        self.chunk_size = chunk_size
+        self.compress_level = compress_level
+        self.chunks_dir = os.path.join(repo_dir, "chunks")
+        self.snapshots_dir = os.path.join(repo_dir, "snapshots")
+
+    # ==================== 备份 ====================
+    def create_backup(self) -> Dict:
+        """创建一个新的快照，返回快照摘要"""
+        self._ensure_repo()
+        with self._lock():
+            previous = self._load_latest_manifest()
+            prev_files = {f["path"]: f for f in previous["files"]} if previous else {}
+
+            stats = {"files": 0, "reused_files": 0, "bytes": 0,
+                     "new_chunks": 0, "new_chunk_bytes": 0}
+            files = []
+
+            databases = []
+            for path in self._iter_source_files():
+                if _is_sqlite(path):
+                    databases.append(path)
+                    continue
+                entry = self._backup_file(path, prev_files.get(path), stats)
+                if entry:
+                    files.append(entry)
+
+            if self.db_path and os.path.exists(self.db_path) and self.db_path not in databases:
+                databases.append(self.db_path)
+            for path in databases:
+                entry = self._backup_database(path, prev_files.get(path), stats)
+                if entry:
+                    files.append(entry)
+
+            now = datetime.now(timezone.utc)
+            snapshot_id = now.strftime("%Y%m%dT%H%M%S%fZ")
+            manifest = {
+                "id": snapshot_id,
+                "created_at": now.isoformat(),
+                "chunk_size": self.chunk_size,
+                "files": files,
+                "stats": stats,
+            }
+            self._write_atomic(
+                os.path.join(self.snapshots_dir, f"{snapshot_id}.json"),
+                json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+            )
+
+            logger.info(
+                f"备份完成: {snapshot_id}, 文件 {stats['files']} 个 "
+                f"(未变化 {stats['reused_files']}), 新数据块 {stats['new_chunks']} 个"
+            )
+            return self._summary(manifest)
+
+    def _backup_file(self, path: str, prev: Optional[Dict], stats: Dict) -> Optional[Dict]:
+        """备份单个普通文件，元数据未变化时直接复用上次的数据块列表"""
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logger.warning(f"跳过无法访问的文件 {path}: {e}")
+            return None
+
+        signature = [st.st_size, st.st_mtime_ns, st.st_ino]
+        stats["files"] += 1
+        stats["bytes"] += st.st_size
+
+        if prev and prev.get("signature") == signature and self._chunks_exist(prev["chunks"]):
+            stats["reused_files"] += 1
+            return dict(prev, mode=stat.S_IMODE(st.st_mode))
+
+        with open(path, "rb") as f:
+            chunks, digest, size = self._store_stream(f, stats)
+
+        return {
+            "path": path,
+            "type": "file",
+            "mode": stat.S_IMODE(st.st_mode),
+            "size": size,
+            "sha256": digest,
+            "signature": signature,
+            "chunks": chunks,
+        }
+
+    def _backup_database(self, db_path: str, prev: Optional[Dict], stats: Dict) -> Optional[Dict]:
+        """使用SQLite在线备份API获取数据库的一致性副本"""
+        signature = self._db_signature(db_path)
+        stats["files"] += 1
+
+        if prev and prev.get("signature") == signature and self._chunks_exist(prev["chunks"]):
+            stats["reused_files"] += 1
+            stats["bytes"] += prev["size"]
+            return prev
+
+        fd, tmp_path = tempfile.mkstemp(prefix=".db-", dir=self.repo_dir)
+        os.close(fd)
+        try:
+            src = sqlite3.connect(db_path)
+            dst = sqlite3.connect(tmp_path)
+            try:
+                with dst:
+                    src.backup(dst)
+            finally:
+                dst.close()
+                src.close()
+
+            with open(tmp_path, "rb") as f:
+                chunks, digest, size = self._store_stream(f, stats)
+        except sqlite3.Error as e:
+            logger.error(f"数据库在线备份失败 {db_path}: {e}")
+            return None
+        finally:
+            os.remove(tmp_path)
+
+        stats["bytes"] += size
+        return {
+            "path": db_path,
+            "type": "sqlite",
+            "mode": stat.S_IMODE(os.stat(db_path).st_mode),
+            "size": size,
+            "sha256": digest,
+            "signature": signature,
+            "chunks": chunks,
+        }
+
+    @staticmethod
+    def _db_signature(db_path: str) -> List:
+        """数据库文件及其WAL文件的元数据签名"""
+        signature = []
+        for suffix in ("", "-wal"):
+            try:
+                st = os.stat(db_path + suffix)
+                signature.extend([st.st_size, st.st_mtime_ns])
+            except OSError:
+                signature.extend([0, 0])
+        return signature
+
+    def _store_stream(self, f, stats: Dict):
+        """按固定大小切分数据流并写入数据块，已存在的数据块直接跳过"""
+        chunks = []
+        file_hash = hashlib.sha256()
+        size = 0
+
+        while True:
+            data = f.read(self.chunk_size)
+            if not data:
+                break
+            file_hash.update(data)
+            size += len(data)
+
+            chunk_id = hashlib.sha256(data).hexdigest()
+            chunk_path = self._chunk_path(chunk_id)
+            if not os.path.exists(chunk_path):
+                compressed = zlib.compress(data, self.compress_level)
+                os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+                self._write_atomic(chunk_path, compressed)
+                stats["new_chunks"] += 1
+                stats["new_chunk_bytes"] += len(compressed)
+            chunks.append(chunk_id)
+
+        return chunks, file_hash.hexdigest(), size
+
+    def _iter_source_files(self):
+        """遍历数据源中的文件（数据库由调用方按文件头识别）"""
+        db_files = {self.db_path + suffix for suffix in SQLITE_SUFFIXES}
+        repo_dir = os.path.abspath(self.repo_dir)
+
+        for source in self.sources:
+            if not os.path.exists(source):
+                continue
+            if os.path.isfile(source):
+                yield source
+                continue
+
+            for root, dirs, filenames in os.walk(source):
+                # 不备份备份仓库本身
+                dirs[:] = sorted(
+                    d for d in dirs
+                    if not self._excluded(d)
+                    and os.path.abspath(os.path.join(root, d)) != repo_dir
+                )
+                for filename in sorted(filenames):
+                    path = os.path.join(root, filename)
+                    if self._excluded(filename) or path in db_files:
+                        continue
+                    # 任何数据库的附属文件都不单独复制（即使排除规则被修改）
+                    if filename.endswith(SQLITE_SUFFIXES) and _is_sqlite(path[:path.rindex("-")]):
+                        continue
+                    if os.path.isfile(path) and not os.path.islink(path):
+                        yield path
+
+    def _excluded(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.excludes)
+
+    # ==================== 校验与恢复 ====================
+    def verify_backup(self, snapshot_id: str) -> Dict:
+        """校验快照中所有数据块和文件的完整性"""
+        manifest = self._load_manifest(snapshot_id)
+        errors = []
+        checked = set()
+
+        for entry in manifest["files"]:
+            file_hash = hashlib.sha256()
+            try:
+                for chunk_id in entry["chunks"]:
+                    data = self._read_chunk(chunk_id, verify=chunk_id not in checked)
+                    checked.add(chunk_id)
+                    file_hash.update(data)
+            except (OSError, ValueError, zlib.error) as e:
+                errors.append(f"{entry['path']}: {e}")
+                continue
+
+            if file_hash.hexdigest() != entry["sha256"]:
+                errors.append(f"{entry['path']}: 文件校验和不匹配")
+
+        if errors:
+            logger.error(f"快照 {snapshot_id} 校验失败: {len(errors)} 个错误")
+        else:
+            logger.info(f"快照 {snapshot_id} 校验通过")
+
+        return {"id": snapshot_id, "ok": not errors, "errors": errors,
+                "files": len(manifest["files"]), "chunks": len(checked)}
+
+    def restore_backup(self, snapshot_id: str, target_root: Optional[str] = None) -> Dict:
+        """从快照恢复文件
+
+        先完整校验快照，再逐个文件写入临时文件并原子替换；
+        指定 target_root 时恢复到该目录下（保留原始路径结构），便于先行检查。
+        """
+        result = self.verify_backup(snapshot_id)
+        if not result["ok"]:
+            raise ValueError(f"快照 {snapshot_id} 校验失败，拒绝恢复: {result['errors'][:3]}")
+
+        manifest = self._load_manifest(snapshot_id)
+        restored = []
+
+        for entry in manifest["files"]:
+            target = entry["path"]
+            if target_root:
+                target = os.path.join(target_root, target.lstrip("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+
+            fd, tmp_path = tempfile.mkstemp(prefix=".restore-", dir=os.path.dirname(target))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk_id in entry["chunks"]:
+                        f.write(self._read_chunk(chunk_id, verify=False))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.chmod(tmp_path, entry["mode"])
+                os.replace(tmp_path, target)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            # 恢复数据库后清理旧的WAL文件，避免与新数据库不一致
+            if entry["type"] == "sqlite":
+                for suffix in ("-wal", "-shm"):
+                    if os.path.exists(target + suffix):
+                        os.remove(target + suffix)
+
+            restored.append(target)
+
+        logger.info(f"快照 {snapshot_id} 恢复完成，共 {len(restored)} 个文件")
+        return {"id": snapshot_id, "restored": restored}
+
+    # ==================== 快照管理 ====================
+    def list_backups(self) -> List[Dict]:
+        """列出所有快照（按时间倒序）"""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        snapshots = []
+        for snapshot_id in self._snapshot_ids():
+            try:
+                snapshots.append(self._summary(self._load_manifest(snapshot_id)))
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取快照 {snapshot_id} 失败: {e}")
+        return snapshots
+
+    def prune_backups(self, keep_last: int = 7, keep_days: int = 30) -> Dict:
+        """按保留策略清理快照，并回收不再被引用的数据块
+
+        保留最近 keep_last 个快照，以及 keep_days 天内每天的最后一个快照。
+        """
+        self._ensure_repo()
+        with self._lock():
+            snapshot_ids = self._snapshot_ids()
+            keep = set(snapshot_ids[:keep_last])
+
+            cutoff = datetime.now(timezone.utc) - timedelta(days=keep_days)
+            seen_days = set()
+            for snapshot_id in snapshot_ids:
+                created = datetime.strptime(snapshot_id, "%Y%m%dT%H%M%S%fZ").replace(tzinfo=timezone.utc)
+                day = created.date()
+                if created >= cutoff and day not in seen_days:
+                    seen_days.add(day)
+                    keep.add(snapshot_id)
+
+            removed = [s for s in snapshot_ids if s not in keep]
+            for snapshot_id in removed:
+                os.remove(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"))
+
+            freed_chunks = self._gc_chunks()
+
+        logger.info(f"清理完成: 删除快照 {len(removed)} 个, 回收数据块 {freed_chunks} 个")
+        return {"removed": removed, "kept": sorted(keep, reverse=True), "freed_chunks": freed_chunks}
+
+    def _gc_chunks(self) -> int:
+        """删除没有被任何快照引用的数据块"""
+        referenced: Set[str] = set()
+        for snapshot_id in self._snapshot_ids():
+            for entry in self._load_manifest(snapshot_id)["files"]:
+                referenced.update(entry["chunks"])
+
+        freed = 0
+        for root, _, filenames in os.walk(self.chunks_dir):
+            for filename in filenames:
+                if filename not in referenced:
+                    os.remove(os.path.join(root, filename))
+                    freed += 1
+        return freed
+
+    # ==================== 内部工具 ====================
+    def _ensure_repo(self):
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        os.chmod(self.repo_dir, 0o700)
+
+    def _lock(self):
+        return _RepoLock(os.path.join(self.repo_dir, ".lock"))
+
+    def _chunk_path(self, chunk_id: str) -> str:
+        return os.path.join(self.chunks_dir, chunk_id[:2], chunk_id)
+
+    def _chunks_exist(self, chunks: List[str]) -> bool:
+        return all(os.path.exists(self._chunk_path(c)) for c in chunks)
+
+    def _read_chunk(self, chunk_id: str, verify: bool = True) -> bytes:
+        with open(self._chunk_path(chunk_id), "rb") as f:
+            data = zlib.decompress(f.read())
+        if verify and hashlib.sha256(data).hexdigest() != chunk_id:
+            raise ValueError(f"数据块 {chunk_id} 校验和不匹配")
+        return data
+
+    def _snapshot_ids(self) -> List[str]:
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(
+            (name[:-5] for name in os.listdir(self.snapshots_dir) if name.endswith(".json")),
+            reverse=True
+        )
+
+    def _load_manifest(self, snapshot_id: str) -> Dict:
+        if os.path.basename(snapshot_id) != snapshot_id:
+            raise ValueError(f"无效的快照ID: {snapshot_id}")
+        path = os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+        if not os.path.exists(path):
+            raise ValueError(f"快照不存在: {snapshot_id}")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _load_latest_manifest(self) -> Optional[Dict]:
+        snapshot_ids = self._snapshot_ids()
+        return self._load_manifest(snapshot_ids[0]) if snapshot_ids else None
+
+    @staticmethod
+    def _summary(manifest: Dict) -> Dict:
+        return {
+            "id": manifest["id"],
+            "created_at": manifest["created_at"],
+            "files": len(manifest["files"]),
+            "size": sum(f["size"] for f in manifest["files"]),
+            "stats": manifest.get("stats", {}),
+        }
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class _RepoLock:
+    """备份仓库的进程间互斥锁"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = open(self.path, "w")
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.fd.close()
+
+
+def _is_sqlite(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: python3 -m utils.backup_manager <命令>"""
+    parser = argparse.ArgumentParser(description="OpenVPN WebUI 备份工具")
+    parser.add_argument("--repo", default="/var/backups/ovpn-ui", help="备份仓库目录")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("backup", help="创建备份")
+    sub.add_parser("list", help="列出备份")
+    p_verify = sub.add_parser("verify", help="校验备份")
+    p_verify.add_argument("snapshot")
+    p_restore = sub.add_parser("restore", help="从备份恢复")
+    p_restore.add_argument("snapshot")
+    p_restore.add_argument("--target", help="恢复到指定目录而不是原始位置")
+    p_prune = sub.add_parser("prune", help="清理旧备份")
+    p_prune.add_argument("--keep-last", type=int, default=7)
+    p_prune.add_argument("--keep-days", type=int, default=30)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    # 目录与 Web 服务一致（OVPN_UI_*_DIR 环境变量）
+    from services import CONFIG_DIR, DATA_DIR, DB_PATH, INSTALL_DIR
+    manager = BackupManager(repo_dir=args.repo, db_path=DB_PATH,
+                            sources=default_sources(INSTALL_DIR, CONFIG_DIR, DATA_DIR))
+
+    try:
+        if args.command == "backup":
+            result = manager.create_backup()
+        elif args.command == "list":
+            result = manager.list_backups()
+        elif args.command == "verify":
+            result = manager.verify_backup(args.snapshot)
+        elif args.command == "restore":
+            result = manager.restore_backup(args.snapshot, args.target)
+        else:
+            result = manager.prune_backups(args.keep_last, args.keep_days)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.command == "verify" and not result["ok"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,486 @@
+import argparse
+import difflib
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.openvpn_manager import OpenVPNManager
+
+logger = logging.getLogger(__name__)
+
+# 保留 OpenVPN 凭据（因此需要 CCD 文件）的用户状态，与 UserReconciler 一致
+CREDENTIAL_STATUSES = ("approved", "suspended")
+
+# 服务端子网（server.conf 中的 server 指令），缺少时与 server.conf.template 一致
+DEFAULT_NETWORK = "10.8.0.0/24"
+
+# 默认地址池的起始序号（地址在子网中的序号，/24 时即最后一段），与 OpenVPNManager._get_next_ip 一致；
+# 结束序号由子网大小决定，/24 时为 253
+DEFAULT_POOL_START = 50
+
+# 每个用户最后一次写入的 CCD 内容哈希、地址序号，以及写入后文件的 (mtime, size)，用于发现手工修改
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ccd_state (
+    username VARCHAR(50) PRIMARY KEY,
+    content_hash VARCHAR(40) NOT NULL,
+    ip INTEGER,
+    mtime_ns INTEGER,
+    size INTEGER
+);
+"""
+
+# 旧数据库中缺少的列（新安装由 db.create_all 按 models.py 创建）
+POLICY_COLUMNS = {
+    "group_id": "INTEGER REFERENCES user_group (id)",
+    "ccd_overrides": "TEXT",
+}
+
+# dry-run 报告中最多附带的 diff 数量
+MAX_DIFFS = 50
+
+
+def normalize_policy(policy: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """校验并规范化组策略或用户覆盖项，格式错误时抛出 ValueError
+
+    支持的键：
+    - routes: ["192.168.10.0/24", ...]    推送的路由
+    - dns: ["10.8.0.1", ...]              推送的 DNS 服务器
+    - max_devices: 2                      max-routes
+    - ip_pool: "100-199"                  分配范围（地址在服务端子网中的序号，/24 时即最后一段）
+    - push: ["block-outside-dns", ...]    其他 push 选项
+    """
+    policy = policy or {}
+    if not isinstance(policy, dict):
+        raise ValueError("策略必须是对象")
+    unknown = set(policy) - {"routes", "dns", "max_devices", "ip_pool", "push"}
+    if unknown:
+        raise ValueError(f"未知的策略项: {', '.join(sorted(unknown))}")
+
+    result: Dict[str, Any] = {}
+    if policy.get("routes") is not None:
+        try:
+            result["routes"] = [str(ipaddress.IPv4Network(r, strict=False)) for r in policy["routes"]]
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"路由格式无效: {e}")
+    if policy.get("dns") is not None:
+        try:
+            result["dns"] = [str(ipaddress.IPv4Address(d)) for d in policy["dns"]]
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"DNS 地址无效: {e}")
+    if policy.get("max_devices") is not None:
+        try:
+            max_devices = int(policy["max_devices"])
+        except (TypeError, ValueError):
+            raise ValueError("max_devices 必须是整数")
+        if not 1 <= max_devices <= 100:
+            raise ValueError("max_devices 必须在 1-100 之间")
+        result["max_devices"] = max_devices
+    if policy.get("ip_pool"):
+        result["ip_pool"] = "{}-{}".format(*_parse_pool(policy["ip_pool"]))
+    if policy.get("push") is not None:
+        push = [str(p).strip() for p in policy["push"]]
+        if any(not p or '"' in p or "\n" in p for p in push):
+            raise ValueError("push 选项不能为空，也不能包含引号或换行")
+        result["push"] = push
+    return result
+
+
+def _parse_pool(value: str) -> Tuple[int, int]:
+    try:
+        start, end = (int(p) for p in str(value).split("-", 1))
+    except ValueError:
+        raise ValueError("地址池格式应为 起始-结束（地址在子网中的序号），例如 100-199")
+    if not 2 <= start <= end:
+        raise ValueError("地址池的起始序号至少为 2，且不能大于结束序号")
+    return start, end
+
+
+def load_server_network(config_file: str) -> str:
+    """读取 server.conf 中 server 指令的子网，缺少或格式错误时返回 DEFAULT_NETWORK"""
+    try:
+        with open(config_file, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[0] == "server":
+                    return str(ipaddress.IPv4Network(f"{parts[1]}/{parts[2]}", strict=False))
+    except (OSError, ValueError):
+        pass
+    return DEFAULT_NETWORK
+
+
+def render_ccd(ip: int, policy: Dict[str, Any], network: str = DEFAULT_NETWORK) -> str:
+    """生成 CCD 文件内容（前两行与 OpenVPNManager.write_ccd 相同）
+
+    ip 是地址在子网中的序号，/24 子网时即地址的最后一段。
+    """
+    subnet = ipaddress.IPv4Network(network)
+    lines = [
+        f"ifconfig-push {subnet.network_address + ip} {subnet.netmask}",
+        f"push \"max-routes {policy['max_devices']}\"",
+    ]
+    for route in policy.get("routes", ()):
+        network = ipaddress.IPv4Network(route)
+        lines.append(f"push \"route {network.network_address} {network.netmask}\"")
+    for dns in policy.get("dns", ()):
+        lines.append(f"push \"dhcp-option DNS {dns}\"")
+    for option in policy.get("push", ()):
+        lines.append(f"push \"{option}\"")
+    return "\n".join(lines) + "\n"
+
+
+class CCDCompiler:
+    """按用户组策略增量生成 CCD 文件
+
+    每个用户的配置 = 用户组策略，再由用户的 ccd_overrides 逐项覆盖；
+    max_devices 依次取 用户覆盖、组策略、normal_user.max_devices。
+    IP 优先使用静态IP，其次沿用上次分配（仍在组的地址池内时），否则从组的地址池分配。
+    地址取自服务端子网（network，由 load_server_network 读取 server.conf），
+    /16 子网可以为六万多个用户分配固定地址；ccd_state 中保存的是地址在子网中的序号。
+
+    ccd_state 表保存每个用户上次写入内容的哈希和文件的 (mtime, size)：
+    内容哈希相同且文件未被修改的用户不会重写，修改一个组的策略只重写该组成员的文件，
+    五万用户的完整编译主要是一次查询和每个文件一次 stat。
+    首次编译时，内容与现有文件相同的用户只记录哈希，不重写文件。
+    """
+
+    def __init__(self, ovpn_manager: OpenVPNManager,
+                 db_path: str = "/var/lib/ovpn-ui/webui.db",
+                 user_table: str = "normal_user", group_table: str = "user_group",
+                 network: str = DEFAULT_NETWORK):
+        self.ovpn_manager = ovpn_manager
+        self.network = ipaddress.IPv4Network(network)
+        # 可分配的最大序号（保留广播地址前的一个，/24 时为 253）
+        self.max_offset = self.network.num_addresses - 3
+        self.db_path = db_path
+        self.user_table = user_table
+        self.group_table = group_table
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    @property
+    def ccd_dir(self) -> str:
+        return os.path.join(self.ovpn_manager.config_dir, "ccd")
+
+    def install(self) -> bool:
+        """创建 ccd_state 表，为已有数据库补充用户组相关的列"""
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.executescript(STATE_SCHEMA)
+                existing = {row[1] for row in conn.execute(f"PRAGMA table_info({self.user_table})")}
+                for column, column_type in POLICY_COLUMNS.items():
+                    if column not in existing:
+                        conn.execute(f"ALTER TABLE {self.user_table} ADD COLUMN {column} {column_type}")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.user_table}_group_id "
+                             f"ON {self.user_table} (group_id)")
+                conn.commit()
+            finally:
+                conn.close()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"安装CCD编译状态表失败: {e}")
+            return False
+
+    # ==================== 编译 ====================
+    def compile(self, dry_run: bool = False, usernames: Optional[Iterable[str]] = None,
+                group_id: Optional[int] = None,
+                group_policies: Optional[Dict[int, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """生成 CCD 文件；dry_run 时只返回差异（附带 unified diff）
+
+        usernames / group_id 限定编译范围（例如修改了一个用户或一个组），
+        不限定时做完整编译，并删除已不再需要 CCD 的用户的文件。
+        group_policies 替换数据库中的组策略，用于在保存前预览修改的效果（配合 dry_run）。
+        """
+        started = time.monotonic()
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            with self.ovpn_manager.lock():
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    report = self.compile_locked(conn, dry_run, usernames, group_id, group_policies)
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        report["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+        if report["changes"] and not dry_run:
+            logger.info(f"CCD编译: 写入 {len(report['write'])} 个，删除 {len(report['remove'])} 个")
+        self.last_report = report
+        return report
+
+    def compile_locked(self, conn: sqlite3.Connection, dry_run: bool = False,
+                       usernames: Optional[Iterable[str]] = None,
+                       group_id: Optional[int] = None,
+                       group_policies: Optional[Dict[int, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """在调用方已持有用户文件锁和数据库写事务时编译（供 UserReconciler 使用）"""
+        full = usernames is None and group_id is None
+        groups = self._load_groups(conn)
+        groups.update(group_policies or {})
+        users = self._load_users(conn, usernames, group_id)
+        state = {row[0]: row[1:] for row in conn.execute(
+            "SELECT username, content_hash, ip, mtime_ns, size FROM ccd_state")}
+
+        # 所有已分配的IP（包括本次范围之外的用户），用于分配和冲突检查
+        owners: Dict[int, str] = {}
+        for name, (_, ip, _, _) in state.items():
+            if ip:
+                owners.setdefault(ip, name)
+        for name, user in users.items():
+            if user["static_ip"]:
+                owners[user["static_ip"]] = name
+        # 每个地址池下一次开始查找空闲地址的位置：本次编译中 owners 只增不减，已查过的地址不必再查
+        cursors: Dict[Tuple[int, int], int] = {}
+
+        write: List[Dict[str, Any]] = []
+        adopted: List[tuple] = []
+        diffs: Dict[str, str] = {}
+        errors: List[str] = []
+        unchanged = 0
+        unassigned = []
+
+        for name, user in users.items():
+            try:
+                policy = self._effective_policy(user, groups)
+            except ValueError as e:
+                errors.append(f"{name}: {e}")
+                continue
+            path = os.path.join(self.ccd_dir, name)
+            previous = state.get(name)
+
+            ip = self._assign_ip(name, user, policy, previous, path, owners, cursors)
+            if ip is None:
+                unassigned.append(name)
+                continue
+            owners[ip] = name
+
+            content = render_ccd(ip, policy, str(self.network))
+            content_hash = hashlib.sha1(content.encode()).hexdigest()
+            try:
+                st = os.stat(path)
+                file_sig = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                file_sig = None
+
+            if previous and previous[0] == content_hash and file_sig == tuple(previous[2:]):
+                unchanged += 1
+                continue
+
+            current = _read_file(path) if file_sig else None
+            if current == content:
+                # 内容已经正确（首次编译或手工写入了相同内容），只记录状态
+                unchanged += 1
+                adopted.append((name, content_hash, ip, file_sig[0], file_sig[1]))
+                continue
+
+            write.append({"username": name, "ip": ip, "group_id": user["group_id"],
+                          "action": "update" if file_sig else "create"})
+            if dry_run:
+                if len(diffs) < MAX_DIFFS:
+                    diffs[name] = "".join(difflib.unified_diff(
+                        (current or "").splitlines(True), content.splitlines(True),
+                        fromfile=f"ccd/{name}", tofile=f"ccd/{name} (编译后)"))
+            else:
+                self.ovpn_manager.write_ccd_content(name, content)
+                st = os.stat(path)
+                adopted.append((name, content_hash, ip, st.st_mtime_ns, st.st_size))
+
+        # 完整编译时，删除已不再保留凭据的用户的 CCD 文件（只删除由编译器写过的文件）
+        remove = sorted(state.keys() - users.keys()) if full else []
+        if not dry_run:
+            for name in remove:
+                try:
+                    os.remove(os.path.join(self.ccd_dir, name))
+                except FileNotFoundError:
+                    pass
+            conn.executemany(
+                "INSERT OR REPLACE INTO ccd_state (username, content_hash, ip, mtime_ns, size) "
+                "VALUES (?, ?, ?, ?, ?)", adopted)
+            conn.executemany("DELETE FROM ccd_state WHERE username = ?", [(n,) for n in remove])
+
+        if unassigned:
+            errors.append(f"地址池已满，{len(unassigned)} 个用户未生成CCD配置: {', '.join(unassigned[:10])}")
+
+        report: Dict[str, Any] = {
+            "dry_run": dry_run, "full": full, "users": len(users),
+            "changes": len(write) + len(remove), "unchanged": unchanged,
+            "write": write, "remove": remove, "errors": errors,
+        }
+        if dry_run:
+            report["diff"] = diffs
+        return report
+
+    def effective_max_devices(self, conn: sqlite3.Connection) -> Dict[str, int]:
+        """{OpenVPN用户名: 生效的 max_devices}（供 UserReconciler 检查 max-routes）"""
+        groups = self._load_groups(conn)
+        result = {}
+        for name, user in self._load_users(conn, None, None).items():
+            try:
+                result[name] = self._effective_policy(user, groups)["max_devices"]
+            except ValueError:
+                pass
+        return result
+
+    def preview(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """单个用户的生效策略（用户详情页显示），用户不存在时返回 None"""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=5)
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute(
+                f"SELECT id, ovpn_username, max_devices, ip_type, static_ip, group_id, ccd_overrides "
+                f"FROM {self.user_table} WHERE id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            groups = self._load_groups(conn)
+            state = conn.execute("SELECT ip FROM ccd_state WHERE username = ?",
+                                 (row["ovpn_username"],)).fetchone()
+        finally:
+            conn.close()
+        user = self._user_from_row(row)
+        policy = self._effective_policy(user, groups)
+        ip = user["static_ip"] or (state[0] if state else None)
+        if not ip:
+            return {"policy": policy, "ip": None, "ccd": None}
+        return {"policy": policy, "ip": str(self.network.network_address + ip),
+                "ccd": render_ccd(ip, policy, str(self.network))}
+
+    # ==================== 内部 ====================
+    def _load_groups(self, conn) -> Dict[int, Any]:
+        """{组ID: 策略}，策略格式错误的组记为 ValueError，由成员报告错误"""
+        groups: Dict[int, Any] = {}
+        for group_id, name, policy in conn.execute(f"SELECT id, name, policy FROM {self.group_table}"):
+            try:
+                groups[group_id] = normalize_policy(json.loads(policy or "{}"))
+            except ValueError as e:
+                groups[group_id] = ValueError(f"用户组 {name} 的策略无效: {e}")
+        return groups
+
+    def _load_users(self, conn, usernames: Optional[Iterable[str]],
+                    group_id: Optional[int]) -> Dict[str, Dict[str, Any]]:
+        sql = (f"SELECT id, ovpn_username, max_devices, ip_type, static_ip, group_id, ccd_overrides "
+               f"FROM {self.user_table} WHERE ovpn_username IS NOT NULL AND ovpn_username != '' "
+               f"AND status IN ({', '.join('?' for _ in CREDENTIAL_STATUSES)})")
+        params: List[Any] = list(CREDENTIAL_STATUSES)
+        if group_id is not None:
+            sql += " AND group_id = ?"
+            params.append(group_id)
+
+        conn.row_factory = sqlite3.Row
+        try:
+            if usernames is None:
+                rows = conn.execute(sql, params).fetchall()
+            else:
+                # 分批查询，避免超过 SQLite 的参数个数限制
+                names = list(usernames)
+                rows = []
+                for i in range(0, len(names), 500):
+                    batch = names[i:i + 500]
+                    rows += conn.execute(
+                        sql + f" AND ovpn_username IN ({', '.join('?' for _ in batch)})",
+                        params + batch).fetchall()
+        finally:
+            conn.row_factory = None
+        return {row["ovpn_username"]: self._user_from_row(row) for row in rows}
+
+    def _user_from_row(self, row) -> Dict[str, Any]:
+        static_ip = None
+        if row["ip_type"] == "static" and row["static_ip"]:
+            static_ip = self._offset(row["static_ip"])
+        try:
+            overrides = json.loads(row["ccd_overrides"] or "{}")
+        except ValueError:
+            overrides = ValueError("用户覆盖项不是有效的 JSON")
+        return {"id": row["id"], "max_devices": row["max_devices"] or 2, "static_ip": static_ip,
+                "group_id": row["group_id"], "overrides": overrides}
+
+    @staticmethod
+    def _effective_policy(user: Dict[str, Any], groups: Dict[int, Any]) -> Dict[str, Any]:
+        group_policy = groups.get(user["group_id"], {}) if user["group_id"] else {}
+        if isinstance(group_policy, ValueError):
+            raise group_policy
+        if isinstance(user["overrides"], ValueError):
+            raise user["overrides"]
+        policy = dict({"max_devices": user["max_devices"]}, **group_policy)
+        policy.update(normalize_policy(user["overrides"]))
+        return policy
+
+    def _offset(self, address: str) -> Optional[int]:
+        """地址在子网中的序号，不在子网内或不可分配时返回 None"""
+        try:
+            offset = int(ipaddress.IPv4Address(address)) - int(self.network.network_address)
+        except ValueError:
+            return None
+        return offset if 2 <= offset <= self.max_offset else None
+
+    def _read_ccd_offset(self, path: str) -> Optional[int]:
+        """读取现有CCD文件中 ifconfig-push 地址的序号（由 create_user 写入的文件）"""
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) > 1 and parts[0] == "ifconfig-push":
+                        return self._offset(parts[1])
+        except OSError:
+            pass
+        return None
+
+    def _assign_ip(self, name: str, user: Dict[str, Any], policy: Dict[str, Any],
+                   previous: Optional[tuple], path: str, owners: Dict[int, str],
+                   cursors: Dict[Tuple[int, int], int]) -> Optional[int]:
+        if user["static_ip"]:
+            return user["static_ip"]
+
+        start, end = _parse_pool(policy["ip_pool"]) if policy.get("ip_pool") else (DEFAULT_POOL_START, self.max_offset)
+        end = min(end, self.max_offset)
+        # 沿用上次的IP；没有编译记录时沿用现有CCD文件中的IP（由 create_user 分配）
+        ip = previous[1] if previous else self._read_ccd_offset(path)
+        if ip and start <= ip <= end and owners.get(ip, name) == name:
+            return ip
+        for candidate in range(cursors.get((start, end), start), end + 1):
+            if candidate not in owners:
+                cursors[(start, end)] = candidate + 1
+                return candidate
+        cursors[(start, end)] = end + 1
+        return None
+
+
+def _read_file(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: python3 -m utils.ccd_compiler [--dry-run] [--user NAME ...] [--group ID]"""
+    parser = argparse.ArgumentParser(description="OpenVPN WebUI CCD 编译")
+    parser.add_argument("--db", default="/var/lib/ovpn-ui/webui.db")
+    parser.add_argument("--config-dir", default="/etc/ovpn-ui/openvpn")
+    parser.add_argument("--dry-run", action="store_true", help="只输出差异，不写入文件")
+    parser.add_argument("--user", action="append", help="只编译指定的 OpenVPN 用户（可重复）")
+    parser.add_argument("--group", type=int, help="只编译指定用户组的成员")
+    parser.add_argument("--network", help="服务端子网（默认读取 server.conf 中的 server 指令）")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    network = args.network or load_server_network(os.path.join(args.config_dir, "server.conf"))
+    compiler = CCDCompiler(OpenVPNManager(config_dir=args.config_dir), db_path=args.db, network=network)
+    compiler.install()
+    report = compiler.compile(dry_run=args.dry_run, usernames=args.user, group_id=args.group)
+    if args.dry_run:
+        for diff in report.pop("diff").values():
+            sys.stdout.write(diff)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
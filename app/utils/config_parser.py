@@ -22,11 +22,16 @@ class ConfigParser:
             with open(self.openvpn_config, 'r') as f:
                 for line in f:
                     line = line.strip()
-                    if line and not line.startswith('#'):
+                    if line and not line.startswith(('#', ';')):
                         parts = line.split()
-                        if len(parts) >= 2:
-                            key = parts[0]
-                            value = ' '.join(parts[1:])
+                        key = parts[0]
+                        value = ' '.join(parts[1:])
+                        # 重复出现的指令（如 push、remote）保存为列表
+                        if key in config:
+                            if not isinstance(config[key], list):
+                                config[key] = [config[key]]
+                            config[key].append(value)
+                        else:
                             config[key] = value
             
             logger.info("OpenVPN配置文件读取成功")
@@ -47,7 +52,10 @@ class ConfigParser:
                 f.write("# 不要手动修改此文件\n\n")
                 
                 for key, value in config.items():
-                    f.write(f"{key} {value}\n")
+                    # 列表表示可重复的指令（如多条 push），空值表示无参数的开关指令
+                    values = value if isinstance(value, (list, tuple)) else [value]
+                    for item in values:
+                        f.write(f"{key} {item}\n" if item != "" else f"{key}\n")
             
             logger.info("OpenVPN配置文件写入成功")
             return True
@@ -68,11 +76,14 @@ class ConfigParser:
             "dh": "/opt/ovpn-ui/config/openvpn/dh.pem",
             "server": "10.8.0.0 255.255.255.0",
             "ifconfig-pool-persist": "ipp.txt",
-            "push": "redirect-gateway def1 bypass-dhcp",
-            "push": "dhcp-option DNS 8.8.8.8",
-            "push": "dhcp-option DNS 8.8.4.4",
+            "push": [
+                "\"redirect-gateway def1 bypass-dhcp\"",
+                "\"dhcp-option DNS 8.8.8.8\"",
+                "\"dhcp-option DNS 8.8.4.4\"",
+            ],
             "keepalive": "10 120",
-            "cipher": "AES-256-CBC",
+            "data-ciphers": "AES-256-GCM:AES-128-GCM:CHACHA20-POLY1305",
+            "data-ciphers-fallback": "AES-256-CBC",
             "user": "nobody",
             "group": "nogroup",
             "persist-key": "",
@@ -83,6 +94,8 @@ class ConfigParser:
             "client-config-dir": "/opt/ovpn-ui/config/openvpn/ccd",
             "script-security": "2",
             "auth-user-pass-verify": "/opt/ovpn-ui/config/openvpn/auth/check_user.sh via-file",
+            "client-connect": "/opt/ovpn-ui/config/openvpn/auth/client_event.py",
+            "client-disconnect": "/opt/ovpn-ui/config/openvpn/auth/client_event.py",
             "username-as-common-name": "",
             "verify-client-cert": "none"
         }
\ No newline at end of file
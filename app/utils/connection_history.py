@@ -0,0 +1,481 @@
+import argparse
+import grp
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 每月一个分区表，只追加不修改；按月份整表删除实现保留期清理
+PARTITION_PREFIX = "connection_event_"
+PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    event VARCHAR(10) NOT NULL,
+    common_name VARCHAR(64) NOT NULL,
+    instance VARCHAR(32),
+    real_address VARCHAR(64),
+    virtual_address VARCHAR(45),
+    connected_at INTEGER,
+    duration INTEGER,
+    bytes_received INTEGER,
+    bytes_sent INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_{table}_cn_ts ON {table} (common_name, ts);
+CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (ts);
+"""
+
+EVENT_COLUMNS = ("ts", "event", "common_name", "instance", "real_address", "virtual_address",
+                 "connected_at", "duration", "bytes_received", "bytes_sent")
+
+
+class ConnectionHistory:
+    """连接历史记录
+
+    OpenVPN 的 client-connect / client-disconnect 钩子脚本
+    (config/openvpn/auth/client_event.py) 把事件以 JSON 数据报发送到本地 Unix 套接字，
+    这里接收后放入内存队列，由写入线程按批次（条数或时间间隔先到者）在一个事务中写入。
+
+    事件存放在独立的 history.db 中（不与 webui.db 争用写锁），按月分区：
+    connection_event_YYYYMM，每个分区有 (common_name, ts) 和 (ts) 索引，
+    查询某用户最近 90 天的会话最多只涉及 4 个分区的索引范围扫描。
+    """
+
+    def __init__(self, db_path: str = "/var/lib/ovpn-ui/history.db",
+                 socket_path: str = "/run/ovpn-ui/events.sock",
+                 socket_group: Optional[str] = "nogroup",
+                 retention_days: int = 180,
+                 batch_size: int = 500,
+                 flush_interval: float = 1.0):
+        self.db_path = db_path
+        self.socket_path = socket_path
+        self.socket_group = socket_group
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # 事件监听器（例如更新用户最后连接时间），在 record() 中同步调用，不能阻塞
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+        self._pending: List[tuple] = []
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    # ==================== 写入 ====================
+    def record(self, event: Dict[str, Any]) -> bool:
+        """记录一个连接事件（异步批量写入）"""
+        row = self._normalize(event)
+        if row is None:
+            logger.warning(f"忽略无效的连接事件: {event}")
+            return False
+        with self._cond:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"连接事件监听器出错: {e}")
+        return True
+
+    def flush(self) -> int:
+        """立即写入队列中的事件，返回写入条数"""
+        with self._cond:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+
+        by_partition: Dict[str, List[tuple]] = {}
+        for row in rows:
+            by_partition.setdefault(_partition_name(row[0]), []).append(row)
+
+        placeholders = ", ".join("?" for _ in EVENT_COLUMNS)
+        try:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for table, batch in by_partition.items():
+                    self._ensure_partition(conn, table)
+                    conn.executemany(
+                        f"INSERT INTO {table} ({', '.join(EVENT_COLUMNS)}) VALUES ({placeholders})",
+                        batch
+                    )
+        except sqlite3.Error as e:
+            logger.error(f"写入连接历史失败，{len(rows)} 条事件重新入队: {e}")
+            with self._cond:
+                self._pending[:0] = rows
+            return 0
+        return len(rows)
+
+    @staticmethod
+    def _normalize(event: Dict[str, Any]) -> Optional[tuple]:
+        kind = event.get("event")
+        common_name = event.get("common_name")
+        if kind not in ("connect", "disconnect") or not common_name:
+            return None
+
+        def as_int(key):
+            try:
+                return int(event[key]) if event.get(key) not in (None, "") else None
+            except (TypeError, ValueError):
+                return None
+
+        ts = as_int("ts") or int(time.time())
+        return (ts, kind, str(common_name)[:64], event.get("instance"), event.get("real_address"),
+                event.get("virtual_address"), as_int("connected_at"), as_int("duration"),
+                as_int("bytes_received"), as_int("bytes_sent"))
+
+    # ==================== 查询 ====================
+    def get_user_sessions(self, common_name: str, days: int = 90, limit: int = 1000) -> List[Dict[str, Any]]:
+        """查询用户最近若干天的会话（按连接时间倒序）
+
+        会话由同一 (connected_at, real_address) 的 connect/disconnect 事件配对得到，
+        没有 disconnect 的会话视为仍在线（或服务异常退出未上报）。
+        """
+        until = int(time.time())
+        since = until - days * 86400
+        events = self._query(since, until, common_name=common_name)
+
+        sessions: Dict[tuple, Dict[str, Any]] = {}
+        for event in events:
+            connected_at = event["connected_at"] or event["ts"]
+            key = (connected_at, event["real_address"], event["instance"])
+            session = sessions.setdefault(key, {
+                "common_name": event["common_name"],
+                "instance": event["instance"],
+                "real_address": event["real_address"],
+                "virtual_address": event["virtual_address"],
+                "connected_at": connected_at,
+                "disconnected_at": None,
+                "duration": None,
+                "bytes_received": None,
+                "bytes_sent": None,
+                "active": True,
+            })
+            if event["event"] == "disconnect":
+                session.update({
+                    "disconnected_at": event["ts"],
+                    "duration": event["duration"],
+                    "bytes_received": event["bytes_received"],
+                    "bytes_sent": event["bytes_sent"],
+                    "active": False,
+                })
+                session["virtual_address"] = session["virtual_address"] or event["virtual_address"]
+
+        ordered = sorted(sessions.values(), key=lambda s: s["connected_at"], reverse=True)
+        return ordered[:limit]
+
+    def get_events(self, since: int, until: Optional[int] = None, common_name: Optional[str] = None,
+                   limit: int = 1000) -> List[Dict[str, Any]]:
+        """按时间范围查询原始事件（按时间倒序）"""
+        until = until or int(time.time())
+        return self._query(since, until, common_name=common_name, limit=limit, descending=True)
+
+    def _query(self, since: int, until: int, common_name: Optional[str] = None,
+               limit: Optional[int] = None, descending: bool = False) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            tables = [t for t in self._list_partitions(conn) if _partition_overlaps(t, since, until)]
+            if not tables:
+                return []
+
+            where = "ts BETWEEN ? AND ?"
+            params: List[Any] = [since, until]
+            if common_name:
+                where = "common_name = ? AND " + where
+                params = [common_name] + params
+
+            # 分区按月份有序，倒序查询时从最新的分区开始，凑够 limit 即可停止
+            order = "DESC" if descending else "ASC"
+            if descending:
+                tables.reverse()
+
+            rows: List[Dict[str, Any]] = []
+            for table in tables:
+                sql = f"SELECT {', '.join(EVENT_COLUMNS)} FROM {table} WHERE {where} ORDER BY ts {order}, id {order}"
+                if limit:
+                    sql += f" LIMIT {int(limit) - len(rows)}"
+                rows.extend(dict(zip(EVENT_COLUMNS, r)) for r in conn.execute(sql, params))
+                if limit and len(rows) >= limit:
+                    break
+        return rows
+
+    # ==================== 流式导出 ====================
+    def iter_events(self, since: int, until: int, common_name: Optional[str] = None,
+                    event: Optional[str] = None, after: Optional[str] = None,
+                    chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """按 (分区, id) 顺序逐批产出原始事件，内存占用与总行数无关
+
+        每个事件带有 event_id（YYYYMM-id），after 为上次已收到的最后一个 event_id，用于断点续传。
+        history.db 使用 WAL，导出期间的读事务不会阻塞写入线程。
+        """
+        after_table, after_id = None, 0
+        if after:
+            month, _, row_id = after.partition("-")
+            after_table, after_id = PARTITION_PREFIX + month, int(row_id)
+
+        where = ["ts BETWEEN ? AND ?"]
+        params: List[Any] = [since, until]
+        if common_name:
+            where.append("common_name = ?")
+            params.append(common_name)
+        if event:
+            where.append("event = ?")
+            params.append(event)
+
+        with self._connect() as conn:
+            tables = [t for t in self._list_partitions(conn) if _partition_overlaps(t, since, until)]
+            for table in tables:
+                if after_table and table < after_table:
+                    continue
+                start_id = after_id if table == after_table else 0
+                month = table[len(PARTITION_PREFIX):]
+                cursor = conn.execute(
+                    f"SELECT id, {', '.join(EVENT_COLUMNS)} FROM {table} "
+                    f"WHERE id > ? AND {' AND '.join(where)} ORDER BY id",
+                    [start_id] + params
+                )
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        item = dict(zip(EVENT_COLUMNS, row[1:]))
+                        item["event_id"] = f"{month}-{row[0]}"
+                        yield item
+
+    def iter_usage(self, since: int, until: int, common_name: Optional[str] = None,
+                   after: Optional[str] = None, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """按用户汇总时间范围内的连接次数、会话时长和流量（按 common_name 排序）
+
+        汇总由 SQLite 在一条语句中完成（排序数据量大时使用临时文件），结果逐批读取；
+        after 为上次已收到的最后一个 common_name。
+        """
+        where = ["ts BETWEEN ? AND ?"]
+        base_params: List[Any] = [since, until]
+        if common_name:
+            where.append("common_name = ?")
+            base_params.append(common_name)
+        if after:
+            where.append("common_name > ?")
+            base_params.append(after)
+
+        with self._connect() as conn:
+            tables = [t for t in self._list_partitions(conn) if _partition_overlaps(t, since, until)]
+            if not tables:
+                return
+            union = " UNION ALL ".join(
+                f"SELECT ts, event, common_name, duration, bytes_received, bytes_sent "
+                f"FROM {table} WHERE {' AND '.join(where)}" for table in tables
+            )
+            cursor = conn.execute(
+                f"SELECT common_name, SUM(event = 'connect'), SUM(event = 'disconnect'), "
+                f"COALESCE(SUM(duration), 0), COALESCE(SUM(bytes_received), 0), "
+                f"COALESCE(SUM(bytes_sent), 0), MIN(ts), MAX(ts) "
+                f"FROM ({union}) GROUP BY common_name ORDER BY common_name",
+                base_params * len(tables)
+            )
+            columns = ("common_name", "connects", "sessions", "duration", "bytes_received",
+                       "bytes_sent", "first_seen", "last_seen")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(columns, row))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各分区的事件数"""
+        with self._connect() as conn:
+            partitions = {
+                table[len(PARTITION_PREFIX):]: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in self._list_partitions(conn)
+            }
+        with self._cond:
+            pending = len(self._pending)
+        return {"partitions": partitions, "total": sum(partitions.values()), "pending": pending}
+
+    # ==================== 保留期 ====================
+    def prune(self) -> List[str]:
+        """删除整月都已超出保留期的分区，返回被删除的分区名"""
+        cutoff = int(time.time()) - self.retention_days * 86400
+        dropped = []
+        with self._connect() as conn:
+            for table in self._list_partitions(conn):
+                if _partition_end(table) <= cutoff:
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                    dropped.append(table)
+
+        if dropped:
+            logger.info(f"已删除过期的连接历史分区: {', '.join(dropped)}")
+        return dropped
+
+    # ==================== 后台线程 ====================
+    def start(self):
+        """启动事件接收线程与批量写入线程"""
+        if any(t.is_alive() for t in self._threads):
+            return
+        self._stop.clear()
+        sock = self._bind_socket()
+        self._threads = [
+            threading.Thread(target=self._writer_loop, name="history-writer", daemon=True),
+        ]
+        if sock:
+            self._threads.append(
+                threading.Thread(target=self._listener_loop, args=(sock,), name="history-listener", daemon=True)
+            )
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"连接历史记录已启动: {self.socket_path}")
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self.flush()
+
+    def _bind_socket(self) -> Optional[socket.socket]:
+        try:
+            os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(self.socket_path)
+            # OpenVPN 降权（server.conf 中的 group）后执行钩子脚本，只允许该组写入，
+            # 其他本地用户不能伪造连接事件
+            os.chmod(self.socket_path, 0o660)
+            if self.socket_group:
+                try:
+                    os.chown(self.socket_path, -1, grp.getgrnam(self.socket_group).gr_gid)
+                except KeyError:
+                    logger.warning(f"用户组 {self.socket_group} 不存在，连接事件套接字只允许属主写入")
+            sock.settimeout(1.0)
+            return sock
+        except OSError as e:
+            logger.error(f"创建连接事件套接字失败: {e}")
+            return None
+
+    def _listener_loop(self, sock: socket.socket):
+        with sock:
+            while not self._stop.is_set():
+                try:
+                    data = sock.recv(65536)
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    logger.error(f"接收连接事件失败: {e}")
+                    continue
+                try:
+                    self.record(json.loads(data.decode("utf-8")))
+                except (ValueError, AttributeError) as e:
+                    logger.warning(f"无法解析连接事件: {e}")
+
+    def _writer_loop(self):
+        last_prune = 0.0
+        while not self._stop.is_set():
+            with self._cond:
+                if len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+            self.flush()
+
+            if time.monotonic() - last_prune > 3600:
+                last_prune = time.monotonic()
+                try:
+                    self.prune()
+                except sqlite3.Error as e:
+                    logger.error(f"清理连接历史失败: {e}")
+
+    # ==================== 分区 ====================
+    @staticmethod
+    def _list_partitions(conn: sqlite3.Connection) -> List[str]:
+        rows = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ORDER BY name",
+            (PARTITION_PREFIX + "%",)
+        ).fetchall()
+        return [name for (name,) in rows]
+
+    @staticmethod
+    def _ensure_partition(conn: sqlite3.Connection, table: str):
+        # executescript 会先提交当前事务，这里逐条执行
+        for statement in PARTITION_SCHEMA.format(table=table).split(";"):
+            if statement.strip():
+                conn.execute(statement)
+
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+def _partition_name(ts: int) -> str:
+    return PARTITION_PREFIX + datetime.fromtimestamp(ts, timezone.utc).strftime("%Y%m")
+
+
+def _partition_start(table: str) -> int:
+    month = table[len(PARTITION_PREFIX):]
+    return int(datetime(int(month[:4]), int(month[4:]), 1, tzinfo=timezone.utc).timestamp())
+
+
+def _partition_end(table: str) -> int:
+    month = table[len(PARTITION_PREFIX):]
+    year, mon = int(month[:4]), int(month[4:])
+    year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return int(datetime(year, mon, 1, tzinfo=timezone.utc).timestamp())
+
+
+def _partition_overlaps(table: str, since: int, until: int) -> bool:
+    return _partition_start(table) <= until and _partition_end(table) > since
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: python3 -m utils.connection_history <命令>"""
+    parser = argparse.ArgumentParser(description="OpenVPN 连接历史")
+    parser.add_argument("--db", default="/var/lib/ovpn-ui/history.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_sessions = sub.add_parser("sessions", help="查询用户会话")
+    p_sessions.add_argument("common_name")
+    p_sessions.add_argument("--days", type=int, default=90)
+    p_sessions.add_argument("--limit", type=int, default=100)
+    sub.add_parser("stats", help="各分区事件数")
+    p_prune = sub.add_parser("prune", help="删除过期分区")
+    p_prune.add_argument("--retention-days", type=int, default=180)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "sessions":
+        result = ConnectionHistory(db_path=args.db).get_user_sessions(args.common_name, args.days, args.limit)
+    elif args.command == "stats":
+        result = ConnectionHistory(db_path=args.db).get_stats()
+    else:
+        result = ConnectionHistory(db_path=args.db, retention_days=args.retention_days).prune()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
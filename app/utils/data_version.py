@@ -0,0 +1,75 @@
+import logging
+import os
+import sqlite3
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 每张表一个版本号，由触发器在同一事务中递增；API 用它生成 ETag，
+# 轮询时只需读取一行即可判断数据是否变化，不必查询和序列化整张表。
+VERSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS data_version (
+    name VARCHAR(50) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO data_version (name, version) VALUES ('{table}', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_{table}_version_insert AFTER INSERT ON {table}
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE name = '{table}';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_{table}_version_update AFTER UPDATE ON {table}
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE name = '{table}';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_{table}_version_delete AFTER DELETE ON {table}
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE name = '{table}';
+END;
+"""
+
+
+class DataVersion:
+    """数据表版本号"""
+
+    def __init__(self, db_path: str = "/var/lib/ovpn-ui/webui.db",
+                 tables: tuple = ("normal_user", "user_group")):
+        self.db_path = db_path
+        self.tables = tables
+
+    def install(self) -> bool:
+        """创建版本表和触发器"""
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                for table in self.tables:
+                    conn.executescript(VERSION_SCHEMA.format(table=table))
+            finally:
+                conn.close()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"安装数据版本触发器失败: {e}")
+            return False
+
+    def get(self, *names: str) -> Optional[str]:
+        """返回一张或多张表的组合版本号，任一张表未安装时返回 None（调用方应视为不可缓存）
+
+        响应依赖多张表时（例如用户组列表中的成员数来自用户表）需要传入所有表，
+        任一张表变化都会产生新的版本。
+        """
+        if not os.path.exists(self.db_path):
+            return None
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=5)
+            try:
+                rows = dict(conn.execute(
+                    f"SELECT name, version FROM data_version WHERE name IN ({', '.join('?' for _ in names)})",
+                    names
+                ).fetchall())
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        if len(rows) != len(set(names)):
+            return None
+        return "|".join(f"{name}:{rows[name]}" for name in names)
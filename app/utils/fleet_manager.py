@@ -0,0 +1,376 @@
+import ipaddress
+import json
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.openvpn_manager import DEFAULT_MANAGEMENT_SOCKET, OpenVPNManager, kill_command
+
+logger = logging.getLogger(__name__)
+
+# 未配置实例注册表时使用的单实例（与原来的硬编码行为一致）
+DEFAULT_INSTANCE = {
+    "name": "server",
+    "service_name": "openvpn-server@server",
+    "config_dir": "/etc/ovpn-ui/openvpn",
+    "status_file": "/var/log/openvpn-status.log",
+    "management": DEFAULT_MANAGEMENT_SOCKET,
+}
+
+
+class FleetManager:
+    """多实例OpenVPN管理
+
+    OpenVPN 是单线程的，一个实例最多用满一个CPU核心。实例注册表
+    (/etc/ovpn-ui/instances.json) 描述本机每核一个的 UDP/TCP 实例或远程主机上的实例，
+    重启、状态、用户同步、配置下发等操作并发地分发到所有实例，返回每个实例各自的结果。
+
+    注册表示例:
+        [
+            {"name": "udp0", "service_name": "openvpn-server@udp0",
+             "config_dir": "/etc/ovpn-ui/openvpn", "management": "/run/openvpn-server/udp0.sock",
+             "status_file": "/run/openvpn/udp0.status"},
+            {"name": "edge1", "host": "10.0.0.2", "management": "10.0.0.2:7505",
+             "config_dir": "/etc/ovpn-ui/openvpn"}
+        ]
+
+    本机实例的 management 是 Unix 套接字路径（server.conf 中 management <路径> unix，
+    并用 management-client-user 限制连接的用户）。
+    指定 host 的实例通过 ssh 执行 systemctl、通过 rsync 同步文件，必须配置 主机:端口 形式的
+    management（在线会话、连接数和断开用户都通过管理接口完成，不会读取本机的状态文件；
+    管理接口没有认证，远程主机上应只监听内网地址）；
+    指定 systemctl_cmd 可以替换服务控制命令（例如本地测试用的替身实例）。
+    指定 subnet 的实例（tuning_profile 生成的多实例）使用自己的 ccd-<名称> 目录，
+    同步用户时由主 ccd/ 生成，ifconfig-push 换算到实例的子网。
+    每个实例的结果归一为 ok（布尔值）：返回 False、抛出异常或返回带 error 的字典都视为失败。
+    """
+
+    def __init__(self, registry_file: str = "/etc/ovpn-ui/instances.json",
+                 source_config_dir: str = "/etc/ovpn-ui/openvpn",
+                 max_workers: int = 16, timeout: float = 30.0):
+        self.registry_file = registry_file
+        self.source_config_dir = source_config_dir
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._registry_mtime = None
+        self._instances: Dict[str, Dict[str, Any]] = {}
+        self._managers: Dict[str, OpenVPNManager] = {}
+        # 配置无效的实例 -> 错误信息
+        self._invalid: Dict[str, str] = {}
+
+    # ==================== 实例注册表 ====================
+    def get_instances(self) -> List[Dict[str, Any]]:
+        """获取实例列表（注册表文件修改后自动重新加载）"""
+        self._load_registry()
+        return list(self._instances.values())
+
+    def get_manager(self, name: str) -> OpenVPNManager:
+        self._load_registry()
+        if name not in self._managers:
+            raise KeyError(f"实例不存在: {name}")
+        return self._managers[name]
+
+    def save_instances(self, instances: List[Dict[str, Any]]):
+        """保存实例注册表"""
+        names = [inst.get("name") for inst in instances]
+        if not all(names) or len(set(names)) != len(names):
+            raise ValueError("实例名称不能为空且不能重复")
+        for inst in instances:
+            self._build_manager(inst)
+
+        os.makedirs(os.path.dirname(self.registry_file), exist_ok=True)
+        tmp_path = f"{self.registry_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(instances, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.registry_file)
+        self._registry_mtime = None
+        logger.info(f"实例注册表已更新: {len(instances)} 个实例")
+
+    def _load_registry(self):
+        try:
+            mtime = os.stat(self.registry_file).st_mtime_ns
+        except OSError:
+            mtime = 0
+
+        if mtime == self._registry_mtime:
+            return
+
+        # 未配置注册表时的单实例使用主配置目录
+        default = [dict(DEFAULT_INSTANCE, config_dir=self.source_config_dir)]
+        instances = default
+        if mtime:
+            try:
+                with open(self.registry_file, "r") as f:
+                    instances = json.load(f) or default
+            except (OSError, ValueError) as e:
+                logger.error(f"读取实例注册表失败: {e}")
+
+        self._instances = {inst["name"]: inst for inst in instances}
+        self._managers, self._invalid = {}, {}
+        for name, inst in self._instances.items():
+            try:
+                self._managers[name] = self._build_manager(inst)
+            except ValueError as e:
+                logger.error(f"实例 {name} 配置无效: {e}")
+                self._invalid[name] = str(e)
+        self._registry_mtime = mtime
+
+    @staticmethod
+    def _build_manager(inst: Dict[str, Any]) -> OpenVPNManager:
+        remote = bool(inst.get("host"))
+        if remote and not inst.get("management"):
+            # 默认的管理套接字是本机的实例，远程实例的会话和断开操作会发到本机
+            raise ValueError(f"远程实例 {inst.get('name')} 必须配置 management 地址")
+        management = inst.get("management", DEFAULT_INSTANCE["management"])
+        if management.startswith("/"):
+            if remote:
+                raise ValueError(f"远程实例 {inst.get('name')} 的 management 必须是 主机:端口")
+            address = management
+        else:
+            host, _, port = management.rpartition(":")
+            try:
+                address = (host or "127.0.0.1", int(port))
+            except ValueError:
+                raise ValueError(f"无效的 management 地址: {management}")
+        systemctl_cmd = inst.get("systemctl_cmd")
+        if not systemctl_cmd and remote:
+            systemctl_cmd = ["ssh", "-o", "BatchMode=yes", inst["host"], "systemctl"]
+        return OpenVPNManager(
+            config_dir=inst.get("config_dir", DEFAULT_INSTANCE["config_dir"]),
+            # 远程实例的状态文件在远程主机上，只使用管理接口
+            status_file=inst.get("status_file", None if remote else DEFAULT_INSTANCE["status_file"]),
+            service_name=inst.get("service_name", f"openvpn-server@{inst['name']}"),
+            management_address=address,
+            systemctl_cmd=systemctl_cmd,
+        )
+
+    # ==================== 并发分发 ====================
+    def fan_out(self, operation: Callable[[str, OpenVPNManager], Any],
+                names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """在所有（或指定）实例上并发执行操作，返回每个实例的结果"""
+        self._load_registry()
+        targets = names or list(self._instances)
+
+        def run(name):
+            started = time.monotonic()
+            try:
+                result = operation(name, self._managers[name])
+                return name, {"ok": _succeeded(result), "result": result, "elapsed_ms": _elapsed_ms(started)}
+            except Exception as e:
+                logger.error(f"实例 {name} 操作失败: {e}")
+                return name, {"ok": False, "error": str(e), "elapsed_ms": _elapsed_ms(started)}
+
+        unknown = [n for n in targets if n not in self._managers]
+        results = {n: {"ok": False, "error": self._invalid.get(n, "实例不存在")} for n in unknown}
+        targets = [n for n in targets if n in self._managers]
+        if not targets:
+            return results
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(targets))) as executor:
+            results.update(executor.map(run, targets))
+        return results
+
+    # ==================== 实例操作 ====================
+    def restart(self, names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """并发重启实例"""
+        return self.fan_out(lambda name, mgr: mgr.restart_service(), names)
+
+    def status(self) -> Dict[str, Any]:
+        """汇总所有实例的状态"""
+        results = self.fan_out(lambda name, mgr: mgr.get_service_status())
+        active = 0
+        connected = 0
+        for result in results.values():
+            info = result.get("result") or {}
+            if info.get("status") == "active":
+                active += 1
+            connected += info.get("connected_clients", 0)
+
+        return {
+            "status": "active" if active else "inactive",
+            "active_instances": active,
+            "total_instances": len(results),
+            "connected_clients": connected,
+            "instances": results,
+        }
+
+    def sessions(self) -> Dict[str, Any]:
+        """汇总所有实例的在线会话"""
+        results = self.fan_out(lambda name, mgr: mgr.get_sessions())
+        sessions = []
+        for name, result in results.items():
+            for session in result.get("result") or []:
+                sessions.append(dict(session, instance=name))
+        return {
+            "sessions": sessions,
+            "total": len(sessions),
+            "instances": {name: {k: v for k, v in r.items() if k != "result"}
+                          for name, r in results.items()},
+        }
+
+    def kill_client(self, common_name: str) -> Dict[str, Dict[str, Any]]:
+        """在所有实例上断开指定用户
+
+        管理接口可达即为成功；用户不在该实例上时 killed 为 false。
+        """
+        command = kill_command(common_name)
+
+        def kill(name, mgr):
+            lines = mgr.management_command(command)
+            if lines is None:
+                raise ConnectionError("管理接口不可用")
+            return {"killed": bool(lines) and lines[-1].startswith("SUCCESS:")}
+        return self.fan_out(kill)
+
+    def sync_users(self, names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """将主配置目录中的 auth/users 与 ccd/ 同步到各实例"""
+        return self.fan_out(lambda name, mgr: self._sync_instance(name, mgr), names)
+
+    def push_config(self, config: str, names: Optional[List[str]] = None,
+                    restart: bool = False) -> Dict[str, Dict[str, Any]]:
+        """将 server.conf 下发到各实例，可选择下发后重启"""
+        def push(name, mgr):
+            self._write_remote(name, os.path.join(mgr.config_dir, "server.conf"), config.encode("utf-8"))
+            if restart:
+                return mgr.restart_service()
+            return True
+        return self.fan_out(push, names)
+
+    def _sync_instance(self, name: str, mgr: OpenVPNManager) -> Dict[str, int]:
+        inst = self._instances[name]
+        src = self.source_config_dir.rstrip("/")
+        dst = mgr.config_dir.rstrip("/")
+
+        subs = ["auth", "ccd"]
+        copied = 0
+        if inst.get("subnet"):
+            # 远程实例先在本机生成，再随其他目录一起同步
+            ccd_dir = os.path.join(src if inst.get("host") else dst, f"ccd-{name}")
+            copied += _render_instance_ccd(os.path.join(src, "ccd"), ccd_dir, inst["subnet"])
+            subs.append(f"ccd-{name}")
+
+        if inst.get("host"):
+            for sub in subs:
+                subprocess.run(
+                    ["rsync", "-a", "--delete", f"{src}/{sub}/", f"{inst['host']}:{dst}/{sub}/"],
+                    check=True, capture_output=True, timeout=self.timeout
+                )
+            return {"synced": 1}
+
+        if os.path.realpath(src) == os.path.realpath(dst):
+            return {"synced": copied}  # 共享配置目录，auth 与 ccd 无需同步
+
+        for sub in ("auth", "ccd"):
+            copied += _mirror_dir(os.path.join(src, sub), os.path.join(dst, sub))
+        return {"synced": copied}
+
+    def _write_remote(self, name: str, path: str, data: bytes):
+        inst = self._instances[name]
+        if inst.get("host"):
+            subprocess.run(
+                ["ssh", "-o", "BatchMode=yes", inst["host"],
+                 f"cat > {shlex.quote(path + '.tmp')} && mv {shlex.quote(path + '.tmp')} {shlex.quote(path)}"],
+                input=data, check=True, capture_output=True, timeout=self.timeout
+            )
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+
+def _mirror_dir(src: str, dst: str) -> int:
+    """把 src 镜像到 dst，只复制大小或修改时间变化的文件，返回复制的文件数"""
+    os.makedirs(dst, exist_ok=True)
+    copied = 0
+    src_names = set(os.listdir(src)) if os.path.isdir(src) else set()
+
+    for name in src_names:
+        s = os.path.join(src, name)
+        d = os.path.join(dst, name)
+        if not os.path.isfile(s):
+            continue
+        st = os.stat(s)
+        try:
+            dt = os.stat(d)
+            if dt.st_size == st.st_size and dt.st_mtime_ns == st.st_mtime_ns:
+                continue
+        except OSError:
+            pass
+        shutil.copy2(s, f"{d}.tmp")
+        os.replace(f"{d}.tmp", d)
+        copied += 1
+
+    for name in set(os.listdir(dst)) - src_names:
+        os.remove(os.path.join(dst, name))
+    return copied
+
+
+def translate_ccd(content: str, subnet: str) -> str:
+    """把 CCD 中的 ifconfig-push 地址换算为实例子网中序号相同的地址
+
+    序号按 ifconfig-push 行自身的掩码计算（10.8.0.X 255.255.255.0 即第 X 个地址）；
+    实例子网容纳不下的地址去掉 ifconfig-push，由该实例从动态地址池分配。
+    """
+    network = ipaddress.ip_network(subnet)
+    lines = []
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[0] == "ifconfig-push":
+            source = ipaddress.IPv4Interface(f"{parts[1]}/{parts[2]}")
+            offset = int(source.ip) - int(source.network.network_address)
+            if offset >= network.num_addresses - 1:
+                logger.warning(f"实例子网 {subnet} 容纳不下地址 {parts[1]}，改为动态分配")
+                continue
+            line = f"ifconfig-push {network.network_address + offset} {network.netmask}"
+        lines.append(line)
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def _render_instance_ccd(src: str, dst: str, subnet: str) -> int:
+    """由主 ccd/ 生成实例的 CCD 目录，只写入内容变化的文件，返回写入的文件数"""
+    os.makedirs(dst, exist_ok=True)
+    written = 0
+    src_names = set(os.listdir(src)) if os.path.isdir(src) else set()
+
+    for name in src_names:
+        s = os.path.join(src, name)
+        if not os.path.isfile(s):
+            continue
+        with open(s, "r") as f:
+            content = translate_ccd(f.read(), subnet)
+        d = os.path.join(dst, name)
+        try:
+            with open(d, "r") as f:
+                if f.read() == content:
+                    continue
+        except OSError:
+            pass
+        with open(f"{d}.tmp", "w") as f:
+            f.write(content)
+        os.replace(f"{d}.tmp", d)
+        written += 1
+
+    for name in set(os.listdir(dst)) - src_names:
+        os.remove(os.path.join(dst, name))
+    return written
+
+
+def _succeeded(result: Any) -> bool:
+    """把操作的返回值归一为是否成功"""
+    if isinstance(result, bool):
+        return result
+    if result is None:
+        return False
+    if isinstance(result, dict):
+        return result.get("status") != "error" and "error" not in result
+    return True
+
+
+def _elapsed_ms(started: float) -> int:
+    return int((time.monotonic() - started) * 1000)
@@ -0,0 +1,478 @@
+import argparse
+import bisect
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+    inotify_flags = None
+
+logger = logging.getLogger(__name__)
+
+def default_log_sources(log_dir: str = "/var/log/ovpn-ui") -> Dict[str, str]:
+    """默认的日志名 -> 路径（支持通配符，多实例的 OpenVPN 日志按文件名区分，例如 openvpn-server-udp0）
+
+    webui.log 由 app.py 写入 LOG_DIR（OVPN_UI_LOG_DIR）。
+    """
+    return {
+        "webui": os.path.join(log_dir, "webui.log"),
+        "openvpn": "/var/log/openvpn/*.log",
+    }
+
+LEVELS = ("debug", "info", "warning", "error", "critical")
+LEVEL_ALIASES = {"warn": "warning", "fatal": "critical"}
+
+# 每隔多少字节记录一个 (偏移, 时间) 索引点
+INDEX_STEP = 1024 * 1024
+# 向前读取的块大小
+READ_BLOCK = 64 * 1024
+# 单次查询最多扫描的字节数，未找到足够的行时返回 next_before 继续翻页
+MAX_SCAN_BYTES = 8 * 1024 * 1024
+# 单行最大长度和一条记录最多附带的续行数（例如异常堆栈）
+MAX_LINE_BYTES = 8192
+MAX_CONTINUATION_LINES = 200
+
+# webui.log: 2026-10-19 07:08:51,123 - name - INFO - 消息
+WEBUI_LINE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:,\d+)? - (\S+) - ([A-Z]+) - ")
+# OpenVPN 2.5+: 2026-10-19 07:08:51 alice/198.51.100.7:51234 消息
+ISO_LINE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:\.\d+)? (?:([^\s/]+)/[\d.:a-fA-F\[\]]+ )?")
+# OpenVPN 2.4: Mon Oct 19 07:08:51 2026 alice/198.51.100.7:51234 消息
+CTIME_LINE = re.compile(r"^(\w{3} \w{3} [ \d]\d \d\d:\d\d:\d\d \d{4}) (?:([^\s/]+)/[\d.:a-fA-F\[\]]+ )?")
+
+# OpenVPN 日志没有级别，按关键字推断
+OPENVPN_LEVEL_KEYWORDS = (
+    ("critical", ("Exiting due to fatal error", "FATAL")),
+    ("error", ("ERROR", "error:", "AUTH_FAILED", "TLS Error", "VERIFY ERROR")),
+    ("warning", ("WARNING", "WARN", "Bad ", "Inactivity timeout", "TLS handshake failed")),
+)
+OPENVPN_LEVEL_PATTERNS = tuple((level, re.compile("|".join(map(re.escape, keywords))))
+                               for level, keywords in OPENVPN_LEVEL_KEYWORDS)
+
+
+def load_log_config(config_file: str = "/etc/ovpn-ui/webui.json",
+                    log_dir: str = "/var/log/ovpn-ui") -> Dict[str, str]:
+    """读取 webui.json 中的 logs 配置段（日志名 -> 路径），覆盖 default_log_sources 中的同名日志"""
+    try:
+        with open(config_file, "r") as f:
+            return dict(default_log_sources(log_dir), **json.load(f).get("logs", {}))
+    except (OSError, ValueError):
+        return default_log_sources(log_dir)
+
+
+def parse_line(line: str) -> Optional[Dict[str, Any]]:
+    """解析一行的时间、级别和 OpenVPN 用户；不以时间开头的行（续行）返回 None"""
+    if not line[:1].isalnum():
+        return None
+    match = WEBUI_LINE.match(line)
+    if match:
+        return {"ts": _iso_ts(match.group(1)),
+                "level": LEVEL_ALIASES.get(match.group(3).lower(), match.group(3).lower()),
+                "user": None}
+    match = ISO_LINE.match(line)
+    if match:
+        return {"ts": _iso_ts(match.group(1)), "level": _openvpn_level(line), "user": match.group(2)}
+    match = CTIME_LINE.match(line)
+    if match:
+        return {"ts": _ctime_ts(match.group(1)), "level": _openvpn_level(line), "user": match.group(2)}
+    return None
+
+
+def _iso_ts(text: str) -> Optional[int]:
+    """YYYY-MM-DD HH:MM:SS（服务器本地时间）；按小时缓存 mktime 的结果，分秒直接相加"""
+    base = _local_hour(text[:13])
+    if base is None:
+        return None
+    return base + int(text[14:16]) * 60 + int(text[17:19])
+
+
+@lru_cache(maxsize=1024)
+def _local_hour(text: str) -> Optional[int]:
+    try:
+        return int(time.mktime(datetime.strptime(text, "%Y-%m-%d %H").timetuple()))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _ctime_ts(text: str) -> Optional[int]:
+    # OpenVPN 2.4 的时间格式（服务器本地时间）
+    try:
+        return int(time.mktime(datetime.strptime(" ".join(text.split()), "%a %b %d %H:%M:%S %Y").timetuple()))
+    except ValueError:
+        return None
+
+
+def _openvpn_level(line: str) -> str:
+    for level, pattern in OPENVPN_LEVEL_PATTERNS:
+        if pattern.search(line):
+            return level
+    return "info"
+
+
+class LogViewer:
+    """日志查看（从文件末尾向前读取，不读取整个文件）
+
+    - 分页：从 before 偏移（默认文件末尾）向前按块读取，凑够 limit 条匹配的记录即停止，
+      返回最早一条的偏移作为下一页的 before；没有时间戳的续行（异常堆栈）归入前一条记录
+    - 时间范围：每个日志维护稀疏索引（每 1MB 一个 (偏移, 时间) 点），只需对每个索引点 seek
+      并读取一行即可建立，文件增长时只补充新的部分，轮转（inode 变化或文件变小）时重建；
+      until 通过二分查找确定读取的起点，早于 since 的记录出现时停止
+    - 跟随：记录完整的行后按偏移继续读取，有 inotify_simple 时等待 inotify 事件，否则轮询
+    单次查询最多扫描 MAX_SCAN_BYTES，过滤条件很少命中时分多次翻页完成。
+    """
+
+    def __init__(self, sources: Optional[Dict[str, str]] = None):
+        self.sources_config = sources if sources is not None else load_log_config()
+        self._indexes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def sources(self) -> Dict[str, str]:
+        """日志名 -> 文件路径（展开通配符）"""
+        result = {}
+        for name, pattern in self.sources_config.items():
+            if glob.has_magic(pattern):
+                for path in sorted(glob.glob(pattern)):
+                    stem = os.path.splitext(os.path.basename(path))[0]
+                    result[f"{name}-{stem}"] = path
+            else:
+                result[name] = pattern
+        return result
+
+    def list_sources(self) -> List[Dict[str, Any]]:
+        items = []
+        for name, path in self.sources().items():
+            try:
+                st = os.stat(path)
+                items.append({"name": name, "path": path, "size": st.st_size, "mtime": int(st.st_mtime)})
+            except OSError:
+                items.append({"name": name, "path": path, "size": None, "mtime": None})
+        return items
+
+    def resolve(self, name: str) -> str:
+        """日志名对应的路径；只允许访问配置中的日志"""
+        path = self.sources().get(name)
+        if path is None:
+            raise KeyError(name)
+        return path
+
+    # ==================== 分页查询 ====================
+    def read(self, name: str, before: Optional[int] = None, limit: int = 200,
+             level: Optional[str] = None, user: Optional[str] = None, query: Optional[str] = None,
+             since: Optional[int] = None, until: Optional[int] = None) -> Dict[str, Any]:
+        """从 before（默认文件末尾）向前读取匹配的记录，按时间倒序返回"""
+        started = time.monotonic()
+        path = self.resolve(name)
+        match = _make_filter(level, user, query, since, until)
+        limit = max(1, min(limit, 1000))
+
+        items: List[Dict[str, Any]] = []
+        next_before: Optional[int] = None
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            end = _complete_end(f, size)
+            if before is not None:
+                end = min(end, before)
+
+            index = self._index(name, f)
+            start = 0
+            if until is not None:
+                # 第一个时间晚于 until 的索引点之后的数据都不需要读取
+                pos = bisect.bisect_right([ts for _, ts in index], until)
+                if pos < len(index):
+                    end = min(end, index[pos][0])
+            if since is not None:
+                pos = bisect.bisect_left([ts for _, ts in index], since)
+                if pos > 0:
+                    start = index[pos - 1][0]
+
+            scan_floor = start
+            if end - MAX_SCAN_BYTES > start:
+                # 对齐到行首，避免一行被拆到两页
+                scan_floor = _next_line_start(f, end - MAX_SCAN_BYTES, end)
+            for entry in _iter_entries_backward(f, end, scan_floor):
+                if since is not None and entry["ts"] is not None and entry["ts"] < since:
+                    next_before = None
+                    break
+                if match(entry):
+                    items.append(entry)
+                    if len(items) >= limit:
+                        next_before = entry["offset"] if entry["offset"] > start else None
+                        break
+            else:
+                next_before = scan_floor if scan_floor > start else None
+
+        return {"source": name, "size": size, "items": items, "next_before": next_before,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+
+    # ==================== 跟随 ====================
+    def follow(self, name: str, after: Optional[int] = None, level: Optional[str] = None,
+               user: Optional[str] = None, query: Optional[str] = None,
+               timeout: float = 300, heartbeat: float = 15) -> Iterator[Dict[str, Any]]:
+        """产出 after（默认文件末尾）之后新写入的记录；空闲 heartbeat 秒产出一次 None（保活）
+
+        文件被轮转（inode 变化或文件变小）时从新文件开头继续，并产出 {"rotated": True}。
+        """
+        path = self.resolve(name)
+        match = _make_filter(level, user, query, None, None)
+        deadline = time.monotonic() + timeout
+        watcher = self._watch(path)
+        f = open(path, "rb")
+        try:
+            inode = os.fstat(f.fileno()).st_ino
+            offset = _complete_end(f, os.fstat(f.fileno()).st_size) if after is None else after
+            current: Optional[Dict[str, Any]] = None
+            current_matched = False
+            last_output = time.monotonic()
+
+            while time.monotonic() < deadline:
+                f.seek(offset)
+                data = f.read(READ_BLOCK)
+                complete = data.rfind(b"\n") + 1
+                if not complete and len(data) == READ_BLOCK:
+                    # 超长的行按块切开，避免一直等待换行符
+                    complete = len(data)
+                if complete:
+                    for raw, consumed in _split_lines(data[:complete]):
+                        line = raw[:MAX_LINE_BYTES].decode("utf-8", errors="replace").rstrip("\r")
+                        parsed = parse_line(line)
+                        if parsed is not None or current is None:
+                            current = parsed or {"ts": None, "level": None, "user": None}
+                            current_matched = match(dict(current, text=line))
+                        # 续行跟随前一条记录是否匹配
+                        if current_matched:
+                            yield dict(current, offset=offset, text=line, next=offset + consumed)
+                            last_output = time.monotonic()
+                        offset += consumed
+                    continue
+
+                # 没有新数据：检查轮转，然后等待
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    st = None
+                if st is not None and (st.st_ino != inode or st.st_size < offset):
+                    f.close()
+                    f = open(path, "rb")
+                    inode, offset, current = os.fstat(f.fileno()).st_ino, 0, None
+                    yield {"rotated": True, "next": 0}
+                    continue
+                if time.monotonic() - last_output >= heartbeat:
+                    yield None
+                    last_output = time.monotonic()
+                self._wait(watcher, min(heartbeat, max(0.0, deadline - time.monotonic())))
+        finally:
+            f.close()
+            if watcher is not None:
+                watcher.close()
+
+    @staticmethod
+    def _watch(path: str):
+        if INotify is None:
+            return None
+        try:
+            watcher = INotify()
+            # 监视目录：文件被轮转（改名、重新创建）后仍能收到事件
+            watcher.add_watch(os.path.dirname(path) or ".",
+                              inotify_flags.MODIFY | inotify_flags.CREATE | inotify_flags.MOVED_TO)
+            return watcher
+        except OSError as e:
+            logger.warning(f"inotify 不可用，改为轮询: {e}")
+            return None
+
+    @staticmethod
+    def _wait(watcher, seconds: float):
+        if watcher is None:
+            time.sleep(min(seconds, 0.5))
+        else:
+            watcher.read(timeout=int(seconds * 1000), read_delay=50)
+
+    # ==================== 稀疏索引 ====================
+    def _index(self, name: str, f) -> List[Tuple[int, int]]:
+        """[(偏移, 时间)]，按偏移递增；增量补充到当前文件大小"""
+        st = os.fstat(f.fileno())
+        with self._lock:
+            index = self._indexes.get(name)
+            if index is None or index["inode"] != st.st_ino or st.st_size < index["size"]:
+                index = {"inode": st.st_ino, "size": 0, "entries": []}
+                self._indexes[name] = index
+
+            offset = index["entries"][-1][0] + INDEX_STEP if index["entries"] else 0
+            while offset < st.st_size:
+                point = _first_timestamp_after(f, offset, st.st_size)
+                if point is None:
+                    break
+                if not index["entries"] or point[0] > index["entries"][-1][0]:
+                    index["entries"].append(point)
+                offset = max(offset, point[0]) + INDEX_STEP
+            index["size"] = st.st_size
+            return index["entries"]
+
+
+def _make_filter(level, user, query, since, until):
+    level = level.lower() if level else None
+    level = LEVEL_ALIASES.get(level, level)
+    min_level = LEVELS.index(level) if level in LEVELS else None
+    user = user.lower() if user else None
+    query = query.lower() if query else None
+
+    def match(entry: Dict[str, Any]) -> bool:
+        if min_level is not None and LEVELS.index(entry["level"] if entry["level"] in LEVELS else "info") < min_level:
+            return False
+        if user:
+            # OpenVPN 日志按行首的用户名匹配，其他日志按内容匹配
+            if entry["user"] is not None:
+                if entry["user"].lower() != user:
+                    return False
+            elif user not in entry["text"].lower():
+                return False
+        if query and query not in entry["text"].lower():
+            return False
+        if entry["ts"] is not None:
+            if since is not None and entry["ts"] < since:
+                return False
+            if until is not None and entry["ts"] > until:
+                return False
+        return True
+    return match
+
+
+def _complete_end(f, size: int) -> int:
+    """最后一个换行符之后的位置（正在写入的不完整行不返回）"""
+    pos = size
+    while pos > 0:
+        step = min(READ_BLOCK, pos)
+        f.seek(pos - step)
+        data = f.read(step)
+        newline = data.rfind(b"\n")
+        if newline != -1:
+            return pos - step + newline + 1
+        pos -= step
+    return 0
+
+
+def _split_lines(data: bytes) -> List[Tuple[bytes, int]]:
+    """[(行内容, 占用字节数)]；末尾没有换行符的部分作为一行（超长行被切开时）"""
+    lines = data.split(b"\n")
+    result = [(line, len(line) + 1) for line in lines[:-1]]
+    if lines[-1]:
+        result.append((lines[-1], len(lines[-1])))
+    return result
+
+
+def _next_line_start(f, offset: int, limit: int) -> int:
+    f.seek(offset)
+    f.readline()
+    return min(f.tell(), limit)
+
+
+def _first_timestamp_after(f, offset: int, size: int) -> Optional[Tuple[int, int]]:
+    """offset 之后第一条带时间的行 (行首偏移, 时间)"""
+    f.seek(offset)
+    if offset:
+        f.readline()
+    for _ in range(64):
+        line_offset = f.tell()
+        if line_offset >= size:
+            return None
+        raw = f.readline(MAX_LINE_BYTES)
+        if not raw:
+            return None
+        parsed = parse_line(raw.decode("utf-8", errors="replace"))
+        if parsed and parsed["ts"] is not None:
+            return line_offset, parsed["ts"]
+    return None
+
+
+def _iter_lines_backward(f, end: int, start: int) -> Iterator[Tuple[int, bytes]]:
+    """从 end 向前逐行产出 (行首偏移, 行内容)，不超过 start"""
+    pos = end
+    tail = b""
+    while pos > start:
+        step = min(READ_BLOCK, pos - start)
+        pos -= step
+        f.seek(pos)
+        lines = (f.read(step) + tail).split(b"\n")
+        # 第一段可能不完整，与下一块（更早的数据）拼接
+        tail = lines[0]
+        offset = pos + len(tail) + 1
+        complete = []
+        for line in lines[1:]:
+            complete.append((offset, line))
+            offset += len(line) + 1
+        for item in reversed(complete):
+            if item[1]:
+                yield item
+        if len(tail) > MAX_LINE_BYTES * 16:
+            # 异常长的行只保留开头部分
+            tail = tail[:MAX_LINE_BYTES]
+    if tail:
+        yield pos, tail
+
+
+def _iter_entries_backward(f, end: int, start: int) -> Iterator[Dict[str, Any]]:
+    """按记录（带时间的行及其续行）倒序产出"""
+    continuation: List[str] = []
+    for offset, raw in _iter_lines_backward(f, end, start):
+        line = raw[:MAX_LINE_BYTES].decode("utf-8", errors="replace").rstrip("\r")
+        parsed = parse_line(line)
+        if parsed is None:
+            if len(continuation) < MAX_CONTINUATION_LINES:
+                continuation.append(line)
+            continue
+        text = "\n".join([line] + continuation[::-1])
+        continuation = []
+        yield dict(parsed, offset=offset, text=text)
+    if continuation:
+        yield {"ts": None, "level": None, "user": None, "offset": start, "text": "\n".join(continuation[::-1])}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: python3 -m utils.log_viewer <日志名> [-n 行数] [--level error] [--follow]"""
+    parser = argparse.ArgumentParser(description="OpenVPN WebUI 日志查看")
+    parser.add_argument("source", nargs="?", help="日志名，省略时列出所有日志")
+    parser.add_argument("-n", "--limit", type=int, default=50)
+    parser.add_argument("--level", choices=LEVELS + tuple(LEVEL_ALIASES), help="最低级别")
+    parser.add_argument("--user", help="OpenVPN 用户名")
+    parser.add_argument("--grep", help="包含的文本")
+    parser.add_argument("--since", type=int, help="起始时间（Unix 时间戳）")
+    parser.add_argument("--until", type=int, help="结束时间（Unix 时间戳）")
+    parser.add_argument("-f", "--follow", action="store_true", help="持续输出新写入的记录")
+    parser.add_argument("--config", default="/etc/ovpn-ui/webui.json")
+    parser.add_argument("--log-dir", default="/var/log/ovpn-ui")
+    args = parser.parse_args(argv)
+
+    viewer = LogViewer(load_log_config(args.config, args.log_dir))
+    if not args.source:
+        print(json.dumps(viewer.list_sources(), ensure_ascii=False, indent=2))
+        return 0
+    try:
+        page = viewer.read(args.source, limit=args.limit, level=args.level, user=args.user,
+                           query=args.grep, since=args.since, until=args.until)
+    except KeyError:
+        parser.error(f"未知的日志: {args.source}，可选 {', '.join(viewer.sources())}")
+    for entry in reversed(page["items"]):
+        print(entry["text"])
+    if args.follow:
+        try:
+            for entry in viewer.follow(args.source, level=args.level, user=args.user, query=args.grep,
+                                       timeout=float("inf")):
+                if entry and "text" in entry:
+                    print(entry["text"], flush=True)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
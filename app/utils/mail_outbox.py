@@ -0,0 +1,343 @@
+import json
+import logging
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mail_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient VARCHAR(100) NOT NULL,
+    domain VARCHAR(100) NOT NULL,
+    template VARCHAR(30) NOT NULL,
+    subject VARCHAR(200) NOT NULL,
+    body TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL,
+    last_error TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME
+);
+CREATE INDEX IF NOT EXISTS ix_mail_outbox_due ON mail_outbox (status, next_attempt_at);
+"""
+
+# 邮件模板：subject/body 使用 str.format 填充
+MAIL_TEMPLATES = {
+    "verification": {
+        "subject": "请验证您的邮箱 - OpenVPN WebUI",
+        "body": (
+            "{username}，您好：\n\n"
+            "感谢注册 OpenVPN WebUI。请点击以下链接验证您的邮箱地址：\n\n"
+            "{verify_url}\n\n"
+            "链接 {expires_hours} 小时内有效。如果这不是您本人的操作，请忽略此邮件。\n"
+        ),
+    },
+    "approved": {
+        "subject": "您的账户已审核通过 - OpenVPN WebUI",
+        "body": (
+            "{username}，您好：\n\n"
+            "您的账户已通过管理员审核，现在可以登录并设置 OpenVPN 密码：\n\n"
+            "{login_url}\n"
+        ),
+    },
+    "password_changed": {
+        "subject": "OpenVPN 密码已修改 - OpenVPN WebUI",
+        "body": (
+            "{username}，您好：\n\n"
+            "您的 OpenVPN 密码已于 {changed_at} 修改。\n"
+            "如果这不是您本人的操作，请立即联系管理员。\n"
+        ),
+    },
+    "account_expiring": {
+        "subject": "您的账户即将到期 - OpenVPN WebUI",
+        "body": (
+            "{username}，您好：\n\n"
+            "您的 OpenVPN 账户将于 {expires_at}（UTC）到期，到期后将无法连接。\n"
+            "如需继续使用，请联系管理员延期。\n"
+        ),
+    },
+    "account_suspended": {
+        "subject": "您的账户已暂停 - OpenVPN WebUI",
+        "body": (
+            "{username}，您好：\n\n"
+            "由于{reason}，您的 OpenVPN 账户已被暂停。\n"
+            "如需恢复，请联系管理员。\n"
+        ),
+    },
+}
+
+
+def load_mail_config(config_file: str = "/etc/ovpn-ui/webui.json") -> Dict[str, Any]:
+    """读取 webui.json 中的 mail 配置段"""
+    try:
+        with open(config_file, "r") as f:
+            return json.load(f).get("mail", {})
+    except (OSError, ValueError):
+        return {}
+
+
+class MailOutbox:
+    """异步邮件发件箱
+
+    请求处理线程只向 mail_outbox 表插入一行（enqueue），不会等待SMTP服务器；
+    后台发送线程批量取出到期的邮件，复用同一个SMTP连接发送，失败时按指数退避重试，
+    并对每个收件域名限速，避免被对方服务器拒收。
+    """
+
+    def __init__(self, db_path: str = "/var/lib/ovpn-ui/webui.db",
+                 config: Optional[Dict[str, Any]] = None,
+                 batch_size: int = 50, max_attempts: int = 8,
+                 retry_base_seconds: int = 30, retry_max_seconds: int = 3600,
+                 domain_rate_per_minute: int = 30, idle_close_seconds: int = 60):
+        self.db_path = db_path
+        self.config = config if config is not None else load_mail_config()
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.domain_rate_per_minute = domain_rate_per_minute
+        self.idle_close_seconds = idle_close_seconds
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._smtp_last_used = 0.0
+        self._domain_sent: Dict[str, List[float]] = {}
+        self._schema_ready = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config.get("enabled") and self.config.get("host"))
+
+    # ==================== 入队 ====================
+    def enqueue(self, template: str, recipient: str, context: Dict[str, Any]) -> Optional[int]:
+        """渲染模板并写入发件箱，立即返回"""
+        if template not in MAIL_TEMPLATES:
+            raise ValueError(f"未知的邮件模板: {template}")
+        tpl = MAIL_TEMPLATES[template]
+        subject = tpl["subject"].format(**context)
+        body = tpl["body"].format(**context)
+        domain = recipient.rsplit("@", 1)[-1].lower()
+
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO mail_outbox (recipient, domain, template, subject, body, next_attempt_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (recipient, domain, template, subject, body, _db_now())
+                )
+                message_id = cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.error(f"邮件入队失败 ({template} -> {recipient}): {e}")
+            return None
+
+        self._wakeup.set()
+        return message_id
+
+    def get_stats(self) -> Dict[str, int]:
+        """按状态统计发件箱"""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM mail_outbox GROUP BY status").fetchall())
+
+    # ==================== 后台发送 ====================
+    def start(self, poll_interval: float = 10.0):
+        """启动后台发送线程（未配置SMTP时不启动，邮件保留在发件箱中）"""
+        if not self.enabled:
+            logger.info("未配置邮件服务器，邮件将保留在发件箱中")
+            return
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._recover_stale()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    sent = self.process_batch()
+                except Exception as e:
+                    logger.error(f"邮件发送线程异常: {e}")
+                    sent = 0
+                if sent == 0:
+                    self._maybe_close_idle()
+                    self._wakeup.wait(poll_interval)
+                    self._wakeup.clear()
+            self._close_smtp()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="mail-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def process_batch(self) -> int:
+        """发送一批到期的邮件，返回本批处理（成功或失败）的数量"""
+        messages = self._claim_batch()
+        if not messages:
+            return 0
+
+        sent, deferred, failed = [], [], []
+        try:
+            for msg in messages:
+                if not self._domain_allowed(msg["domain"]):
+                    # 超出域名限速：原样放回队列，稍后重试，不计入失败次数
+                    deferred.append((_db_time(datetime.now(timezone.utc) + timedelta(seconds=60)), msg["id"]))
+                    continue
+                try:
+                    self._send(msg)
+                    sent.append((_db_now(), msg["id"]))
+                    self._domain_sent.setdefault(msg["domain"], []).append(time.monotonic())
+                except smtplib.SMTPRecipientsRefused as e:
+                    # 收件人被拒绝属于永久错误，不再重试
+                    failed.append(self._failure(msg, str(e), permanent=True))
+                except (smtplib.SMTPException, OSError) as e:
+                    self._close_smtp()
+                    failed.append(self._failure(msg, str(e)))
+                except Exception as e:
+                    # 邮件本身无法发送（如地址或内容无法编码），重试也不会成功
+                    self._close_smtp()
+                    failed.append(self._failure(msg, f"{type(e).__name__}: {e}", permanent=True))
+        finally:
+            # 即使中途退出也要保存已发送的结果，未处理的邮件放回队列，避免重复发送或卡在 sending
+            done = {row[-1] for row in sent + deferred + failed}
+            deferred += [(_db_now(), msg["id"]) for msg in messages if msg["id"] not in done]
+            with self._connect() as conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "UPDATE mail_outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?", sent)
+                conn.executemany(
+                    "UPDATE mail_outbox SET status = 'pending', next_attempt_at = ? WHERE id = ?", deferred)
+                conn.executemany(
+                    "UPDATE mail_outbox SET status = ?, attempts = attempts + 1, next_attempt_at = ?, "
+                    "last_error = ? WHERE id = ?", failed)
+
+        if sent or failed:
+            logger.info(f"邮件发送: 成功 {len(sent)} 封, 失败 {len(failed)} 封, 限速延后 {len(deferred)} 封")
+        return len(sent) + len(failed)
+
+    def _claim_batch(self) -> List[sqlite3.Row]:
+        """取出一批到期邮件并标记为发送中"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT * FROM mail_outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (_db_now(), self.batch_size)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE mail_outbox SET status = 'sending' WHERE id = ?",
+                    [(row["id"],) for row in rows]
+                )
+        return rows
+
+    def _recover_stale(self):
+        """进程重启后，把上次中断时处于发送中的邮件放回队列"""
+        with self._connect() as conn:
+            conn.execute("UPDATE mail_outbox SET status = 'pending' WHERE status = 'sending'")
+
+    def _failure(self, msg: sqlite3.Row, error: str, permanent: bool = False):
+        attempts = msg["attempts"] + 1
+        if permanent or attempts >= self.max_attempts:
+            logger.error(f"邮件 {msg['id']} 发送失败，不再重试: {error}")
+            return ("failed", _db_now(), error, msg["id"])
+        delay = min(self.retry_base_seconds * (2 ** (attempts - 1)), self.retry_max_seconds)
+        logger.warning(f"邮件 {msg['id']} 发送失败，{delay} 秒后重试: {error}")
+        return ("pending", _db_time(datetime.now(timezone.utc) + timedelta(seconds=delay)), error, msg["id"])
+
+    def _domain_allowed(self, domain: str) -> bool:
+        """每个收件域名每分钟最多发送 domain_rate_per_minute 封"""
+        now = time.monotonic()
+        recent = [t for t in self._domain_sent.get(domain, []) if now - t < 60]
+        self._domain_sent[domain] = recent
+        return len(recent) < self.domain_rate_per_minute
+
+    # ==================== SMTP连接 ====================
+    def _send(self, msg: sqlite3.Row):
+        message = EmailMessage()
+        message["From"] = self.config.get("sender", "ovpn-ui@localhost")
+        message["To"] = msg["recipient"]
+        message["Subject"] = msg["subject"]
+        message["Date"] = formatdate(localtime=True)
+        message["Message-ID"] = make_msgid(domain=message["From"].rsplit("@", 1)[-1])
+        message.set_content(msg["body"])
+        self._get_smtp().send_message(message)
+        self._smtp_last_used = time.monotonic()
+
+    def _get_smtp(self) -> smtplib.SMTP:
+        """获取复用的SMTP连接，断开时自动重连"""
+        if self._smtp is not None:
+            # 连续发送时直接复用，空闲一段时间后先用 NOOP 确认连接仍然可用
+            if time.monotonic() - self._smtp_last_used < 10:
+                return self._smtp
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_smtp()
+
+        host = self.config["host"]
+        port = int(self.config.get("port", 25))
+        timeout = float(self.config.get("timeout", 30))
+        if self.config.get("use_ssl"):
+            smtp = smtplib.SMTP_SSL(host, port, timeout=timeout)
+        else:
+            smtp = smtplib.SMTP(host, port, timeout=timeout)
+            if self.config.get("use_tls"):
+                smtp.starttls()
+        if self.config.get("username"):
+            smtp.login(self.config["username"], self.config.get("password", ""))
+        self._smtp = smtp
+        return smtp
+
+    def _maybe_close_idle(self):
+        if self._smtp is not None and time.monotonic() - self._smtp_last_used > self.idle_close_seconds:
+            self._close_smtp()
+
+    def _close_smtp(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            if not self._schema_ready:
+                conn.executescript(OUTBOX_SCHEMA)
+                self._schema_ready = True
+            yield conn
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+def _db_now() -> str:
+    return _db_time(datetime.now(timezone.utc))
+
+
+def _db_time(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
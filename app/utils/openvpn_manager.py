@@ -1,19 +1,112 @@
 import subprocess
 import os
+import fcntl
+import hmac
 import logging
-from typing import Dict, List, Optional
+import re
+import socket
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
+# 锁定的凭据在哈希前加 "!"（与 /etc/shadow 相同），任何密码都无法匹配，去掉前缀即恢复原密码
+LOCKED_PREFIX = "!"
+
+# 可以直接放进管理接口命令的参数（不含空白、引号、反斜杠和控制字符）
+MANAGEMENT_ARG = re.compile(r'[^\s"\\\x00-\x1f\x7f]+')
+
+# 本机 OpenVPN 管理接口：Unix 套接字，只有 management-client-user 可以连接
+DEFAULT_MANAGEMENT_SOCKET = "/run/openvpn-server/management.sock"
+
+
+def set_line_locked(line: str, locked: bool) -> str:
+    """返回锁定或解锁后的认证文件行"""
+    name, sep, password_hash = line.partition(":")
+    if not sep or password_hash.startswith(LOCKED_PREFIX) == locked:
+        return line
+    password_hash = LOCKED_PREFIX + password_hash if locked else password_hash[len(LOCKED_PREFIX):]
+    return f"{name}:{password_hash}"
+
+
+def is_line_locked(line: str) -> bool:
+    return line.partition(":")[2].startswith(LOCKED_PREFIX)
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """校验 openssl passwd -1 生成的 md5crypt 哈希（用哈希中的 salt 重新计算后比较）"""
+    parts = password_hash.split("$")
+    if len(parts) != 4 or parts[0] or parts[1] != "1":
+        return False
+    result = subprocess.run(
+        ['openssl', 'passwd', '-1', '-salt', parts[2], '-stdin'],
+        input=password, capture_output=True, text=True
+    )
+    return result.returncode == 0 and hmac.compare_digest(result.stdout.strip(), password_hash)
+
+
+def kill_command(common_name: str) -> str:
+    """管理接口的 kill 命令；CN 中的空白、引号或控制字符会改变命令的含义，直接拒绝"""
+    if not common_name or not MANAGEMENT_ARG.fullmatch(common_name):
+        raise ValueError(f"无效的用户名: {common_name!r}")
+    return f"kill {common_name}"
+
+
 class OpenVPNManager:
-    def __init__(self, install_dir: str = "/usr/local/ovpn-ui"):
+    def __init__(self, install_dir: str = "/usr/local/ovpn-ui",
+                 config_dir: str = "/etc/ovpn-ui/openvpn",
+                 status_file: Optional[str] = "/var/log/openvpn-status.log",
+                 service_name: str = "openvpn-server@server",
+                 management_address: Union[str, Tuple[str, int]] = DEFAULT_MANAGEMENT_SOCKET,
+                 systemctl_cmd: Optional[List[str]] = None):
         self.install_dir = install_dir
         self.openvpn_bin = "/usr/sbin/openvpn"  # 使用系统安装的OpenVPN
-        self.config_dir = "/etc/ovpn-ui/openvpn"  # 新的配置目录
+        self.config_dir = config_dir  # 新的配置目录
         self.auth_dir = os.path.join(self.config_dir, "auth")
+        self.status_file = status_file  # 系统标准位置；为 None 时（远程实例）只使用管理接口
+        self.service_name = service_name
+        # 对应 server.conf 中的 management 指令：Unix 套接字路径，或远程实例的 (主机, 端口)
+        self.management_address = management_address
+        # 服务控制命令，远程实例可以设置为 ['ssh', 'host', 'systemctl']
+        self.systemctl_cmd = systemctl_cmd or ['systemctl']
         
+    @contextmanager
+    def lock(self):
+        """用户文件排他锁（auth/users 与 ccd/ 的所有修改都在锁内进行）"""
+        os.makedirs(self.config_dir, exist_ok=True)
+        with open(os.path.join(self.config_dir, ".ovpn-ui.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write_auth_file(self, lines: List[str]):
+        """原子替换认证文件"""
+        auth_file = os.path.join(self.auth_dir, "users")
+        os.makedirs(self.auth_dir, exist_ok=True)
+        tmp_path = f"{auth_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(lines)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, auth_file)
+
+    def write_ccd(self, username: str, ip: int, max_devices: int):
+        """原子写入用户的CCD配置文件"""
+        self.write_ccd_content(username, f"ifconfig-push 10.8.0.{ip} 255.255.255.0\n"
+                                         f"push \"max-routes {max_devices}\"\n")
+
+    def write_ccd_content(self, username: str, content: str):
+        """原子替换用户的CCD配置文件（内容由 CCDCompiler 按用户组策略生成）"""
+        ccd_file = os.path.join(self.config_dir, "ccd", username)
+        os.makedirs(os.path.dirname(ccd_file), exist_ok=True)
+        with open(f"{ccd_file}.tmp", 'w') as f:
+            f.write(content)
+        os.chmod(f"{ccd_file}.tmp", 0o644)
+        os.replace(f"{ccd_file}.tmp", ccd_file)
+
     def create_user(self, username: str, password: str, max_devices: int = 2) -> bool:
-        """创建OpenVPN用户"""
+        """创建OpenVPN用户（用户已存在时更新密码，保留原有IP）"""
         try:
             # 确保目录存在
             os.makedirs(self.auth_dir, exist_ok=True)
@@ -29,19 +122,27 @@ class OpenVPNManager:
             )
             password_hash = result.stdout.strip()
             
-            # 添加用户到认证文件
-            with open(auth_file, 'a') as f:
-                f.write(f"{username}:{password_hash}\n")
-            
-            # 创建CCD配置文件
-            ccd_file = os.path.join(self.config_dir, "ccd", username)
-            with open(ccd_file, 'w') as f:
-                f.write(f"ifconfig-push 10.8.0.{self._get_next_ip()} 255.255.255.0\n")
-                f.write(f"push \"max-routes {max_devices}\"\n")
-            
-            # 设置文件权限
-            os.chmod(auth_file, 0o600)
-            os.chmod(ccd_file, 0o644)
+            with self.lock():
+                lines = []
+                if os.path.exists(auth_file):
+                    with open(auth_file, 'r') as f:
+                        lines = [line for line in f if not line.startswith(f"{username}:")]
+                lines.append(f"{username}:{password_hash}\n")
+                
+                self.write_auth_file(lines)
+
+                # 创建CCD配置文件（已存在时沿用原来的地址，可能是 CCDCompiler 从整个子网分配的）
+                ccd_file = os.path.join(self.config_dir, "ccd", username)
+                push_line = self._read_ccd_push(ccd_file)
+                ip = None if push_line else self._get_next_ip()
+                if push_line:
+                    self.write_ccd_content(username, f"{push_line}\npush \"max-routes {max_devices}\"\n")
+                elif ip:
+                    self.write_ccd(username, ip, max_devices)
+                else:
+                    # 10.8.0.x 的默认地址池已满：先不指定地址，由 CCDCompiler 从服务端子网分配
+                    logger.warning(f"默认地址池已满，OpenVPN用户 {username} 的地址由CCD编译分配")
+                    self.write_ccd_content(username, f"push \"max-routes {max_devices}\"\n")
             
             logger.info(f"OpenVPN用户 {username} 创建成功")
             return True
@@ -50,8 +151,28 @@ class OpenVPNManager:
             logger.error(f"创建OpenVPN用户失败: {e}")
             return False
     
+    def verify_user(self, username: str, password: str) -> bool:
+        """按 auth/users 校验 OpenVPN 登录；锁定（暂停）的凭据一律拒绝"""
+        auth_file = os.path.join(self.auth_dir, "users")
+        password_hash = None
+        try:
+            with open(auth_file, 'r') as f:
+                for line in f:
+                    name, sep, value = line.rstrip("\n").partition(":")
+                    if sep and name == username:
+                        password_hash = value
+        except FileNotFoundError:
+            return False
+        if not password_hash or password_hash.startswith(LOCKED_PREFIX):
+            return False
+        return verify_password(password, password_hash)
+
     def change_password(self, username: str, current_password: str, new_password: str) -> bool:
         """修改用户密码"""
+        with self.lock():
+            return self._change_password(username, current_password, new_password)
+
+    def _change_password(self, username: str, current_password: str, new_password: str) -> bool:
         try:
             auth_file = os.path.join(self.auth_dir, "users")
             
@@ -68,14 +189,8 @@ class OpenVPNManager:
             new_lines = []
             for line in lines:
                 if line.startswith(f"{username}:"):
-                    # 验证当前密码
-                    result = subprocess.run(
-                        ['openssl', 'passwd', '-1', current_password],
-                        capture_output=True, text=True, check=True
-                    )
-                    current_hash = result.stdout.strip()
-                    
-                    if current_hash in line:
+                    # 验证当前密码（md5crypt 的 salt 是随机的，需要用原哈希的 salt 重新计算）
+                    if verify_password(current_password, line.rstrip("\n").partition(":")[2]):
                         # 生成新密码哈希
                         result = subprocess.run(
                             ['openssl', 'passwd', '-1', new_password],
@@ -91,11 +206,7 @@ class OpenVPNManager:
             
             if updated:
                 # 写回文件
-                with open(auth_file, 'w') as f:
-                    f.writelines(new_lines)
-                
-                # 重新设置权限
-                os.chmod(auth_file, 0o600)
+                self.write_auth_file(new_lines)
                 
                 logger.info(f"用户 {username} 密码修改成功")
                 return True
@@ -109,6 +220,59 @@ class OpenVPNManager:
     
     def delete_user(self, username: str) -> bool:
         """删除OpenVPN用户"""
+        with self.lock():
+            return self._delete_user(username)
+
+    def delete_users(self, usernames: List[str]) -> int:
+        """批量删除OpenVPN用户（一次加锁，认证文件只重写一次），返回删除的凭据数"""
+        names = set(usernames)
+        if not names:
+            return 0
+        with self.lock():
+            try:
+                auth_file = os.path.join(self.auth_dir, "users")
+                removed = 0
+                if os.path.exists(auth_file):
+                    with open(auth_file, 'r') as f:
+                        lines = f.readlines()
+                    kept = [line for line in lines if line.split(":", 1)[0] not in names]
+                    removed = len(lines) - len(kept)
+                    if removed:
+                        self.write_auth_file(kept)
+
+                for username in names:
+                    try:
+                        os.remove(os.path.join(self.config_dir, "ccd", username))
+                    except FileNotFoundError:
+                        pass
+
+                logger.info(f"批量删除OpenVPN用户 {len(names)} 个")
+                return removed
+
+            except Exception as e:
+                logger.error(f"批量删除OpenVPN用户失败: {e}")
+                return 0
+
+    def set_locked(self, usernames: List[str], locked: bool) -> int:
+        """锁定（暂停）或解锁（激活）用户凭据，返回修改的凭据数"""
+        names = set(usernames)
+        if not names:
+            return 0
+        with self.lock():
+            auth_file = os.path.join(self.auth_dir, "users")
+            if not os.path.exists(auth_file):
+                return 0
+            with open(auth_file, 'r') as f:
+                lines = f.readlines()
+            new_lines = [set_line_locked(line, locked) if line.split(":", 1)[0] in names else line
+                         for line in lines]
+            changed = sum(1 for old, new in zip(lines, new_lines) if old != new)
+            if changed:
+                self.write_auth_file(new_lines)
+                logger.info(f"已{'锁定' if locked else '解锁'} {changed} 个OpenVPN用户凭据")
+            return changed
+
+    def _delete_user(self, username: str) -> bool:
         try:
             auth_file = os.path.join(self.auth_dir, "users")
             ccd_file = os.path.join(self.config_dir, "ccd", username)
@@ -118,13 +282,7 @@ class OpenVPNManager:
                 with open(auth_file, 'r') as f:
                     lines = f.readlines()
                 
-                with open(auth_file, 'w') as f:
-                    for line in lines:
-                        if not line.startswith(f"{username}:"):
-                            f.write(line)
-                
-                # 重新设置权限
-                os.chmod(auth_file, 0o600)
+                self.write_auth_file([line for line in lines if not line.startswith(f"{username}:")])
             
             # 删除CCD文件
             if os.path.exists(ccd_file):
@@ -141,7 +299,7 @@ class OpenVPNManager:
         """获取OpenVPN服务状态"""
         try:
             result = subprocess.run(
-                ['systemctl', 'is-active', 'openvpn-server@server'],
+                self.systemctl_cmd + ['is-active', self.service_name],
                 capture_output=True, text=True
             )
             
@@ -150,9 +308,10 @@ class OpenVPNManager:
             # 获取连接客户端数量
             connected_clients = 0
             if status == "active":
-                status_file = "/var/log/openvpn-status.log"  # 系统标准位置
-                if os.path.exists(status_file):
-                    with open(status_file, 'r') as f:
+                if self.status_file is None:
+                    connected_clients = len(self.get_sessions())
+                elif os.path.exists(self.status_file):
+                    with open(self.status_file, 'r') as f:
                         for line in f:
                             if line.startswith("CLIENT_LIST"):
                                 connected_clients += 1
@@ -166,16 +325,116 @@ class OpenVPNManager:
             logger.error(f"获取服务状态失败: {e}")
             return {"status": "error", "error": str(e)}
     
+    def get_sessions(self) -> List[Dict[str, str]]:
+        """获取在线会话列表
+
+        优先通过管理接口读取实时状态（status 3），管理接口不可用时读取状态文件；
+        没有状态文件时抛出 ConnectionError。需要 status-version 2/3 格式（CLIENT_LIST 行）。
+        """
+        lines = self.management_command("status 3")
+        if lines is None:
+            if self.status_file is None:
+                raise ConnectionError(f"管理接口不可用: {self.management_label}")
+            if not os.path.exists(self.status_file):
+                return []
+            with open(self.status_file, 'r') as f:
+                lines = f.read().splitlines()
+        return self._parse_client_list(lines)
+
+    @staticmethod
+    def _parse_client_list(lines: List[str]) -> List[Dict[str, str]]:
+        """解析状态输出中的 CLIENT_LIST 行（status-version 2 使用逗号，3 使用制表符）"""
+        columns = ['common_name', 'real_address', 'virtual_address', 'virtual_ipv6_address',
+                   'bytes_received', 'bytes_sent', 'connected_since', 'connected_since_time_t',
+                   'username', 'client_id', 'peer_id', 'data_channel_cipher']
+        sessions = []
+        for line in lines:
+            sep = '\t' if '\t' in line else ','
+            parts = line.split(sep)
+            if parts[0] == 'HEADER' and len(parts) > 1 and parts[1] == 'CLIENT_LIST':
+                columns = [c.strip().lower().replace(' ', '_').replace('(', '').replace(')', '')
+                           for c in parts[2:]]
+            elif parts[0] == 'CLIENT_LIST':
+                sessions.append(dict(zip(columns, parts[1:])))
+        return sessions
+
     def restart_service(self) -> bool:
         """重启OpenVPN服务"""
         try:
-            subprocess.run(['systemctl', 'restart', 'openvpn-server@server'], check=True)
+            subprocess.run(self.systemctl_cmd + ['restart', self.service_name], check=True)
             logger.info("OpenVPN服务重启成功")
             return True
         except subprocess.CalledProcessError as e:
             logger.error(f"重启OpenVPN服务失败: {e}")
             return False
     
+    @property
+    def management_label(self) -> str:
+        """管理接口地址的显示形式"""
+        if isinstance(self.management_address, str):
+            return self.management_address
+        return f"{self.management_address[0]}:{self.management_address[1]}"
+
+    def _connect_management(self, timeout: float) -> socket.socket:
+        """连接管理接口：字符串地址是本机的 Unix 套接字，(host, port) 是远程实例"""
+        if isinstance(self.management_address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(self.management_address)
+            except OSError:
+                sock.close()
+                raise
+            return sock
+        return socket.create_connection(self.management_address, timeout=timeout)
+
+    def management_command(self, command: str, timeout: float = 5.0) -> Optional[List[str]]:
+        """通过OpenVPN管理接口执行命令，返回响应行（连接失败返回None）"""
+        if "\n" in command or "\r" in command:
+            raise ValueError("管理接口命令不能包含换行")
+        try:
+            with self._connect_management(timeout) as sock:
+                f = sock.makefile('rw', encoding='utf-8', newline='\n')
+                f.readline()  # 欢迎信息 >INFO:OpenVPN Management Interface ...
+                f.write(f"{command}\n")
+                f.flush()
+
+                lines = []
+                for line in f:
+                    line = line.rstrip('\r\n')
+                    if line.startswith('>'):
+                        continue  # 实时通知消息
+                    lines.append(line)
+                    if line == 'END' or line.startswith(('SUCCESS:', 'ERROR:')):
+                        break
+
+                f.write("quit\n")
+                f.flush()
+                return lines
+        except OSError as e:
+            logger.warning(f"连接OpenVPN管理接口失败: {e}")
+            return None
+
+    def kill_client(self, common_name: str) -> bool:
+        """断开指定用户的所有在线会话"""
+        lines = self.management_command(kill_command(common_name))
+        if lines and lines[-1].startswith('SUCCESS:'):
+            logger.info(f"已断开用户 {common_name} 的在线会话")
+            return True
+        return False
+
+    @staticmethod
+    def _read_ccd_push(ccd_file: str) -> Optional[str]:
+        """读取CCD文件中的 ifconfig-push 行"""
+        try:
+            with open(ccd_file, 'r') as f:
+                for line in f:
+                    if line.startswith("ifconfig-push"):
+                        return line.strip()
+        except OSError:
+            pass
+        return None
+
     def _get_next_ip(self) -> int:
         """获取下一个可用的IP地址"""
         ccd_dir = os.path.join(self.config_dir, "ccd")
@@ -202,6 +461,10 @@ class OpenVPNManager:
     
     def change_password_direct(self, username: str, new_password: str) -> tuple[bool, str, str]:
         """直接修改用户密码（不需要当前密码）"""
+        with self.lock():
+            return self._change_password_direct(username, new_password)
+
+    def _change_password_direct(self, username: str, new_password: str) -> tuple[bool, str, str]:
         try:
             auth_file = os.path.join(self.auth_dir, "users")
             
@@ -224,18 +487,15 @@ class OpenVPNManager:
                         capture_output=True, text=True, check=True
                     )
                     new_hash = result.stdout.strip()
-                    new_lines.append(f"{username}:{new_hash}\n")
+                    # 暂停期间修改密码不会解除锁定
+                    new_lines.append(set_line_locked(f"{username}:{new_hash}\n", is_line_locked(line)))
                     updated = True
                 else:
                     new_lines.append(line)
             
             if updated:
                 # 写回文件
-                with open(auth_file, 'w') as f:
-                    f.writelines(new_lines)
-                
-                # 重新设置权限
-                os.chmod(auth_file, 0o600)
+                self.write_auth_file(new_lines)
                 
                 logger.info(f"用户 {username} 密码修改成功")
                 return True, "密码修改成功", ""
@@ -0,0 +1,482 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+logger = logging.getLogger(__name__)
+
+CERT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS certificate (
+    serial VARCHAR(40) PRIMARY KEY,
+    common_name VARCHAR(64) NOT NULL,
+    not_before DATETIME NOT NULL,
+    not_after DATETIME NOT NULL,
+    status VARCHAR(12) NOT NULL DEFAULT 'valid',
+    revoked_at DATETIME,
+    revoke_reason VARCHAR(32),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_certificate_cn ON certificate (common_name, status);
+CREATE INDEX IF NOT EXISTS ix_certificate_expiry ON certificate (status, not_after);
+"""
+
+# 子进程中常驻的CA（由进程池 initializer 加载一次）
+_worker_ca = {}
+
+
+def _init_worker(ca_cert_pem: bytes, ca_key_pem: bytes, key_type: str, key_size: int, days: int):
+    """进程池初始化：每个工作进程只解析一次CA证书和私钥"""
+    _worker_ca["cert"] = x509.load_pem_x509_certificate(ca_cert_pem)
+    _worker_ca["key"] = serialization.load_pem_private_key(ca_key_pem, password=None)
+    _worker_ca["key_type"] = key_type
+    _worker_ca["key_size"] = key_size
+    _worker_ca["days"] = days
+
+
+def _issue_one(common_name: str) -> Tuple[str, str, str, str, bytes, bytes]:
+    """在工作进程中生成客户端密钥并签发证书"""
+    ca_cert = _worker_ca["cert"]
+    ca_key = _worker_ca["key"]
+    key = _generate_key(_worker_ca["key_type"], _worker_ca["key_size"])
+
+    now = datetime.now(timezone.utc)
+    not_before = now - timedelta(minutes=5)
+    not_after = now + timedelta(days=_worker_ca["days"])
+    serial = x509.random_serial_number()
+
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)]))
+        .issuer_name(ca_cert.subject)
+        .public_key(key.public_key())
+        .serial_number(serial)
+        .not_valid_before(not_before)
+        .not_valid_after(not_after)
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+        .add_extension(x509.KeyUsage(
+            digital_signature=True, key_encipherment=True, content_commitment=False,
+            data_encipherment=False, key_agreement=False, key_cert_sign=False,
+            crl_sign=False, encipher_only=False, decipher_only=False), critical=True)
+        .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.CLIENT_AUTH]), critical=False)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_key.public_key()), critical=False)
+        .sign(ca_key, hashes.SHA256())
+    )
+
+    cert_pem = cert.public_bytes(serialization.Encoding.PEM)
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+    return (common_name, format(serial, "X"), _db_time(not_before), _db_time(not_after),
+            cert_pem, key_pem)
+
+
+def _generate_key(key_type: str, key_size: int):
+    if key_type == "rsa":
+        return rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+# 客户端证书CN（同时是 private/<CN>.key 和 issued/<CN>.crt 的文件名）
+COMMON_NAME_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+# easy-rsa 目录中CA、服务端和其他 PKI 文件使用的名称
+RESERVED_COMMON_NAMES = {"ca", "server", "dh", "ta", "crl"}
+
+
+def load_pki_dir(config_file: str = "/etc/ovpn-ui/webui.json") -> str:
+    """PKI目录：webui.json 中 openvpn.easy_rsa_dir 下的 pki
+
+    CA、签发的证书和 CRL（OpenVPN crl-verify 读取的文件）都在这个目录中。
+    """
+    try:
+        with open(config_file, "r") as f:
+            easy_rsa_dir = json.load(f).get("openvpn", {}).get("easy_rsa_dir")
+    except (OSError, ValueError):
+        easy_rsa_dir = None
+    return os.path.join(easy_rsa_dir or "/usr/local/ovpn-ui/easy-rsa", "pki")
+
+
+def _db_time(value: datetime) -> str:
+    """与SQLAlchemy存储 DateTime 的格式保持一致"""
+    return value.astimezone(timezone.utc).replace(tzinfo=None).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class PKIManager:
+    """进程内PKI：批量签发客户端证书
+
+    目录结构与 easy-rsa 兼容（ca.crt、private/、issued/），可以直接接管已有的
+    easy-rsa PKI。CA私钥只在进程池启动时加载一次，密钥生成和签名在多个CPU核心上
+    并行执行；证书登记在 webui.db 的 certificate 表中（按序列号、CN、到期时间索引）。
+    """
+
+    def __init__(self, pki_dir: Optional[str] = None,
+                 db_path: str = "/var/lib/ovpn-ui/webui.db",
+                 key_type: str = "ec", key_size: int = 2048,
+                 cert_days: int = 825, workers: Optional[int] = None):
+        pki_dir = pki_dir or load_pki_dir()
+        self.pki_dir = pki_dir
+        self.db_path = db_path
+        self.key_type = key_type
+        self.key_size = key_size
+        self.cert_days = cert_days
+        self.workers = workers or os.cpu_count() or 1
+        self.ca_cert_file = os.path.join(pki_dir, "ca.crt")
+        self.ca_key_file = os.path.join(pki_dir, "private", "ca.key")
+        self.issued_dir = os.path.join(pki_dir, "issued")
+        self.private_dir = os.path.join(pki_dir, "private")
+        self._schema_ready = False
+
+    # ==================== CA ====================
+    def init_ca(self, common_name: str = "OpenVPN-WebUI CA", days: int = 3650) -> bool:
+        """创建CA（已存在时不做任何修改）"""
+        if os.path.exists(self.ca_cert_file) and os.path.exists(self.ca_key_file):
+            logger.info("CA已存在，跳过创建")
+            return False
+
+        os.makedirs(self.private_dir, mode=0o700, exist_ok=True)
+        os.makedirs(self.issued_dir, exist_ok=True)
+
+        key = _generate_key(self.key_type, 4096 if self.key_type == "rsa" else self.key_size)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+        now = datetime.now(timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(minutes=5))
+            .not_valid_after(now + timedelta(days=days))
+            .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+            .add_extension(x509.KeyUsage(
+                digital_signature=False, key_encipherment=False, content_commitment=False,
+                data_encipherment=False, key_agreement=False, key_cert_sign=True,
+                crl_sign=True, encipher_only=False, decipher_only=False), critical=True)
+            .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+            .sign(key, hashes.SHA256())
+        )
+
+        self._write_file(self.ca_key_file, key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ), 0o600)
+        self._write_file(self.ca_cert_file, cert.public_bytes(serialization.Encoding.PEM), 0o644)
+        logger.info(f"CA创建成功: {common_name}")
+        return True
+
+    def get_ca_cert(self) -> str:
+        """获取CA证书PEM（用于填充 client.conf.template 中的 ca_cert）"""
+        with open(self.ca_cert_file, "r") as f:
+            return f.read().strip()
+
+    def load_ca(self):
+        """加载CA证书和私钥"""
+        with open(self.ca_cert_file, "rb") as f:
+            ca_cert = x509.load_pem_x509_certificate(f.read())
+        with open(self.ca_key_file, "rb") as f:
+            ca_key = serialization.load_pem_private_key(f.read(), password=None)
+        return ca_cert, ca_key
+
+    # ==================== 签发 ====================
+    def issue_certificates(self, common_names: Iterable[str], batch_size: int = 500) -> List[Dict]:
+        """批量签发客户端证书
+
+        密钥生成与签名在进程池中并行执行，主进程负责写文件并按批次
+        登记到证书表（每批一个事务）。
+        """
+        names = list(dict.fromkeys(cn for cn in common_names if cn))
+        if not names:
+            return []
+        for cn in names:
+            self._check_common_name(cn)
+
+        with open(self.ca_cert_file, "rb") as f:
+            ca_cert_pem = f.read()
+        with open(self.ca_key_file, "rb") as f:
+            ca_key_pem = f.read()
+
+        os.makedirs(self.issued_dir, exist_ok=True)
+        os.makedirs(self.private_dir, mode=0o700, exist_ok=True)
+
+        issued = []
+        chunksize = max(1, min(64, len(names) // (self.workers * 4) or 1))
+        started = datetime.now()
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(ca_cert_pem, ca_key_pem, self.key_type, self.key_size, self.cert_days)
+        ) as executor, self._connect() as conn:
+            batch = []
+            for result in executor.map(_issue_one, names, chunksize=chunksize):
+                cn, serial, not_before, not_after, cert_pem, key_pem = result
+                self._write_file(os.path.join(self.private_dir, f"{cn}.key"), key_pem, 0o600)
+                self._write_file(os.path.join(self.issued_dir, f"{cn}.crt"), cert_pem, 0o644)
+                batch.append((cn, serial, not_before, not_after))
+                if len(batch) >= batch_size:
+                    self._register(conn, batch)
+                    issued.extend(batch)
+                    batch = []
+            if batch:
+                self._register(conn, batch)
+                issued.extend(batch)
+
+        elapsed = (datetime.now() - started).total_seconds()
+        logger.info(f"证书签发完成: {len(issued)} 个, 耗时 {elapsed:.1f} 秒")
+        return [
+            {"common_name": cn, "serial": serial, "not_before": nb, "not_after": na}
+            for cn, serial, nb, na in issued
+        ]
+
+    def issue_certificate(self, common_name: str) -> Dict:
+        """签发单个客户端证书（不启动进程池）"""
+        ca_cert, ca_key = self.load_ca()
+        _worker_ca.update(cert=ca_cert, key=ca_key, key_type=self.key_type,
+                          key_size=self.key_size, days=self.cert_days)
+        self._check_common_name(common_name)
+        cn, serial, not_before, not_after, cert_pem, key_pem = _issue_one(common_name)
+        self._write_file(os.path.join(self.private_dir, f"{cn}.key"), key_pem, 0o600)
+        self._write_file(os.path.join(self.issued_dir, f"{cn}.crt"), cert_pem, 0o644)
+        with self._connect() as conn:
+            self._register(conn, [(cn, serial, not_before, not_after)])
+        return {"common_name": cn, "serial": serial, "not_before": not_before, "not_after": not_after}
+
+    def _register(self, conn: sqlite3.Connection, rows: List[Tuple[str, str, str, str]]):
+        """登记新证书，同一CN之前的有效证书标记为已替换（发布CRL时以 superseded 原因吊销）"""
+        now = _db_time(datetime.now(timezone.utc))
+        conn.executemany(
+            "UPDATE certificate SET status = 'superseded', revoked_at = ?, revoke_reason = 'superseded' "
+            "WHERE common_name = ? AND status = 'valid'",
+            [(now, row[0]) for row in rows]
+        )
+        conn.executemany(
+            "INSERT INTO certificate (common_name, serial, not_before, not_after, status) "
+            "VALUES (?, ?, ?, ?, 'valid')",
+            rows
+        )
+        conn.commit()
+
+    # ==================== 查询与续期 ====================
+    def get_certificate(self, common_name: str) -> Optional[Dict]:
+        """获取用户当前有效的证书记录"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM certificate WHERE common_name = ? AND status = 'valid' "
+                "ORDER BY not_after DESC LIMIT 1",
+                (common_name,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_expiring(self, days: int = 30, limit: Optional[int] = None) -> List[Dict]:
+        """获取即将到期的有效证书（走 status + not_after 索引）"""
+        cutoff = _db_time(datetime.now(timezone.utc) + timedelta(days=days))
+        sql = ("SELECT * FROM certificate WHERE status = 'valid' AND not_after <= ? "
+               "ORDER BY not_after")
+        params = [cutoff]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def renew_expiring(self, days: int = 30) -> List[Dict]:
+        """批量续期即将到期的证书"""
+        expiring = self.get_expiring(days)
+        if not expiring:
+            logger.info(f"没有 {days} 天内到期的证书")
+            return []
+        logger.info(f"开始续期 {len(expiring)} 个证书")
+        return self.issue_certificates(row["common_name"] for row in expiring)
+
+    def count_certificates(self) -> Dict[str, int]:
+        """按状态统计证书数量"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM certificate GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    # ==================== 内部工具 ====================
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            if not self._schema_ready:
+                conn.executescript(CERT_SCHEMA)
+                self._schema_ready = True
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _check_common_name(common_name: str):
+        # 客户端证书与CA、服务端证书在同一个 private/ 和 issued/ 目录中（easy-rsa 布局），
+        # CN 即文件名，不能与它们重名
+        if (not COMMON_NAME_PATTERN.fullmatch(common_name) or common_name.startswith(".")
+                or common_name.lower() in RESERVED_COMMON_NAMES):
+            raise ValueError(f"无效的证书CN: {common_name}")
+
+    @staticmethod
+    def _write_file(path: str, data: bytes, mode: int):
+        tmp_path = f"{path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class IssueJobRunner:
+    """后台证书签发任务
+
+    批量签发在独立的子进程（本模块的命令行）中执行：Web 服务是多线程进程，在其中
+    创建进程池会在持有锁的线程存在时 fork；子进程是新启动的单线程进程，且请求只需
+    提交任务并返回任务ID，不必等待数分钟的签发过程。同一时间只运行一个任务。
+    子进程替换证书后自行发布CRL；任务成功后通知 revocation_manager 重新加载吊销索引。
+    """
+
+    def __init__(self, pki_manager: PKIManager, revocation_manager=None, max_finished: int = 50):
+        self.pki = pki_manager
+        self.revocation_manager = revocation_manager
+        self.max_finished = max_finished
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, command: str, names: Optional[List[str]] = None, days: int = 30) -> str:
+        """提交签发（issue）或续期（renew）任务，返回任务ID；已有任务运行时抛出 RuntimeError"""
+        args = [sys.executable, "-m", "utils.pki_manager", "--pki-dir", self.pki.pki_dir,
+                "--db", self.pki.db_path, "--workers", str(self.pki.workers)]
+        if command == "issue":
+            names = list(dict.fromkeys(cn for cn in names or [] if cn))
+            for cn in names:
+                self.pki._check_common_name(cn)
+            args += ["issue", "--file", "-"]
+            stdin = "\n".join(names) + "\n"
+        elif command == "renew":
+            args += ["renew", "--days", str(days)]
+            stdin = ""
+        else:
+            raise ValueError(f"未知的任务类型: {command}")
+
+        with self._lock:
+            if any(job["status"] == "running" for job in self._jobs.values()):
+                raise RuntimeError("已有证书签发任务在运行")
+            job = {"id": uuid.uuid4().hex[:12], "command": command, "status": "running",
+                   "count": len(names) if command == "issue" else None,
+                   "started_at": time.time(), "finished_at": None, "result": None, "error": None}
+            self._jobs[job["id"]] = job
+            self._prune()
+
+        threading.Thread(target=self._run, args=(job, args, stdin),
+                         name=f"pki-job-{job['id']}", daemon=True).start()
+        return job["id"]
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self) -> List[Dict]:
+        with self._lock:
+            return sorted((dict(job) for job in self._jobs.values()),
+                          key=lambda job: job["started_at"], reverse=True)
+
+    def _run(self, job: Dict, args: List[str], stdin: str):
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        try:
+            proc = subprocess.Popen(args, cwd=app_dir, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, text=True)
+            stdout, stderr = proc.communicate(stdin)
+            if proc.returncode == 0:
+                result, error = json.loads(stdout), None
+            else:
+                result, error = None, (stderr.strip().splitlines() or [f"退出码 {proc.returncode}"])[-1]
+        except (OSError, ValueError) as e:
+            result, error = None, str(e)
+
+        if self.revocation_manager:
+            # 失败的任务也可能已经登记了部分证书
+            self.revocation_manager.reload()
+        with self._lock:
+            job.update(status="done" if error is None else "failed", result=result, error=error,
+                       finished_at=time.time())
+        if error:
+            logger.error(f"证书任务 {job['id']} 失败: {error}")
+        else:
+            logger.info(f"证书任务 {job['id']} 完成: {result}")
+
+    def _prune(self):
+        finished = sorted((job for job in self._jobs.values() if job["status"] != "running"),
+                          key=lambda job: job["started_at"])
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job["id"]]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: python3 -m utils.pki_manager <命令>"""
+    parser = argparse.ArgumentParser(description="OpenVPN WebUI 证书管理")
+    parser.add_argument("--pki-dir", default=None, help="默认为 webui.json 中 openvpn.easy_rsa_dir 下的 pki")
+    parser.add_argument("--db", default="/var/lib/ovpn-ui/webui.db")
+    parser.add_argument("--workers", type=int, default=None)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_ca = sub.add_parser("init-ca", help="创建CA")
+    p_ca.add_argument("--cn", default="OpenVPN-WebUI CA")
+    p_issue = sub.add_parser("issue", help="批量签发证书")
+    p_issue.add_argument("names", nargs="*")
+    p_issue.add_argument("--file", help="从文件读取CN列表（每行一个，- 表示标准输入）")
+    p_renew = sub.add_parser("renew", help="续期即将到期的证书")
+    p_renew.add_argument("--days", type=int, default=30)
+    p_exp = sub.add_parser("expiring", help="列出即将到期的证书")
+    p_exp.add_argument("--days", type=int, default=30)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    manager = PKIManager(pki_dir=args.pki_dir, db_path=args.db, workers=args.workers)
+
+    if args.command == "init-ca":
+        result = {"created": manager.init_ca(args.cn)}
+    elif args.command == "issue":
+        names = list(args.names)
+        if args.file == "-":
+            names.extend(line.strip() for line in sys.stdin if line.strip())
+        elif args.file:
+            with open(args.file, "r") as f:
+                names.extend(line.strip() for line in f if line.strip())
+        result = {"issued": len(manager.issue_certificates(names))}
+    elif args.command == "renew":
+        result = {"renewed": len(manager.renew_expiring(args.days))}
+    else:
+        result = manager.get_expiring(args.days)
+
+    if args.command in ("issue", "renew") and (result.get("issued") or result.get("renewed")):
+        # 被替换的旧证书需要进入CRL
+        from utils.revocation_manager import RevocationManager
+        RevocationManager(manager).publish_crl()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
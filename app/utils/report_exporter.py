@@ -0,0 +1,327 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from utils.connection_history import EVENT_COLUMNS, ConnectionHistory
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+# 每个数据集的可选列和续传键（续传键总是输出，作为 after 参数恢复导出）
+DATASETS = {
+    "users": {
+        "columns": ("id", "username", "email", "status", "ovpn_username", "group_id", "max_devices",
+                    "ip_type", "static_ip", "password_set", "created_at", "approved_at",
+                    "last_login_at", "last_connect_at", "expires_at"),
+        "key": "id",
+        "filters": ("status", "group_id", "since", "until"),
+    },
+    "events": {
+        "columns": ("event_id",) + EVENT_COLUMNS,
+        "key": "event_id",
+        "filters": ("common_name", "event", "since", "until"),
+    },
+    "usage": {
+        "columns": ("common_name", "connects", "sessions", "duration", "bytes_received",
+                    "bytes_sent", "first_seen", "last_seen"),
+        "key": "common_name",
+        "filters": ("common_name", "since", "until"),
+    },
+    "online": {
+        "columns": ("common_name", "instance", "real_address", "virtual_address", "bytes_received",
+                    "bytes_sent", "connected_since_time_t", "data_channel_cipher"),
+        "key": "common_name",
+        "filters": ("common_name",),
+    },
+}
+
+AFTER_PATTERNS = {
+    "id": re.compile(r"^\d+$"),
+    "event_id": re.compile(r"^\d{6}-\d+$"),
+    "common_name": re.compile(r"^.+$"),
+}
+
+# 每次写出的字节数（小块输出会增加系统调用和 HTTP 分块的开销）
+FLUSH_BYTES = 64 * 1024
+
+
+class ReportExporter:
+    """用户与会话数据的流式导出（CSV / JSONL）
+
+    所有数据集都以生成器逐行产出，内存占用与行数无关：
+    - users：按 id 键集分页，每页一条短查询（webui.db 不是 WAL 模式，长时间持有读锁会阻塞写入）
+    - events / usage：来自 history.db（WAL 模式），一条语句用游标逐批读取
+    - online：所有实例当前的在线会话（数量受服务器容量限制，按用户名排序的快照）
+    每个数据集都有续传键列（users.id、events.event_id、usage/online.common_name），
+    把已收到的最后一行的键作为 after 参数即可从断点继续。
+    """
+
+    def __init__(self, db_path: str = "/var/lib/ovpn-ui/webui.db",
+                 connection_history: Optional[ConnectionHistory] = None,
+                 fleet_manager=None, user_table: str = "normal_user", chunk_size: int = 1000):
+        self.db_path = db_path
+        self.connection_history = connection_history or ConnectionHistory()
+        self.fleet_manager = fleet_manager
+        self.user_table = user_table
+        self.chunk_size = chunk_size
+
+    def prepare(self, dataset: str, fmt: str = "csv", columns: Optional[Sequence[str]] = None,
+                filters: Optional[Dict[str, Any]] = None, after: Optional[str] = None) -> Dict[str, Any]:
+        """校验参数，返回规范化后的导出参数；参数无效时抛出 ValueError（在开始输出之前）"""
+        spec = DATASETS.get(dataset)
+        if spec is None:
+            raise ValueError(f"未知的数据集: {dataset}，可选 {', '.join(DATASETS)}")
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"未知的格式: {fmt}，可选 {', '.join(EXPORT_FORMATS)}")
+
+        columns = [c for c in (columns or spec["columns"]) if c]
+        unknown = [c for c in columns if c not in spec["columns"]]
+        if unknown:
+            raise ValueError(f"未知的列: {', '.join(unknown)}")
+        if spec["key"] not in columns:
+            columns.insert(0, spec["key"])
+
+        filters = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+        unknown = [k for k in filters if k not in spec["filters"]]
+        if unknown:
+            raise ValueError(f"数据集 {dataset} 不支持筛选条件: {', '.join(unknown)}")
+        for key in ("since", "until"):
+            if key in filters:
+                filters[key] = _parse_time(filters[key])
+        if "group_id" in filters:
+            try:
+                filters["group_id"] = int(filters["group_id"])
+            except (TypeError, ValueError):
+                raise ValueError("group_id 必须是整数")
+        if after and not AFTER_PATTERNS[spec["key"]].match(after):
+            raise ValueError(f"续传键格式无效: {after}")
+        return {"dataset": dataset, "format": fmt, "columns": columns, "filters": filters,
+                "key": spec["key"], "after": after or None}
+
+    def export(self, params: Dict[str, Any], limit: Optional[int] = None) -> Iterator[str]:
+        """按 prepare() 的结果逐块产出导出内容"""
+        columns = params["columns"]
+        rows = self.iter_rows(params["dataset"], params["filters"], params["after"])
+        buffer = io.StringIO()
+        if params["format"] == "csv":
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            write = lambda row: writer.writerow([_csv_value(row.get(c)) for c in columns])  # noqa: E731
+        else:
+            write = lambda row: buffer.write(  # noqa: E731
+                json.dumps({c: row.get(c) for c in columns}, ensure_ascii=False, default=str) + "\n")
+
+        count = 0
+        for row in rows:
+            if limit is not None and count >= limit:
+                break
+            write(row)
+            count += 1
+            if buffer.tell() >= FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def iter_rows(self, dataset: str, filters: Dict[str, Any],
+                  after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        if dataset == "users":
+            return self._iter_users(filters, after)
+        since = filters.get("since", 0)
+        until = filters.get("until", int(time.time()))
+        if dataset == "events":
+            return self.connection_history.iter_events(
+                since, until, common_name=filters.get("common_name"), event=filters.get("event"),
+                after=after, chunk_size=self.chunk_size)
+        if dataset == "usage":
+            return self.connection_history.iter_usage(
+                since, until, common_name=filters.get("common_name"), after=after,
+                chunk_size=self.chunk_size)
+        return self._iter_online(filters, after)
+
+    # ==================== 数据源 ====================
+    def _iter_users(self, filters: Dict[str, Any], after: Optional[str]) -> Iterator[Dict[str, Any]]:
+        columns = DATASETS["users"]["columns"]
+        where, params = [], []
+        if "status" in filters:
+            where.append("status = ?")
+            params.append(filters["status"])
+        if "group_id" in filters:
+            where.append("group_id = ?")
+            params.append(filters["group_id"])
+        # created_at 以 SQLAlchemy 的 UTC 文本格式保存，按字符串比较
+        if "since" in filters:
+            where.append("created_at >= ?")
+            params.append(_db_time(filters["since"]))
+        if "until" in filters:
+            where.append("created_at <= ?")
+            params.append(_db_time(filters["until"]))
+        sql = (f"SELECT {', '.join(columns)} FROM {self.user_table} WHERE id > ? "
+               f"{''.join(' AND ' + w for w in where)} ORDER BY id LIMIT ?")
+
+        last_id = int(after) if after else 0
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=30,
+                               check_same_thread=False)
+        try:
+            while True:
+                # 每页读完即结束语句、释放读锁，页与页之间写入可以进行
+                rows = conn.execute(sql, [last_id] + params + [self.chunk_size]).fetchall()
+                for row in rows:
+                    yield dict(zip(columns, row))
+                if len(rows) < self.chunk_size:
+                    break
+                last_id = rows[-1][0]
+        finally:
+            conn.close()
+
+    def _iter_online(self, filters: Dict[str, Any], after: Optional[str]) -> Iterator[Dict[str, Any]]:
+        if self.fleet_manager is None:
+            return
+        sessions = sorted(self.fleet_manager.sessions()["sessions"],
+                          key=lambda s: (s.get("common_name", ""), s.get("instance", "")))
+        for session in sessions:
+            name = session.get("common_name", "")
+            if after and name <= after:
+                continue
+            if filters.get("common_name") and name != filters["common_name"]:
+                continue
+            yield session
+
+
+def _parse_time(value: Any) -> int:
+    """Unix 时间戳或 ISO 8601 时间（不带时区按 UTC）"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"时间格式无效: {value}（使用 Unix 时间戳或 ISO 8601）")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def _db_time(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@"):
+        # 防止电子表格把字段当作公式执行
+        return "'" + value
+    return "" if value is None else value
+
+
+def _resume_point(path: str, fmt: str, key: str) -> Optional[str]:
+    """截掉导出文件末尾不完整的行，返回最后一个完整行的续传键（只读取文件末尾）
+
+    导出中断时最后一行可能只写了一半：JSONL 无法解析，CSV 会得到错误的键
+    （例如 3,"par 得到 3），因此先把文件截断到最后一个行结束符之后。
+    """
+    # csv.writer 的行结束符是 \r\n；JSONL 的换行在字符串中会被转义
+    terminator = b"\n" if fmt == "jsonl" else b"\r\n"
+    with open(path, "r+b") as f:
+        header = f.readline().decode("utf-8", errors="replace").strip()
+        size = f.seek(0, os.SEEK_END)
+        data, pos = b"", size
+        while pos > 0 and data.count(terminator) < 2:
+            start = max(0, pos - 64 * 1024)
+            f.seek(start)
+            data = f.read(pos - start) + data
+            pos = start
+
+        cut = data.rfind(terminator)
+        complete = pos + cut + len(terminator) if cut >= 0 else 0
+        if complete < size:
+            logger.warning(f"截掉导出文件末尾不完整的 {size - complete} 字节: {path}")
+            f.truncate(complete)
+        if cut < 0:
+            return None
+        prev = data.rfind(terminator, 0, cut)
+        line = data[prev + len(terminator) if prev >= 0 else 0:cut].decode("utf-8")
+
+    if fmt == "jsonl":
+        try:
+            return str(json.loads(line)[key])
+        except (ValueError, KeyError):
+            raise ValueError(f"无法从最后一行读取续传键: {line[:100]}")
+    if line.strip() == header:
+        return None
+    row = next(csv.reader([line]))
+    columns = next(csv.reader([header]))
+    if key not in columns or len(row) != len(columns):
+        raise ValueError(f"无法从最后一行读取续传键: {line[:100]}")
+    return row[columns.index(key)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: python3 -m utils.report_exporter <数据集> [--format csv|jsonl] [-o 文件 [--resume]]"""
+    from utils.fleet_manager import FleetManager
+
+    parser = argparse.ArgumentParser(description="OpenVPN WebUI 数据导出")
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--columns", help="逗号分隔的列名，默认全部")
+    parser.add_argument("--status", help="用户状态 (users)")
+    parser.add_argument("--group-id", help="用户组 (users)")
+    parser.add_argument("--common-name", help="OpenVPN 用户名 (events/usage/online)")
+    parser.add_argument("--event", choices=["connect", "disconnect"], help="事件类型 (events)")
+    parser.add_argument("--since", help="起始时间（Unix 时间戳或 ISO 8601）")
+    parser.add_argument("--until", help="结束时间（Unix 时间戳或 ISO 8601）")
+    parser.add_argument("--after", help="从该续传键之后继续导出")
+    parser.add_argument("--limit", type=int, help="最多导出的行数")
+    parser.add_argument("-o", "--output", help="输出文件，默认标准输出")
+    parser.add_argument("--resume", action="store_true", help="从输出文件最后一行继续（追加写入）")
+    parser.add_argument("--db", default="/var/lib/ovpn-ui/webui.db")
+    parser.add_argument("--history-db", default="/var/lib/ovpn-ui/history.db")
+    args = parser.parse_args(argv)
+
+    exporter = ReportExporter(db_path=args.db,
+                              connection_history=ConnectionHistory(db_path=args.history_db),
+                              fleet_manager=FleetManager())
+    filters = {"status": args.status, "group_id": args.group_id, "common_name": args.common_name,
+               "event": args.event, "since": args.since, "until": args.until}
+    filters = {k: v for k, v in filters.items() if v is not None}
+    resuming = args.resume and args.output and os.path.exists(args.output) and os.path.getsize(args.output)
+    after = args.after
+    if resuming:
+        try:
+            after = _resume_point(args.output, args.format, DATASETS[args.dataset]["key"]) or after
+        except ValueError as e:
+            parser.error(str(e))
+        # 只有不完整的表头时文件被截空，重新写表头
+        resuming = os.path.getsize(args.output) > 0
+    try:
+        params = exporter.prepare(args.dataset, args.format,
+                                  args.columns.split(",") if args.columns else None, filters, after)
+    except ValueError as e:
+        parser.error(str(e))
+
+    out = open(args.output, "a" if resuming else "w", newline="") if args.output else sys.stdout
+    try:
+        for i, chunk in enumerate(exporter.export(params, limit=args.limit)):
+            if i == 0 and resuming and args.format == "csv":
+                # 续传时不重复写表头
+                chunk = chunk.split("\n", 1)[1] if "\n" in chunk else ""
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
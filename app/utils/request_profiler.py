@@ -0,0 +1,364 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+from flask import request
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 单个请求最多记录的不同 SQL 语句数（归一化前/后）、子进程调用数、慢请求日志中的调用栈数
+MAX_RAW_SQL = 2000
+MAX_SQL = 200
+MAX_SUBPROCESS = 50
+MAX_STACKS = 10
+
+# SQL 中的字面量（字符串、数字）替换为 ?，避免日志中出现密码哈希等数据，相同语句也能合并计数
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+_local = threading.local()
+_hooks_installed = False
+_original_connect = sqlite3.connect
+
+
+class _Record:
+    """进行中的请求"""
+
+    __slots__ = ("id", "thread_id", "method", "path", "started", "profile",
+                 "stacks", "sql", "sql_total", "subprocesses")
+
+    def __init__(self, method: str, path: str, profile: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.thread_id = threading.get_ident()
+        self.method = method
+        self.path = path
+        self.started = time.monotonic()
+        self.profile = profile
+        self.stacks: Counter = Counter()
+        self.sql: Dict[str, List[float]] = {}
+        self.sql_total = 0
+        self.subprocesses: List[Dict[str, Any]] = []
+
+
+class RequestProfiler:
+    """按需采样分析与慢请求记录
+
+    - 单个请求：管理员请求带 X-Profile: 1 头或 ?_profile=1 参数时，对该请求的线程采样，
+      结束后保存 flame graph 格式（folded stacks）的分析结果，响应头 X-Profile-Id 返回编号
+    - 全局：start_global(seconds) 在 N 秒内对所有线程采样，结束后保存为一个分析结果
+    - 慢请求：请求运行超过 slow_threshold_ms / 4 后开始采样，结束时超过阈值则把
+      调用栈摘要、SQL 语句和子进程调用写入 slow_requests.log（JSON Lines）
+
+    SQL 通过连接的 trace 回调记录，子进程通过 subprocess.Popen 审计事件记录，不修改业务代码。
+    没有请求运行超过采样起点、也没有开启分析时，采样线程休眠到最早的请求到达采样起点
+    （新请求开始时唤醒它重新计算），每个请求的额外开销只有创建记录、两次字典操作和一次唤醒。
+    """
+
+    def __init__(self, log_dir: str = "/var/log/ovpn-ui", slow_threshold_ms: float = 1000,
+                 sample_interval: float = 0.005, max_profiles: int = 50):
+        self.log_dir = log_dir
+        self.profile_dir = os.path.join(log_dir, "profiles")
+        self.slow_log_path = os.path.join(log_dir, "slow_requests.log")
+        self.slow_threshold = slow_threshold_ms / 1000
+        self.sample_after = self.slow_threshold / 4
+        self.sample_interval = sample_interval
+        self.max_profiles = max_profiles
+
+        self._inflight: Dict[int, _Record] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._global_until = 0.0
+        self._global_started: Optional[float] = None
+        self._global_stacks: Counter = Counter()
+        self._slow_logger: Optional[logging.Logger] = None
+
+    def init_app(self, app):
+        """注册请求钩子，安装 SQL 和子进程记录"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        _install_hooks()
+
+    # ==================== 请求钩子 ====================
+    def _before_request(self):
+        record = _Record(request.method, request.path, self._wants_profile())
+        _local.record = record
+        with self._lock:
+            self._inflight[record.thread_id] = record
+        self._ensure_sampler()
+
+    def _after_request(self, response):
+        record = getattr(_local, "record", None)
+        if record is not None:
+            profile_id = self._finish(record, response.status_code)
+            if profile_id:
+                response.headers["X-Profile-Id"] = profile_id
+        return response
+
+    def _teardown_request(self, exc=None):
+        # 视图抛出异常时 after_request 不会执行
+        record = getattr(_local, "record", None)
+        if record is not None:
+            self._finish(record, 500)
+
+    @staticmethod
+    def _wants_profile() -> bool:
+        if request.headers.get("X-Profile") != "1" and request.args.get("_profile") != "1":
+            return False
+        return getattr(current_user, "user_type", "") == "admin"
+
+    def _finish(self, record: _Record, status: int) -> Optional[str]:
+        _local.record = None
+        with self._lock:
+            self._inflight.pop(record.thread_id, None)
+        duration = time.monotonic() - record.started
+
+        profile_id = None
+        if record.profile:
+            profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{record.id}"
+            self._save_profile(profile_id, record.stacks)
+        if duration >= self.slow_threshold:
+            self._log_slow(record, status, duration)
+        return profile_id
+
+    # ==================== 采样 ====================
+    def start_global(self, seconds: int) -> Dict[str, Any]:
+        """对所有线程采样 seconds 秒"""
+        with self._lock:
+            if self._global_started is None:
+                self._global_started = time.monotonic()
+                self._global_stacks = Counter()
+            self._global_until = time.monotonic() + seconds
+        self._ensure_sampler()
+        self._wake.set()
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        remaining = max(0.0, self._global_until - time.monotonic())
+        return {
+            "global_active": self._global_started is not None,
+            "global_remaining": round(remaining, 1),
+            "slow_threshold_ms": self.slow_threshold * 1000,
+            "inflight": len(self._inflight),
+        }
+
+    def _ensure_sampler(self):
+        if self._sampler is None or not self._sampler.is_alive():
+            with self._lock:
+                if self._sampler is None or not self._sampler.is_alive():
+                    self._sampler = threading.Thread(target=self._sample_loop, name="request-profiler",
+                                                     daemon=True)
+                    self._sampler.start()
+        if self._inflight:
+            self._wake.set()
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while True:
+            delay = self._next_sample_delay()
+            if delay > 0:
+                self._wake.wait(timeout=delay)
+                self._wake.clear()
+                continue
+            time.sleep(self.sample_interval)
+
+            now = time.monotonic()
+            global_active = self._global_started is not None
+            frames = None
+            # 在锁内更新：请求结束时先在锁内移出 _inflight，之后采样线程不会再修改它的记录
+            with self._lock:
+                for record in self._inflight.values():
+                    if record.profile or now - record.started >= self.sample_after:
+                        frames = frames or sys._current_frames()
+                        frame = frames.get(record.thread_id)
+                        if frame is not None:
+                            record.stacks[_fold(frame)] += 1
+            if not global_active:
+                continue
+
+            frames = frames or sys._current_frames()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id != own_id:
+                    self._global_stacks[f"{names.get(thread_id, thread_id)};{_fold(frame)}"] += 1
+            if now >= self._global_until:
+                with self._lock:
+                    stacks, self._global_stacks = self._global_stacks, Counter()
+                    self._global_started = None
+                self._save_profile(f"{datetime.now():%Y%m%d-%H%M%S}-global", stacks)
+
+    def _next_sample_delay(self) -> float:
+        """距离需要采样的时间：有分析中的请求或全局采样时为 0，没有进行中的请求时最多 1 秒"""
+        if self._global_started is not None:
+            return 0.0
+        now = time.monotonic()
+        delay = 1.0
+        with self._lock:
+            for record in self._inflight.values():
+                if record.profile:
+                    return 0.0
+                delay = min(delay, record.started + self.sample_after - now)
+        return max(delay, 0.0)
+
+    # ==================== 输出 ====================
+    def _save_profile(self, profile_id: str, stacks: Counter):
+        """保存为 folded stacks（每行 "帧;帧;帧 次数"，可直接用于 flamegraph.pl / speedscope）"""
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            with open(os.path.join(self.profile_dir, f"{profile_id}.folded"), "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self._prune_profiles()
+        except OSError as e:
+            logger.error(f"保存性能分析结果失败: {e}")
+
+    def _prune_profiles(self):
+        files = sorted(name for name in os.listdir(self.profile_dir) if name.endswith(".folded"))
+        for name in files[:-self.max_profiles]:
+            os.remove(os.path.join(self.profile_dir, name))
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.profile_dir):
+            return []
+        profiles = []
+        for name in sorted(os.listdir(self.profile_dir), reverse=True):
+            if name.endswith(".folded"):
+                path = os.path.join(self.profile_dir, name)
+                profiles.append({"id": name[:-len(".folded")], "size": os.path.getsize(path)})
+        return profiles
+
+    def profile_path(self, profile_id: str) -> Optional[str]:
+        """分析结果文件路径（编号不合法或不存在时返回 None）"""
+        if not re.fullmatch(r"[0-9A-Za-z-]+", profile_id):
+            return None
+        path = os.path.join(self.profile_dir, f"{profile_id}.folded")
+        return path if os.path.exists(path) else None
+
+    def _log_slow(self, record: _Record, status: int, duration: float):
+        entry = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "method": record.method,
+            "path": record.path,
+            "status": status,
+            "duration_ms": round(duration * 1000, 1),
+            "samples": sum(record.stacks.values()),
+            "stacks": [{"stack": stack, "samples": count}
+                       for stack, count in record.stacks.most_common(MAX_STACKS)],
+            "sql_total": record.sql_total,
+            "sql": _normalize_sql(record.sql),
+            "subprocesses": record.subprocesses,
+        }
+        self._get_slow_logger().info(json.dumps(entry, ensure_ascii=False))
+
+    def _get_slow_logger(self) -> logging.Logger:
+        if self._slow_logger is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            slow_logger = logging.getLogger("ovpn_ui.slow_requests")
+            slow_logger.propagate = False
+            slow_logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(self.slow_log_path, maxBytes=10 * 1024 * 1024, backupCount=3)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            slow_logger.addHandler(handler)
+            self._slow_logger = slow_logger
+        return self._slow_logger
+
+    def recent_slow_requests(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """最近的慢请求（新的在前）"""
+        if not os.path.exists(self.slow_log_path):
+            return []
+        with open(self.slow_log_path, "r", encoding="utf-8") as f:
+            lines = deque(f, maxlen=limit)
+        entries = []
+        for line in reversed(lines):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+
+def _fold(frame) -> str:
+    """调用栈折叠为 "外层;...;内层"（根在前）"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.startswith(APP_DIR):
+            filename = os.path.relpath(filename, APP_DIR)
+        else:
+            filename = os.path.basename(filename)
+        names.append(f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+# ==================== SQL 与子进程记录 ====================
+def _trace_sql(statement: str):
+    # 每条语句都会调用：只按原始语句计数，归一化留到写慢请求日志时再做
+    record = getattr(_local, "record", None)
+    if record is None:
+        return
+    record.sql_total += 1
+    stats = record.sql.get(statement)
+    if stats is not None:
+        stats[0] += 1
+    elif len(record.sql) < MAX_RAW_SQL:
+        record.sql[statement] = [1, (time.monotonic() - record.started) * 1000]
+
+
+def _normalize_sql(raw: Dict[str, List[float]]) -> List[Dict[str, Any]]:
+    """把原始语句的字面量替换为 ? 后合并计数（按首次执行时间排序）"""
+    merged: Dict[str, List[float]] = {}
+    for statement, (count, first_at) in raw.items():
+        statement = _SQL_LITERAL.sub("?", statement)
+        stats = merged.get(statement)
+        if stats is not None:
+            stats[0] += count
+            stats[1] = min(stats[1], first_at)
+        elif len(merged) < MAX_SQL:
+            merged[statement] = [count, first_at]
+    return [{"statement": statement, "count": int(stats[0]), "first_at_ms": round(stats[1], 1)}
+            for statement, stats in sorted(merged.items(), key=lambda item: item[1][1])]
+
+
+def _traced_connect(*args, **kwargs):
+    conn = _original_connect(*args, **kwargs)
+    # 回调只在请求线程中记录（SQLAlchemy 连接池的连接同样经过这里）
+    conn.set_trace_callback(_trace_sql)
+    return conn
+
+
+def _audit(name: str, args: tuple):
+    if name == "subprocess.Popen":
+        record = getattr(_local, "record", None)
+        if record is not None and len(record.subprocesses) < MAX_SUBPROCESS:
+            argv = [str(a) for a in args[1]] if isinstance(args[1], (list, tuple)) else [str(args[1])]
+            # 只保留命令和前两个参数：后面可能是密码（如 openssl passwd -1 <密码>）
+            record.subprocesses.append({
+                "args": argv[:3] + ([f"...({len(argv) - 3} args)"] if len(argv) > 3 else []),
+                "at_ms": round((time.monotonic() - record.started) * 1000, 1),
+            })
+
+
+def _install_hooks():
+    # 审计钩子无法移除，只安装一次
+    # sqlite3.connect/handle 审计事件触发时连接尚未初始化，无法设置 trace 回调，因此包装 sqlite3.connect
+    global _hooks_installed
+    if not _hooks_installed:
+        sys.addaudithook(_audit)
+        sqlite3.connect = _traced_connect
+        _hooks_installed = True
@@ -0,0 +1,258 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+
+from utils.pki_manager import PKIManager, _db_time
+
+logger = logging.getLogger(__name__)
+
+# 数据库中的吊销原因 -> CRL中的原因码
+REVOKE_REASONS = {
+    "unspecified": x509.ReasonFlags.unspecified,
+    "key_compromise": x509.ReasonFlags.key_compromise,
+    "superseded": x509.ReasonFlags.superseded,
+    "cessation_of_operation": x509.ReasonFlags.cessation_of_operation,
+    "certificate_hold": x509.ReasonFlags.certificate_hold,
+}
+
+
+class RevocationManager:
+    """证书吊销与CRL发布
+
+    吊销记录保存在证书表中（status = 'revoked' / 'hold'，续期替换的旧证书为
+    'superseded'），同时在内存中维护已吊销证书的索引：首次使用时从证书表加载一次，
+    之后新吊销只增加条目，发布CRL不需要像 easy-rsa 那样每次重新扫描整个 index.txt。
+    证书也可能由其他进程（签发任务、命令行）替换，这类修改完成后调用 reload()
+    重新加载索引（IssueJobRunner 在任务成功后调用）。短时间内的多次吊销会合并为一次CRL
+    发布（防抖），CRL通过临时文件 + rename 原子替换，OpenVPN 在下一次握手时即可
+    读取到新文件。
+    """
+
+    def __init__(self, pki_manager: PKIManager, ovpn_manager=None,
+                 crl_file: Optional[str] = None, crl_days: int = 30,
+                 debounce_seconds: float = 2.0, max_delay_seconds: float = 10.0):
+        self.pki = pki_manager
+        self.ovpn_manager = ovpn_manager
+        self.crl_file = crl_file or os.path.join(pki_manager.pki_dir, "crl.pem")
+        self.crl_days = crl_days
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+
+        self._entries: Optional[Dict[int, x509.RevokedCertificate]] = None
+        self._expiry: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._first_request: Optional[float] = None
+        self._last_request: Optional[float] = None
+        self._last_publish: Optional[float] = None
+        self._next_refresh: Optional[float] = None
+        self._worker: Optional[threading.Thread] = None
+
+    # ==================== 吊销 ====================
+    def revoke_user(self, common_name: str, reason: str = "cessation_of_operation",
+                    kick: bool = True) -> int:
+        """吊销用户所有有效证书，并断开其在线会话"""
+        status = "hold" if reason == "certificate_hold" else "revoked"
+        now = datetime.now(timezone.utc)
+
+        with self.pki._connect() as conn:
+            rows = conn.execute(
+                "SELECT serial, not_after FROM certificate "
+                "WHERE common_name = ? AND status = 'valid'",
+                (common_name,)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE certificate SET status = ?, revoked_at = ?, revoke_reason = ? "
+                    "WHERE serial = ?",
+                    [(status, _db_time(now), reason, row["serial"]) for row in rows]
+                )
+
+        if rows:
+            with self._lock:
+                self._load_entries()
+                for row in rows:
+                    self._add_entry(row["serial"], now, reason, row["not_after"])
+            logger.info(f"已吊销用户 {common_name} 的 {len(rows)} 个证书 ({reason})")
+            self.request_publish()
+
+        if kick and self.ovpn_manager:
+            self.ovpn_manager.kill_client(common_name)
+        return len(rows)
+
+    def release_hold(self, common_name: str) -> int:
+        """解除暂停（certificate_hold）状态，恢复用户证书"""
+        with self.pki._connect() as conn:
+            rows = conn.execute(
+                "SELECT serial FROM certificate WHERE common_name = ? AND status = 'hold'",
+                (common_name,)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE certificate SET status = 'valid', revoked_at = NULL, "
+                    "revoke_reason = NULL WHERE serial = ?",
+                    [(row["serial"],) for row in rows]
+                )
+
+        if rows:
+            with self._lock:
+                self._load_entries()
+                for row in rows:
+                    serial = int(row["serial"], 16)
+                    self._entries.pop(serial, None)
+                    self._expiry.pop(serial, None)
+            logger.info(f"已恢复用户 {common_name} 的 {len(rows)} 个证书")
+            self.request_publish()
+        return len(rows)
+
+    def revoked_serials(self) -> List[str]:
+        """当前CRL中的证书序列号"""
+        with self._lock:
+            self._load_entries()
+            return [format(serial, "X") for serial in self._entries]
+
+    # ==================== CRL 发布 ====================
+    def request_publish(self):
+        """请求发布CRL；在防抖窗口内的多次请求只会发布一次"""
+        with self._cond:
+            now = time.monotonic()
+            if self._first_request is None:
+                self._first_request = now
+            self._last_request = now
+            self._ensure_worker()
+            self._cond.notify()
+
+    def publish_crl(self) -> str:
+        """立即生成并原子替换CRL文件"""
+        ca_cert, ca_key = self.pki.load_ca()
+        now = datetime.now(timezone.utc)
+
+        with self._lock:
+            self._load_entries()
+            # 已过期的证书不需要继续出现在CRL中
+            expired = [s for s, exp in self._expiry.items() if exp < now]
+            for serial in expired:
+                self._entries.pop(serial, None)
+                self._expiry.pop(serial, None)
+            revoked = list(self._entries.values())
+
+        # 直接传入列表构造，避免逐个 add_revoked_certificate 产生的 O(n²) 复制
+        builder = x509.CertificateRevocationListBuilder(
+            issuer_name=ca_cert.subject,
+            last_update=now,
+            next_update=now + timedelta(days=self.crl_days),
+            revoked_certificates=revoked,
+        )
+        crl = builder.sign(ca_key, hashes.SHA256())
+        data = crl.public_bytes(serialization.Encoding.PEM)
+
+        tmp_path = f"{self.crl_file}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, self.crl_file)
+
+        self._last_publish = time.monotonic()
+        self._next_refresh = self._last_publish + self.refresh_interval
+        logger.info(f"CRL发布成功: {len(revoked)} 个吊销条目")
+        return self.crl_file
+
+    @property
+    def refresh_interval(self) -> float:
+        """CRL在有效期过半时重新发布"""
+        return self.crl_days * 86400 / 2
+
+    def ensure_crl(self):
+        """确保CRL文件存在且未过半有效期，并启动后台发布线程定期刷新
+
+        OpenVPN 启用 crl-verify 时缺少文件会无法启动，CRL 超过 nextUpdate 后所有连接都会被拒绝；
+        服务启动后可能很长时间没有吊销操作，因此刷新不能依赖吊销触发。
+        """
+        if not os.path.exists(self.pki.ca_key_file):
+            return
+        try:
+            age = time.time() - os.stat(self.crl_file).st_mtime
+        except FileNotFoundError:
+            age = None
+        if age is None or age >= self.refresh_interval:
+            self.publish_crl()
+        else:
+            self._next_refresh = time.monotonic() + self.refresh_interval - age
+        with self._cond:
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._publish_loop, name="crl-publisher", daemon=True)
+            self._worker.start()
+
+    def _publish_loop(self):
+        """后台发布线程：等待防抖窗口结束后发布，并定期刷新即将过期的CRL"""
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._first_request is not None:
+                        quiet_until = self._last_request + self.debounce_seconds
+                        deadline = self._first_request + self.max_delay_seconds
+                        wait = min(quiet_until, deadline) - now
+                        if wait <= 0:
+                            self._first_request = self._last_request = None
+                            break
+                    elif self._next_refresh is not None and now >= self._next_refresh:
+                        break
+                    else:
+                        wait = 3600 if self._next_refresh is None else min(3600, self._next_refresh - now)
+                    self._cond.wait(wait)
+
+            try:
+                self.publish_crl()
+            except Exception as e:
+                logger.error(f"CRL发布失败: {e}")
+                # 稍后重试，避免连续失败时空转
+                self._next_refresh = time.monotonic() + 300
+
+    # ==================== 吊销索引 ====================
+    def reload(self):
+        """证书表被其他进程修改后，下次使用时重新加载索引"""
+        with self._lock:
+            self._entries = None
+
+    def _load_entries(self):
+        """首次使用时从证书表加载已吊销证书（调用方需持有锁）"""
+        if self._entries is not None:
+            return
+        self._entries, self._expiry = {}, {}
+        with self.pki._connect() as conn:
+            rows = conn.execute(
+                "SELECT serial, revoked_at, revoke_reason, not_after FROM certificate "
+                "WHERE status IN ('revoked', 'hold', 'superseded')"
+            ).fetchall()
+        for row in rows:
+            revoked_at = _parse_db_time(row["revoked_at"]) if row["revoked_at"] else datetime.now(timezone.utc)
+            self._add_entry(row["serial"], revoked_at, row["revoke_reason"] or "superseded", row["not_after"])
+
+    def _add_entry(self, serial_hex: str, revoked_at: datetime, reason: str, not_after: str):
+        serial = int(serial_hex, 16)
+        flag = REVOKE_REASONS.get(reason, x509.ReasonFlags.unspecified)
+        builder = (
+            x509.RevokedCertificateBuilder()
+            .serial_number(serial)
+            .revocation_date(revoked_at)
+        )
+        if flag != x509.ReasonFlags.unspecified:
+            builder = builder.add_extension(x509.CRLReason(flag), critical=False)
+        self._entries[serial] = builder.build()
+        self._expiry[serial] = _parse_db_time(not_after)
+
+
+def _parse_db_time(value: str) -> datetime:
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
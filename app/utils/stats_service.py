@@ -0,0 +1,179 @@
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 计数表与按小时分桶的事件表；触发器在修改用户表的同一事务中维护计数，
+# 因此无论通过哪个路由（注册、审核、暂停、激活、删除）修改 status 都不会遗漏。
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_status_counter (
+    status VARCHAR(20) PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS user_event_bucket (
+    bucket VARCHAR(19) NOT NULL,
+    event VARCHAR(20) NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, event)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_insert AFTER INSERT ON {table}
+BEGIN
+    INSERT INTO user_status_counter (status, count) VALUES (COALESCE(NEW.status, 'pending'), 1)
+        ON CONFLICT(status) DO UPDATE SET count = count + 1;
+    INSERT INTO user_event_bucket (bucket, event, count)
+        VALUES (strftime('%Y-%m-%d %H:00:00', 'now'), 'registered', 1)
+        ON CONFLICT(bucket, event) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_update AFTER UPDATE OF status ON {table}
+WHEN COALESCE(OLD.status, 'pending') != COALESCE(NEW.status, 'pending')
+BEGIN
+    UPDATE user_status_counter SET count = count - 1 WHERE status = COALESCE(OLD.status, 'pending');
+    INSERT INTO user_status_counter (status, count) VALUES (COALESCE(NEW.status, 'pending'), 1)
+        ON CONFLICT(status) DO UPDATE SET count = count + 1;
+    INSERT INTO user_event_bucket (bucket, event, count)
+        VALUES (strftime('%Y-%m-%d %H:00:00', 'now'), NEW.status, 1)
+        ON CONFLICT(bucket, event) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_delete AFTER DELETE ON {table}
+BEGIN
+    UPDATE user_status_counter SET count = count - 1 WHERE status = COALESCE(OLD.status, 'pending');
+    INSERT INTO user_event_bucket (bucket, event, count)
+        VALUES (strftime('%Y-%m-%d %H:00:00', 'now'), 'deleted', 1)
+        ON CONFLICT(bucket, event) DO UPDATE SET count = count + 1;
+END;
+"""
+
+
+class StatsService:
+    """用户统计服务
+
+    控制面板轮询时只读取计数表（行数等于状态种类数）和最近的事件分桶，
+    与用户总数无关。定期对账用 GROUP BY 重新计算并修正偏差（例如触发器安装之前
+    的数据，或者绕过数据库直接修改文件的情况）。
+    """
+
+    def __init__(self, db_path: str = "/var/lib/ovpn-ui/webui.db",
+                 user_table: str = "normal_user",
+                 bucket_retention_days: int = 90):
+        self.db_path = db_path
+        self.user_table = user_table
+        self.bucket_retention_days = bucket_retention_days
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def install(self) -> bool:
+        """创建计数表和触发器，并做一次初始对账"""
+        try:
+            with self._connect() as conn:
+                conn.executescript(STATS_SCHEMA.format(table=self.user_table))
+            self.reconcile()
+            logger.info("用户统计触发器安装完成")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"安装用户统计触发器失败: {e}")
+            return False
+
+    def get_stats(self) -> Dict:
+        """获取控制面板统计数据"""
+        now = datetime.now(timezone.utc)
+        since_24h = (now - timedelta(hours=24)).strftime("%Y-%m-%d %H:00:00")
+        since_7d = (now - timedelta(days=7)).strftime("%Y-%m-%d %H:00:00")
+
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, count FROM user_status_counter").fetchall())
+            rows = conn.execute(
+                "SELECT bucket, event, count FROM user_event_bucket WHERE bucket >= ? ORDER BY bucket",
+                (since_7d,)
+            ).fetchall()
+
+        rates = {"last_24h": {}, "last_7d": {}}
+        hourly: Dict[str, Dict[str, int]] = {}
+        for bucket, event, count in rows:
+            rates["last_7d"][event] = rates["last_7d"].get(event, 0) + count
+            if bucket >= since_24h:
+                rates["last_24h"][event] = rates["last_24h"].get(event, 0) + count
+                hourly.setdefault(bucket, {})[event] = count
+
+        return {
+            "total_users": sum(counts.values()),
+            "pending_users": counts.get("pending", 0),
+            "approved_users": counts.get("approved", 0),
+            "suspended_users": counts.get("suspended", 0),
+            "rejected_users": counts.get("rejected", 0),
+            "by_status": counts,
+            "rates": rates,
+            "hourly": [dict(events, bucket=bucket) for bucket, events in hourly.items()],
+        }
+
+    def reconcile(self) -> Dict[str, int]:
+        """用实际数据重新计算计数，返回被修正的偏差"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            actual = dict(conn.execute(
+                f"SELECT COALESCE(status, 'pending'), COUNT(*) FROM {self.user_table} "
+                f"GROUP BY COALESCE(status, 'pending')"
+            ).fetchall())
+            stored = dict(conn.execute("SELECT status, count FROM user_status_counter").fetchall())
+
+            drift = {}
+            for status in set(actual) | set(stored):
+                diff = actual.get(status, 0) - stored.get(status, 0)
+                if diff:
+                    drift[status] = diff
+
+            if drift:
+                conn.execute("DELETE FROM user_status_counter")
+                conn.executemany(
+                    "INSERT INTO user_status_counter (status, count) VALUES (?, ?)",
+                    list(actual.items())
+                )
+
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=self.bucket_retention_days)).strftime(
+                "%Y-%m-%d %H:00:00")
+            conn.execute("DELETE FROM user_event_bucket WHERE bucket < ?", (cutoff,))
+
+        if drift:
+            logger.warning(f"用户统计计数存在偏差，已修正: {drift}")
+        return drift
+
+    def start_reconciler(self, interval: int = 3600):
+        """启动后台定期对账线程"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.reconcile()
+                except sqlite3.Error as e:
+                    logger.error(f"用户统计对账失败: {e}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="stats-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop_reconciler(self):
+        self._stop.set()
+
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
@@ -0,0 +1,358 @@
+import argparse
+import ipaddress
+import json
+import logging
+import math
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.config_parser import ConfigParser
+from utils.fleet_manager import FleetManager
+from utils.pki_manager import load_pki_dir
+
+logger = logging.getLogger(__name__)
+
+# OpenVPN 数据通道支持的AEAD算法（openssl 名称）
+AEAD_CIPHERS = ["AES-256-GCM", "AES-128-GCM", "CHACHA20-POLY1305"]
+
+# 性能配置档
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # 兼容模式：只协商AEAD并保留CBC回退，其余使用OpenVPN默认值
+    "compatible": {
+        "fallback_cipher": "AES-256-CBC",
+        "sndbuf": 0,
+        "rcvbuf": 0,
+        "fast_io": False,
+        "tun_mtu": 1500,
+        "mssfix": 1450,
+        "txqueuelen": 0,
+    },
+    "balanced": {
+        "fallback_cipher": "AES-256-CBC",
+        "sndbuf": 393216,
+        "rcvbuf": 393216,
+        "fast_io": True,
+        "tun_mtu": 1500,
+        "mssfix": 1450,
+        "txqueuelen": 1000,
+    },
+    # 高吞吐：更大的套接字缓冲区和发送队列，不再接受非AEAD客户端
+    "throughput": {
+        "fallback_cipher": None,
+        "sndbuf": 2097152,
+        "rcvbuf": 2097152,
+        "fast_io": True,
+        "tun_mtu": 1500,
+        "mssfix": 1450,
+        "txqueuelen": 4000,
+    },
+}
+
+
+class ServerProfileGenerator(ConfigParser):
+    """根据性能配置档生成服务端/客户端配置
+
+    OpenVPN 单个进程只能使用一个CPU核心，因此按核心数生成多个实例：
+    每个实例使用独立端口（端口分片）、独立的 tun 设备和从总地址池中切分出的子网，
+    客户端配置列出所有实例并使用 remote-random 分散连接。生成的实例同时写入
+    FleetManager 的实例注册表；各实例的 CCD 目录（静态地址换算到实例子网）
+    由 FleetManager.sync_users 生成，用户或组策略变更后需要重新同步。
+    """
+
+    def __init__(self, config_dir: str = "/etc/ovpn-ui", profile: str = "balanced"):
+        super().__init__(config_dir)
+        if profile not in PROFILES:
+            raise ValueError(f"未知的性能配置档: {profile}")
+        self.profile_name = profile
+        self.profile = PROFILES[profile]
+        self.openvpn_dir = os.path.join(config_dir, "openvpn")
+        self.benchmark_file = os.path.join(config_dir, "cipher_benchmark.json")
+
+    # ==================== 实例布局 ====================
+    def build_layout(self, instances: Optional[int] = None, protocols: tuple = ("udp",),
+                     base_port: int = 1194, network: str = "10.8.0.0/16") -> List[Dict[str, Any]]:
+        """生成实例布局：每个实例的协议、端口、tun设备和客户端地址池"""
+        per_proto = instances or os.cpu_count() or 1
+        total = per_proto * len(protocols)
+
+        pool = ipaddress.ip_network(network)
+        new_prefix = pool.prefixlen + math.ceil(math.log2(total)) if total > 1 else pool.prefixlen
+        # CCD 中的静态地址是 10.8.0.x 的最后一段，换算到实例子网后需要容纳 x <= 253
+        if new_prefix > 24:
+            raise ValueError(f"地址池 {network} 太小，无法切分给 {total} 个实例")
+        subnets = list(pool.subnets(new_prefix=new_prefix))
+
+        layout = []
+        for p_index, proto in enumerate(protocols):
+            for i in range(per_proto):
+                index = p_index * per_proto + i
+                name = f"{proto}{i}"
+                layout.append({
+                    "name": name,
+                    "proto": proto,
+                    # 不同协议使用不同的端口段，避免 TCP/UDP 端口号交错
+                    "port": base_port + p_index * 100 + i,
+                    "dev": f"tun{index}",
+                    "subnet": str(subnets[index]),
+                    "management": f"/run/openvpn-server/management-{name}.sock",
+                })
+        return layout
+
+    def build_server_config(self, instance: Dict[str, Any]) -> Dict[str, Any]:
+        """生成单个实例的服务端配置"""
+        profile = self.profile
+        subnet = ipaddress.ip_network(instance["subnet"])
+        name = instance["name"]
+
+        config = self.get_default_openvpn_config()
+        config.pop("cipher", None)
+        config.update({
+            "port": str(instance["port"]),
+            "proto": instance["proto"],
+            "dev": instance["dev"],
+            "server": f"{subnet.network_address} {subnet.netmask}",
+            "topology": "subnet",
+            "ifconfig-pool-persist": os.path.join(self.openvpn_dir, f"ipp-{name}.txt"),
+            # 每个实例的 CCD 由 FleetManager.sync_users 从 ccd/ 生成，地址位于实例子网内
+            "client-config-dir": os.path.join(self.openvpn_dir, f"ccd-{name}"),
+            "status": f"/run/openvpn-server/status-{name}.log",
+            "status-version": "2",
+            # 与 RevocationManager 发布CRL的位置一致
+            "crl-verify": os.path.join(load_pki_dir(os.path.join(self.config_dir, "webui.json")), "crl.pem"),
+            "log-append": f"/var/log/openvpn/server-{name}.log",
+            # Unix 套接字，只有 root（WebUI 服务）可以连接
+            "management": f"{instance['management']} unix",
+            "management-client-user": "root",
+            "data-ciphers": ":".join(self.cipher_preference()),
+            "tun-mtu": str(profile["tun_mtu"]),
+        })
+
+        if profile["fallback_cipher"]:
+            config["data-ciphers-fallback"] = profile["fallback_cipher"]
+        else:
+            config.pop("data-ciphers-fallback", None)
+
+        pushes = list(config.get("push", []))
+        if profile["sndbuf"]:
+            config["sndbuf"] = str(profile["sndbuf"])
+            config["rcvbuf"] = str(profile["rcvbuf"])
+            pushes += [f"\"sndbuf {profile['sndbuf']}\"", f"\"rcvbuf {profile['rcvbuf']}\""]
+        config["push"] = pushes
+
+        if instance["proto"] == "udp":
+            config["mssfix"] = str(profile["mssfix"])
+            config["explicit-exit-notify"] = "1"
+            if profile["fast_io"]:
+                config["fast-io"] = ""
+        else:
+            config.pop("explicit-exit-notify", None)
+
+        if profile["txqueuelen"]:
+            config["txqueuelen"] = str(profile["txqueuelen"])
+
+        return config
+
+    def build_client_config(self, server_address: str, layout: List[Dict[str, Any]],
+                            ca_cert: str = "{{ ca_cert }}") -> str:
+        """生成客户端配置：列出所有实例端口并随机选择，实现连接分片"""
+        lines = [
+            "client",
+            "dev tun",
+            "nobind",
+            "resolv-retry infinite",
+            "persist-key",
+            "persist-tun",
+            "remote-cert-tls server",
+        ]
+        # UDP 实例优先，TCP 作为回退
+        for instance in sorted(layout, key=lambda x: x["proto"] != "udp"):
+            lines.append(f"remote {server_address} {instance['port']} {instance['proto']}")
+        if len(layout) > 1:
+            lines.append("remote-random")
+
+        lines.append(f"data-ciphers {':'.join(self.cipher_preference())}")
+        if self.profile["fallback_cipher"]:
+            lines.append(f"data-ciphers-fallback {self.profile['fallback_cipher']}")
+        # 缓冲区由服务端 push，客户端使用系统默认值
+        lines += ["sndbuf 0", "rcvbuf 0", "auth SHA256", "verb 3", "auth-user-pass",
+                  "<ca>", ca_cert, "</ca>"]
+        return "\n".join(lines) + "\n"
+
+    def write_layout(self, layout: List[Dict[str, Any]],
+                     registry_file: Optional[str] = None) -> List[str]:
+        """写入所有实例的配置文件，并更新实例注册表"""
+        written = []
+        original = self.openvpn_config
+        try:
+            for instance in layout:
+                self.openvpn_config = os.path.join(self.openvpn_dir, f"server-{instance['name']}.conf")
+                if not self.write_openvpn_config(self.build_server_config(instance)):
+                    raise OSError(f"写入实例 {instance['name']} 配置失败")
+                written.append(self.openvpn_config)
+        finally:
+            self.openvpn_config = original
+
+        if registry_file:
+            # openvpn-server@<名称> 读取 /etc/openvpn/server/<名称>.conf，安装时需要建立软链接
+            fleet = FleetManager(registry_file=registry_file, source_config_dir=self.openvpn_dir)
+            fleet.save_instances([
+                {
+                    "name": instance["name"],
+                    "service_name": f"openvpn-server@server-{instance['name']}",
+                    "config_dir": self.openvpn_dir,
+                    "status_file": f"/run/openvpn-server/status-{instance['name']}.log",
+                    "management": instance["management"],
+                    "subnet": instance["subnet"],
+                }
+                for instance in layout
+            ])
+            fleet.sync_users()
+
+        logger.info(f"已生成 {len(written)} 个实例配置 (配置档: {self.profile_name})")
+        return written
+
+    # ==================== 算法选择 ====================
+    def cipher_preference(self) -> List[str]:
+        """数据通道算法的协商顺序：有本机基准测试结果时按吞吐量排序"""
+        try:
+            with open(self.benchmark_file, "r") as f:
+                results = json.load(f)["results"]
+            ranked = [r["cipher"] for r in sorted(results, key=lambda r: -r["bytes_per_sec"])
+                      if r["cipher"] in AEAD_CIPHERS]
+            # 结果中缺少的算法追加在最后，保证与客户端的兼容性
+            return ranked + [c for c in AEAD_CIPHERS if c not in ranked]
+        except (OSError, ValueError, KeyError):
+            return list(AEAD_CIPHERS)
+
+    def save_benchmark(self, results: List[Dict[str, Any]]):
+        os.makedirs(os.path.dirname(self.benchmark_file), exist_ok=True)
+        with open(self.benchmark_file, "w") as f:
+            json.dump({"measured_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=4)
+
+
+def benchmark_ciphers(ciphers: Optional[List[str]] = None, packet_size: int = 1400,
+                      seconds: int = 1) -> List[Dict[str, Any]]:
+    """测量本机各算法在典型数据包大小下的加密吞吐量
+
+    优先使用 openssl speed（与 OpenVPN 使用同一个加密库），
+    没有 openssl 命令时使用 cryptography 库近似测量。
+    """
+    results = []
+    for cipher in ciphers or AEAD_CIPHERS:
+        if shutil.which("openssl"):
+            rate = _openssl_speed(cipher, packet_size, seconds)
+        else:
+            rate = _python_speed(cipher, packet_size, seconds)
+        if rate is not None:
+            results.append({"cipher": cipher, "packet_size": packet_size,
+                            "bytes_per_sec": rate, "mbit_per_sec": round(rate * 8 / 1e6, 1)})
+            logger.info(f"{cipher}: {rate * 8 / 1e6:.0f} Mbit/s")
+    return sorted(results, key=lambda r: -r["bytes_per_sec"])
+
+
+def _openssl_speed(cipher: str, packet_size: int, seconds: int) -> Optional[float]:
+    try:
+        result = subprocess.run(
+            ["openssl", "speed", "-evp", cipher.lower(), "-bytes", str(packet_size),
+             "-seconds", str(seconds), "-mr"],
+            capture_output=True, text=True, timeout=seconds * 10 + 10
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"openssl speed 执行失败 ({cipher}): {e}")
+        return None
+
+    # 机器可读输出: +F:<序号>:<算法名>:<每个数据包大小对应的 字节/秒>
+    for line in result.stdout.splitlines():
+        if line.startswith("+F:"):
+            return float(line.split(":")[-1])
+    logger.warning(f"openssl 不支持算法 {cipher}")
+    return None
+
+
+def _python_speed(cipher: str, packet_size: int, seconds: int) -> Optional[float]:
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+    except ImportError:
+        return None
+
+    if cipher == "CHACHA20-POLY1305":
+        aead = ChaCha20Poly1305(os.urandom(32))
+    elif cipher in ("AES-256-GCM", "AES-128-GCM"):
+        aead = AESGCM(os.urandom(32 if cipher == "AES-256-GCM" else 16))
+    else:
+        return None
+
+    packet = os.urandom(packet_size)
+    nonce = os.urandom(12)
+    processed = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            aead.encrypt(nonce, packet, None)
+        processed += packet_size * 100
+    return processed / (time.perf_counter() - started)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: python3 -m utils.tuning_profile <命令>"""
+    parser = argparse.ArgumentParser(description="OpenVPN 性能配置生成")
+    parser.add_argument("--config-dir", default="/etc/ovpn-ui")
+    parser.add_argument("--profile", default="balanced", choices=sorted(PROFILES))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_bench = sub.add_parser("benchmark", help="测量本机加密吞吐量并保存结果")
+    p_bench.add_argument("--packet-size", type=int, default=1400)
+    p_bench.add_argument("--seconds", type=int, default=1)
+
+    p_gen = sub.add_parser("generate", help="生成多实例服务端配置和客户端模板")
+    p_gen.add_argument("--instances", type=int, default=None, help="每种协议的实例数（默认CPU核心数）")
+    p_gen.add_argument("--proto", default="udp", help="协议列表，如 udp,tcp")
+    p_gen.add_argument("--port", type=int, default=1194)
+    p_gen.add_argument("--network", default="10.8.0.0/16")
+    p_gen.add_argument("--server-address", default="{{ server_address }}")
+    p_gen.add_argument("--registry", default="/etc/ovpn-ui/instances.json")
+    p_gen.add_argument("--dry-run", action="store_true", help="只打印配置，不写入文件")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    generator = ServerProfileGenerator(args.config_dir, args.profile)
+
+    if args.command == "benchmark":
+        results = benchmark_ciphers(packet_size=args.packet_size, seconds=args.seconds)
+        generator.save_benchmark(results)
+        print(json.dumps(results, indent=2))
+        return 0
+
+    try:
+        layout = generator.build_layout(args.instances, tuple(args.proto.split(",")),
+                                        args.port, args.network)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    client_config = generator.build_client_config(args.server_address, layout)
+    if args.dry_run:
+        for instance in layout:
+            print(f"# ===== server-{instance['name']}.conf =====")
+            for key, value in generator.build_server_config(instance).items():
+                for item in value if isinstance(value, list) else [value]:
+                    print(f"{key} {item}".rstrip())
+        print("# ===== client.conf =====")
+        print(client_config)
+        return 0
+
+    generator.write_layout(layout, args.registry)
+    client_file = os.path.join(generator.openvpn_dir, "client.conf.template")
+    with open(client_file, "w") as f:
+        f.write(client_config)
+    print(f"✅ 已生成 {len(layout)} 个实例配置，客户端模板: {client_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
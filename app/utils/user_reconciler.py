@@ -0,0 +1,447 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.ccd_compiler import CCDCompiler, load_server_network
+from utils.data_version import DataVersion
+from utils.openvpn_manager import OpenVPNManager, is_line_locked, set_line_locked
+
+logger = logging.getLogger(__name__)
+
+# 保留 OpenVPN 凭据的用户状态；暂停的用户凭据被锁定（哈希前加 "!"），激活时解锁即可恢复
+CREDENTIAL_STATUSES = ("approved", "suspended")
+
+# CCD 地址池，与 OpenVPNManager._get_next_ip 一致
+IP_POOL = range(50, 254)
+
+# OpenVPN 自身使用的 CCD 文件名（没有单独配置的客户端使用 ccd/DEFAULT），不属于任何用户
+RESERVED_CCD_NAMES = {"DEFAULT"}
+
+# 一次对账中删除和重置的条目超过用户数的该比例（且超过 REMOVAL_GUARD_MIN 条）时不执行，
+# 例如数据库被清空或从旧备份恢复；确认无误后用命令行的 --force 执行
+REMOVAL_GUARD_RATIO = 0.2
+REMOVAL_GUARD_MIN = 20
+
+# 会删除凭据、CCD 或重置密码状态的差异
+DESTRUCTIVE_KEYS = ("auth_remove", "ccd_remove", "db_reset_password_set")
+
+
+class UserReconciler:
+    """数据库与用户文件的增量对账
+
+    三个数据源可能出现偏差：normal_user 表、auth/users 中的行、ccd/ 下的文件。
+    对账时以数据库为准计算差异：
+
+    - auth/users 中属于不保留凭据用户（被拒绝、待审核）的行被删除，重复行只保留最后一行
+    - 暂停用户的凭据未锁定时锁定，正常用户的凭据被锁定时解锁
+    - 已设置密码但 auth/users 中没有凭据的用户，把 password_set 置为 0，让用户重新设置
+    - auth/users 中有凭据但 password_set 为 0 的用户，把 password_set 置为 1
+    - 有凭据的用户缺少 CCD 文件时补建，max-routes 与 max_devices 不一致时更新
+    - 属于不保留凭据用户的 CCD 文件被删除
+
+    只删除数据库中存在的用户的条目：数据库中没有的名称（ccd/DEFAULT、脚本创建的用户、
+    已删除但文件删除失败的用户）只在报告的 unmanaged 中列出，不做修改。删除和重置的
+    数量超过阈值时（数据库被清空或从旧备份恢复）整体跳过这些修改，只记录错误。
+
+    增量：用户表按 data_version 缓存，auth/users 按 (mtime, size, inode) 缓存解析结果，
+    ccd/ 每次只做一次 scandir，只重新读取 (mtime, size) 变化的文件；三者都没有重新加载时
+    沿用上次的差异结果。三者都未变化时（用户表版本 + 两个 mtime），定时检查直接跳过。
+    完整检查仍要 stat 每个 CCD 文件（原地编辑不会改变目录 mtime），10 万用户约需 0.5 秒。
+
+    修复在用户文件锁内进行：数据库修改在一个事务中，auth/users 整体原子替换，
+    CCD 文件逐个原子替换；文件写入失败时回滚数据库事务，下次对账会继续完成剩余修改。
+    max_devices 按用户组策略计算（与 CCDCompiler 一致），因此用户表和用户组表的版本都参与缓存。
+    """
+
+    def __init__(self, ovpn_manager: OpenVPNManager,
+                 db_path: str = "/var/lib/ovpn-ui/webui.db",
+                 user_table: str = "normal_user",
+                 ccd_compiler: Optional[CCDCompiler] = None):
+        self.ovpn_manager = ovpn_manager
+        # 设置后 CCD 文件的创建和更新交给编译器（按用户组策略生成完整内容）
+        self.ccd_compiler = ccd_compiler
+        self.db_path = db_path
+        self.user_table = user_table
+        self.data_version = DataVersion(db_path)
+
+        self._users_cache: Tuple[Optional[tuple], Dict[str, Tuple[int, bool, int, bool]], Dict[str, set]] = \
+            (None, {}, {"known": set(), "suspended": set(), "password_set": set()})
+        self._auth_cache: Tuple[Optional[tuple], List[Tuple[str, str]], Dict[str, set]] = \
+            (None, [], {"names": set(), "duplicated": set(), "locked": set()})
+        self._ccd_cache: Dict[str, Tuple[int, int, Optional[int], Optional[int]]] = {}
+        self._stop = threading.Event()
+        self._ccd_dir_mtime: Optional[int] = None
+        self._clean_signature: Optional[tuple] = None
+        # 上次计算差异时的 (用户, auth/users 行, CCD 扫描结果) 对象和差异
+        self._last_plan: Optional[tuple] = None
+        self._thread: Optional[threading.Thread] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    @property
+    def auth_file(self) -> str:
+        return os.path.join(self.ovpn_manager.auth_dir, "users")
+
+    @property
+    def ccd_dir(self) -> str:
+        return os.path.join(self.ovpn_manager.config_dir, "ccd")
+
+    # ==================== 对账 ====================
+    def plan(self, full: bool = True) -> Dict[str, Any]:
+        """计算差异（不做任何修改）"""
+        stats = {"users_queried": False, "auth_parsed": False, "ccd_scanned": False, "ccd_read": 0}
+        users, user_sets = self._load_users(stats)
+        auth_lines, auth_sets = self._load_auth(stats)
+        ccd = self._scan_ccd(stats, full)
+
+        inputs = (users, auth_lines, ccd)
+        if self._last_plan is not None and all(a is b for a, b in zip(inputs, self._last_plan[0])):
+            # 三个数据源都没有重新加载（内容未变化），差异与上次相同
+            plan, unmanaged = self._last_plan[1]
+            return self._report(plan, unmanaged, stats, inputs)
+
+        # 差异都用集合运算得到，只对（通常很少的）结果排序
+        auth_names = auth_sets["names"]
+        known = user_sets["known"]
+        # 有凭据的用户；没有凭据的用户保留现有 CCD（重新设置密码时沿用原来的IP）
+        with_credentials = users.keys() & auth_names
+        without_credentials = users.keys() - with_credentials
+        suspended, locked = user_sets["suspended"], auth_sets["locked"]
+
+        orphan_auth = auth_names - users.keys()
+        orphan_ccd = ccd.keys() - users.keys() - RESERVED_CCD_NAMES
+
+        plan: Dict[str, List[Any]] = {
+            "auth_remove": sorted(orphan_auth & known),
+            "auth_dedupe": sorted(auth_sets["duplicated"] & users.keys()),
+            "auth_lock": sorted((suspended - locked) & with_credentials),
+            "auth_unlock": sorted((locked - suspended) & with_credentials),
+            "db_mark_password_set": [{"id": users[n][0], "username": n}
+                                     for n in sorted(with_credentials - user_sets["password_set"])],
+            "db_reset_password_set": [{"id": users[n][0], "username": n}
+                                      for n in sorted(without_credentials & user_sets["password_set"])],
+            "ccd_create": [{"username": n, "max_devices": users[n][2]}
+                           for n in sorted(with_credentials - ccd.keys())],
+            "ccd_update": [{"username": n, "max_devices": users[n][2]}
+                           for n in sorted(n for n in with_credentials & ccd.keys() if ccd[n][3] != users[n][2])],
+            "ccd_remove": sorted(orphan_ccd & known),
+        }
+
+        unmanaged = {"auth": sorted(orphan_auth - known), "ccd": sorted(orphan_ccd - known)}
+        self._last_plan = (inputs, (plan, unmanaged))
+        return self._report(plan, unmanaged, stats, inputs)
+
+    @staticmethod
+    def _report(plan: Dict[str, List[Any]], unmanaged: Dict[str, List[str]], stats: Dict[str, Any],
+                inputs: tuple) -> Dict[str, Any]:
+        users, auth_lines, ccd = inputs
+        return {"changes": sum(len(v) for v in plan.values()),
+                "plan": {key: list(value) for key, value in plan.items()},
+                "unmanaged": {key: list(value) for key, value in unmanaged.items()}, "stats": stats,
+                "users": len(users), "auth_entries": len(auth_lines), "ccd_files": len(ccd)}
+
+    def reconcile(self, dry_run: bool = False, full: bool = True, force: bool = False) -> Dict[str, Any]:
+        """执行对账；dry_run 时只返回差异报告
+
+        删除和重置的数量超过阈值时跳过这些修改（报告中的 blocked），force=True 时照常执行。
+
+        full=False 时，如果用户表版本、auth/users 和 ccd/ 目录自上次无差异的检查后都没有变化，
+        直接跳过；只有 ccd/ 目录未变化时沿用上次的扫描结果。
+        原地编辑 CCD 文件不会改变目录 mtime，因此定时任务会定期做完整检查。
+        """
+        started = time.monotonic()
+        with self.ovpn_manager.lock():
+            signature = self._signature()
+            if not full and signature is not None and signature == self._clean_signature:
+                report = {"changes": 0, "skipped": True, "dry_run": dry_run}
+            else:
+                report = self.plan(full)
+                report["dry_run"] = dry_run
+                blocked = {} if force else self._guard(report)
+                if blocked:
+                    report["blocked"] = blocked
+                if not dry_run and report["changes"]:
+                    plan = dict(report["plan"], **{key: [] for key in blocked})
+                    report["errors"] = self._apply(plan)
+                # 检查开始前的状态无差异，且 mtime 不在当前时间附近（同一时间片内的修改可能未被看到）
+                clean = report["changes"] == 0 and signature is not None and \
+                    time.time_ns() - max(signature[1:]) > 2_000_000_000
+                self._clean_signature = signature if clean else None
+
+        report["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+        if report.get("blocked"):
+            logger.error(f"用户数据对账需要删除或重置的条目过多，已跳过: {report['blocked']}，"
+                         f"确认后执行 python3 -m utils.user_reconciler --force")
+        if report["changes"] and not dry_run:
+            logger.warning(f"用户数据对账修复了 {report['changes']} 处偏差: "
+                           f"{ {k: len(v) for k, v in report['plan'].items() if v} }")
+        self.last_report = report
+        return report
+
+    @staticmethod
+    def _guard(report: Dict[str, Any]) -> Dict[str, int]:
+        """删除和重置的条目超过阈值时返回各项数量，否则返回空字典"""
+        counts = {key: len(report["plan"][key]) for key in DESTRUCTIVE_KEYS if report["plan"][key]}
+        limit = max(REMOVAL_GUARD_MIN, report["users"] * REMOVAL_GUARD_RATIO)
+        return counts if sum(counts.values()) > limit else {}
+
+    def _signature(self) -> Optional[tuple]:
+        """(用户表和用户组表版本, auth/users mtime, ccd/ 目录 mtime)，无法确定时返回 None"""
+        version = self._users_version()
+        if version is None:
+            return None
+        try:
+            return (version, os.stat(self.auth_file).st_mtime_ns, os.stat(self.ccd_dir).st_mtime_ns)
+        except OSError:
+            return None
+
+    def _apply(self, plan: Dict[str, List[Any]]) -> List[str]:
+        # CCD 缓存会在原地修改，修复后重新计算差异
+        self._last_plan = None
+        errors = []
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(f"UPDATE {self.user_table} SET password_set = 1 WHERE id = ?",
+                             [(u["id"],) for u in plan["db_mark_password_set"]])
+            conn.executemany(f"UPDATE {self.user_table} SET password_set = 0 WHERE id = ?",
+                             [(u["id"],) for u in plan["db_reset_password_set"]])
+
+            try:
+                self._apply_files(plan, errors, conn)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return errors
+
+    def _apply_files(self, plan: Dict[str, List[Any]], errors: List[str], conn: sqlite3.Connection):
+        if plan["auth_remove"] or plan["auth_dedupe"] or plan["auth_lock"] or plan["auth_unlock"]:
+            remove = set(plan["auth_remove"])
+            lock, unlock = set(plan["auth_lock"]), set(plan["auth_unlock"])
+            latest = {}
+            for name, line in self._auth_cache[1]:
+                if name not in remove:
+                    latest[name] = set_line_locked(line, True) if name in lock else \
+                        set_line_locked(line, False) if name in unlock else line
+            # 保持原有顺序，重复的用户保留最后一行
+            seen = set()
+            lines = []
+            for name, _ in self._auth_cache[1]:
+                if name in latest and name not in seen:
+                    seen.add(name)
+                    lines.append(latest[name])
+            self.ovpn_manager.write_auth_file(lines)
+
+        if self.ccd_compiler is not None:
+            # 编译器生成完整内容（组路由、DNS 等），沿用现有IP，没有时从组的地址池分配
+            names = [item["username"] for item in plan["ccd_create"] + plan["ccd_update"]]
+            if names:
+                errors.extend(self.ccd_compiler.compile_locked(conn, usernames=names)["errors"])
+        else:
+            self._create_ccd(plan["ccd_create"], errors)
+            for item in plan["ccd_update"]:
+                self._update_max_routes(item["username"], item["max_devices"])
+
+        for name in plan["ccd_remove"]:
+            try:
+                os.remove(os.path.join(self.ccd_dir, name))
+            except FileNotFoundError:
+                pass
+            self._ccd_cache.pop(name, None)
+
+    def _create_ccd(self, items: List[Dict[str, Any]], errors: List[str]):
+        used_ips = {entry[2] for entry in self._ccd_cache.values() if entry[2]}
+        free_ips = (ip for ip in IP_POOL if ip not in used_ips)
+        unassigned = []
+        for item in items:
+            ip = next(free_ips, None)
+            if ip is None:
+                unassigned.append(item["username"])
+                continue
+            self.ovpn_manager.write_ccd(item["username"], ip, item["max_devices"])
+        if unassigned:
+            errors.append(f"地址池已满，{len(unassigned)} 个用户未创建CCD配置: {', '.join(unassigned[:10])}")
+
+    def _update_max_routes(self, username: str, max_devices: int):
+        """只替换 max-routes 行，保留CCD文件中的其他配置"""
+        path = os.path.join(self.ccd_dir, username)
+        with open(path, "r") as f:
+            lines = [line for line in f if "max-routes" not in line]
+        lines.append(f"push \"max-routes {max_devices}\"\n")
+        with open(f"{path}.tmp", "w") as f:
+            f.writelines(lines)
+        os.chmod(f"{path}.tmp", 0o644)
+        os.replace(f"{path}.tmp", path)
+
+    # ==================== 数据源（带缓存） ====================
+    def _load_users(self, stats: Dict[str, Any]) -> Tuple[Dict[str, Tuple[int, bool, int, bool]], Dict[str, set]]:
+        """返回 {保留凭据的ovpn用户名: (id, password_set, max_devices, 是否暂停)} 和名称集合：
+        known（数据库中所有ovpn用户名）、suspended、password_set
+        """
+        version = self._users_version()
+        cached_version, cached, cached_sets = self._users_cache
+        if version is not None and version == cached_version:
+            return cached, cached_sets
+
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=30)
+        try:
+            rows = conn.execute(
+                f"SELECT id, ovpn_username, password_set, max_devices, status FROM {self.user_table} "
+                f"WHERE ovpn_username IS NOT NULL AND ovpn_username != ''"
+            ).fetchall()
+            # 属于用户组的用户，max-routes 以组策略和个人覆盖项为准
+            effective = self.ccd_compiler.effective_max_devices(conn) if self.ccd_compiler else {}
+        finally:
+            conn.close()
+
+        users = {
+            name: (user_id, bool(password_set), effective.get(name, max_devices or 2), status == "suspended")
+            for user_id, name, password_set, max_devices, status in rows if status in CREDENTIAL_STATUSES
+        }
+        sets = {
+            "known": {row[1] for row in rows},
+            "suspended": {name for name, user in users.items() if user[3]},
+            "password_set": {name for name, user in users.items() if user[1]},
+        }
+        stats["users_queried"] = True
+        self._users_cache = (version, users, sets)
+        return users, sets
+
+    def _users_version(self) -> Optional[tuple]:
+        """用户表和用户组表的版本，任一未安装时返回 None"""
+        versions = (self.data_version.get(self.user_table), self.data_version.get("user_group"))
+        return None if None in versions else versions
+
+    def _load_auth(self, stats: Dict[str, Any]) -> Tuple[List[Tuple[str, str]], Dict[str, set]]:
+        """返回 [(用户名, 行)] 和名称集合：names、duplicated（重复出现）、locked（以最后一行为准）"""
+        try:
+            st = os.stat(self.auth_file)
+            signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            return [], {"names": set(), "duplicated": set(), "locked": set()}
+
+        if signature == self._auth_cache[0]:
+            return self._auth_cache[1], self._auth_cache[2]
+
+        lines = []
+        with open(self.auth_file, "r") as f:
+            for line in f:
+                name, sep, _ = line.partition(":")
+                if sep and name:
+                    lines.append((name, line if line.endswith("\n") else line + "\n"))
+        counts = Counter(name for name, _ in lines)
+        # 重复行以最后一行为准
+        locked = {name: is_line_locked(line) for name, line in lines}
+        sets = {
+            "names": set(counts),
+            "duplicated": {name for name, count in counts.items() if count > 1},
+            "locked": {name for name, is_locked in locked.items() if is_locked},
+        }
+        stats["auth_parsed"] = True
+        self._auth_cache = (signature, lines, sets)
+        return lines, sets
+
+    def _scan_ccd(self, stats: Dict[str, Any], full: bool = True) -> Dict[str, Tuple[int, int, Optional[int], Optional[int]]]:
+        """返回 {用户名: (mtime, size, IP末段, max-routes)}，只读取变化过的文件"""
+        try:
+            dir_mtime = os.stat(self.ccd_dir).st_mtime_ns
+        except OSError:
+            self._ccd_cache, self._ccd_dir_mtime = {}, None
+            return {}
+        if not full and dir_mtime == self._ccd_dir_mtime:
+            return self._ccd_cache
+
+        previous, cache, read = self._ccd_cache, {}, 0
+        with os.scandir(self.ccd_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if name[0] == "." or name.endswith(".tmp") or not entry.is_file():
+                    continue
+                st = entry.stat()
+                cached = previous.get(name)
+                if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                    cache[name] = cached
+                    continue
+                ip, max_routes = _parse_ccd(entry.path)
+                read += 1
+                cache[name] = (st.st_mtime_ns, st.st_size, ip, max_routes)
+
+        # 没有文件变化时沿用原来的字典，plan() 据此沿用上次的差异结果
+        if read == 0 and len(cache) == len(previous):
+            cache = previous
+        stats["ccd_read"] += read
+        self._ccd_cache = cache
+        stats["ccd_scanned"] = True
+        # 与当前时间太近的 mtime 可能还会在同一时间片内变化，下次仍需扫描
+        self._ccd_dir_mtime = dir_mtime if time.time_ns() - dir_mtime > 2_000_000_000 else None
+        return cache
+
+    # ==================== 定时对账 ====================
+    def start(self, interval: int = 300, full_every: int = 12):
+        """启动后台定时对账线程，每 full_every 次做一次完整检查"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            runs = 0
+            while not self._stop.wait(interval):
+                runs += 1
+                try:
+                    self.reconcile(full=runs % full_every == 0)
+                except Exception as e:
+                    logger.error(f"用户数据对账失败: {e}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="user-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def _parse_ccd(path: str) -> Tuple[Optional[int], Optional[int]]:
+    ip = max_routes = None
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                if line.startswith("ifconfig-push"):
+                    parts = line.split()
+                    if len(parts) > 1:
+                        ip = int(parts[1].split(".")[-1])
+                elif "max-routes" in line:
+                    max_routes = int(line.replace('"', " ").split()[-1])
+    except (OSError, ValueError):
+        pass
+    return ip, max_routes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: python3 -m utils.user_reconciler [--dry-run]"""
+    parser = argparse.ArgumentParser(description="OpenVPN WebUI 用户数据对账")
+    parser.add_argument("--db", default="/var/lib/ovpn-ui/webui.db")
+    parser.add_argument("--config-dir", default="/etc/ovpn-ui/openvpn")
+    parser.add_argument("--dry-run", action="store_true", help="只输出差异，不做修改")
+    parser.add_argument("--force", action="store_true", help="删除和重置的条目超过阈值时仍然执行")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    ovpn_manager = OpenVPNManager(config_dir=args.config_dir)
+    reconciler = UserReconciler(ovpn_manager, db_path=args.db,
+                                ccd_compiler=CCDCompiler(ovpn_manager, db_path=args.db, network=load_server_network(
+                                    os.path.join(args.config_dir, "server.conf"))))
+    report = reconciler.reconcile(dry_run=args.dry_run, force=args.force)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
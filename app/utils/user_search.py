@@ -0,0 +1,221 @@
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+from markupsafe import escape
+
+logger = logging.getLogger(__name__)
+
+# 参与搜索的列，顺序即排序时的列优先级（用户名命中排在邮箱、IP 命中之前）
+SEARCH_COLUMNS = ("username", "ovpn_username", "email", "static_ip", "status")
+
+# 参与排序的候选数上限（取最新注册的用户和用户名前缀匹配的用户），宽泛的输入只排序这部分
+MAX_CANDIDATES = 500
+
+# 外部内容表：索引只保存 trigram，原始数据仍在 normal_user 中，由触发器同步
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+    {columns},
+    content='{table}', content_rowid='id', tokenize='trigram'
+);
+-- 不区分大小写的用户名前缀查询使用的表达式索引
+CREATE INDEX IF NOT EXISTS ix_{table}_username_lower ON {table} (lower(username));
+CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_insert AFTER INSERT ON {table}
+BEGIN
+    INSERT INTO {table}_fts (rowid, {columns}) VALUES ({new_values});
+END;
+CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_delete AFTER DELETE ON {table}
+BEGIN
+    INSERT INTO {table}_fts ({table}_fts, rowid, {columns}) VALUES ('delete', {old_values});
+END;
+CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_update AFTER UPDATE OF {columns} ON {table}
+BEGIN
+    INSERT INTO {table}_fts ({table}_fts, rowid, {columns}) VALUES ('delete', {old_values});
+    INSERT INTO {table}_fts (rowid, {columns}) VALUES ({new_values});
+END;
+"""
+
+
+class UserSearch:
+    """用户全文搜索（SQLite FTS5 trigram 索引）
+
+    trigram 分词支持任意位置的子串匹配（不区分大小写）。完全匹配和用户名前缀匹配排在最前，
+    其余按命中的列排序，只为最终返回的结果生成高亮（<mark>，其余内容已做 HTML 转义）。
+    bm25 需要读取每个匹配词的完整倒排列表，输入宽泛时（如公共邮箱域名）单次查询要几十毫秒，
+    对用户名、邮箱这类短字段，按列排序的效果与 bm25 相当。
+    宽泛的输入只对最新的 MAX_CANDIDATES 个匹配排序，用户名以输入开头的用户另外按
+    lower(username) 索引做范围查询加入候选，不会因为注册较早而被漏掉。
+    少于 3 个字符的输入无法使用 trigram 索引，只做同样的用户名前缀匹配，
+    输入框逐字输入时每一步都能走索引。
+    """
+
+    def __init__(self, db_path: str = "/var/lib/ovpn-ui/webui.db", table: str = "normal_user"):
+        self.db_path = db_path
+        self.table = table
+        self.fts_table = f"{table}_fts"
+
+    def install(self) -> bool:
+        """创建索引和同步触发器；首次安装或索引与数据不一致时重建"""
+        columns = ", ".join(SEARCH_COLUMNS)
+        schema = SEARCH_SCHEMA.format(
+            table=self.table,
+            columns=columns,
+            new_values=", ".join(["new.id"] + [f"new.{c}" for c in SEARCH_COLUMNS]),
+            old_values=", ".join(["old.id"] + [f"old.{c}" for c in SEARCH_COLUMNS]),
+        )
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.executescript(schema)
+                indexed = conn.execute(f"SELECT COUNT(*) FROM {self.fts_table}_docsize").fetchone()[0]
+                total = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+                if indexed != total:
+                    logger.info(f"重建用户搜索索引: {total} 条记录")
+                    conn.execute(f"INSERT INTO {self.fts_table} ({self.fts_table}) VALUES ('rebuild')")
+                    conn.commit()
+            finally:
+                conn.close()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"安装用户搜索索引失败: {e}")
+            return False
+
+    def search(self, query: str, limit: int = 20, status: Optional[str] = None) -> Dict[str, Any]:
+        """搜索用户，返回 {"items": [...], "mode": "fts"|"prefix", "elapsed_ms": ...}"""
+        started = time.monotonic()
+        terms = query.split()
+        long_terms = [t for t in terms if len(t) >= 3]
+        limit = max(1, min(limit, 100))
+
+        if not terms or not os.path.exists(self.db_path):
+            items, mode = [], "none"
+        else:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=5)
+            conn.row_factory = sqlite3.Row
+            try:
+                if long_terms:
+                    short_terms = [t for t in terms if len(t) < 3]
+                    items, mode = self._search_fts(conn, query.strip(), long_terms, short_terms, limit, status), "fts"
+                else:
+                    items, mode = self._search_prefix(conn, query.strip(), limit, status), "prefix"
+            except sqlite3.Error as e:
+                logger.error(f"用户搜索失败: {e}")
+                items, mode = [], "error"
+            finally:
+                conn.close()
+
+        return {"items": items, "mode": mode,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 2)}
+
+    def _search_fts(self, conn, query: str, terms: List[str], short_terms: List[str],
+                    limit: int, status: Optional[str]) -> List[Dict[str, Any]]:
+        # 每个词作为短语（子串）匹配，词之间为 AND；双引号按 FTS5 语法加倍转义
+        match = " AND ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+        # 第一步：按 rowid 倒序取最新的 MAX_CANDIDATES 个匹配，FTS5 逐条产出，宽泛的输入也不会读取全部匹配
+        candidates = (
+            f"SELECT f.rowid AS id FROM {self.fts_table} f "
+            f"{f'JOIN {self.table} s ON s.id = f.rowid ' if status else ''}"
+            f"WHERE {self.fts_table} MATCH ? "
+        )
+        params: List[Any] = [match]
+        if status:
+            candidates += "AND s.status = ? "
+            params.append(status)
+        candidates += "ORDER BY f.rowid DESC LIMIT ?"
+        params.append(MAX_CANDIDATES)
+        # 用户名前缀匹配（包括完全匹配）的用户即使不在最新的候选中也要返回（走 lower(username) 索引）
+        prefix_sql, prefix_params = self._prefix_query(query, MAX_CANDIDATES, status, columns="id")
+        candidates = f"SELECT id FROM ({candidates}) UNION SELECT id FROM ({prefix_sql})"
+        params += prefix_params
+
+        sql = (
+            f"SELECT u.id, u.username, u.email, u.status, u.ovpn_username, u.static_ip, "
+            f"u.max_devices, u.created_at "
+            f"FROM ({candidates}) c JOIN {self.table} u ON u.id = c.id "
+        )
+        # 少于 3 个字符的词无法使用 trigram，只在候选结果上做子串过滤
+        if short_terms:
+            sql += "WHERE " + " AND ".join(
+                "(" + " OR ".join(f"instr(lower(u.{c}), ?)" for c in SEARCH_COLUMNS) + ")"
+                for _ in short_terms
+            ) + " "
+            for term in short_terms:
+                params.extend([term.lower()] * len(SEARCH_COLUMNS))
+
+        # 第二步：排序。以最长的词计算：完全匹配 > 用户名前缀 > 按 SEARCH_COLUMNS 顺序的列命中，
+        # 同级内用户名越短越接近输入，最后按注册时间倒序
+        key = max(terms, key=len).lower()
+        rank = ["WHEN lower(u.username) = ? OR lower(u.ovpn_username) = ? OR lower(u.email) = ? "
+                "OR u.static_ip = ? THEN 0",
+                "WHEN instr(lower(u.username), ?) = 1 THEN 1"]
+        rank += [f"WHEN instr(lower(u.{c}), ?) THEN {i + 2}" for i, c in enumerate(SEARCH_COLUMNS)]
+        sql += (f"ORDER BY CASE {' '.join(rank)} ELSE {len(SEARCH_COLUMNS) + 2} END, "
+                f"length(u.username), u.id DESC LIMIT ?")
+        params.extend([key] * (5 + len(SEARCH_COLUMNS)) + [limit])
+        return [self._with_highlight(dict(row), terms + short_terms) for row in conn.execute(sql, params)]
+
+    def _search_prefix(self, conn, prefix: str, limit: int, status: Optional[str]) -> List[Dict[str, Any]]:
+        sql, params = self._prefix_query(prefix, limit, status)
+        return [self._with_highlight(dict(row), [prefix]) for row in conn.execute(sql, params)]
+
+    def _prefix_query(self, prefix: str, limit: int, status: Optional[str],
+                      columns: str = "id, username, email, status, ovpn_username, static_ip, max_devices, created_at"):
+        """不区分大小写的用户名前缀查询：lower(username) 上的范围查询可以使用表达式索引
+        （LIKE 在 case_sensitive_like 关闭时无法走索引）"""
+        prefix = prefix.lower()
+        sql = f"SELECT {columns} FROM {self.table} WHERE lower(username) >= ? AND lower(username) < ? "
+        params: List[Any] = [prefix, prefix + "\U0010ffff"]
+        if status:
+            sql += "AND status = ? "
+            params.append(status)
+        sql += "ORDER BY lower(username) LIMIT ?"
+        params.append(limit)
+        return sql, params
+
+    @staticmethod
+    def _with_highlight(item: Dict[str, Any], terms: List[str]) -> Dict[str, Any]:
+        item["highlight"] = {}
+        for col in SEARCH_COLUMNS:
+            marked = _highlight(item.get(col), terms)
+            if marked:
+                item["highlight"][col] = marked
+        return item
+
+
+def _highlight(text: Optional[str], terms: List[str]) -> Optional[str]:
+    """标出 text 中所有词的出现位置（不区分大小写），转义 HTML 后返回；没有命中返回 None
+
+    结果只有 20 行左右，在 Python 中处理比 FTS5 highlight() 重新执行一次 MATCH 快得多。
+    """
+    if not text:
+        return None
+    lower = text.lower()
+    spans = []
+    for term in terms:
+        term = term.lower()
+        start = lower.find(term)
+        while start != -1:
+            spans.append((start, start + len(term)))
+            start = lower.find(term, start + 1)
+    if not spans:
+        return None
+
+    # 合并重叠的区间
+    spans.sort()
+    merged = [list(spans[0])]
+    for start, end in spans[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    parts, pos = [], 0
+    for start, end in merged:
+        parts.append(str(escape(text[pos:start])))
+        parts.append(f"<mark>{escape(text[start:end])}</mark>")
+        pos = end
+    parts.append(str(escape(text[pos:])))
+    return "".join(parts)
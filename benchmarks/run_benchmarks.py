@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+ovpn-ui 规模基准测试
+
+在临时目录中构造合成部署（auth/users、ccd/、状态日志、webui.db），
+分别测量 1k/10k/100k 用户规模下的关键操作耗时，并与 baselines.json 中保存的
+基线比较，超过阈值即视为性能回退（退出码 1）。
+
+用法:
+    python3 benchmarks/run_benchmarks.py                      # 默认 1000,10000
+    python3 benchmarks/run_benchmarks.py --sizes 1000,10000,100000
+    python3 benchmarks/run_benchmarks.py --update-baseline    # 重新生成基线
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT_DIR, "app")
+sys.path.insert(0, APP_DIR)
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from utils.openvpn_manager import OpenVPNManager  # noqa: E402
+from utils.user_search import UserSearch  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+BENCH_PASSWORD = "Bench-Passw0rd"
+# 假的 md5crypt 哈希，只用于填充认证文件
+FAKE_HASH = "$1$bench000$4nS0yW3kB3r5aQ7Yw1mZc/"
+
+
+# ==================== 合成部署 ====================
+def build_openvpn_tree(config_dir, users):
+    """生成 auth/users 与 ccd/ 文件"""
+    auth_dir = os.path.join(config_dir, "auth")
+    ccd_dir = os.path.join(config_dir, "ccd")
+    os.makedirs(auth_dir, exist_ok=True)
+    os.makedirs(ccd_dir, exist_ok=True)
+
+    with open(os.path.join(auth_dir, "users"), "w") as f:
+        f.writelines(f"user{i:06d}:{FAKE_HASH}\n" for i in range(users))
+
+    for i in range(users):
+        with open(os.path.join(ccd_dir, f"user{i:06d}"), "w") as f:
+            f.write(f"ifconfig-push 10.8.0.{50 + i % 204} 255.255.255.0\n")
+            f.write("push \"max-routes 2\"\n")
+
+
+def build_status_log(path, clients):
+    """生成 status-version 2 格式的状态日志"""
+    now = int(time.time())
+    with open(path, "w") as f:
+        f.write("TITLE,OpenVPN 2.6.8 x86_64-pc-linux-gnu\n")
+        f.write(f"TIME,{datetime.fromtimestamp(now)},{now}\n")
+        f.write("HEADER,CLIENT_LIST,Common Name,Real Address,Virtual Address,Virtual IPv6 Address,"
+                "Bytes Received,Bytes Sent,Connected Since,Connected Since (time_t),Username,"
+                "Client ID,Peer ID,Data Channel Cipher\n")
+        for i in range(clients):
+            f.write(f"CLIENT_LIST,user{i:06d},198.51.{(i >> 8) & 255}.{i & 255}:{1024 + i % 60000},"
+                    f"10.8.{(i >> 8) & 255}.{i & 255},,{i * 1024},{i * 2048},"
+                    f"{datetime.fromtimestamp(now - i)},{now - i},user{i:06d},{i},{i},AES-256-GCM\n")
+        f.write("HEADER,ROUTING_TABLE,Virtual Address,Common Name,Real Address,Last Ref,Last Ref (time_t)\n")
+        f.write("GLOBAL_STATS,Max bcast/mcast queue length,0\n")
+        f.write("END\n")
+
+
+def populate_webui_db(db_path, users, password_hash):
+    """批量写入管理员与普通用户（表结构已由 db.create_all 创建）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO admin_user (id, username, password_hash, email, created_at) "
+                "VALUES (1, 'admin', ?, 'admin@localhost', CURRENT_TIMESTAMP)",
+                (password_hash,)
+            )
+            statuses = ("approved", "approved", "approved", "pending", "suspended")
+            conn.executemany(
+                "INSERT INTO normal_user (username, email, email_verified, password_hash, status, "
+                "ovpn_username, max_devices, ip_type, password_set, created_at) "
+                "VALUES (?, ?, 1, ?, ?, ?, 2, 'dhcp', 1, CURRENT_TIMESTAMP)",
+                ((f"user{i:06d}", f"user{i:06d}@example.com", password_hash,
+                  statuses[i % len(statuses)], f"user{i:06d}") for i in range(users))
+            )
+    finally:
+        conn.close()
+
+
+def load_webui(data_root):
+    """以独立模块名加载 app.py，目录全部指向临时部署"""
+    for name, sub in (("INSTALL", "install"), ("CONFIG", "etc"), ("LOG", "log"), ("DATA", "data")):
+        os.environ[f"OVPN_UI_{name}_DIR"] = os.path.join(data_root, sub)
+
+    spec = importlib.util.spec_from_file_location("ovpn_ui_webui", os.path.join(APP_DIR, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.app.config["TESTING"] = True
+    # 业务日志（每次操作都会输出）会干扰计时
+    logging.disable(logging.CRITICAL)
+    return module
+
+
+# ==================== 计时 ====================
+def timeit(func, repeat):
+    """执行 repeat 次，返回中位数耗时（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def bench_manager(workdir, size, repeat):
+    """OpenVPNManager 文件操作"""
+    config_dir = os.path.join(workdir, "openvpn")
+    status_file = os.path.join(workdir, "openvpn-status.log")
+    build_openvpn_tree(config_dir, size)
+    build_status_log(status_file, size)
+
+    # systemctl 用 true 代替；管理端口指向不存在的端口，强制读取状态文件
+    manager = OpenVPNManager(
+        install_dir=workdir, config_dir=config_dir, status_file=status_file,
+        management_address=("127.0.0.1", 1), systemctl_cmd=["true"]
+    )
+    target = f"user{size // 2:06d}"
+    counter = iter(range(10 ** 9))
+
+    results = {
+        "ip_allocation": timeit(manager._get_next_ip, repeat),
+        "status_count": timeit(manager.get_service_status, repeat),
+        "session_list": timeit(manager.get_sessions, repeat),
+        "change_password": timeit(lambda: manager.change_password_direct(target, BENCH_PASSWORD), repeat),
+    }
+
+    def create():
+        manager.create_user(f"bench{next(counter):06d}", BENCH_PASSWORD)
+    results["create_user"] = timeit(create, repeat)
+
+    victims = iter(f"user{i:06d}" for i in range(size))
+    results["delete_user"] = timeit(lambda: manager.delete_user(next(victims)), repeat)
+    return results
+
+
+def bench_web(webui, size, repeat, password_hash):
+    """通过 Flask 测试客户端测量登录与用户列表"""
+    app = webui.app
+    db_path = os.path.join(os.environ["OVPN_UI_DATA_DIR"], "webui.db")
+    with app.app_context():
+        webui.db.session.remove()
+        webui.db.engine.dispose()
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        webui.db.create_all()
+    populate_webui_db(db_path, size, password_hash)
+
+    client = app.test_client()
+    # 下标为 5 的倍数的用户是 approved 状态
+    login_payload = {"username": f"user{size // 10 * 5:06d}", "password": BENCH_PASSWORD}
+
+    def login():
+        resp = client.post("/user/login", json=login_payload)
+        assert resp.get_json().get("success"), resp.get_json()
+
+    admin = app.test_client()
+    with admin.session_transaction() as sess:
+        sess["_user_id"] = "admin-1"
+        sess["_fresh"] = True
+
+    def list_users():
+        resp = admin.get("/admin/api/users")
+        assert resp.status_code == 200 and len(resp.get_json()["data"]) == size
+
+    user_search = UserSearch(db_path)
+    user_search.install()
+    # 用户名中间的数字串：同时命中用户名、邮箱和 OpenVPN 用户名
+    search_query = f"{size // 2:06d}"
+
+    def search_users():
+        assert user_search.search(search_query)["items"]
+
+    return {
+        "login": timeit(login, repeat),
+        "list_users": timeit(list_users, repeat),
+        "search_users": timeit(search_users, repeat),
+    }
+
+
+def run(sizes, repeat):
+    workdir = tempfile.mkdtemp(prefix="ovpn-ui-bench-")
+    try:
+        webui = load_webui(workdir)
+        password_hash = generate_password_hash(BENCH_PASSWORD)
+        results = {}
+        for size in sizes:
+            size_dir = os.path.join(workdir, f"n{size}")
+            os.makedirs(size_dir)
+            started = time.monotonic()
+            results[str(size)] = dict(bench_manager(size_dir, size, repeat),
+                                      **bench_web(webui, size, repeat, password_hash))
+            print(f"[{size} 用户] 完成，用时 {time.monotonic() - started:.1f}s", file=sys.stderr)
+            shutil.rmtree(size_dir, ignore_errors=True)
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ==================== 基线比较 ====================
+def compare(results, baseline, threshold, min_delta):
+    """返回 (报告行, 回退项)"""
+    lines = [f"{'规模':>8}  {'操作':<16} {'当前(ms)':>11} {'基线(ms)':>11} {'变化':>8}"]
+    regressions = []
+    for size, ops in results.items():
+        base_ops = baseline.get(size, {})
+        for op, value in ops.items():
+            base = base_ops.get(op)
+            if base:
+                change = (value - base) / base
+                mark = ""
+                # 亚毫秒级操作的相对抖动很大，绝对差值低于 min_delta 不算回退
+                if change > threshold and value - base > min_delta:
+                    mark = "  回退"
+                    regressions.append((size, op, base, value))
+                lines.append(f"{size:>8}  {op:<16} {value:>11.3f} {base:>11.3f} {change:>+7.0%}{mark}")
+            else:
+                lines.append(f"{size:>8}  {op:<16} {value:>11.3f} {'-':>11} {'-':>8}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ovpn-ui 规模基准测试")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="用户规模，逗号分隔（例如 1000,10000,100000）")
+    parser.add_argument("--repeat", type=int, default=7, help="每项重复次数，取中位数")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许的变慢比例（0.25 = 25%%）")
+    parser.add_argument("--min-delta", type=float, default=2.0, help="判定回退的最小绝对差值（毫秒）")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果更新基线")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = run(sizes, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f).get("results", {})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        lines, _ = compare(results, baseline, args.threshold, args.min_delta)
+        print("\n".join(lines))
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "repeat": args.repeat,
+                "results": baseline,
+            }, f, indent=2)
+            f.write("\n")
+        print(f"基线已更新: {args.baseline}")
+        return 0
+
+    _, regressions = compare(results, baseline, args.threshold, args.min_delta)
+    if regressions:
+        print(f"\n性能回退（阈值 {args.threshold:.0%}）:")
+        for size, op, base, value in regressions:
+            print(f"  {size} 用户 {op}: {base:.3f}ms -> {value:.3f}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,22 @@
 #!/bin/bash
 #
 # OpenVPN 用户验证脚本
+# auth-user-pass-verify ... via-file：$1 是临时文件，第一行为用户名，第二行为密码
 
-USERNAME_FILE="$1"
-PASSWORD_FILE="$2"
+CREDENTIALS_FILE="$1"
 
 # 读取用户名和密码
-USERNAME=$(cat "$USERNAME_FILE")
-PASSWORD=$(cat "$PASSWORD_FILE")
+USERNAME=$(sed -n '1p' "$CREDENTIALS_FILE")
+PASSWORD=$(sed -n '2p' "$CREDENTIALS_FILE")
 
-# 调用WebUI的验证API
-RESPONSE=$(curl -s -f -X POST \
-  -H "Content-Type: application/json" \
-  -d "{\"username\":\"$USERNAME\",\"password\":\"$PASSWORD\"}" \
-  http://127.0.0.1:5000/api/v1/auth/verify)
-
-if [ $? -eq 0 ] && [ "$RESPONSE" = "success" ]; then
+# 调用WebUI的验证API：账户暂停、过期或凭据被锁定时返回 403
+# 密码从标准输入传给 curl，不出现在进程列表中
+if printf '%s' "$PASSWORD" | curl -s -f -o /dev/null -X POST \
+  --data-urlencode "username=$USERNAME" \
+  --data-urlencode "password@-" \
+  http://127.0.0.1:5000/api/v1/auth/verify; then
     exit 0
 else
     echo "Authentication failed for user: $USERNAME"
     exit 1
-fi
\ No newline at end of file
+fi
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+#
+# OpenVPN client-connect / client-disconnect 钩子脚本
+#
+# 把连接事件以 JSON 数据报发送给 WebUI 的连接历史服务（/run/ovpn-ui/events.sock）。
+# 数据报是非阻塞的，WebUI 未运行时事件被丢弃，任何情况下都不能影响客户端连接。
+
+import json
+import os
+import socket
+import time
+
+SOCKET_PATH = os.environ.get("OVPN_UI_EVENT_SOCKET", "/run/ovpn-ui/events.sock")
+
+
+def main():
+    env = os.environ
+    script_type = env.get("script_type", "")
+    if script_type not in ("client-connect", "client-disconnect"):
+        return
+
+    real_address = env.get("trusted_ip") or env.get("trusted_ip6") or ""
+    if env.get("trusted_port"):
+        real_address = f"{real_address}:{env['trusted_port']}"
+
+    event = {
+        "event": "connect" if script_type == "client-connect" else "disconnect",
+        "ts": int(time.time()),
+        "common_name": env.get("common_name") or env.get("username", ""),
+        "instance": env.get("dev", ""),
+        "real_address": real_address,
+        "virtual_address": env.get("ifconfig_pool_remote_ip", ""),
+        "connected_at": env.get("time_unix"),
+        "duration": env.get("time_duration"),
+        "bytes_received": env.get("bytes_received"),
+        "bytes_sent": env.get("bytes_sent"),
+    }
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            sock.sendto(json.dumps(event).encode("utf-8"), SOCKET_PATH)
+    except OSError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -137,6 +137,9 @@ setup_python_env() {
         pip install flask flask-sqlalchemy flask-login flask-wtf wtforms pyopenssl requests >> $LOG_FILE 2>&1
     fi
     
+    # 构建带哈希的静态资源包
+    (cd $INSTALL_DIR/app && python3 -m utils.asset_pipeline build) >> $LOG_FILE 2>&1
+    
     log "Python环境配置完成"
 }
 
@@ -211,16 +214,32 @@ initialize_application() {
     
     # 创建必要目录
     mkdir -p /var/log/ovpn-ui
+    mkdir -p /var/log/openvpn
     mkdir -p /etc/ovpn-ui
     mkdir -p /var/lib/ovpn-ui
     mkdir -p /var/lib/ovpn-ui/temp_links
     
+    # 生成配置文件（secret_key 在重启之间保持不变，会话和验证链接才不会失效）
+    create_config_file
+    
     # 初始化管理员账户 - 使用与app.py一致的密码验证方式
     create_admin_user
     
     log "应用初始化完成"
 }
 
+create_config_file() {
+    if [ -f /etc/ovpn-ui/webui.json ]; then
+        log "配置文件已存在，保留现有配置"
+        return
+    fi
+    
+    SECRET_KEY=$(python3 -c 'import secrets; print(secrets.token_hex(32))')
+    sed "s/{{ secret_key }}/$SECRET_KEY/" $INSTALL_DIR/config/webui.json.template > /etc/ovpn-ui/webui.json
+    chmod 600 /etc/ovpn-ui/webui.json
+    log "配置文件创建完成"
+}
+
 create_admin_user() {
     log "创建管理员账户..."
     
@@ -1,11 +1,11 @@
 #!/bin/bash
-# 配置备份脚本
+# 配置备份脚本（增量备份，调用 app/utils/backup_manager.py）
 
 set -e
 
-INSTALL_DIR="/opt/ovpn-ui"
-BACKUP_NAME="ovpn-ui-backup-$(date +%Y%m%d_%H%M%S)"
-BACKUP_FILE="/tmp/${BACKUP_NAME}.tar.gz"
+INSTALL_DIR="/usr/local/ovpn-ui"
+BACKUP_REPO="${OVPN_UI_BACKUP_REPO:-/var/backups/ovpn-ui}"
+PYTHON="$INSTALL_DIR/venv/bin/python3"
 
 log() {
     echo "[$(date +'%Y-%m-%d %H:%M:%S')] $1"
@@ -14,148 +14,70 @@ log() {
 show_usage() {
     echo "用法: $0 [选项]"
     echo "选项:"
-    echo "  backup    创建备份 (默认)"
-    echo "  restore   从备份恢复"
-    echo "  list      列出备份文件"
+    echo "  backup              创建备份 (默认)"
+    echo "  restore <快照ID>    从备份恢复"
+    echo "  verify <快照ID>     校验备份"
+    echo "  list                列出备份"
+    echo "  prune [保留个数] [保留天数]  清理旧备份 (默认 7 个 / 30 天)"
 }
 
-create_backup() {
-    log "创建配置备份..."
-    
-    # 创建临时备份目录
-    TEMP_DIR=$(mktemp -d)
-    BACKUP_DIR="$TEMP_DIR/$BACKUP_NAME"
-    mkdir -p "$BACKUP_DIR"
-    
-    # 备份配置文件
-    if [ -d "$INSTALL_DIR/config" ]; then
-        log "备份配置文件..."
-        cp -r "$INSTALL_DIR/config" "$BACKUP_DIR/"
-    fi
-    
-    # 备份数据文件
-    if [ -d "$INSTALL_DIR/data" ]; then
-        log "备份数据文件..."
-        cp -r "$INSTALL_DIR/data" "$BACKUP_DIR/"
-    fi
-    
-    # 备份SSL证书
-    if [ -d "$INSTALL_DIR/ssl" ]; then
-        log "备份SSL证书..."
-        cp -r "$INSTALL_DIR/ssl" "$BACKUP_DIR/"
-    fi
-    
-    # 备份安装信息
-    if [ -f "$INSTALL_DIR/.installed" ]; then
-        log "备份安装信息..."
-        cp "$INSTALL_DIR/.installed" "$BACKUP_DIR/"
+run_backup_manager() {
+    if [ ! -x "$PYTHON" ]; then
+        PYTHON="python3"
     fi
-    
-    # 创建压缩包
-    log "创建压缩包..."
-    cd "$TEMP_DIR"
-    tar -czf "$BACKUP_FILE" "$BACKUP_NAME"
-    
-    # 清理临时文件
-    rm -rf "$TEMP_DIR"
-    
-    log "备份完成: $BACKUP_FILE"
-    echo "✅ 备份已保存到: $BACKUP_FILE"
+    (cd "$INSTALL_DIR/app" && "$PYTHON" -m utils.backup_manager --repo "$BACKUP_REPO" "$@")
+}
+
+create_backup() {
+    log "创建增量备份..."
+    run_backup_manager backup
+    echo "✅ 备份已保存到: $BACKUP_REPO"
 }
 
 restore_backup() {
-    local backup_file=$1
-    
-    if [ -z "$backup_file" ]; then
-        echo "请指定备份文件:"
-        ls -1 /tmp/ovpn-ui-backup-*.tar.gz 2>/dev/null || echo "未找到备份文件"
-        read -p "备份文件路径: " backup_file
+    local snapshot_id=$1
+
+    if [ -z "$snapshot_id" ]; then
+        run_backup_manager list
+        read -p "快照ID: " snapshot_id
     fi
-    
-    if [ ! -f "$backup_file" ]; then
-        echo "错误: 备份文件不存在: $backup_file"
+
+    if [ -z "$snapshot_id" ]; then
+        echo "错误: 未指定快照ID"
         exit 1
     fi
-    
-    log "从备份恢复: $backup_file"
-    
+
+    log "校验备份: $snapshot_id"
+    if ! run_backup_manager verify "$snapshot_id" >/dev/null; then
+        echo "错误: 备份校验失败，拒绝恢复"
+        exit 1
+    fi
+
     # 确认恢复
     read -p "确定要恢复备份? 这将覆盖现有配置 [y/N]: " confirm
     if [[ ! $confirm =~ ^[Yy]$ ]]; then
         log "恢复取消"
         exit 0
     fi
-    
-    # 创建临时目录
-    TEMP_DIR=$(mktemp -d)
-    
-    # 解压备份文件
-    log "解压备份文件..."
-    tar -xzf "$backup_file" -C "$TEMP_DIR"
-    
-    # 查找备份目录
-    BACKUP_DIR=$(find "$TEMP_DIR" -name "ovpn-ui-backup-*" -type d | head -1)
-    
-    if [ -z "$BACKUP_DIR" ]; then
-        echo "错误: 无效的备份文件"
-        rm -rf "$TEMP_DIR"
-        exit 1
-    fi
-    
+
     # 停止服务
     log "停止服务..."
     systemctl stop ovpn-ui 2>/dev/null || true
-    systemctl stop ovpn-nginx 2>/dev/null || true
-    
-    # 恢复文件
-    log "恢复配置文件..."
-    if [ -d "$BACKUP_DIR/config" ]; then
-        rm -rf "$INSTALL_DIR/config"
-        cp -r "$BACKUP_DIR/config" "$INSTALL_DIR/"
-    fi
-    
-    log "恢复数据文件..."
-    if [ -d "$BACKUP_DIR/data" ]; then
-        rm -rf "$INSTALL_DIR/data"
-        cp -r "$BACKUP_DIR/data" "$INSTALL_DIR/"
-    fi
-    
-    log "恢复SSL证书..."
-    if [ -d "$BACKUP_DIR/ssl" ]; then
-        rm -rf "$INSTALL_DIR/ssl"
-        cp -r "$BACKUP_DIR/ssl" "$INSTALL_DIR/"
-    fi
-    
-    # 恢复安装信息
-    if [ -f "$BACKUP_DIR/.installed" ]; then
-        cp "$BACKUP_DIR/.installed" "$INSTALL_DIR/"
-    fi
-    
-    # 设置权限
-    chmod -R 755 "$INSTALL_DIR/config"
-    chmod -R 755 "$INSTALL_DIR/data"
-    chmod 600 "$INSTALL_DIR/ssl/key.pem" 2>/dev/null || true
-    
-    # 清理临时文件
-    rm -rf "$TEMP_DIR"
-    
+
+    log "恢复文件..."
+    run_backup_manager restore "$snapshot_id"
+
     # 重启服务
     log "重启服务..."
-    systemctl start ovpn-nginx
     systemctl start ovpn-ui
-    
+    if [ -f "/etc/nginx/sites-enabled/ovpn-ui" ]; then
+        systemctl reload nginx 2>/dev/null || true
+    fi
+
     log "恢复完成"
     echo "✅ 配置恢复成功"
 }
 
-list_backups() {
-    echo "可用的备份文件:"
-    echo "─────────────────────────────────────"
-    ls -lh /tmp/ovpn-ui-backup-*.tar.gz 2>/dev/null | while read line; do
-        echo "  $line"
-    done || echo "  未找到备份文件"
-}
-
 # 主程序
 case "${1:-backup}" in
     "backup")
@@ -164,10 +86,16 @@ case "${1:-backup}" in
     "restore")
         restore_backup "$2"
         ;;
+    "verify")
+        run_backup_manager verify "$2"
+        ;;
     "list")
-        list_backups
+        run_backup_manager list
+        ;;
+    "prune")
+        run_backup_manager prune --keep-last "${2:-7}" --keep-days "${3:-30}"
         ;;
     *)
         show_usage
         ;;
-esac
\ No newline at end of file
+esac
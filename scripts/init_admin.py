@@ -115,9 +115,12 @@ def create_default_config():
         template_path = f"{INSTALL_DIR}/config/webui.json.template"
         
         if os.path.exists(template_path):
-            # 复制模板文件
-            import shutil
-            shutil.copy2(template_path, config_path)
+            # 从模板创建，并生成固定的 secret_key
+            with open(template_path, "r") as f:
+                content = f.read().replace("{{ secret_key }}", secrets.token_hex(32))
+            with open(config_path, "w") as f:
+                f.write(content)
+            os.chmod(config_path, 0o600)
             print(f"✅ 配置文件已从模板创建: {config_path}")
         else:
             # 创建默认配置
@@ -137,6 +140,16 @@ def create_default_config():
                     "easy_rsa_dir": f"{INSTALL_DIR}/easy-rsa",
                     "log_file": "/var/log/openvpn-status.log"
                 },
+                "mail": {
+                    "enabled": False,
+                    "host": "localhost",
+                    "port": 25,
+                    "use_tls": False,
+                    "use_ssl": False,
+                    "username": "",
+                    "password": "",
+                    "sender": "ovpn-ui@localhost"
+                },
                 "security": {
                     "password_min_length": 8,
                     "max_login_attempts": 5,
@@ -168,7 +181,7 @@ def set_permissions():
         
         # 设置配置目录权限
         os.chmod(CONFIG_DIR, 0o755)
-        os.chmod(f"{CONFIG_DIR}/webui.json", 0o644)
+        os.chmod(f"{CONFIG_DIR}/webui.json", 0o600)  # 包含 secret_key 和邮件密码
         
         print("✅ 文件权限设置完成")
     except Exception as e:
@@ -349,35 +349,16 @@ EOF
 backup_config() {
     echo "📦 备份配置..."
     
-    backup_dir="/tmp/ovpn-ui-backup-$(date +%Y%m%d_%H%M%S)"
-    mkdir -p $backup_dir
+    # 增量备份：数据库使用SQLite在线备份，未变化的数据不会重复存储
+    bash $INSTALL_DIR/scripts/backup_config.sh backup
     
-    # 备份配置文件
-    if [ -d "$CONFIG_DIR" ]; then
-        cp -r $CONFIG_DIR $backup_dir/
-    fi
-    
-    # 备份SSL证书
-    if [ -d "/etc/ssl/ovpn-ui" ]; then
-        cp -r /etc/ssl/ovpn-ui $backup_dir/
-    fi
-    
-    # 备份Nginx配置
-    if [ -f "/etc/nginx/sites-available/ovpn-ui" ]; then
-        cp /etc/nginx/sites-available/ovpn-ui $backup_dir/
-    fi
-    
-    # 备份数据库
-    if [ -f "/var/lib/ovpn-ui/webui.db" ]; then
-        cp /var/lib/ovpn-ui/webui.db $backup_dir/
-    fi
-    
-    # 创建压缩包
-    cd /tmp
-    tar -czf $backup_dir.tar.gz $(basename $backup_dir)
-    rm -rf $backup_dir
-    
-    echo "✅ 备份完成: $backup_dir.tar.gz"
+    # 按保留策略清理旧备份
+    bash $INSTALL_DIR/scripts/backup_config.sh prune
+}
+
+restore_config() {
+    echo "♻️  恢复配置..."
+    bash $INSTALL_DIR/scripts/backup_config.sh restore "$1"
 }
 
 uninstall_system() {
@@ -514,6 +495,7 @@ case "${1:-}" in
     "cert") install_certificate ;;
     "password") change_password ;;
     "backup") backup_config ;;
+    "restore") restore_config "${2:-}" ;;
     "uninstall") uninstall_system ;;
     *) main ;;
 esac
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 应用代码以 app/ 为根目录导入（utils.xxx、routes.xxx）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
@@ -0,0 +1,33 @@
+"""LifecycleSweeper 测试：真实的 auth/users 文件，管理接口不可达"""
+import sqlite3
+
+from utils.account_lifecycle import LifecycleSweeper, install_columns
+from utils.openvpn_manager import OpenVPNManager, is_line_locked
+
+
+def test_expired_users_lose_credentials(tmp_path):
+    db_path = str(tmp_path / "webui.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE normal_user (id INTEGER PRIMARY KEY, username TEXT, email TEXT, "
+                     "status TEXT, ovpn_username TEXT, approved_at DATETIME, created_at DATETIME)")
+        conn.executemany("INSERT INTO normal_user (id, username, email, status, ovpn_username) "
+                         "VALUES (?, ?, ?, 'approved', ?)",
+                         [(1, "alice", "alice@example.com", "alice"), (2, "bob", "bob@example.com", "bob")])
+    install_columns(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE normal_user SET expires_at = '2000-01-01 00:00:00' WHERE id = 1")
+
+    config_dir = tmp_path / "openvpn"
+    (config_dir / "auth").mkdir(parents=True)
+    (config_dir / "auth" / "users").write_text("alice:$1$a$x\nbob:$1$b$y\n")
+    manager = OpenVPNManager(install_dir=str(tmp_path), config_dir=str(config_dir), status_file=None,
+                             management_address=("127.0.0.1", 1), systemctl_cmd=["true"])
+    sweeper = LifecycleSweeper(manager, db_path=db_path, policy={"enabled": True, "notify_days": 0})
+
+    report = sweeper.sweep()
+
+    assert report["counts"]["suspend"] == 1
+    lines = {line.split(":", 1)[0]: line
+             for line in (config_dir / "auth" / "users").read_text().splitlines()}
+    assert is_line_locked(lines["alice"])
+    assert not is_line_locked(lines["bob"])
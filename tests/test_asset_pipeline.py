@@ -0,0 +1,85 @@
+"""AssetPipeline 测试：在临时 static 目录中构建"""
+import gzip
+import json
+import os
+
+import pytest
+
+from utils import asset_pipeline
+from utils.asset_pipeline import AssetPipeline
+
+SCRIPT = """// 页面脚本
+function render(user) {
+    const row = `
+        <tr>
+            // 这一行在模板字符串里，不是注释
+
+            <td>${user.name}</td>
+        </tr>`;
+    const url = "http://example.com/api";   // 行尾注释
+    return row + url;
+}
+var padding = "%s";
+""" % ("x" * 600)
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    (tmp_path / "js").mkdir()
+    (tmp_path / "css").mkdir()
+    (tmp_path / "js" / "page.js").write_text(SCRIPT)
+    (tmp_path / "js" / "extra.js").write_text("var extra = 1\n")
+    (tmp_path / "css" / "page.css").write_text("/* 样式 */\nbody {\n    color: red;\n}\n")
+    return tmp_path
+
+
+def build(static_dir):
+    pipeline = AssetPipeline(static_dir=str(static_dir), bundles={
+        "page.js": ["js/page.js", "js/extra.js"],
+        "page.css": ["css/page.css"],
+    })
+    return pipeline, pipeline.build()
+
+
+@pytest.mark.parametrize("minifier", ["rjsmin", None])
+def test_build_keeps_template_literals_intact(static_dir, monkeypatch, minifier):
+    if minifier is None:
+        monkeypatch.setattr(asset_pipeline, "rjsmin", None)
+    elif asset_pipeline.rjsmin is None:
+        pytest.skip("未安装 rjsmin")
+
+    _, manifest = build(static_dir)
+
+    content = (static_dir / "dist" / manifest["page.js"]).read_text()
+    template = SCRIPT[SCRIPT.index("`"):SCRIPT.rindex("`") + 1]
+    assert template in content
+    assert '"http://example.com/api"' in content
+    assert "extra" in content
+
+
+def test_build_writes_hashed_files_and_manifest(static_dir):
+    pipeline, manifest = build(static_dir)
+
+    assert set(manifest) == {"page.js", "page.css"}
+    assert manifest["page.js"].startswith("page.") and manifest["page.js"].endswith(".js")
+    dist = static_dir / "dist"
+    assert json.loads((dist / "manifest.json").read_text()) == manifest
+    js = (dist / manifest["page.js"]).read_bytes()
+    assert gzip.decompress((dist / (manifest["page.js"] + ".gz")).read_bytes()) == js
+    # 小文件不生成预压缩文件
+    assert not (dist / (manifest["page.css"] + ".gz")).exists()
+    assert "color:red" in (dist / manifest["page.css"]).read_text()
+    assert not pipeline.is_stale()
+
+
+def test_rebuild_removes_outdated_files(static_dir):
+    _, first = build(static_dir)
+    (static_dir / "js" / "extra.js").write_text("var extra = 2\n")
+
+    _, second = build(static_dir)
+
+    assert first["page.js"] != second["page.js"]
+    assert not (static_dir / "dist" / first["page.js"]).exists()
+    assert sorted(os.listdir(static_dir / "dist")) == sorted(
+        ["manifest.json", second["page.js"], second["page.js"] + ".gz", second["page.css"]]
+        + ([second["page.js"] + ".br"] if asset_pipeline.brotli else []))
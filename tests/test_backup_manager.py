@@ -0,0 +1,46 @@
+"""BackupManager 测试：WAL 模式数据库的在线备份与恢复"""
+import os
+import sqlite3
+
+from utils.backup_manager import BackupManager, default_sources
+
+
+def test_wal_database_is_backed_up_online(tmp_path):
+    data_dir = tmp_path / "data"
+    config_dir = tmp_path / "etc"
+    data_dir.mkdir()
+    config_dir.mkdir()
+    (config_dir / "webui.json").write_text("{}")
+    with sqlite3.connect(data_dir / "webui.db") as conn:
+        conn.execute("CREATE TABLE normal_user (id INTEGER PRIMARY KEY)")
+
+    # 保持连接打开：已提交的数据留在 history.db-wal 中，尚未写回主文件
+    history = sqlite3.connect(data_dir / "history.db", isolation_level=None)
+    history.execute("PRAGMA journal_mode=WAL")
+    history.execute("PRAGMA wal_autocheckpoint=0")
+    history.execute("CREATE TABLE connection_event (id INTEGER PRIMARY KEY)")
+    history.executemany("INSERT INTO connection_event VALUES (?)", [(i,) for i in range(100)])
+    assert os.path.getsize(data_dir / "history.db-wal") > 0
+
+    manager = BackupManager(repo_dir=str(tmp_path / "repo"), db_path=str(data_dir / "webui.db"),
+                            sources=default_sources(str(tmp_path / "install"), str(config_dir), str(data_dir)))
+    try:
+        snapshot = manager.create_backup()
+    finally:
+        history.close()
+
+    manifest = manager._load_manifest(snapshot["id"])
+    types = {os.path.basename(f["path"]): f["type"] for f in manifest["files"]}
+    assert types == {"webui.json": "file", "webui.db": "sqlite", "history.db": "sqlite"}
+
+    restore_root = tmp_path / "restore"
+    manager.restore_backup(snapshot["id"], str(restore_root))
+    restored = restore_root / str(data_dir).lstrip("/") / "history.db"
+    with sqlite3.connect(restored) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM connection_event").fetchone()[0] == 100
+
+
+def test_default_sources_follow_configured_dirs():
+    sources = default_sources("/opt/ui", "/srv/etc", "/srv/data")
+
+    assert sources[:4] == ["/srv/etc", "/srv/data", "/opt/ui/config", "/opt/ui/.installed"]
@@ -0,0 +1,130 @@
+"""CCDCompiler 测试：临时目录中的 ccd/ 和 webui.db"""
+import json
+import os
+import sqlite3
+
+import pytest
+
+from utils.ccd_compiler import CCDCompiler, load_server_network
+from utils.fleet_manager import translate_ccd
+from utils.openvpn_manager import OpenVPNManager
+
+
+@pytest.fixture
+def env(tmp_path):
+    db_path = str(tmp_path / "webui.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE user_group (id INTEGER PRIMARY KEY, name TEXT, policy TEXT)")
+        conn.execute("CREATE TABLE normal_user (id INTEGER PRIMARY KEY, ovpn_username TEXT, status TEXT, "
+                     "max_devices INTEGER DEFAULT 2, ip_type TEXT, static_ip TEXT)")
+    manager = OpenVPNManager(install_dir=str(tmp_path), config_dir=str(tmp_path / "openvpn"),
+                             status_file=None, management_address=("127.0.0.1", 1), systemctl_cmd=["true"])
+    return manager, db_path
+
+
+def make_compiler(env, network="10.8.0.0/24"):
+    manager, db_path = env
+    compiler = CCDCompiler(manager, db_path=db_path, network=network)
+    assert compiler.install()
+    return compiler
+
+
+def add_group(compiler, group_id, policy):
+    with sqlite3.connect(compiler.db_path) as conn:
+        conn.execute("INSERT OR REPLACE INTO user_group (id, name, policy) VALUES (?, ?, ?)",
+                     (group_id, f"group{group_id}", json.dumps(policy)))
+
+
+def add_users(compiler, names, group_id=None):
+    with sqlite3.connect(compiler.db_path) as conn:
+        conn.executemany("INSERT INTO normal_user (ovpn_username, status, group_id) VALUES (?, 'approved', ?)",
+                         [(name, group_id) for name in names])
+
+
+def read_ccd(compiler, name):
+    with open(os.path.join(compiler.ccd_dir, name)) as f:
+        return f.read()
+
+
+def test_unchanged_users_are_not_rewritten(env):
+    compiler = make_compiler(env)
+    add_users(compiler, ["alice", "bob"])
+
+    assert len(compiler.compile()["write"]) == 2
+    mtime = os.stat(os.path.join(compiler.ccd_dir, "alice")).st_mtime_ns
+
+    report = compiler.compile()
+    assert report["changes"] == 0
+    assert report["unchanged"] == 2
+    assert os.stat(os.path.join(compiler.ccd_dir, "alice")).st_mtime_ns == mtime
+
+    # 手工修改的文件会被重写
+    with open(os.path.join(compiler.ccd_dir, "bob"), "a") as f:
+        f.write("push \"route 1.2.3.0 255.255.255.0\"\n")
+    assert [w["username"] for w in compiler.compile()["write"]] == ["bob"]
+
+
+def test_group_compile_only_rewrites_members(env):
+    compiler = make_compiler(env)
+    add_group(compiler, 1, {})
+    add_group(compiler, 2, {})
+    add_users(compiler, ["alice", "bob"], group_id=1)
+    add_users(compiler, ["carol"], group_id=2)
+    compiler.compile()
+
+    add_group(compiler, 1, {"routes": ["192.168.10.0/24"]})
+    add_group(compiler, 2, {"dns": ["10.8.0.1"]})
+    report = compiler.compile(group_id=1)
+
+    assert sorted(w["username"] for w in report["write"]) == ["alice", "bob"]
+    assert not report["full"] and report["remove"] == []
+    assert "route 192.168.10.0 255.255.255.0" in read_ccd(compiler, "alice")
+    assert "dhcp-option" not in read_ccd(compiler, "carol")
+
+
+def test_dry_run_returns_diff_without_writing(env):
+    compiler = make_compiler(env)
+    add_group(compiler, 1, {})
+    add_users(compiler, ["alice"], group_id=1)
+    compiler.compile()
+    before = read_ccd(compiler, "alice")
+
+    report = compiler.compile(dry_run=True, group_id=1,
+                              group_policies={1: {"push": ["block-outside-dns"]}})
+
+    assert [w["username"] for w in report["write"]] == ["alice"]
+    assert "+push \"block-outside-dns\"" in report["diff"]["alice"]
+    assert read_ccd(compiler, "alice") == before
+    assert compiler.compile()["changes"] == 0
+
+
+def test_large_subnet_assigns_full_addresses(env, tmp_path):
+    server_conf = tmp_path / "server.conf"
+    server_conf.write_text("port 1194\nserver 10.8.0.0 255.255.0.0\n")
+    compiler = make_compiler(env, network=load_server_network(str(server_conf)))
+    names = [f"user{i}" for i in range(600)]
+    add_users(compiler, names)
+
+    report = compiler.compile()
+
+    assert report["errors"] == [] and len(report["write"]) == 600
+    addresses = {read_ccd(compiler, name).split()[1] for name in names}
+    assert len(addresses) == 600
+    assert read_ccd(compiler, "user0").startswith("ifconfig-push 10.8.0.50 255.255.0.0\n")
+    assert read_ccd(compiler, "user599").startswith("ifconfig-push 10.8.2.137 255.255.0.0\n")
+    # 实例子网中使用相同的序号
+    assert translate_ccd(read_ccd(compiler, "user599"), "10.9.0.0/20").startswith(
+        "ifconfig-push 10.9.2.137 255.255.240.0\n")
+    assert "ifconfig-push" not in translate_ccd(read_ccd(compiler, "user599"), "10.9.0.0/24")
+
+
+def test_default_network_keeps_the_legacy_pool(env, tmp_path):
+    assert load_server_network(str(tmp_path / "missing.conf")) == "10.8.0.0/24"
+    compiler = make_compiler(env)
+    add_users(compiler, [f"user{i}" for i in range(205)])
+
+    report = compiler.compile()
+
+    assert len(report["write"]) == 204
+    assert read_ccd(compiler, "user203").startswith("ifconfig-push 10.8.0.253 255.255.255.0\n")
+    assert "地址池已满" in report["errors"][0]
@@ -0,0 +1,145 @@
+"""ConnectionHistory 测试：事件套接字的权限、按月分区、批量写入与会话配对"""
+import grp
+import json
+import os
+import socket
+import sqlite3
+import stat
+import time
+from datetime import datetime, timezone
+
+from utils.connection_history import ConnectionHistory
+
+
+def test_event_socket_is_group_writable_only(tmp_path):
+    group = grp.getgrgid(os.getgid()).gr_name
+    history = ConnectionHistory(db_path=str(tmp_path / "history.db"),
+                                socket_path=str(tmp_path / "run" / "events.sock"), socket_group=group)
+
+    sock = history._bind_socket()
+    try:
+        st = os.stat(history.socket_path)
+        assert stat.S_IMODE(st.st_mode) == 0o660
+        assert st.st_gid == os.getgid()
+    finally:
+        sock.close()
+
+
+def test_unknown_socket_group_keeps_owner_only(tmp_path):
+    history = ConnectionHistory(db_path=str(tmp_path / "history.db"),
+                                socket_path=str(tmp_path / "events.sock"), socket_group="no-such-group")
+
+    sock = history._bind_socket()
+    try:
+        assert sock is not None
+        assert not os.stat(history.socket_path).st_mode & stat.S_IWOTH
+    finally:
+        sock.close()
+
+
+def make_history(tmp_path, **kwargs):
+    return ConnectionHistory(db_path=str(tmp_path / "history.db"),
+                             socket_path=str(tmp_path / "events.sock"), socket_group=None, **kwargs)
+
+
+def month(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y%m")
+
+
+def test_events_are_written_to_monthly_partitions(tmp_path):
+    history = make_history(tmp_path)
+    now = int(time.time())
+    old = now - 40 * 86400
+    history.record({"event": "connect", "common_name": "alice", "ts": old, "connected_at": old})
+    history.record({"event": "connect", "common_name": "alice", "ts": now, "connected_at": now})
+    history.record({"event": "connect", "common_name": "bob", "ts": now, "connected_at": now})
+
+    assert history.flush() == 3
+
+    assert history.get_stats() == {"partitions": {month(old): 1, month(now): 2}, "total": 3, "pending": 0}
+    # 时间范围只覆盖一个分区时只返回该分区的事件
+    assert [e["common_name"] for e in history.get_events(since=now - 60)] == ["bob", "alice"]
+    assert len(history.get_events(since=old - 60)) == 3
+
+
+def test_invalid_events_are_ignored(tmp_path):
+    history = make_history(tmp_path)
+
+    assert history.record({"event": "connect"}) is False
+    assert history.record({"event": "reboot", "common_name": "alice"}) is False
+    assert history.flush() == 0
+
+
+def test_writes_are_batched(tmp_path):
+    history = make_history(tmp_path, batch_size=3, flush_interval=30)
+    history.record({"event": "connect", "common_name": "alice"})
+    history.record({"event": "connect", "common_name": "bob"})
+    # 未达到批次大小时只在内存队列中
+    assert history.get_stats()["pending"] == 2
+    assert history.get_stats()["total"] == 0
+
+    history.start()
+    try:
+        history.record({"event": "connect", "common_name": "carol"})
+        deadline = time.monotonic() + 5
+        while history.get_stats()["total"] < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # 达到批次大小立即写入，不等待 flush_interval
+        assert history.get_stats() == {"partitions": {month(time.time()): 3}, "total": 3, "pending": 0}
+    finally:
+        history.stop()
+
+
+def test_events_are_received_over_socket(tmp_path):
+    history = make_history(tmp_path, flush_interval=0.05)
+    history.start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(json.dumps({"event": "connect", "common_name": "alice"}).encode(), history.socket_path)
+            sock.sendto(b"not json", history.socket_path)
+        deadline = time.monotonic() + 5
+        while history.get_stats()["total"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        history.stop()
+
+    assert [e["common_name"] for e in history.get_events(since=0)] == ["alice"]
+
+
+def test_connect_and_disconnect_are_paired_into_sessions(tmp_path):
+    history = make_history(tmp_path)
+    now = int(time.time())
+    first, second = now - 7200, now - 600
+    history.record({"event": "connect", "common_name": "alice", "ts": first, "connected_at": first,
+                    "real_address": "198.51.100.1:5000", "virtual_address": "10.8.0.2", "instance": "udp0"})
+    history.record({"event": "connect", "common_name": "alice", "ts": second, "connected_at": second,
+                    "real_address": "198.51.100.1:6000", "instance": "udp0"})
+    history.record({"event": "disconnect", "common_name": "alice", "ts": first + 3600, "connected_at": first,
+                    "real_address": "198.51.100.1:5000", "instance": "udp0", "duration": 3600,
+                    "bytes_received": "100", "bytes_sent": "200"})
+    history.record({"event": "connect", "common_name": "bob", "ts": now, "connected_at": now})
+    history.flush()
+
+    sessions = history.get_user_sessions("alice")
+
+    assert [(s["connected_at"], s["active"]) for s in sessions] == [(second, True), (first, False)]
+    closed = sessions[1]
+    assert (closed["disconnected_at"], closed["duration"]) == (first + 3600, 3600)
+    assert (closed["bytes_received"], closed["bytes_sent"], closed["virtual_address"]) == (100, 200, "10.8.0.2")
+
+
+def test_prune_drops_expired_partitions(tmp_path):
+    history = make_history(tmp_path, retention_days=30)
+    now = int(time.time())
+    old = now - 100 * 86400
+    history.record({"event": "connect", "common_name": "alice", "ts": old})
+    history.record({"event": "connect", "common_name": "alice", "ts": now})
+    history.flush()
+
+    dropped = history.prune()
+
+    assert dropped == [f"connection_event_{month(old)}"]
+    assert history.get_stats()["partitions"] == {month(now): 1}
+    with sqlite3.connect(history.db_path) as conn:
+        tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert f"connection_event_{month(old)}" not in tables
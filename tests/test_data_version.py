@@ -0,0 +1,23 @@
+"""DataVersion 测试：组合版本号"""
+import sqlite3
+
+from utils.data_version import DataVersion
+
+
+def test_combined_version_changes_with_either_table(tmp_path):
+    db_path = str(tmp_path / "webui.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE user_group (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.execute("CREATE TABLE normal_user (id INTEGER PRIMARY KEY, group_id INTEGER)")
+    versions = DataVersion(db_path)
+    versions.install()
+
+    before = versions.get("user_group", "normal_user")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO normal_user (group_id) VALUES (1)")
+    after = versions.get("user_group", "normal_user")
+
+    assert before == "user_group:0|normal_user:0"
+    assert after == "user_group:0|normal_user:1"
+    assert versions.get("user_group") == "user_group:0"
+    assert versions.get("user_group", "missing") is None
@@ -0,0 +1,298 @@
+"""FleetManager 测试：本地替身实例
+
+systemctl_cmd 指向记录调用的脚本，status_file 指向临时状态文件，
+管理接口由本地 socket 替身模拟。
+"""
+import json
+import os
+import socket
+import subprocess
+import threading
+
+import pytest
+
+from utils import fleet_manager
+from utils.fleet_manager import FleetManager
+
+
+class FakeManagement:
+    """OpenVPN 管理接口替身：status 3 返回给定的会话，kill 对在线用户返回 SUCCESS
+
+    指定 path 时监听 Unix 套接字（本机实例），否则监听 127.0.0.1 的随机端口。
+    """
+
+    def __init__(self, sessions=(), path=None):
+        self.sessions = list(sessions)
+        self.commands = []
+        if path:
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(path)
+            self.address = path
+        else:
+            self._server = socket.socket()
+            self._server.bind(("127.0.0.1", 0))
+            self.address = "127.0.0.1:%d" % self._server.getsockname()[1]
+        self._server.listen()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            with conn, conn.makefile("rw", encoding="utf-8", newline="\n") as f:
+                f.write(">INFO:OpenVPN Management Interface Version 5\r\n")
+                f.flush()
+                command = f.readline().strip()
+                self.commands.append(command)
+                if command == "status 3":
+                    f.write("TITLE\tOpenVPN 2.6\r\n")
+                    f.write("HEADER\tCLIENT_LIST\tCommon Name\tReal Address\tVirtual Address\r\n")
+                    for cn in self.sessions:
+                        f.write(f"CLIENT_LIST\t{cn}\t198.51.100.1:5000\t10.8.0.2\r\n")
+                    f.write("END\r\n")
+                elif command.startswith("kill "):
+                    cn = command.split(" ", 1)[1]
+                    if cn in self.sessions:
+                        f.write(f"SUCCESS: common name '{cn}' found, 1 client(s) killed\r\n")
+                    else:
+                        f.write(f"ERROR: common name '{cn}' not found\r\n")
+                f.flush()
+                f.readline()  # quit
+
+    def close(self):
+        self._server.close()
+
+
+def write_systemctl(tmp_path, name, active=True, restart_ok=True):
+    """systemctl 替身：记录参数，is-active / restart 按参数返回"""
+    log = tmp_path / f"{name}.calls"
+    script = tmp_path / f"{name}-systemctl"
+    script.write_text(
+        "#!/bin/sh\n"
+        f"echo \"$@\" >> {log}\n"
+        f"[ \"$1\" = is-active ] && exit {0 if active else 3}\n"
+        f"exit {0 if restart_ok else 1}\n"
+    )
+    script.chmod(0o755)
+    return [str(script)], log
+
+
+def write_status(tmp_path, name, common_names):
+    path = tmp_path / f"{name}.status"
+    lines = ["TITLE,OpenVPN 2.6", "HEADER,CLIENT_LIST,Common Name,Real Address,Virtual Address"]
+    lines += [f"CLIENT_LIST,{cn},198.51.100.1:5000,10.8.0.2" for cn in common_names]
+    path.write_text("\n".join(lines + ["END"]) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def fleet(tmp_path):
+    def build(instances):
+        registry = tmp_path / "instances.json"
+        registry.write_text(json.dumps(instances))
+        return FleetManager(registry_file=str(registry), source_config_dir=str(tmp_path / "source"))
+    return build
+
+
+def test_status_aggregates_local_instances(tmp_path, fleet):
+    udp0_cmd, _ = write_systemctl(tmp_path, "udp0")
+    udp1_cmd, _ = write_systemctl(tmp_path, "udp1", active=False)
+    manager = fleet([
+        {"name": "udp0", "systemctl_cmd": udp0_cmd, "management": "127.0.0.1:1",
+         "status_file": write_status(tmp_path, "udp0", ["alice", "bob"])},
+        {"name": "udp1", "systemctl_cmd": udp1_cmd, "management": "127.0.0.1:1",
+         "status_file": write_status(tmp_path, "udp1", ["carol"])},
+    ])
+
+    status = manager.status()
+
+    assert status["active_instances"] == 1
+    assert status["total_instances"] == 2
+    # 未运行的实例不计入连接数
+    assert status["connected_clients"] == 2
+    assert all(r["ok"] for r in status["instances"].values())
+
+
+def test_status_error_result_is_not_ok(tmp_path, fleet):
+    manager = fleet([{"name": "broken", "systemctl_cmd": [str(tmp_path / "missing")],
+                      "management": "127.0.0.1:1"}])
+
+    result = manager.status()["instances"]["broken"]
+
+    assert result["result"]["status"] == "error"
+    assert result["ok"] is False
+
+
+def test_restart_reports_each_instance(tmp_path, fleet):
+    ok_cmd, ok_log = write_systemctl(tmp_path, "udp0")
+    bad_cmd, _ = write_systemctl(tmp_path, "udp1", restart_ok=False)
+    manager = fleet([
+        {"name": "udp0", "systemctl_cmd": ok_cmd, "management": "127.0.0.1:1"},
+        {"name": "udp1", "systemctl_cmd": bad_cmd, "management": "127.0.0.1:1"},
+    ])
+
+    results = manager.restart()
+
+    assert results["udp0"]["ok"] is True
+    assert results["udp1"]["ok"] is False
+    assert ok_log.read_text().split() == ["restart", "openvpn-server@udp0"]
+
+
+def test_unknown_instance_is_reported(tmp_path, fleet):
+    cmd, _ = write_systemctl(tmp_path, "udp0")
+    manager = fleet([{"name": "udp0", "systemctl_cmd": cmd, "management": "127.0.0.1:1"}])
+
+    results = manager.restart(["udp0", "nope"])
+
+    assert results["nope"] == {"ok": False, "error": "实例不存在"}
+
+
+def test_remote_instance_requires_management(tmp_path, fleet):
+    manager = fleet([{"name": "edge1", "host": "edge1.example"}])
+
+    result = manager.sessions()["instances"]["edge1"]
+
+    assert result["ok"] is False
+    assert "management" in result["error"]
+    with pytest.raises(ValueError):
+        manager.save_instances([{"name": "edge1", "host": "edge1.example"}])
+
+
+def test_remote_sessions_use_management_not_local_status(tmp_path, fleet, monkeypatch):
+    remote = FakeManagement(sessions=["dave"])
+    try:
+        # 本机默认状态文件中的会话不能算到远程实例上
+        local_status = write_status(tmp_path, "local", ["alice", "bob"])
+        monkeypatch.setitem(fleet_manager.DEFAULT_INSTANCE, "status_file", local_status)
+        cmd, _ = write_systemctl(tmp_path, "edge1")
+        manager = fleet([{"name": "edge1", "host": "edge1.example", "management": remote.address,
+                          "systemctl_cmd": cmd}])
+
+        sessions = manager.sessions()
+        status = manager.status()
+
+        assert [s["common_name"] for s in sessions["sessions"]] == ["dave"]
+        assert status["connected_clients"] == 1
+    finally:
+        remote.close()
+
+
+def test_remote_sessions_fail_when_management_unreachable(tmp_path, fleet):
+    # 绑定后不监听的端口：连接会被拒绝
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        address = "127.0.0.1:%d" % sock.getsockname()[1]
+        manager = fleet([{"name": "edge1", "host": "edge1.example", "management": address}])
+
+        result = manager.sessions()["instances"]["edge1"]
+
+    assert result["ok"] is False
+
+
+def test_kill_client_fans_out(tmp_path, fleet):
+    udp0, udp1 = FakeManagement(sessions=["alice"]), FakeManagement()
+    try:
+        manager = fleet([{"name": "udp0", "management": udp0.address},
+                         {"name": "udp1", "management": udp1.address}])
+
+        results = manager.kill_client("alice")
+
+        assert (results["udp0"]["ok"], results["udp0"]["result"]) == (True, {"killed": True})
+        # 用户不在该实例上不是失败
+        assert (results["udp1"]["ok"], results["udp1"]["result"]) == (True, {"killed": False})
+        assert udp0.commands == ["kill alice"] and udp1.commands == ["kill alice"]
+    finally:
+        udp0.close()
+        udp1.close()
+
+
+def test_kill_client_over_unix_socket(tmp_path, fleet):
+    local = FakeManagement(sessions=["alice"], path=str(tmp_path / "management.sock"))
+    try:
+        manager = fleet([{"name": "udp0", "management": local.address}])
+
+        results = manager.kill_client("alice")
+
+        assert (results["udp0"]["ok"], results["udp0"]["result"]) == (True, {"killed": True})
+        assert local.commands == ["kill alice"]
+    finally:
+        local.close()
+
+
+@pytest.mark.parametrize("common_name", ["a b", "alice\nsignal SIGTERM", "alice\r", "", "a\"b"])
+def test_kill_client_rejects_unsafe_common_name(tmp_path, fleet, common_name):
+    local = FakeManagement(sessions=["alice"], path=str(tmp_path / "management.sock"))
+    try:
+        manager = fleet([{"name": "udp0", "management": local.address}])
+
+        with pytest.raises(ValueError):
+            manager.kill_client(common_name)
+        with pytest.raises(ValueError):
+            manager.get_manager("udp0").kill_client(common_name)
+        # 没有任何命令发到管理接口
+        assert local.commands == []
+    finally:
+        local.close()
+
+
+def test_remote_instance_rejects_unix_socket_management(tmp_path, fleet):
+    manager = fleet([{"name": "edge1", "host": "edge1.example", "management": "/run/openvpn-server/edge1.sock"}])
+
+    result = manager.status()["instances"]["edge1"]
+
+    assert result["ok"] is False
+    assert "management" in result["error"]
+
+
+def test_sync_users_mirrors_source_to_local_instance(tmp_path, fleet):
+    source = tmp_path / "source"
+    (source / "auth").mkdir(parents=True)
+    (source / "ccd").mkdir()
+    (source / "auth" / "users").write_text("alice:$1$x$y\n")
+    (source / "ccd" / "alice").write_text("ifconfig-push 10.8.0.50 255.255.255.0\n")
+    target = tmp_path / "udp1"
+    (target / "ccd").mkdir(parents=True)
+    (target / "ccd" / "stale").write_text("")
+    manager = fleet([{"name": "udp1", "config_dir": str(target), "management": "127.0.0.1:1"}])
+
+    first = manager.sync_users()["udp1"]
+    second = manager.sync_users()["udp1"]
+
+    assert first["ok"] and first["result"] == {"synced": 2}
+    assert second["result"] == {"synced": 0}
+    assert (target / "auth" / "users").read_text() == "alice:$1$x$y\n"
+    assert sorted(os.listdir(target / "ccd")) == ["alice"]
+
+
+def test_push_config_quotes_remote_path(tmp_path, fleet, monkeypatch):
+    calls = []
+    monkeypatch.setattr(subprocess, "run", lambda args, **kwargs: calls.append(args))
+    manager = fleet([{"name": "edge1", "host": "edge1.example", "management": "10.0.0.2:7505",
+                      "config_dir": "/etc/openvpn/a b;touch x"}])
+
+    result = manager.push_config("port 1194\n")["edge1"]
+
+    assert result["ok"] is True
+    remote_command = calls[0][-1]
+    assert remote_command == ("cat > '/etc/openvpn/a b;touch x/server.conf.tmp' && "
+                              "mv '/etc/openvpn/a b;touch x/server.conf.tmp' '/etc/openvpn/a b;touch x/server.conf'")
+
+
+def test_sync_users_renders_instance_ccd_in_subnet(tmp_path, fleet):
+    source = tmp_path / "source"
+    (source / "ccd").mkdir(parents=True)
+    (source / "ccd" / "alice").write_text("ifconfig-push 10.8.0.50 255.255.255.0\npush \"max-routes 2\"\n")
+    manager = fleet([{"name": "udp1", "config_dir": str(source), "management": "127.0.0.1:1",
+                      "subnet": "10.8.64.0/18"}])
+
+    first = manager.sync_users()["udp1"]
+    second = manager.sync_users()["udp1"]
+
+    assert first["result"] == {"synced": 1}
+    assert second["result"] == {"synced": 0}
+    assert (source / "ccd-udp1" / "alice").read_text() == (
+        "ifconfig-push 10.8.64.50 255.255.192.0\npush \"max-routes 2\"\n")
+    # 主 ccd/ 保持不变
+    assert (source / "ccd" / "alice").read_text().startswith("ifconfig-push 10.8.0.50 ")
@@ -0,0 +1,99 @@
+"""LogViewer 测试：临时目录中的 webui.log 和 OpenVPN 日志"""
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+import utils.log_viewer as log_viewer
+from utils.log_viewer import LogViewer, default_log_sources, load_log_config
+
+BASE = datetime(2026, 10, 19, 7, 0, 0)
+LEVELS = ("INFO", "WARNING", "ERROR", "DEBUG")
+
+
+def webui_line(i):
+    ts = BASE.replace(minute=i // 60 % 60, second=i % 60).strftime("%Y-%m-%d %H:%M:%S")
+    return f"{ts},123 - app - {LEVELS[i % 4]} - 消息 {i}\n"
+
+
+@pytest.fixture
+def webui_log(tmp_path):
+    path = tmp_path / "webui.log"
+    with open(path, "w") as f:
+        for i in range(300):
+            f.write(webui_line(i))
+            if i % 10 == 2:
+                f.write("Traceback (most recent call last):\n  File \"app.py\", line 1\n")
+    return LogViewer({"webui": str(path)})
+
+
+def read_all(viewer, **kwargs):
+    items, before, pages = [], None, 0
+    while True:
+        page = viewer.read("webui", before=before, **kwargs)
+        items += page["items"]
+        pages += 1
+        before = page["next_before"]
+        if before is None:
+            return items, pages
+
+
+def test_default_sources_follow_log_dir(tmp_path):
+    assert default_log_sources(str(tmp_path))["webui"] == str(tmp_path / "webui.log")
+    assert load_log_config(str(tmp_path / "missing.json"), str(tmp_path))["webui"] == str(tmp_path / "webui.log")
+
+    config = tmp_path / "webui.json"
+    config.write_text(json.dumps({"logs": {"nginx": "/var/log/nginx/error.log"}}))
+    sources = load_log_config(str(config), str(tmp_path))
+    assert sources["webui"] == str(tmp_path / "webui.log")
+    assert sources["nginx"] == "/var/log/nginx/error.log"
+
+
+def test_pagination_returns_every_record_once(webui_log):
+    items, pages = read_all(webui_log, limit=40)
+
+    assert pages == 8
+    assert [item["text"].split("\n")[0] for item in items] == [webui_line(i).rstrip("\n") for i in reversed(range(300))]
+    # 异常堆栈归入前一条记录
+    assert items[-3]["text"].endswith("line 1")
+
+
+def test_pagination_continues_when_scan_limit_is_reached(webui_log, monkeypatch):
+    monkeypatch.setattr(log_viewer, "MAX_SCAN_BYTES", 2048)
+
+    items, pages = read_all(webui_log, limit=1000, query="消息 1")
+
+    assert pages > 1
+    assert len(items) == len([i for i in range(300) if f"消息 {i}".startswith("消息 1")])
+
+
+@pytest.mark.parametrize("level", ["warn", "WARNING", "warning"])
+def test_level_aliases(webui_log, level):
+    items, _ = read_all(webui_log, limit=1000, level=level)
+
+    assert len(items) == 150
+    assert {item["level"] for item in items} == {"warning", "error"}
+
+
+def test_time_range_uses_index(webui_log, monkeypatch):
+    monkeypatch.setattr(log_viewer, "INDEX_STEP", 512)
+    since = int(time.mktime(BASE.replace(minute=1).timetuple()))
+    until = since + 59
+
+    items, _ = read_all(webui_log, limit=1000, since=since, until=until)
+
+    assert [item["text"].split("\n")[0] for item in items] == [webui_line(i).rstrip("\n") for i in reversed(range(60, 120))]
+
+
+def test_openvpn_user_filter(tmp_path):
+    (tmp_path / "server-udp0.log").write_text(
+        "2026-10-19 07:00:00 alice/198.51.100.7:51234 TLS Error: handshake failed\n"
+        "2026-10-19 07:00:01 bob/198.51.100.8:51234 Initialization Sequence Completed\n"
+        "2026-10-19 07:00:02 alice/198.51.100.7:51234 SENT CONTROL [alice]: 'PUSH_REPLY'\n")
+    viewer = LogViewer({"openvpn": str(tmp_path / "*.log")})
+
+    assert list(viewer.sources()) == ["openvpn-server-udp0"]
+    page = viewer.read("openvpn-server-udp0", user="ALICE")
+    assert [item["level"] for item in page["items"]] == ["info", "error"]
+    assert viewer.read("openvpn-server-udp0", user="alice", level="warn")["items"][0]["text"].endswith("failed")
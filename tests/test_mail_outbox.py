@@ -0,0 +1,222 @@
+"""MailOutbox 测试：邮件发送到本机随机端口上的 SMTP 接收服务器"""
+import socketserver
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from utils.mail_outbox import MailOutbox
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """最小的 SMTP 接收服务器：记录收到的邮件
+
+    收件人包含 reject 时 RCPT 返回 550（永久错误）；fail_data 大于 0 时
+    DATA 结束后返回 451（临时错误）并减一。
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.fail_data = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 sink ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().rstrip("\r\n")
+            if not line:
+                return
+            command = line.split(" ", 1)[0].upper()
+            if command == "EHLO":
+                self.reply("250-sink")
+                self.reply("250 8BITMIME")
+            elif command in ("HELO", "NOOP", "RSET"):
+                recipients = [] if command == "RSET" else recipients
+                self.reply("250 OK")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                if "reject" in line:
+                    self.reply("550 mailbox unavailable")
+                else:
+                    recipients.append(line.split(":", 1)[1].strip(" <>"))
+                    self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while True:
+                    chunk = self.rfile.readline().decode()
+                    if chunk in (".\r\n", ""):
+                        break
+                    data.append(chunk)
+                with server.lock:
+                    if server.fail_data > 0:
+                        server.fail_data -= 1
+                        self.reply("451 try again later")
+                        continue
+                    server.messages.append((recipients, "".join(data)))
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+@pytest.fixture
+def sink():
+    server = SMTPSink()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def outbox(tmp_path, sink):
+    return MailOutbox(db_path=str(tmp_path / "webui.db"),
+                      config={"enabled": True, "host": "127.0.0.1", "port": sink.port, "timeout": 5})
+
+
+CONTEXT = {"username": "u", "changed_at": "now"}
+
+
+def rows(box):
+    with sqlite3.connect(box.db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        return {row["recipient"]: row for row in conn.execute("SELECT * FROM mail_outbox")}
+
+
+def seconds_until(value):
+    due = datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return (due - datetime.now(timezone.utc)).total_seconds()
+
+
+def make_due(box):
+    with sqlite3.connect(box.db_path) as conn:
+        conn.execute("UPDATE mail_outbox SET next_attempt_at = '2000-01-01 00:00:00'")
+
+
+def test_batch_is_sent_over_one_connection(outbox, sink):
+    for name in ("alice", "bob", "carol"):
+        outbox.enqueue("password_changed", f"{name}@example.com", CONTEXT)
+
+    assert outbox.process_batch() == 3
+
+    assert sink.connections == 1
+    assert sorted(r[0][0] for r in sink.messages) == ["alice@example.com", "bob@example.com", "carol@example.com"]
+    assert {row["status"] for row in rows(outbox).values()} == {"sent"}
+    # 已发送的邮件不会再次发送
+    assert outbox.process_batch() == 0
+    assert len(sink.messages) == 3
+
+
+def test_temporary_failure_retries_with_backoff(outbox, sink):
+    outbox.max_attempts = 3
+    outbox.enqueue("password_changed", "alice@example.com", CONTEXT)
+    sink.fail_data = 2
+
+    outbox.process_batch()
+    first = rows(outbox)["alice@example.com"]
+    make_due(outbox)
+    outbox.process_batch()
+    second = rows(outbox)["alice@example.com"]
+    make_due(outbox)
+    outbox.process_batch()
+    third = rows(outbox)["alice@example.com"]
+
+    assert (first["status"], first["attempts"]) == ("pending", 1)
+    assert 25 <= seconds_until(first["next_attempt_at"]) <= 31
+    assert (second["status"], second["attempts"]) == ("pending", 2)
+    assert 55 <= seconds_until(second["next_attempt_at"]) <= 61
+    assert "451" in second["last_error"]
+    assert (third["status"], third["last_error"]) == ("sent", None)
+    assert len(sink.messages) == 1
+
+
+def test_gives_up_after_max_attempts(outbox, sink):
+    outbox.max_attempts = 2
+    outbox.enqueue("password_changed", "alice@example.com", CONTEXT)
+    sink.fail_data = 5
+
+    outbox.process_batch()
+    make_due(outbox)
+    outbox.process_batch()
+
+    row = rows(outbox)["alice@example.com"]
+    assert (row["status"], row["attempts"]) == ("failed", 2)
+    make_due(outbox)
+    assert outbox.process_batch() == 0
+
+
+def test_permanent_errors_are_not_retried(outbox, sink):
+    outbox.enqueue("password_changed", "reject@example.com", CONTEXT)
+    # 换行无法写入邮件头
+    outbox.enqueue("password_changed", "bad\n@example.com", CONTEXT)
+    outbox.enqueue("password_changed", "bob@example.com", CONTEXT)
+
+    assert outbox.process_batch() == 3
+
+    result = {name: (row["status"], row["attempts"]) for name, row in rows(outbox).items()}
+    assert result == {"reject@example.com": ("failed", 1), "bad\n@example.com": ("failed", 1),
+                      "bob@example.com": ("sent", 0)}
+    assert [r[0] for r in sink.messages] == [["bob@example.com"]]
+
+
+def test_domain_rate_limit_defers_without_counting_attempts(outbox, sink):
+    outbox.domain_rate_per_minute = 2
+    for name in ("alice", "bob", "carol"):
+        outbox.enqueue("password_changed", f"{name}@example.com", CONTEXT)
+    outbox.enqueue("password_changed", "dave@example.org", CONTEXT)
+
+    assert outbox.process_batch() == 3
+
+    result = rows(outbox)
+    assert sorted(r[0][0] for r in sink.messages) == ["alice@example.com", "bob@example.com", "dave@example.org"]
+    deferred = result["carol@example.com"]
+    assert (deferred["status"], deferred["attempts"]) == ("pending", 0)
+    assert 55 <= seconds_until(deferred["next_attempt_at"]) <= 61
+    # 限速窗口内再次到期也不会发送
+    make_due(outbox)
+    assert outbox.process_batch() == 0
+    assert rows(outbox)["carol@example.com"]["status"] == "pending"
+
+
+def test_interrupted_batch_keeps_sent_results(outbox, sink, monkeypatch):
+    outbox.enqueue("password_changed", "alice@example.com", CONTEXT)
+    outbox.enqueue("password_changed", "bob@example.com", CONTEXT)
+    send = outbox._send
+
+    def send_then_stop(msg):
+        if msg["recipient"] == "bob@example.com":
+            raise KeyboardInterrupt
+        send(msg)
+    monkeypatch.setattr(outbox, "_send", send_then_stop)
+
+    with pytest.raises(KeyboardInterrupt):
+        outbox.process_batch()
+
+    assert {name: row["status"] for name, row in rows(outbox).items()} == {
+        "alice@example.com": "sent", "bob@example.com": "pending"}
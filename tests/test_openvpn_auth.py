@@ -0,0 +1,58 @@
+"""OpenVPN 登录校验测试：真实的 openssl 哈希和 auth/users 文件"""
+from datetime import datetime, timedelta, timezone
+
+from utils.account_lifecycle import account_active
+from utils.openvpn_manager import OpenVPNManager, verify_password
+
+
+def make_manager(tmp_path):
+    return OpenVPNManager(install_dir=str(tmp_path), config_dir=str(tmp_path / "openvpn"), status_file=None,
+                          management_address=("127.0.0.1", 1), systemctl_cmd=["true"])
+
+
+def test_verify_user_checks_hash(tmp_path):
+    manager = make_manager(tmp_path)
+    assert manager.create_user("alice", "s3cret pass")
+
+    assert manager.verify_user("alice", "s3cret pass")
+    assert not manager.verify_user("alice", "wrong")
+    assert not manager.verify_user("bob", "s3cret pass")
+
+
+def test_suspended_user_fails_auth(tmp_path):
+    manager = make_manager(tmp_path)
+    manager.create_user("alice", "s3cret")
+
+    assert manager.set_locked(["alice"], True) == 1
+    assert not manager.verify_user("alice", "s3cret")
+
+    # 激活后恢复原密码
+    manager.set_locked(["alice"], False)
+    assert manager.verify_user("alice", "s3cret")
+
+
+def test_change_password_verifies_salted_hash(tmp_path):
+    manager = make_manager(tmp_path)
+    manager.create_user("alice", "old-pass")
+
+    assert not manager.change_password("alice", "wrong", "new-pass")
+    assert manager.change_password("alice", "old-pass", "new-pass")
+    assert manager.verify_user("alice", "new-pass")
+    assert not manager.verify_user("alice", "old-pass")
+
+
+def test_verify_password_rejects_other_formats():
+    assert not verify_password("x", "")
+    assert not verify_password("x", "!$1$salt$hash")
+    assert not verify_password("x", "plaintext")
+
+
+def test_account_active():
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    naive_now = now.replace(tzinfo=None)
+
+    assert account_active("approved", None, now)
+    assert account_active("approved", naive_now + timedelta(days=1), now)
+    assert not account_active("approved", naive_now - timedelta(seconds=1), now)
+    assert not account_active("suspended", None, now)
+    assert not account_active("pending", None, now)
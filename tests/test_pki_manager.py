@@ -0,0 +1,64 @@
+"""PKIManager / IssueJobRunner 测试：临时目录中的 PKI"""
+import time
+
+import pytest
+
+from utils.pki_manager import IssueJobRunner, PKIManager
+
+
+@pytest.fixture
+def pki(tmp_path):
+    manager = PKIManager(pki_dir=str(tmp_path / "pki"), db_path=str(tmp_path / "webui.db"), workers=2)
+    manager.init_ca()
+    return manager
+
+
+@pytest.mark.parametrize("name", ["ca", "server", "Server", "ta", "../x", "a b", "bob\n", ".hidden", "x" * 65])
+def test_reserved_and_invalid_names_are_rejected(pki, name):
+    with pytest.raises(ValueError):
+        pki.issue_certificates([name])
+
+
+def test_issuing_cannot_overwrite_ca_key(pki):
+    with open(pki.ca_key_file, "rb") as f:
+        ca_key = f.read()
+
+    with pytest.raises(ValueError):
+        pki.issue_certificates(["alice", "ca"])
+
+    with open(pki.ca_key_file, "rb") as f:
+        assert f.read() == ca_key
+    assert pki.count_certificates() == {}
+
+
+def test_reissue_supersedes_previous_certificate(pki):
+    first = pki.issue_certificates(["alice", "bob"])
+    second = pki.issue_certificates(["alice"])
+
+    assert {c["common_name"] for c in first} == {"alice", "bob"}
+    assert pki.get_certificate("alice")["serial"] == second[0]["serial"]
+    assert pki.count_certificates() == {"valid": 2, "superseded": 1}
+
+
+def test_job_runner_issues_in_background(pki):
+    runner = IssueJobRunner(pki)
+
+    job_id = runner.submit("issue", ["carol", "dave"])
+    with pytest.raises(RuntimeError):
+        runner.submit("issue", ["erin"])
+    deadline = time.monotonic() + 60
+    while runner.get(job_id)["status"] == "running" and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    job = runner.get(job_id)
+    assert job["status"] == "done", job["error"]
+    assert job["result"] == {"issued": 2}
+    assert pki.get_certificate("carol") is not None
+
+
+def test_job_runner_rejects_bad_names_before_starting(pki):
+    runner = IssueJobRunner(pki)
+
+    with pytest.raises(ValueError):
+        runner.submit("issue", ["server"])
+    assert runner.list_jobs() == []
@@ -0,0 +1,58 @@
+"""ReportExporter 测试：中断后续传"""
+import pytest
+
+from utils.report_exporter import _resume_point
+
+
+def test_csv_partial_row_is_truncated(tmp_path):
+    path = tmp_path / "users.csv"
+    complete = b"id,username\r\n1,alice\r\n2,bob\r\n"
+    path.write_bytes(complete + b'3,"par')
+
+    assert _resume_point(str(path), "csv", "id") == "2"
+    assert path.read_bytes() == complete
+
+
+def test_jsonl_partial_line_is_truncated(tmp_path):
+    path = tmp_path / "events.jsonl"
+    complete = b'{"id": 1}\n{"id": 2}\n'
+    path.write_bytes(complete + b'{"id": 3, "comm')
+
+    assert _resume_point(str(path), "jsonl", "id") == "2"
+    assert path.read_bytes() == complete
+
+
+def test_complete_file_is_unchanged(tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_bytes(b"id,username\r\n1,alice\r\n")
+
+    assert _resume_point(str(path), "csv", "id") == "1"
+    assert path.read_bytes() == b"id,username\r\n1,alice\r\n"
+
+
+def test_header_only_and_partial_header(tmp_path):
+    header_only = tmp_path / "a.csv"
+    header_only.write_bytes(b"id,username\r\n")
+    partial = tmp_path / "b.csv"
+    partial.write_bytes(b"id,user")
+
+    assert _resume_point(str(header_only), "csv", "id") is None
+    assert _resume_point(str(partial), "csv", "id") is None
+    assert partial.read_bytes() == b""
+
+
+def test_long_tail_spans_blocks(tmp_path):
+    path = tmp_path / "events.jsonl"
+    rows = b"".join(b'{"id": %d, "pad": "%s"}\n' % (i, b"x" * 40000) for i in range(1, 4))
+    path.write_bytes(rows + b'{"id": 4')
+
+    assert _resume_point(str(path), "jsonl", "id") == "3"
+    assert path.read_bytes() == rows
+
+
+def test_unreadable_last_row_is_an_error(tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_bytes(b"id,username\r\nnot a row with,too,many\r\n")
+
+    with pytest.raises(ValueError):
+        _resume_point(str(path), "csv", "id")
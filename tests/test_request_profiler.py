@@ -0,0 +1,65 @@
+"""RequestProfiler 测试：SQL 记录与采样线程"""
+import threading
+import time
+
+from utils import request_profiler
+from utils.request_profiler import RequestProfiler, _Record, _normalize_sql, _trace_sql
+
+
+def test_sql_is_normalized_only_when_logged(monkeypatch):
+    record = _Record("GET", "/admin/api/users", profile=False)
+    monkeypatch.setattr(request_profiler._local, "record", record, raising=False)
+
+    for user_id in (1, 2, 2):
+        _trace_sql(f"SELECT * FROM normal_user WHERE id = {user_id}")
+    _trace_sql("UPDATE normal_user SET password_hash = 'secret' WHERE id = 3")
+
+    # 请求进行中只按原始语句计数
+    assert record.sql_total == 4
+    assert record.sql["SELECT * FROM normal_user WHERE id = 2"][0] == 2
+
+    logged = _normalize_sql(record.sql)
+    assert [(s["statement"], s["count"]) for s in logged] == [
+        ("SELECT * FROM normal_user WHERE id = ?", 3),
+        ("UPDATE normal_user SET password_hash = ? WHERE id = ?", 1),
+    ]
+
+
+def test_sampler_sleeps_until_earliest_request_is_due(tmp_path):
+    profiler = RequestProfiler(log_dir=str(tmp_path), slow_threshold_ms=400)
+    assert profiler._next_sample_delay() == 1.0
+
+    older, newer = _Record("GET", "/a", profile=False), _Record("GET", "/b", profile=False)
+    older.thread_id, newer.thread_id = 1, 2
+    older.started -= 0.08
+    profiler._inflight = {1: older, 2: newer}
+    assert 0.01 < profiler._next_sample_delay() <= 0.02 + 1e-6
+
+    older.started -= 1
+    assert profiler._next_sample_delay() == 0.0
+
+    profiled = _Record("GET", "/c", profile=True)
+    profiler._inflight = {3: profiled}
+    assert profiler._next_sample_delay() == 0.0
+
+
+def test_slow_request_is_sampled_after_threshold(tmp_path):
+    profiler = RequestProfiler(log_dir=str(tmp_path), slow_threshold_ms=200, sample_interval=0.002)
+    done = threading.Event()
+    worker = threading.Thread(target=done.wait, args=(5,), daemon=True)
+    worker.start()
+    record = _Record("GET", "/slow", profile=False)
+    record.thread_id = worker.ident
+    with profiler._lock:
+        profiler._inflight[record.thread_id] = record
+    profiler._ensure_sampler()
+
+    time.sleep(0.02)
+    early = sum(record.stacks.values())
+    time.sleep(0.15)
+    late = sum(record.stacks.values())
+    done.set()
+
+    assert early == 0
+    assert late > 0
+    assert any("wait" in stack for stack in record.stacks)
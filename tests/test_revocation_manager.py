@@ -0,0 +1,67 @@
+"""RevocationManager 测试：临时目录中的 PKI，CRL 写入临时文件"""
+import time
+
+import pytest
+from cryptography import x509
+
+from utils.pki_manager import IssueJobRunner, PKIManager
+from utils.revocation_manager import RevocationManager
+
+
+@pytest.fixture
+def pki(tmp_path):
+    manager = PKIManager(pki_dir=str(tmp_path / "pki"), db_path=str(tmp_path / "webui.db"), workers=2)
+    manager.init_ca()
+    return manager
+
+
+def crl_serials(path):
+    with open(path, "rb") as f:
+        crl = x509.load_pem_x509_crl(f.read())
+    return {format(entry.serial_number, "X") for entry in crl}
+
+
+def test_publish_uses_in_memory_index(pki, monkeypatch):
+    certs = {c["common_name"]: c["serial"] for c in pki.issue_certificates(["alice", "bob"])}
+    manager = RevocationManager(pki)
+    manager.publish_crl()
+
+    connects = []
+    connect = pki._connect
+    monkeypatch.setattr(pki, "_connect", lambda: connects.append(1) or connect())
+    manager.revoke_user("alice")
+    crl_file = manager.publish_crl()
+
+    # 吊销时更新一次证书表，发布时不再重新加载
+    assert len(connects) == 1
+    assert crl_serials(crl_file) == {certs["alice"].upper()}
+
+
+def test_release_hold_removes_entry(pki):
+    certs = {c["common_name"]: c["serial"] for c in pki.issue_certificates(["alice", "bob"])}
+    manager = RevocationManager(pki)
+
+    manager.revoke_user("alice", reason="certificate_hold")
+    manager.revoke_user("bob")
+    assert crl_serials(manager.publish_crl()) == {certs["alice"].upper(), certs["bob"].upper()}
+
+    manager.release_hold("alice")
+    assert crl_serials(manager.publish_crl()) == {certs["bob"].upper()}
+    assert pki.get_certificate("alice")["serial"] == certs["alice"]
+
+
+def test_job_runner_reloads_superseded_certificates(pki):
+    old = pki.issue_certificates(["carol"])[0]["serial"]
+    manager = RevocationManager(pki)
+    assert manager.revoked_serials() == []
+    runner = IssueJobRunner(pki, manager)
+
+    job_id = runner.submit("issue", ["carol"])
+    deadline = time.monotonic() + 60
+    while runner.get(job_id)["status"] == "running" and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    assert runner.get(job_id)["status"] == "done"
+    # 子进程替换的旧证书进入索引，之后的发布不会把它丢掉
+    assert manager.revoked_serials() == [old.upper()]
+    assert crl_serials(manager.publish_crl()) == {old.upper()}
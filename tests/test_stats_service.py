@@ -0,0 +1,63 @@
+"""StatsService 测试：触发器维护的计数与对账"""
+import sqlite3
+
+import pytest
+
+from utils.stats_service import StatsService
+
+
+@pytest.fixture
+def stats(tmp_path):
+    db_path = str(tmp_path / "webui.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE normal_user (id INTEGER PRIMARY KEY, username TEXT, status TEXT)")
+        conn.executemany("INSERT INTO normal_user (username, status) VALUES (?, ?)",
+                         [("alice", "approved"), ("bob", None)])
+    service = StatsService(db_path)
+    assert service.install()
+    return service
+
+
+def execute(service, sql, params=()):
+    with sqlite3.connect(service.db_path) as conn:
+        conn.execute(sql, params)
+
+
+def test_install_reconciles_existing_users(stats):
+    assert stats.get_stats()["by_status"] == {"approved": 1, "pending": 1}
+
+
+def test_triggers_track_insert_update_and_delete(stats):
+    execute(stats, "INSERT INTO normal_user (username, status) VALUES ('carol', 'pending')")
+    execute(stats, "UPDATE normal_user SET status = 'suspended' WHERE username = 'alice'")
+    # 状态未变化的更新不计数
+    execute(stats, "UPDATE normal_user SET status = 'pending' WHERE username = 'carol'")
+    execute(stats, "DELETE FROM normal_user WHERE username = 'bob'")
+
+    result = stats.get_stats()
+
+    assert result["total_users"] == 2
+    assert (result["pending_users"], result["approved_users"], result["suspended_users"]) == (1, 0, 1)
+    assert result["rates"]["last_24h"] == {"registered": 1, "suspended": 1, "deleted": 1}
+    assert stats.reconcile() == {}
+
+
+def test_reconcile_corrects_drift(stats):
+    # 绕过触发器修改数据
+    execute(stats, "DROP TRIGGER trg_normal_user_stats_insert")
+    execute(stats, "INSERT INTO normal_user (username, status) VALUES ('carol', 'approved')")
+    execute(stats, "UPDATE user_status_counter SET count = 5 WHERE status = 'pending'")
+
+    drift = stats.reconcile()
+
+    assert drift == {"approved": 1, "pending": -4}
+    assert stats.get_stats()["by_status"] == {"approved": 2, "pending": 1}
+
+
+def test_reconcile_prunes_old_buckets(stats):
+    execute(stats, "INSERT INTO user_event_bucket (bucket, event, count) VALUES ('2000-01-01 00:00:00', 'registered', 3)")
+
+    stats.reconcile()
+
+    with sqlite3.connect(stats.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM user_event_bucket WHERE bucket < '2001'").fetchone()[0] == 0
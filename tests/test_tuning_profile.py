@@ -0,0 +1,72 @@
+"""ServerProfileGenerator / ConfigParser 测试：配置写入临时目录"""
+import ipaddress
+import json
+
+import pytest
+
+from utils.config_parser import ConfigParser
+from utils.tuning_profile import ServerProfileGenerator
+
+
+@pytest.fixture
+def generator(tmp_path):
+    return ServerProfileGenerator(config_dir=str(tmp_path), profile="throughput")
+
+
+def test_build_layout_splits_ports_devices_and_subnets(generator):
+    layout = generator.build_layout(instances=4, protocols=("udp", "tcp"))
+
+    assert [inst["name"] for inst in layout] == ["udp0", "udp1", "udp2", "udp3", "tcp0", "tcp1", "tcp2", "tcp3"]
+    assert [inst["port"] for inst in layout] == [1194, 1195, 1196, 1197, 1294, 1295, 1296, 1297]
+    assert len({inst["dev"] for inst in layout}) == 8
+    assert len({inst["management"] for inst in layout}) == 8
+    subnets = [ipaddress.ip_network(inst["subnet"]) for inst in layout]
+    # 8 个实例平分 /16：互不重叠，且都在总地址池内
+    assert {s.prefixlen for s in subnets} == {19}
+    assert all(a == b or not a.overlaps(b) for a in subnets for b in subnets)
+    assert all(s.subnet_of(ipaddress.ip_network("10.8.0.0/16")) for s in subnets)
+
+
+def test_build_layout_rejects_pool_too_small(generator):
+    with pytest.raises(ValueError):
+        generator.build_layout(instances=4, network="10.8.0.0/24")
+
+
+def test_server_config_uses_instance_subnet_and_profile(generator):
+    instance = generator.build_layout(instances=2)[1]
+
+    config = generator.build_server_config(instance)
+
+    assert config["server"] == "10.8.128.0 255.255.128.0"
+    assert config["client-config-dir"].endswith("ccd-udp1")
+    assert config["management"] == f"{instance['management']} unix"
+    assert "data-ciphers-fallback" not in config
+    assert "\"sndbuf 2097152\"" in config["push"]
+    assert config["fast-io"] == ""
+
+
+def test_config_parser_round_trips_repeated_directives(tmp_path):
+    parser = ConfigParser(config_dir=str(tmp_path))
+    config = {"port": "1194", "push": ["\"route 10.0.0.0 255.0.0.0\"", "\"dhcp-option DNS 10.0.0.1\""],
+              "fast-io": "", "persist-key": ""}
+
+    assert parser.write_openvpn_config(config)
+    lines = (tmp_path / "openvpn" / "server.conf").read_text().splitlines()
+
+    assert "push \"route 10.0.0.0 255.0.0.0\"" in lines and "push \"dhcp-option DNS 10.0.0.1\"" in lines
+    assert "fast-io" in lines
+    assert parser.read_openvpn_config() == config
+
+
+def test_write_layout_writes_configs_and_registry(generator, tmp_path):
+    layout = generator.build_layout(instances=2)
+    registry = tmp_path / "instances.json"
+
+    written = generator.write_layout(layout, registry_file=str(registry))
+
+    assert [p.rsplit("/", 1)[1] for p in written] == ["server-udp0.conf", "server-udp1.conf"]
+    instances = json.loads(registry.read_text())
+    assert [(inst["name"], inst["subnet"], inst["management"]) for inst in instances] == [
+        (inst["name"], inst["subnet"], inst["management"]) for inst in layout]
+    # 主配置文件保持不变
+    assert not (tmp_path / "openvpn" / "server.conf").exists()
@@ -0,0 +1,170 @@
+"""UserReconciler 测试：临时目录中的 auth/users、ccd/ 和 webui.db"""
+import os
+import sqlite3
+
+import pytest
+
+from utils.data_version import DataVersion
+from utils.openvpn_manager import OpenVPNManager
+from utils.user_reconciler import UserReconciler
+
+
+@pytest.fixture
+def env(tmp_path):
+    db_path = str(tmp_path / "webui.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE normal_user (id INTEGER PRIMARY KEY, ovpn_username TEXT, "
+                     "password_set INTEGER DEFAULT 0, max_devices INTEGER DEFAULT 2, status TEXT)")
+        conn.execute("CREATE TABLE user_group (id INTEGER PRIMARY KEY, name TEXT)")
+    DataVersion(db_path).install()
+    manager = OpenVPNManager(install_dir=str(tmp_path), config_dir=str(tmp_path / "openvpn"),
+                             status_file=None, management_address=("127.0.0.1", 1), systemctl_cmd=["true"])
+    os.makedirs(os.path.join(manager.config_dir, "ccd"))
+    os.makedirs(manager.auth_dir)
+    return manager, UserReconciler(manager, db_path=db_path)
+
+
+def add_users(reconciler, *users):
+    with sqlite3.connect(reconciler.db_path) as conn:
+        conn.executemany("INSERT INTO normal_user (ovpn_username, password_set, status) VALUES (?, ?, ?)", users)
+
+
+def write_files(manager, auth, ccd=()):
+    manager.write_auth_file([f"{name}:$1$x$y\n" for name in auth])
+    for index, name in enumerate(ccd):
+        manager.write_ccd(name, 50 + index, 2)
+
+
+def auth_names(manager):
+    with open(os.path.join(manager.auth_dir, "users")) as f:
+        return [line.split(":")[0] for line in f]
+
+
+def ccd_names(manager):
+    return sorted(os.listdir(os.path.join(manager.config_dir, "ccd")))
+
+
+def test_removes_credentials_of_users_without_access(env):
+    manager, reconciler = env
+    add_users(reconciler, ("alice", 1, "approved"), ("bob", 1, "rejected"), ("carol", 0, "approved"))
+    write_files(manager, auth=["alice", "bob", "alice"], ccd=["alice", "bob"])
+
+    report = reconciler.reconcile()
+
+    assert report["plan"]["auth_remove"] == ["bob"]
+    assert report["plan"]["auth_dedupe"] == ["alice"]
+    assert auth_names(manager) == ["alice"]
+    assert ccd_names(manager) == ["alice"]
+    assert reconciler.reconcile()["changes"] == 0
+
+
+def test_never_removes_names_unknown_to_the_database(env):
+    manager, reconciler = env
+    add_users(reconciler, ("alice", 1, "approved"))
+    write_files(manager, auth=["alice", "scripted"], ccd=["alice", "DEFAULT", "scripted"])
+
+    report = reconciler.reconcile()
+
+    assert report["changes"] == 0
+    assert report["unmanaged"] == {"auth": ["scripted"], "ccd": ["scripted"]}
+    assert auth_names(manager) == ["alice", "scripted"]
+    assert ccd_names(manager) == ["DEFAULT", "alice", "scripted"]
+
+
+def test_empty_database_keeps_all_credentials(env):
+    manager, reconciler = env
+    write_files(manager, auth=["alice", "bob"], ccd=["alice", "bob"])
+
+    reconciler.reconcile()
+
+    assert auth_names(manager) == ["alice", "bob"]
+    assert ccd_names(manager) == ["alice", "bob"]
+
+
+def test_mass_removal_is_blocked_unless_forced(env):
+    manager, reconciler = env
+    names = [f"user{i:02d}" for i in range(30)]
+    # 例如从旧备份恢复后，所有用户都回到了待审核状态
+    add_users(reconciler, *[(name, 1, "pending") for name in names])
+    write_files(manager, auth=names, ccd=names)
+
+    blocked = reconciler.reconcile()
+
+    assert blocked["blocked"] == {"auth_remove": 30, "ccd_remove": 30}
+    assert auth_names(manager) == names and len(ccd_names(manager)) == 30
+
+    forced = reconciler.reconcile(force=True)
+
+    assert "blocked" not in forced
+    assert ccd_names(manager) == []
+    assert not os.path.getsize(os.path.join(manager.auth_dir, "users"))
+
+
+def test_locks_suspended_and_marks_password_set(env):
+    manager, reconciler = env
+    add_users(reconciler, ("alice", 0, "approved"), ("bob", 1, "suspended"), ("carol", 1, "approved"))
+    write_files(manager, auth=["alice", "bob"], ccd=["alice", "bob"])
+
+    report = reconciler.reconcile()
+
+    assert report["plan"]["auth_lock"] == ["bob"]
+    assert [u["username"] for u in report["plan"]["db_mark_password_set"]] == ["alice"]
+    assert [u["username"] for u in report["plan"]["db_reset_password_set"]] == ["carol"]
+    with open(os.path.join(manager.auth_dir, "users")) as f:
+        assert f.read().splitlines() == ["alice:$1$x$y", "bob:!$1$x$y"]
+    with sqlite3.connect(reconciler.db_path) as conn:
+        assert dict(conn.execute("SELECT ovpn_username, password_set FROM normal_user")) == {
+            "alice": 1, "bob": 1, "carol": 0}
+
+
+def test_dry_run_changes_nothing(env):
+    manager, reconciler = env
+    add_users(reconciler, ("alice", 1, "approved"), ("bob", 1, "rejected"))
+    write_files(manager, auth=["bob"])
+
+    report = reconciler.reconcile(dry_run=True)
+
+    assert report["plan"]["auth_remove"] == ["bob"]
+    assert report["plan"]["db_reset_password_set"] == [{"id": 1, "username": "alice"}]
+    assert auth_names(manager) == ["bob"]
+    assert ccd_names(manager) == []
+
+
+def test_incremental_check_skips_unchanged_sources(env):
+    manager, reconciler = env
+    add_users(reconciler, ("alice", 1, "approved"))
+    write_files(manager, auth=["alice"], ccd=["alice"])
+    reconciler.reconcile()
+    # mtime 在当前时间附近时不会被视为稳定，把文件和目录的时间调早
+    for path in (os.path.join(manager.auth_dir, "users"), os.path.join(manager.config_dir, "ccd")):
+        os.utime(path, (1_000_000_000, 1_000_000_000))
+
+    # 时间变化后重新检查，但内容未变的 CCD 文件不会重新读取
+    first = reconciler.reconcile(full=False)
+    skipped = reconciler.reconcile(full=False)
+    full = reconciler.reconcile()
+
+    assert first["changes"] == 0 and first["stats"]["ccd_read"] == 0
+    assert skipped.get("skipped") is True
+    assert full["changes"] == 0 and full["stats"]["ccd_read"] == 0
+
+
+def test_full_check_detects_in_place_ccd_edit(env):
+    manager, reconciler = env
+    add_users(reconciler, ("alice", 1, "approved"))
+    write_files(manager, auth=["alice"], ccd=["alice"])
+    assert reconciler.reconcile()["changes"] == 0
+    ccd_file = os.path.join(manager.config_dir, "ccd", "alice")
+    ccd_dir = os.path.dirname(ccd_file)
+    dir_mtime = os.stat(ccd_dir).st_mtime_ns
+    # 原地修改不改变目录 mtime
+    with open(ccd_file, "w") as f:
+        f.write("ifconfig-push 10.8.0.50 255.255.255.0\npush \"max-routes 10\"\n")
+    os.utime(ccd_dir, ns=(dir_mtime, dir_mtime))
+
+    report = reconciler.reconcile()
+
+    assert report["plan"]["ccd_update"] == [{"username": "alice", "max_devices": 2}]
+    with open(ccd_file) as f:
+        assert "max-routes 2" in f.read()
+    assert reconciler.reconcile()["changes"] == 0
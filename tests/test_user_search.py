@@ -0,0 +1,80 @@
+"""UserSearch 测试：临时数据库中的 FTS5 索引"""
+import sqlite3
+
+import pytest
+
+from utils import user_search
+from utils.user_search import UserSearch
+
+
+@pytest.fixture
+def search(tmp_path):
+    db_path = str(tmp_path / "webui.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE normal_user (id INTEGER PRIMARY KEY, username VARCHAR(50) UNIQUE NOT NULL, "
+                     "email TEXT, status TEXT, ovpn_username TEXT, static_ip TEXT, max_devices INTEGER, "
+                     "created_at DATETIME)")
+    service = UserSearch(db_path)
+    assert service.install()
+    return service
+
+
+def add_users(service, users):
+    with sqlite3.connect(service.db_path) as conn:
+        conn.executemany("INSERT INTO normal_user (username, email, status) VALUES (?, ?, ?)", users)
+
+
+def usernames(result):
+    return [item["username"] for item in result["items"]]
+
+
+def test_prefix_search_is_case_insensitive(search):
+    add_users(search, [("UserOne", "a@example.com", "approved"), ("user_two", "b@example.com", "pending"),
+                       ("admin", "c@example.com", "approved")])
+
+    result = search.search("Us")
+
+    assert result["mode"] == "prefix"
+    assert usernames(result) == ["user_two", "UserOne"]
+    assert usernames(search.search("us", status="pending")) == ["user_two"]
+    assert result["items"][0]["highlight"]["username"].lower().startswith("<mark>us</mark>")
+
+
+def test_prefix_query_uses_index(search):
+    sql, params = search._prefix_query("us", 20, None)
+    with sqlite3.connect(search.db_path) as conn:
+        plan = " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+    assert "ix_normal_user_username_lower" in plan
+
+
+def test_username_prefix_matches_outside_newest_candidates(search, monkeypatch):
+    monkeypatch.setattr(user_search, "MAX_CANDIDATES", 50)
+    # 最早注册的用户，之后有大量邮箱也包含 zed 的新用户
+    add_users(search, [("Zedadmin", "root@example.com", "approved"), ("zedx", "x@example.org", "pending")])
+    add_users(search, [(f"user{i:03d}", f"user{i:03d}@zedcorp.com", "approved") for i in range(200)])
+
+    result = search.search("zed", limit=5)
+
+    assert result["mode"] == "fts"
+    # 用户名前缀命中排在邮箱命中之前
+    assert usernames(result)[:2] == ["zedx", "Zedadmin"]
+    assert usernames(search.search("ZEDADMIN", limit=5))[0] == "Zedadmin"
+    assert usernames(search.search("zed", limit=5, status="pending")) == ["zedx"]
+
+
+def test_fts_matches_substrings_and_short_terms(search):
+    add_users(search, [("alice", "alice@corp.example", "approved"), ("bob", "bob@corp.example", "approved"),
+                       ("carol", "carol@other.example", "approved")])
+
+    assert usernames(search.search("corp.example", limit=10)) == ["bob", "alice"]
+    assert usernames(search.search("corp al")) == ["alice"]
+
+
+
+def test_highlight_escapes_html(search):
+    add_users(search, [("mallory", "<script>@evil.example", "pending")])
+
+    item = search.search("script")["items"][0]
+
+    assert item["highlight"]["email"] == "&lt;<mark>script</mark>&gt;@evil.example"